@@ -14,14 +14,18 @@ from astropy import constants as const
 from astropy.cosmology import LambdaCDM
 import pandas as pd
 import h5py, pickle
-import matplotlib as mpl
-mpl.use('Agg')
-import matplotlib.pyplot as plt
 sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/lib/')
 import read_hdf5
+import cosmotable
 sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/StrongLensing/LensingMap/lib/')
 import lm_cfuncs as cf
 import lenstools as lt
+import lensplane as lp
+import lensstore as ls
+import lenspool
+import lenscache
+import mapreader
+import mapprep
 import warnings
 warnings.filterwarnings("ignore", category=RuntimeWarning, append=1)
 os.system("taskset -p 0xff %d" % os.getpid())
@@ -33,17 +37,38 @@ def plant_Tree():
     return collections.defaultdict(plant_Tree)
 
 
-def lenslistinit():
-    global l_HFID,l_fov,l_deltat,l_mu,l_srctheta,l_srcbeta,l_tancritcurves,l_caustic,l_einsteinradius
-    l_HFID=[]; l_fov=[]; l_deltat=[]; l_mu=[]; l_srctheta=[]; l_srcbeta=[]; l_tancritcurves=[]
-    l_caustic=[]; l_einsteinradius=[]
-    return l_HFID,l_fov,l_deltat,l_mu,l_srctheta,l_srcbeta,l_tancritcurves,l_caustic,l_einsteinradius
-
-
-def srclistinit():
-    global s_deltat, s_mu, s_zs, s_alpha, s_theta, s_beta, s_tancritcurves, s_einsteinradius
-    s_deltat=[]; s_mu=[]; s_zs=[]; s_alpha=[]; s_theta=[]; s_beta=[]; s_tancritcurves=[]; s_einsteinradius=[]
-    return s_deltat, s_mu, s_zs, s_alpha, s_theta, s_beta, s_tancritcurves, s_einsteinradius
+def lens_signal(dmap, task, consts):
+    """
+    Lensing signal of one lens, run by the workers of lenspool.LensPool
+    Input:
+        dmap[np.ndarray] : surface density map, read-only
+        task[dict] : row of the map, FOV [arcsec]
+        consts[dict] : sigma_cr, zl, zs, ncells, cosmo, cache,
+                       deflections, tree_args
+    Output:
+        dict of per-lens results
+    """
+    FOV_arc = task['FOV']
+    ncells = consts['ncells']
+    # initialize the coordinates of grids (light rays on lens plan)
+    lpv = cf.make_r_coor(FOV_arc, ncells)[2]
+
+    # Lensing fields of unit critical surface density, reused if unchanged
+    plane = lp.LensPlane(dmap, FOV_arc, ncells, lpv, cache=consts['cache'],
+                         deflections=consts['deflections'],
+                         tree_args=consts['tree_args'])
+    fields = plane.fields(consts['sigma_cr'])
+
+    # Calculate Einstein Radii
+    Ncrit, curve_crit_tan, caustic, Rein = fields.einstein_radii('med')
+
+    # Calculate Time-Delay and Magnification
+    beta = np.array([0., 0.])
+    n_imgs, delta_t, mu, theta = fields.timedelay_magnification(
+            beta, consts['zs'], consts['zl'], consts['cosmo'])
+    return {'n_imgs' : n_imgs, 'beta' : beta, 'Rein' : Rein,
+            'CAU' : caustic, 'TCC' : curve_crit_tan,
+            'theta' : theta, 'delta_t' : delta_t, 'mu' : mu}
 
 
 def lensing_signal():
@@ -56,6 +81,30 @@ def lensing_signal():
     args["ncells"]       = int(sys.argv[5])
     args["outbase"]      = sys.argv[6]
     args["lenses"]       = int(sys.argv[7])
+    # number of processes, default all cores of the node
+    if len(sys.argv) > 8:
+        args["nproc"]    = int(sys.argv[8])
+    else:
+        args["nproc"]    = None
+    # cache of the lensing fields, directory or 'none', and its size [GB]
+    if len(sys.argv) > 9 and sys.argv[9] != 'none':
+        if len(sys.argv) > 10:
+            budget = float(sys.argv[10])
+        else:
+            budget = 20.
+        args["cache"]    = lenscache.LensCache(sys.argv[9], budget)
+    else:
+        args["cache"]    = None
+    # deflections, 'fft' or Barnes-Hut 'tree', and the opening angle of
+    # the tree
+    if len(sys.argv) > 11:
+        args["deflections"]  = sys.argv[11]
+    else:
+        args["deflections"]  = 'fft'
+    if len(sys.argv) > 12:
+        args["tree_args"]    = {'theta' : float(sys.argv[12])}
+    else:
+        args["tree_args"]    = {}
     
     # Organize devision of Sub-&Halos over Processes on Proc. 0
     s = read_hdf5.snapshot(args["snapnum"], args["simdir"])
@@ -80,126 +129,90 @@ def lensing_signal():
     # Calculate critical surface density
     zl = redshift
     zs = 0.409
-    sigma_cr = lt.sigma_crit(zl, zs, cosmo).to_value('Msun %s-2' % unitlength)
+    sigma_cr = cosmotable.get_table(cosmo, unitlength).sigma_crit(zl, zs)
     
-    lenslistinit(); srclistinit()
+    # Results are written per lens into a columnar store
+    simlabel = args["simdir"].split('/')[-2].split('_')[2]
+    zllabel = str(redshift).replace('.', '')[:3].zfill(3)
+    zslabel = '{:<03d}'.format(int(str(zs).replace('.', '')))
+    if args["lenses"] == True:
+        lenslabel = 'lens'
+    elif args["lenses"] == False:
+        lenslabel = 'nonlens'
+    filename = args["outbase"]+'LM_%s_%s_zl%szs%s.h5' % \
+            (simlabel, lenslabel, zllabel, zslabel)
+    store = ls.LensStore(filename, 'w')
+    store.attrs['snapnum'] = args["snapnum"]
+    store.attrs['zl'] = redshift
+    store.attrs['zs'] = zs
+    nlenses = 0
+    consts = {'sigma_cr' : sigma_cr, 'zl' : zl, 'zs' : zs,
+              'ncells' : args["ncells"], 'cosmo' : cosmo,
+              'cache' : args["cache"], 'deflections' : args["deflections"],
+              'tree_args' : args["tree_args"]}
+    pool = lenspool.LensPool(args["nproc"])
+    # The next file is read while the lenses of the current one are run
+    reader = mapreader.MapReader(dmfile, ['HFID', 'FOV'], maps='DMAP')
     # Run through files
-    for ff in range(len(dmfile)):
+    for ff, dmf in enumerate(reader):
         print('\n')
         print('------------- \n Reading File: %s' % (fname[ff].split('/')[-2:]))
-        dmf = h5py.File(dmfile[ff], 'r')
         print('Nr. of galxies:', len(dmf['HFID']))
 
+        # Density maps are shared with the workers, not copied
+        dmaps = dmf.maps
+        HFID = dmf['HFID']
+        # convert. box size and pixels size from ang. diam. dist. to arcsec
+        units = mapprep.MapUnits(dmf['FOV'], zl, cosmo, args["ncells"],
+                                 unitlength)
+        tasks = [{'row' : ll, 'FOV' : units.fov_arc[ll]}
+                 for ll in range(len(HFID))]
+        if args["cache"] is not None and args["deflections"] == 'fft':
+            # unit Sigma_cr fields of all maps from batched transforms,
+            # the workers find them in the cache
+            lp.fill_cache([dmaps.array[task['row']] for task in tasks],
+                          [task['FOV'] for task in tasks], args["ncells"],
+                          [cf.make_r_coor(task['FOV'], args["ncells"])[2]
+                           for task in tasks], args["cache"])
+
         # Run through lenses
-        for ll in range(len(dmf['HFID'])):
-            # convert. box size and pixels size from ang. diam. dist. to arcsec
-            FOV_arc = (dmf['FOV'][ll]/cf.Da(zl, unitlength, cosmo) * \
-                       u.rad).to_value('arcsec')
-            dsx_arc = FOV_arc/args["ncells"]  #[arcsec] pixel size
-            # initialize the coordinates of grids (light rays on lens plan)
-            lp1, lp2, lpv = cf.make_r_coor(FOV_arc, args["ncells"])
-
-            # Calculate convergence map
-            kappa = dmf['DMAP'][ll]/sigma_cr
-            fig = plt.figure()
-            ax = fig.add_subplot(111)
-            
-            # Calculate Deflection Maps
-            alpha1, alpha2, mu_map, phi, detA, lambda_t, lpv = lt.cal_lensing_signals(
-                    kappa, FOV_arc, args["ncells"], lpv) 
-            lp2, lp1 = np.meshgrid(lpv, lpv)  #[arcsec] finer resol. in centre
-            # Mapping light rays from image plane to source plan
-            [sp1, sp2] = [lp1 - alpha1, lp2 - alpha2]  #[arcsec]
-
-            # Calculate Einstein Radii
-            Ncrit, curve_crit_tan, caustic, Rein = lt.einstein_radii(
-                    lp1, lp2, sp1, sp2, detA, lambda_t, cosmo, ax, 'med')
-            # Calculate Time-Delay and Magnification
-            beta = np.array([0., 0.])
-            n_imgs, delta_t, mu, theta = lt.timedelay_magnification(
-                    mu_map, phi, dsx_arc, args["ncells"],
-                    lp1, lp2, alpha1, alpha2, beta, zs, zl, cosmo)
+        for task, res in pool.imap(lens_signal, dmaps, tasks, consts):
+            ll = task['row']
+            n_imgs = res['n_imgs']
             if args["lenses"] == True:
                 if n_imgs > 1:
                     #TODO: does n_imgs include the original
                     print('Galaxy %d/%d got %d multiple lensed images' % \
-                            (ll, len(dmf['HFID']), n_imgs))
-                    # Tree Branch 1
-                    l_HFID.append(int(dmf['HFID'][ll]))
-                    l_fov.append(FOV_arc)
-                    # Tree Branch 2
-                    l_srcbeta.append(beta)
-                    l_tancritcurves.append(curve_crit_tan)
-                    l_caustic.append(caustic)
-                    l_einsteinradius.append(Rein)
-                    # Tree Branch 3
-                    l_srctheta.append(theta)
-                    l_deltat.append(delta_t)
-                    l_mu.append(mu)
+                            (ll, len(HFID), n_imgs))
+                else:
+                    continue
             elif args["lenses"] == False:
-                if n_imgs == 1:
-                    l_HFID.append(int(dmf['HFID'][ll]))
-                    l_fov.append(FOV_arc)
-                    l_srcbeta.append(beta)
-                    l_tancritcurves.append(curve_crit_tan)
-                    l_caustic.append(caustic)
-                    l_einsteinradius.append(Rein)
-                    l_srctheta.append(theta)
-                    l_deltat.append(delta_t)
-                    l_mu.append(mu)
-
-    ########## Save to File ########
+                if n_imgs != 1:
+                    continue
+            store.append('lenses', {
+                'HF_ID' : [int(HFID[ll])],
+                'FOV' : [task['FOV']],  #[arcsec] for glafic
+                'DMAP' : [dmaps.array[ll]],
+                'beta' : [res['beta']],
+                'Rein' : [res['Rein']]},
+                ragged={'CAU' : [res['CAU']],
+                        'TCC' : [res['TCC']],
+                        # Multiple Images
+                        'theta' : [res['theta']],
+                        'delta_t' : [res['delta_t']],
+                        'mu' : [res['mu']]})
+            store.flush()
+            nlenses += 1
+    store.close()
+    st = reader.stats()
+    print('Read %d files, %.1f MB in %.1f s, waited %.1f s, '
+          'mean queue depth %.2f' % (st['files'], st['MB'], st['read_time'],
+          st['wait_time'], st['depth_mean']))
+
     if args["lenses"] == True:
-        print('%d galaxies produce multiple imaged SN Ia' % (len(l_HFID)))
-        tree = plant_Tree()
-        # Tree Branches of Node 1 : Lenses
-        tree['HF_ID'] = l_HFID
-        tree['snapnum'] = args["snapnum"]
-        tree['zl'] = redshift
-        tree['zs'] = zs
-        tree['FOV'] = l_fov  #[arcsec] for glafic
-        # Tree Branches of Node 1 : Sources
-        tree['Sources']['beta'] = l_srcbeta
-        tree['Sources']['CAU'] = l_caustic
-        tree['Sources']['TCC'] = l_tancritcurves
-        tree['Sources']['Rein'] = l_einsteinradius
-        for imgs in range(len(l_mu)):
-            # Tree Branches of Node 2 : Multiple Images
-            tree['Sources']['theta'][imgs] = l_srctheta[imgs]
-            tree['Sources']['delta_t'][imgs] = l_deltat[imgs]
-            tree['Sources']['mu'][imgs] = l_mu[imgs]
-        simlabel = args["simdir"].split('/')[-2].split('_')[2]
-        zllabel = str(redshift).replace('.', '')[:3].zfill(3)
-        zslabel = '{:<03d}'.format(int(str(zs).replace('.', '')))
-        filename = args["outbase"]+'LM_%s_%s_zl%szs%s.pickle' % \
-                (simlabel, 'lens', zllabel, zslabel)
-        filed = open(filename, 'wb')
-        pickle.dump(tree, filed)
-        filed.close()
-        plt.close(fig)
+        print('%d galaxies produce multiple imaged SN Ia' % (nlenses))
     elif args["lenses"] == False:
-        print('%d galaxies produce single imaged SN Ia' % (len(l_HFID)))
-        dicts = {}
-        dicts['HF_ID'] = l_HFID
-        dicts['snapnum'] = args["snapnum"]
-        dicts['zl'] = redshift
-        dicts['zs'] = zs
-        dicts['FOV'] = l_fov  #[arcsec] for glafic
-        dicts['beta'] = l_srcbeta
-        dicts['CAU'] = l_caustic
-        dicts['TCC'] = l_tancritcurves
-        dicts['Rein'] = l_einsteinradius
-        dicts['theta'] = l_srctheta
-        dicts['delta_t'] = l_deltat
-        dicts['mu'] = l_mu
-        df = pd.DataFrame(data=dicts)
-        simlabel = args["simdir"].split('/')[-2].split('_')[2]
-        zllabel = str(redshift).replace('.', '')[:3].zfill(3)
-        zslabel = '{:<03d}'.format(int(str(zs).replace('.', '')))
-        filename = args["outbase"]+'LM_%s_%s_zl%szs%s.h5' % \
-                (simlabel, 'nonlens', zllabel, zslabel)
-        df.to_hdf(filename, key='nonlenses')
-        plt.close(fig)
+        print('%d galaxies produce single imaged SN Ia' % (nlenses))
 
 
 if __name__ == '__main__':
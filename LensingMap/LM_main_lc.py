@@ -18,7 +18,17 @@ sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/lib/')
 import read_hdf5
 sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/StrongLensing/LensingMap/lib/')
 import cfuncs as cf
+import lm_cfuncs
 import lenstools as lt
+import lensplane as lp
+import lensstore as ls
+import lenspool
+import lenscache
+import multiplane as mp
+import prescreen
+import cascade
+import mapreader
+import mapprep
 import warnings
 #sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/StrongLensing/LensingMap/backup/')
 #import testkappamap as kmap
@@ -32,15 +42,215 @@ def plant_Tree():
     return collections.defaultdict(plant_Tree)
 
 
-def lenslistinit():
-    global l_HFID, l_haloID, l_snapnum, l_deltat, l_mu, l_haloposbox, l_zs, l_zl, l_lensplane, l_detA, l_srctheta, l_srcbeta, l_srcID, l_tancritcurves, l_einsteinradius
-    l_HFID=[]; l_haloID=[]; l_snapnum=[]; l_deltat=[]; l_mu=[]; l_haloposbox=[]; l_zs=[]; l_zl=[]; l_lensplane=[]; l_detA=[]; l_srctheta=[]; l_srcbeta=[]; l_srcID=[]; l_tancritcurves=[]; l_einsteinradius=[]
-    return l_HFID, l_haloID, l_snapnum, l_deltat, l_mu, l_haloposbox, l_zs, l_zl, l_lensplane, l_detA, l_srctheta, l_srcbeta, l_srcID, l_tancritcurves, l_einsteinradius
+# line-of-sight halos transformed by this worker, shared by later lenses
+_los_fields = mp.FieldCache()
 
-def srclistinit():
-    global s_srcID, s_deltat, s_mu, s_zs, s_alpha, s_detA, s_theta, s_beta, s_tancritcurves, s_einsteinradius
-    s_srcID=[]; s_deltat=[]; s_mu=[]; s_zs=[]; s_alpha=[]; s_detA=[]; s_theta=[]; s_beta=[]; s_tancritcurves=[]; s_einsteinradius=[]
-    return s_srcID, s_deltat, s_mu, s_zs, s_alpha, s_detA, s_theta, s_beta, s_tancritcurves, s_einsteinradius
+
+def line_of_sight(dmap, task, consts):
+    """
+    Lens and the halos along its line-of-sight, one plane per snapshot
+    shell of the lightcone
+    Input:
+        see lens_sources, task['los'] holding the line-of-sight halos
+    Output:
+        multiplane.MultiPlane
+    """
+    ncells = consts['ncells']
+    maps = lenspool.worker_maps()
+    shells = {task['snapnum'] : [mp.HaloField(dmap, task['FOV'], ncells,
+                                              [0., 0.])]}
+    shell_z = {task['snapnum'] : [task['zl']]}
+    for los in task['los']:
+        halo = _los_fields.get(los['LC_ID'], lambda: mp.HaloField(
+                maps[los['row']], los['FOV'], ncells, [0., 0.]))
+        shells.setdefault(los['snapnum'], []).append(
+                halo.shifted(los['centre']))
+        shell_z.setdefault(los['snapnum'], []).append(los['zl'])
+    # planes at the median halo redshift, the lens keeps its own
+    planes = []
+    for snap in shells.keys():
+        if snap == task['snapnum']:
+            zp = task['zl']
+        else:
+            zp = np.median(shell_z[snap])
+        planes.append(mp.LensShell(zp, shells[snap]))
+    return mp.MultiPlane(planes, consts['cosmo'])
+
+
+def lens_sources_multiplane(dmap, task, consts):
+    """
+    Lensing signal of all sources behind one lens, traced through all
+    planes along the line-of-sight, see lens_sources
+    Output:
+        dict of lists over multiply imaged sources, with the effective
+        convergence and shear at the images
+    """
+    lm_cfuncs.set_precision(consts['precision'])
+    multi = line_of_sight(dmap, task, consts)
+    # mean surface density within circles around the peak of the lens
+    theta_prof, sbar = lt.mean_kappa_profiles(
+            dmap, task['FOV']/consts['ncells'], 'peak')
+    srcs = {'Src_ID' : [], 'zs' : [], 'beta' : [], 'Rein' : [],
+            'Rein_prof' : [], 'TCC' : [], 'theta' : [], 'delta_t' : [],
+            'mu' : [], 'kappa' : [], 'shear' : []}
+    for ss in range(len(task['Src_ID'])):
+        zs = task['zs'][ss]
+        beta = lt.mpc2arc(task['SrcPosSky'][ss])
+        beta = [bb*1e-3 for bb in beta]
+        img = multi.find_images(beta, zs, task['FOV'], consts['ncells'])
+        if len(img['mu']) <= 1:
+            continue
+        Ncrit, curve_crit_tan, caustic, Rein = lt.einstein_radii(
+                img['lp1'], img['lp2'], img['sp1'], img['sp2'],
+                img['detA'], img['lambda_t'], None, 'med')
+        srcs['Src_ID'].append(task['Src_ID'][ss])
+        srcs['zs'].append(zs)
+        srcs['beta'].append(beta)
+        srcs['TCC'].append(curve_crit_tan)
+        srcs['Rein'].append(Rein)  #[arcsec]
+        sigma_cr = task['sigma_cr'][ss]
+        srcs['Rein_prof'].append(
+                lt.profile_einstein_radii(theta_prof, sbar, sigma_cr)[0])
+        srcs['theta'].append(np.array([img['theta1'], img['theta2']]).T)
+        srcs['delta_t'].append(img['delta_t'])
+        srcs['mu'].append(img['mu'])
+        srcs['kappa'].append(img['kappa'])
+        srcs['shear'].append(np.array([img['shear1'], img['shear2']]).T)
+    return srcs
+
+
+def plane_coord(FOV_arc, ncells):
+    """ Lensing plane axis coordinates of a map [arcsec] """
+    dsx_arc = FOV_arc/ncells  #[arcsec] pixel size
+    return np.linspace(-(FOV_arc-dsx_arc)/2, (FOV_arc-dsx_arc)/2, ncells)
+
+
+def lens_sources(dmap, task, consts):
+    """
+    Lensing signal of all sources behind one lens,
+    run by the workers of lenspool.LensPool
+    Input:
+        dmap[np.ndarray] : surface density map, read-only
+        task[dict] : row of the map, FOV [arcsec], zl and sources with
+                     their critical surface density
+        consts[dict] : ncells, cosmo, refine, precision, cache,
+                       deflections, tree_args
+    Output:
+        dict of lists over multiply imaged sources
+    """
+    lm_cfuncs.set_precision(consts['precision'])
+    ncells = consts['ncells']
+    cosmo = consts['cosmo']
+    FOV_arc = task['FOV']
+    dsx_arc = FOV_arc/ncells  #[arcsec] pixel size
+    # initialize the coordinates of grids (light rays on lens plan)
+    lpv = plane_coord(FOV_arc, ncells)
+    
+    # Calculate lensing fields of unit critical surface density,
+    # all sources behind the lens only rescale them
+    if consts['refine'] == 'cascade':
+        plane = cascade.Cascade(dmap, FOV_arc, ncells, lpv)
+    else:
+        plane = lp.LensPlane(dmap, FOV_arc, ncells, lpv, consts['refine'],
+                             cache=consts['cache'],
+                             deflections=consts['deflections'],
+                             tree_args=consts['tree_args'])
+    # mean surface density within circles around the peak, the
+    # Einstein radius of the profile of every source follows from it
+    theta_prof, sbar = lt.mean_kappa_profiles(dmap, dsx_arc, 'peak')
+    
+    srcs = {'Src_ID' : [], 'zs' : [], 'beta' : [], 'Rein' : [],
+            'Rein_prof' : [], 'TCC' : [], 'theta' : [], 'delta_t' : [],
+            'mu' : []}
+    # images of the multiply imaged sources, their time delays follow
+    # for all sources at once
+    imgs = {'nimgs' : [], 'theta1' : [], 'theta2' : [], 'mu' : [], 'phi' : []}
+    # Run through sources
+    for ss in range(len(task['Src_ID'])):
+        zs = task['zs'][ss]
+        # critical surface density of the source
+        sigma_cr = task['sigma_cr'][ss]
+
+        # convert source position from Mpc to arcsec
+        beta = lt.mpc2arc(task['SrcPosSky'][ss])
+        beta = [bb*1e-3 for bb in beta]
+
+        # Deflection, magnification and potential maps
+        fields = plane.fields(sigma_cr)
+        # sources outside of all caustics are singly imaged
+        if not fields.caustic_classifier.classify(beta[0], beta[1])[1][0]:
+            continue
+        
+        # Calculate Einstein Radii in [arcsec]
+        Ncrit, curve_crit_tan, caustic, Rein = fields.einstein_radii('med')
+        #if Rein == 0. or math.isnan(Rein):
+        #    print('!!! Rein is 0. or NaN')
+        #    continue
+        # Multiple Images with magnification and potential
+        nimgs, theta1, theta2, mu, phi = fields.images([beta[0]], [beta[1]])
+        if nimgs[0] > 1:
+            srcs['Src_ID'].append(task['Src_ID'][ss])
+            srcs['zs'].append(zs)
+            srcs['beta'].append(beta)
+            srcs['TCC'].append(curve_crit_tan)
+            srcs['Rein'].append(Rein)  #[arcsec]
+            srcs['Rein_prof'].append(
+                    lt.profile_einstein_radii(theta_prof, sbar, sigma_cr)[0])
+            for name, value in zip(['nimgs', 'theta1', 'theta2', 'mu', 'phi'],
+                                   [nimgs, theta1, theta2, mu, phi]):
+                imgs[name].append(value)
+            #print(' -> %d multiple lensed images' % (nimgs[0]))
+    if len(srcs['Src_ID']) == 0:
+        return srcs
+
+    # Calculate Time-Delay and Magnification of all images
+    beta = np.array(srcs['beta'])
+    flat = dict((name, np.concatenate(imgs[name])) for name in imgs)
+    table = lt.image_table(flat['nimgs'], flat['theta1'], flat['theta2'],
+                           flat['mu'], flat['phi'], beta[:, 0], beta[:, 1],
+                           srcs['zs'], task['zl'], cosmo)
+    for ss in range(len(srcs['Src_ID'])):
+        img = slice(table['offsets'][ss], table['offsets'][ss+1])
+        srcs['theta'].append(np.array([table['theta1'][img],
+                                       table['theta2'][img]]).T)
+        srcs['delta_t'].append(table['delta_t'][img])
+        srcs['mu'].append(table['mu'][img])
+    return srcs
+
+
+def screen_lenses(tasks, lcdf, dmaps, cosmo, ncells, store):
+    """
+    Drop lenses which can not form critical curves for their sources,
+    the estimates of all lenses are written to the 'prescreen' table
+    Input:
+        tasks[list] : lens tasks of lensing_signal
+        lcdf[pd.DataFrame] : lightcone halos
+        dmaps[np.ndarray] : density maps of the file
+    Output:
+        tasks[list] : lenses which may be strong lenses
+    """
+    if len(tasks) == 0:
+        return tasks
+    screen = prescreen.PreScreen(cosmo)
+    lenses = lcdf.iloc[[task['ll'] for task in tasks]]
+    zs = np.array([np.max(task['zs']) for task in tasks])
+    dsx_arc = np.array([task['FOV'] for task in tasks])/ncells
+    keep, est = screen.catalogue(lenses['vrms'].values,
+                                 lenses['M200'].values/cosmo.h,
+                                 lenses['zl'].values, zs, dsx_arc)
+    est['kappa_peak'] = np.full(len(tasks), np.nan)
+    est['kappa_mean'] = np.full(len(tasks), np.nan)
+    for tt in np.where(keep)[0]:
+        # of the most distant source
+        sigma_cr = tasks[tt]['sigma_cr'][np.argmax(tasks[tt]['zs'])]
+        keep[tt], mest = screen.density_map(dmaps[tasks[tt]['row']], sigma_cr)
+        est['kappa_peak'][tt] = mest['kappa_peak']
+        est['kappa_mean'][tt] = mest['kappa_mean']
+    est.update({'LC_ID' : lenses.index.values.astype(int),
+                'zl' : lenses['zl'].values, 'zs' : zs, 'keep' : keep})
+    store.append('prescreen', est)
+    print('Pre-screen keeps %d of %d lenses' % (np.sum(keep), len(tasks)))
+    return [task for task, kk in zip(tasks, keep) if kk]
 
 
 def lensing_signal():
@@ -51,6 +261,53 @@ def lensing_signal():
     args["lcdir"]        = sys.argv[3]
     args["outbase"]      = sys.argv[4]
     args["ncells"]      = int(sys.argv[5])
+    # number of processes, default all cores of the node
+    if len(sys.argv) > 6:
+        args["nproc"]   = int(sys.argv[6])
+    else:
+        args["nproc"]   = None
+    # refinement of lensing plane, 'centre', 'adaptive' or 'cascade'
+    if len(sys.argv) > 7:
+        args["refine"]  = sys.argv[7]
+    else:
+        args["refine"]  = 'centre'
+    # lens planes, 'single' lens or 'multi' planes along line-of-sight
+    if len(sys.argv) > 8:
+        args["planes"]  = sys.argv[8]
+    else:
+        args["planes"]  = 'single'
+    # skip halos which can not be strong lenses, 'on' or 'off'
+    if len(sys.argv) > 9:
+        args["prescreen"]  = sys.argv[9]
+    else:
+        args["prescreen"]  = 'on'
+    # precision of the lensing kernels, 'double' or 'single'
+    if len(sys.argv) > 10:
+        args["precision"]  = sys.argv[10]
+    else:
+        args["precision"]  = 'double'
+    # cache of the lensing fields, directory or 'none', and its size [GB]
+    if len(sys.argv) > 11 and sys.argv[11] != 'none':
+        if len(sys.argv) > 12:
+            budget = float(sys.argv[12])
+        else:
+            budget = 20.
+        args["cache"]  = lenscache.LensCache(sys.argv[11], budget)
+    else:
+        args["cache"]  = None
+    # deflections of single lens planes, 'fft' or Barnes-Hut 'tree', and
+    # the opening angle of the tree
+    if len(sys.argv) > 13:
+        args["deflections"]  = sys.argv[13]
+    else:
+        args["deflections"]  = 'fft'
+    if len(sys.argv) > 14:
+        args["tree_args"]  = {'theta' : float(sys.argv[14])}
+    else:
+        args["tree_args"]  = {}
+    if args["deflections"] != 'fft' and \
+            (args["refine"] == 'cascade' or args["planes"] == 'multi'):
+        raise Exception('Dont know these deflections ->', args["deflections"])
     #args["simdir"]       = '/cosma6/data/dp004/dc-arno1/SZ_project/full_physics/L62_N512_F5_kpc/'
     #args["dmdir"]        = '/cosma5/data/dp004/dc-beck3/StrongLensing/DensityMap/full_physics/L62_N512_F5_kpc/Lightcone/'
     #args["lcdir"]        = '/cosma5/data/dp004/dc-beck3/StrongLensing/LightCone/full_physics/Rockstar/LC_SN_L62_N512_F5_kpc'
@@ -64,34 +321,59 @@ def lensing_signal():
     lcfile = glob.glob(args["lcdir"]+'*.h5')
     lcfile.sort(key = lambda x: x[-4])
 
-    lenslistinit(); srclistinit()
+    # Results are written per lens into a columnar store
+    label = args["simdir"].split('/')[-2].split('_')[2]
+    filename = args["outbase"]+'LM_%s.h5' % (label)
+    store = ls.LensStore(filename, 'w')
+
+    pool = lenspool.LensPool(args["nproc"])
+    # Einstein radii of all sources, curve and mean convergence profile
+    rein_curve, rein_prof = [], []
+    # Files of the next lightcone are read while the lenses of the
+    # current one are run
+    dmreader = mapreader.MapReader(dmfile, ['HF_ID', 'LC_ID', 'fov_Mpc'],
+                                   maps='density_map')
+    lcreader = mapreader.MapReader(lcfile, ['HF_ID', 'LC_ID', 'Halo_z',
+                                            'VelDisp', 'snapnum', 'FOV',
+                                            'M200', 'HaloPosLC', 'Src_ID',
+                                            'Src_z', 'SrcPosSky',
+                                            'SrcAbsMag'])
     # Run through files
-    for ff in range(len(dmfile)):
+    for ff, (dmf, lcf) in enumerate(zip(dmreader, lcreader)):
         print('\n')
         print('------------- \n Reading Files: \n%s\n%s' % \
                 (dmfile[ff].split('/')[-2:], lcfile[ff].split('/')[-2:]))
         # Load density maps
-        dmf = h5py.File(dmfile[ff], 'r')
         dmdf = pd.DataFrame({'HF_ID' : dmf['HF_ID'],
                              'LC_ID' : dmf['LC_ID'],
                              'fov_Mpc' : dmf['fov_Mpc']})
-        s1 = pd.Series(dict(list(enumerate(dmf['density_map']))), index=dmdf.index)
-        dmdf['density_map'] = s1
+        # row of the density map in the file
+        dmdf['dmrow'] = np.arange(len(dmdf.index))
         dmdf = dmdf.set_index('LC_ID')
+        # Density maps are shared with the workers, not copied
+        dmaps = dmf.maps
 
         # Load Lightcones
-        lcf = h5py.File(lcfile[ff], 'r')
-        lcdf = pd.DataFrame({'HF_ID' : lcf['HF_ID'].value,
-                             'LC_ID' : lcf['LC_ID'].value,
-                             'zl' : lcf['Halo_z'].value,
-                             'vrms' : lcf['VelDisp'].value,
-                             'snapnum' : lcf['snapnum'].value,
-                             'fov_Mpc' : lcf['FOV'][:][1]})
+        lcdf = pd.DataFrame({'HF_ID' : lcf['HF_ID'],
+                             'LC_ID' : lcf['LC_ID'],
+                             'zl' : lcf['Halo_z'],
+                             'vrms' : lcf['VelDisp'],
+                             'snapnum' : lcf['snapnum'],
+                             'fov_Mpc' : lcf['FOV'][1]})
+        if 'M200' in lcf:
+            lcdf['M200'] = lcf['M200']  #[Msun/h]
+        else:
+            lcdf['M200'] = np.nan
+        if args["planes"] == 'multi':
+            # sky position of halos [arcsec], small angles around the axis
+            poslc = lcf['HaloPosLC']
+            lcdf['sky1'] = (np.arctan2(poslc[:, 1], poslc[:, 0])*u.rad).to_value('arcsec')
+            lcdf['sky2'] = (np.arctan2(poslc[:, 2], poslc[:, 0])*u.rad).to_value('arcsec')
         lcdf = lcdf.set_index('LC_ID')
-        srcdf = {'Src_ID' : lcf['Src_ID'].value,
-                 'zs' : lcf['Src_z'].value,
-                 'SrcPosSky' : lcf['SrcPosSky'].value,
-                 'SrcAbsMag' : lcf['SrcAbsMag'].value}
+        srcdf = {'Src_ID' : lcf['Src_ID'],
+                 'zs' : lcf['Src_z'],
+                 'SrcPosSky' : lcf['SrcPosSky'],
+                 'SrcAbsMag' : lcf['SrcAbsMag']}
 
         print('The minimum Vrms is %f' % (np.min(lcdf['vrms'].values)))
 
@@ -99,7 +381,7 @@ def lensing_signal():
         lcdf = lcdf.sort_values(by=['LC_ID'])
         # sanity check
         assert len(lcdf.index.intersection(dmdf.index)) == len(dmdf.index.values)
-        lcdf['density_map'] = dmdf['density_map']
+        lcdf['dmrow'] = dmdf['dmrow']
         
         #lcdf = lcdf.sort_values(by=['snapnum'])
         s = read_hdf5.snapshot(45, args["simdir"])
@@ -108,136 +390,114 @@ def lensing_signal():
                           Om0=s.header.omega_m,
                           Ode0=s.header.omega_l)
     
-        # Run through lenses
+        # field-of-view of all lenses [arcsec]
+        units = mapprep.MapUnits(lcdf['fov_Mpc'].values, lcdf['zl'].values,
+                                 cosmo, args["ncells"], hubble=True)
+        # Lens tasks, lenses without sources are skipped
         print('There are %d lenses in file' % (len(lcdf.index.values)))
+        tasks = []
         for ll in range(len(lcdf.index.values)):
             lens = lcdf.iloc[ll]
-            #print('working on lens %d' % lens['HF_ID'])
-            # convert. box size and pixels size from ang. diam. dist. to arcsec
-            FOV_arc = (lens['fov_Mpc']/cf.Da(lens['zl'], cosmo)*u.rad).to_value('arcsec')
-            dsx_arc = FOV_arc/args["ncells"]  #[arcsec] pixel size
-            # initialize the coordinates of grids (light rays on lens plan)
-            lpv = np.linspace(-(FOV_arc-dsx_arc)/2, (FOV_arc-dsx_arc)/2, args["ncells"])
-            lp1, lp2 = np.meshgrid(lpv, lpv)  #[arcsec]
-       
+            # halos without a density map
+            if not np.isfinite(lens['dmrow']):
+                continue
             zs, Src_ID, SrcPosSky = lt.source_selection(
                     srcdf['Src_ID'], srcdf['zs'], srcdf['SrcPosSky'],
                     lcdf.index.values[ll])
-            
-            # Run through sources
-            check_for_sources = 0
-            fig = plt.figure()
-            ax = fig.add_subplot(111)
-            for ss in range(len(Src_ID)):
-                # Calculate critical surface density
-                sigma_cr = lt.sigma_crit(lens['zl'],
-                                         zs[ss],
-                                         cosmo).to_value('Msun Mpc-2')
-
-                # convert source position from Mpc to arcsec
-                beta = lt.mpc2arc(SrcPosSky[ss])
-                beta = [bb*1e-3 for bb in beta]
-
-                # Calculate convergence map
-                kappa = lens['density_map']/sigma_cr
-                #fig = plt.figure()
-                #ax = fig.add_subplot(111)
-                
-                # Calculate Deflection Maps
-                alpha1, alpha2, mu_map, phi, detA, lambda_t = lt.cal_lensing_signals(
-                        kappa, FOV_arc, args["ncells"]) 
-                # Calculate Einstein Radii in [arcsec]
-                Ncrit, curve_crit, curve_crit_tan, Rein = lt.einstein_radii(
-                        lp1, lp2, detA, lambda_t, lens['zl'], cosmo, ax, 'med')
-                #if Rein == 0. or math.isnan(Rein):
-                #    print('!!! Rein is 0. or NaN')
-                #    continue
-                # Calculate Time-Delay and Magnification
-                n_imgs, delta_t, mu, theta  = lt.timedelay_magnification(
-                        mu_map, phi, dsx_arc, args["ncells"],
-                        lp1, lp2, alpha1, alpha2, beta,
-                        zs[ss], lens['zl'], cosmo)
-                if n_imgs > 1:
-                    # Tree Branch 2
-                    s_srcID.append(Src_ID[ss])
-                    s_zs.append(zs[ss])
-                    s_beta.append(beta)
-                    #s_lensplane.append([lp1, lp2])
-                    s_detA.append(detA)
-                    s_tancritcurves.append(curve_crit_tan)
-                    s_einsteinradius.append(Rein)  #[arcsec]
-                    # Tree Branch 3
-                    s_theta.append(theta)
-                    s_deltat.append(delta_t)
-                    s_mu.append(mu)
-                    check_for_sources = 1
-                    #print(' -> %d multiple lensed images' % (n_imgs))
-            if check_for_sources == 1:
-                # Tree Branch 1
-                l_HFID.append(int(lens['HF_ID']))
-                l_haloID.append(int(lcdf.index.values[ll]))
-                l_snapnum.append(int(lens['snapnum']))
-                l_zl.append(lens['zl'])
-                #l_haloposbox.append(HaloPosBox[ll])
-                # Tree Branch 2
-                l_srcID.append(s_srcID)
-                l_zs.append(s_zs)
-                l_srcbeta.append(s_beta)
-                #l_lensplane.append(s_lensplane)
-                l_detA.append(s_detA)
-                l_tancritcurves.append(s_tancritcurves)
-                l_einsteinradius.append(s_einsteinradius)
-                # Tree Branch 3
-                l_srctheta.append(s_theta)
-                l_deltat.append(s_deltat)
-                l_mu.append(s_mu)
-                srclistinit()
-                check_for_sources = 0
-                print('Save data of lens %d' % ll)
-    
-    ########## Save to File ########
-    tree = plant_Tree()
-    ## Tree Branches of Node 1 : Lenses
-    #tree['HF_ID'] = l_HFID
-    #tree['snapnum'] = args["snapnum"]
-    #tree['zl'] = redshift
-    #tree['zs'] = zs
-    ## Tree Branches of Node 1 : Sources
-    #tree['Sources']['beta'] = l_srcbeta
-    #tree['Sources']['TCC'] = l_tancritcurves
-    #tree['Sources']['Rein'] = l_einsteinradius
-    #for imgs in range(len(l_mu)):
-    #    # Tree Branches of Node 2 : Multiple Images
-    #    tree['Sources']['theta'][imgs] = l_srctheta[imgs]
-    #    tree['Sources']['delta_t'][imgs] = l_deltat[imgs]
-    #    tree['Sources']['mu'][imgs] = l_mu[imgs]
-
-    # Tree Branches of Node 1 : Lenses
-    tree['LC_ID'] = l_haloID
-    tree['HF_ID'] = l_HFID
-    tree['snapnum'] = l_snapnum
-    tree['zl'] = l_zl
-    #tree['HaloPosBox'] = l_haloposbox
-    for sid in range(len(l_haloID)):
-        # Tree Branches of Node 2 : Sources
-        tree['Sources']['Src_ID'][sid] = l_srcID[sid]
-        tree['Sources']['zs'][sid] = l_zs[sid]
-        tree['Sources']['beta'][sid] = l_srcbeta[sid]
-        #tree['Sources']['LP'][sid] = l_lensplane[sid]
-        tree['Sources']['detA'][sid] = l_detA[sid]
-        tree['Sources']['TCC'][sid] = l_tancritcurves[sid]
-        tree['Sources']['Rein'][sid] = l_einsteinradius[sid]
-        for imgs in range(len(l_srcID[sid])):
-            # Tree Branches of Node 3 : Multiple Images
-            tree['Sources']['theta'][sid][imgs] = l_srctheta[sid][imgs]
-            tree['Sources']['delta_t'][sid][imgs] = l_deltat[sid][imgs]
-            tree['Sources']['mu'][sid][imgs] = l_mu[sid][imgs]
-    label = args["simdir"].split('/')[-2].split('_')[2]
-    filename = args["outbase"]+'LM_%s.pickle' % (label)
-    filed = open(filename, 'wb')
-    pickle.dump(tree, filed)
-    filed.close()
-    plt.close(fig)
+            if len(Src_ID) == 0:
+                continue
+            tasks.append({'row' : int(lens['dmrow']), 'll' : ll,
+                          'FOV' : units.fov_arc[ll], 'zl' : lens['zl'],
+                          'snapnum' : int(lens['snapnum']),
+                          'zs' : zs, 'Src_ID' : Src_ID,
+                          'SrcPosSky' : SrcPosSky,
+                          # critical surface density of every source
+                          'sigma_cr' : np.atleast_1d(
+                                  units.sigma_crit(zs, ll))})
+        if args["prescreen"] == 'on':
+            tasks = screen_lenses(tasks, lcdf, dmaps.array, cosmo,
+                                  args["ncells"], store)
+        consts = {'ncells' : args["ncells"], 'cosmo' : cosmo,
+                  'refine' : args["refine"], 'precision' : args["precision"],
+                  'cache' : args["cache"], 'deflections' : args["deflections"],
+                  'tree_args' : args["tree_args"]}
+        if args["planes"] == 'multi':
+            # halos in front of the sources overlapping the lens field
+            fov_arc = units.fov_arc
+            for task in tasks:
+                lens = lcdf.iloc[task['ll']]
+                sep = np.maximum(np.abs(lcdf['sky1'].values - lens['sky1']),
+                                 np.abs(lcdf['sky2'].values - lens['sky2']))
+                indx = np.where((sep < 0.5*(fov_arc + task['FOV'])) &
+                                (lcdf['zl'].values < np.max(task['zs'])) &
+                                np.isfinite(lcdf['dmrow'].values))[0]
+                task['los'] = [{'row' : int(lcdf['dmrow'].values[ii]),
+                                'LC_ID' : int(lcdf.index.values[ii]),
+                                'FOV' : fov_arc[ii],
+                                'zl' : lcdf['zl'].values[ii],
+                                'snapnum' : int(lcdf['snapnum'].values[ii]),
+                                'centre' : [lcdf['sky1'].values[ii] - lens['sky1'],
+                                            lcdf['sky2'].values[ii] - lens['sky2']]}
+                               for ii in indx if ii != task['ll']]
+            func = lens_sources_multiplane
+        else:
+            func = lens_sources
+            if args["cache"] is not None and args["refine"] != 'cascade' \
+                    and args["deflections"] == 'fft':
+                # unit Sigma_cr fields of all maps from batched
+                # transforms, the workers find them in the cache
+                lm_cfuncs.set_precision(args["precision"])
+                lp.fill_cache([dmaps.array[task['row']] for task in tasks],
+                              [task['FOV'] for task in tasks], args["ncells"],
+                              [plane_coord(task['FOV'], args["ncells"])
+                               for task in tasks],
+                              args["cache"], refine=args["refine"])
+
+        # Run through lenses
+        for task, srcs in pool.imap(func, dmaps, tasks, consts):
+            if len(srcs['Src_ID']) == 0:
+                continue
+            ll = task['ll']
+            lens = lcdf.iloc[ll]
+            # Table 1 : Lenses
+            store.append('lenses', {
+                'LC_ID' : [int(lcdf.index.values[ll])],
+                'HF_ID' : [int(lens['HF_ID'])],
+                'snapnum' : [int(lens['snapnum'])],
+                'zl' : [lens['zl']]})
+            # Table 2 : Sources, rows of one lens follow each other
+            ragged = {'TCC' : srcs['TCC'],
+                      # Multiple Images
+                      'theta' : srcs['theta'],
+                      'delta_t' : srcs['delta_t'],
+                      'mu' : srcs['mu']}
+            if args["planes"] == 'multi':
+                ragged['kappa'] = srcs['kappa']
+                ragged['shear'] = srcs['shear']
+            store.append('sources', {
+                'lens' : [store.nrows('lenses')-1]*len(srcs['Src_ID']),
+                'Src_ID' : srcs['Src_ID'],
+                'zs' : srcs['zs'],
+                'beta' : srcs['beta'],
+                'Rein' : srcs['Rein'],  #[arcsec]
+                'Rein_prof' : srcs['Rein_prof']},  #[arcsec]
+                ragged=ragged)
+            rein_curve += srcs['Rein']
+            rein_prof += srcs['Rein_prof']
+            store.flush()
+            print('Save data of lens %d' % ll)
+    store.close()
+    for name, reader in (('density maps', dmreader), ('lightcones', lcreader)):
+        st = reader.stats()
+        print('Read %d files of %s, %.1f MB in %.1f s, waited %.1f s, '
+              'mean queue depth %.2f' % (st['files'], name, st['MB'],
+              st['read_time'], st['wait_time'], st['depth_mean']))
+    # profile against critical curve Einstein radii of all sources
+    agree = lt.einstein_radius_agreement(rein_prof, rein_curve)
+    print('Einstein radii of %d sources, profile/curve - 1: median %f, '
+          '16-84th percentile [%f, %f], %f within 10 per cent' % \
+          (agree['n_both'], agree['median'], agree['p16'], agree['p84'],
+           agree['within_tol']))
 
 
 #args["simdir"]       = '/cosma6/data/dp004/dc-arno1/SZ_project/full_physics/L62_N512_GR_kpc/'
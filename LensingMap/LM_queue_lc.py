@@ -0,0 +1,298 @@
+# File Description:
+#   Lensing of lightcone sources as a resumable work queue, for many
+#   independent jobs (e.g. a SLURM array) instead of one MPI job.
+#     python LM_queue_lc.py build queue.db simdir dmdir lcdir outbase ncells [nsrc_max]
+#   writes the manifest, one task per lens and set of at most nsrc_max of
+#   its sources, with a cost estimate,
+#     python LM_queue_lc.py work queue.db [nproc] [lease] [deflections] [theta]
+#   claims tasks until none are left and writes the results into a store
+#   of its own, LM_<label>_<worker>.h5 (tables as in LM_main_lc.py with
+#   the column 'task' of the queue),
+#     python LM_queue_lc.py merge queue.db
+#   joins the stores of all workers into LM_<label>.h5, every done task
+#   from the store of the worker which completed it, and
+#     python LM_queue_lc.py status queue.db
+#   prints the state of the queue. Workers can be started and killed at
+#   any time, tasks of dead or straggling workers are claimed again once
+#   their lease ran out. Only single lens planes are run.
+#
+from __future__ import division
+import os, sys, glob, socket
+import numpy as np
+from astropy.cosmology import LambdaCDM
+import pandas as pd
+sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/lib/')
+import read_hdf5
+sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/StrongLensing/LensingMap/lib/')
+import lenstools as lt
+import lensstore as ls
+import lenspool
+import prescreen
+import mapreader
+import mapprep
+import taskqueue
+from LM_main_lc import lens_sources
+
+_dm_sets = ['HF_ID', 'LC_ID', 'fov_Mpc']
+_lc_sets = ['HF_ID', 'LC_ID', 'Halo_z', 'VelDisp', 'snapnum', 'FOV', 'M200',
+            'Src_ID', 'Src_z', 'SrcPosSky']
+
+
+def read_cosmology(simdir):
+    s = read_hdf5.snapshot(45, simdir)
+    return LambdaCDM(H0=s.header.hubble*100,
+                     Om0=s.header.omega_m,
+                     Ode0=s.header.omega_l)
+
+
+def lens_table(dmf, lcf):
+    """
+    Lenses of one lightcone file with the row of their density map
+    Input:
+        dmf, lcf[mapreader.MapFile] : density map and lightcone file
+    Output:
+        lcdf[pd.DataFrame] : indexed by LC_ID
+    """
+    dmdf = pd.DataFrame({'LC_ID' : dmf['LC_ID'],
+                         'dmrow' : np.arange(len(dmf['LC_ID']))})
+    dmdf = dmdf.set_index('LC_ID')
+    lcdf = pd.DataFrame({'HF_ID' : lcf['HF_ID'],
+                         'LC_ID' : lcf['LC_ID'],
+                         'zl' : lcf['Halo_z'],
+                         'vrms' : lcf['VelDisp'],
+                         'snapnum' : lcf['snapnum'],
+                         'fov_Mpc' : lcf['FOV'][1]})
+    if 'M200' in lcf:
+        lcdf['M200'] = lcf['M200']  #[Msun/h]
+    else:
+        lcdf['M200'] = np.nan
+    lcdf = lcdf.set_index('LC_ID')
+    lcdf['dmrow'] = dmdf['dmrow']
+    return lcdf
+
+
+def build_manifest(queue, args):
+    """ One task per lens with sources and set of its sources """
+    dmfile = glob.glob(args["dmdir"]+'*.h5')
+    dmfile.sort(key = lambda x: x[-4])
+    lcfile = glob.glob(args["lcdir"]+'*.h5')
+    lcfile.sort(key = lambda x: x[-4])
+    cosmo = read_cosmology(args["simdir"])
+    screen = prescreen.PreScreen(cosmo)
+    for ff in range(len(dmfile)):
+        # the index of the maps only, not the maps
+        dmf = mapreader.read_file(dmfile[ff], _dm_sets)
+        lcf = mapreader.read_file(lcfile[ff], _lc_sets)
+        lcdf = lens_table(dmf, lcf)
+        fov_arc = mapprep.MapUnits(lcdf['fov_Mpc'].values, lcdf['zl'].values,
+                                   cosmo, args["ncells"], hubble=True).fov_arc
+        tasks = []
+        for ll in range(len(lcdf.index.values)):
+            lens = lcdf.iloc[ll]
+            if not np.isfinite(lens['dmrow']):
+                continue
+            zs, Src_ID, SrcPosSky = lt.source_selection(
+                    lcf['Src_ID'], lcf['Src_z'], lcf['SrcPosSky'],
+                    lcdf.index.values[ll])
+            if len(Src_ID) == 0:
+                continue
+            # halos which can not be strong lenses of their sources
+            if not screen.catalogue([lens['vrms']], [lens['M200']/cosmo.h],
+                                    [lens['zl']], [np.max(zs)],
+                                    fov_arc[ll]/args["ncells"])[0][0]:
+                continue
+            for start, stop in taskqueue.source_sets(len(Src_ID),
+                                                     args["nsrc_max"]):
+                tasks.append({'file' : dmfile[ff], 'lcfile' : lcfile[ff],
+                              'row' : int(lens['dmrow']),
+                              'LC_ID' : int(lcdf.index.values[ll]),
+                              'src_start' : start, 'src_stop' : stop,
+                              'cost' : taskqueue.task_cost(args["ncells"],
+                                                           stop - start)})
+        queue.add(tasks)
+        print('%d tasks of %d lenses in %s' % \
+              (len(tasks), len(lcdf.index), dmfile[ff].split('/')[-1]))
+    for key in ['simdir', 'outbase', 'ncells']:
+        queue.set_meta(key, args[key])
+    queue.set_meta('label', args["simdir"].split('/')[-2].split('_')[2])
+
+
+def run_tasks(queue, owner, claimed, files, consts, pool, store):
+    """ Lens the claimed tasks of one density map file """
+    dmf, lcf, lcdf = files
+    # units of all claimed lenses at once
+    lenses = lcdf.loc[[claim['LC_ID'] for claim in claimed]]
+    units = mapprep.MapUnits(lenses['fov_Mpc'].values, lenses['zl'].values,
+                             consts['cosmo'], consts['ncells'], hubble=True)
+    tasks = []
+    for cc, claim in enumerate(claimed):
+        lens = lenses.iloc[cc]
+        zs, Src_ID, SrcPosSky = lt.source_selection(
+                lcf['Src_ID'], lcf['Src_z'], lcf['SrcPosSky'],
+                claim['LC_ID'])
+        sel = slice(claim['src_start'], claim['src_stop'])
+        tasks.append({'row' : claim['row'], 'id' : claim['id'],
+                      'LC_ID' : claim['LC_ID'], 'FOV' : units.fov_arc[cc],
+                      'zl' : lens['zl'], 'snapnum' : int(lens['snapnum']),
+                      'zs' : zs[sel], 'Src_ID' : Src_ID[sel],
+                      'SrcPosSky' : SrcPosSky[sel],
+                      'sigma_cr' : np.atleast_1d(
+                              units.sigma_crit(zs[sel], cc))})
+    pending = [task['id'] for task in tasks]
+    for task, srcs in pool.imap(lens_sources, dmf.maps, tasks, consts):
+        pending.remove(task['id'])
+        # results are written only while the task is held, a task
+        # claimed by another worker after the lease ran out is its own
+        if queue.renew([task['id']], owner) == 0:
+            queue.renew(pending, owner)
+            continue
+        lens = lcdf.loc[task['LC_ID']]
+        if len(srcs['Src_ID']) > 0:
+            store.append('lenses', {
+                'task' : [task['id']],
+                'LC_ID' : [task['LC_ID']],
+                'HF_ID' : [int(lens['HF_ID'])],
+                'snapnum' : [int(lens['snapnum'])],
+                'zl' : [lens['zl']]})
+            store.append('sources', {
+                'lens' : [store.nrows('lenses')-1]*len(srcs['Src_ID']),
+                'Src_ID' : srcs['Src_ID'],
+                'zs' : srcs['zs'],
+                'beta' : srcs['beta'],
+                'Rein' : srcs['Rein'],  #[arcsec]
+                'Rein_prof' : srcs['Rein_prof']},  #[arcsec]
+                ragged={'TCC' : srcs['TCC'],
+                        'theta' : srcs['theta'],
+                        'delta_t' : srcs['delta_t'],
+                        'mu' : srcs['mu']})
+        store.flush()
+        # results are on disk before the task is marked done
+        queue.complete([task['id']], owner)
+        queue.renew(pending, owner)
+
+
+def work(queue, args):
+    """ Claim and run tasks until the queue is empty """
+    meta = queue.meta()
+    owner = '%s_%s_%d' % (os.environ.get('SLURM_ARRAY_TASK_ID', 'x'),
+                          socket.gethostname(), os.getpid())
+    cosmo = read_cosmology(meta['simdir'])
+    consts = {'ncells' : meta['ncells'], 'cosmo' : cosmo,
+              'refine' : 'centre', 'precision' : 'double', 'cache' : None,
+              'deflections' : args["deflections"],
+              'tree_args' : args["tree_args"]}
+    pool = lenspool.LensPool(args["nproc"])
+    filename = meta['outbase']+'LM_%s_%s.h5' % (meta['label'], owner)
+    store = ls.LensStore(filename, 'a')
+    files = {}
+    while True:
+        # a few tasks per process, most expensive first
+        claimed = queue.claim(owner, 4*pool.nproc)
+        if len(claimed) == 0:
+            break
+        for name in sorted(set(cc['file'] for cc in claimed)):
+            sub = [cc for cc in claimed if cc['file'] == name]
+            if name not in files:
+                # keep the maps of the last file only
+                dmf = mapreader.read_file(name, _dm_sets, 'density_map')
+                lcf = mapreader.read_file(sub[0]['lcfile'], _lc_sets)
+                files = {name : (dmf, lcf, lens_table(dmf, lcf))}
+            try:
+                run_tasks(queue, owner, sub, files[name], consts, pool, store)
+            except Exception as err:
+                queue.fail([cc['id'] for cc in sub], owner, repr(err))
+                raise
+    store.close()
+    print('Worker %s done, queue: %s' % (owner, queue.status()))
+
+
+def merge(queue):
+    """
+    Join the stores of all workers, a task written by several workers
+    (e.g. by a worker which died before marking it done) is taken once,
+    from the store of the worker which completed it
+    """
+    meta = queue.meta()
+    prefix = meta['outbase']+'LM_%s_' % meta['label']
+    owners = queue.owners('done')
+    merged = set()
+    out = ls.LensStore(meta['outbase']+'LM_%s.h5' % meta['label'], 'w')
+    for filename in sorted(glob.glob(prefix+'*.h5')):
+        owner = filename[len(prefix):-len('.h5')]
+        with ls.LensStore(filename, 'r') as store:
+            if 'lenses' not in store.tables():
+                continue
+            lenses = store.read('lenses')
+            keep = [ll for ll, tt in enumerate(lenses['task'])
+                    if owners.get(tt) == owner and tt not in merged]
+            if len(keep) == 0:
+                continue
+            merged.update(lenses['task'][keep])
+            out.append('lenses', dict((name, lenses[name][keep])
+                                      for name in lenses))
+            # sources of the kept lenses, pointing to their new rows
+            sources = store.read('sources')
+            first = out.nrows('lenses') - len(keep)
+            newrow = dict((ll, first + kk) for kk, ll in enumerate(keep))
+            rows = [ss for ss, ll in enumerate(sources['lens'])
+                    if ll in newrow]
+            columns, ragged = {}, {}
+            for name in sources:
+                if store.is_ragged('sources', name):
+                    ragged[name] = [sources[name][ss] for ss in rows]
+                elif name == 'lens':
+                    columns[name] = [newrow[ll] for ll in
+                                     sources['lens'][rows]]
+                else:
+                    columns[name] = sources[name][rows]
+            out.append('sources', columns, ragged=ragged)
+    out.close()
+    print('Merged %d of %d done tasks' % (len(merged), len(owners)))
+
+
+def lensing_queue():
+    args = {}
+    command = sys.argv[1]
+    queue = taskqueue.TaskQueue(sys.argv[2])
+    if command == 'build':
+        args["simdir"]       = sys.argv[3]
+        args["dmdir"]        = sys.argv[4]
+        args["lcdir"]        = sys.argv[5]
+        args["outbase"]      = sys.argv[6]
+        args["ncells"]       = int(sys.argv[7])
+        # largest number of sources of one task
+        if len(sys.argv) > 8:
+            args["nsrc_max"] = int(sys.argv[8])
+        else:
+            args["nsrc_max"] = 50
+        build_manifest(queue, args)
+    elif command == 'work':
+        # number of processes, default all cores of the node
+        if len(sys.argv) > 3:
+            args["nproc"]    = int(sys.argv[3])
+        else:
+            args["nproc"]    = None
+        # time after which tasks of a worker are handed out again [s]
+        if len(sys.argv) > 4:
+            queue.lease      = float(sys.argv[4])
+        # deflections, 'fft' or Barnes-Hut 'tree', and the opening angle
+        # of the tree
+        if len(sys.argv) > 5:
+            args["deflections"]  = sys.argv[5]
+        else:
+            args["deflections"]  = 'fft'
+        if len(sys.argv) > 6:
+            args["tree_args"]    = {'theta' : float(sys.argv[6])}
+        else:
+            args["tree_args"]    = {}
+        work(queue, args)
+    elif command == 'merge':
+        merge(queue)
+    elif command != 'status':
+        raise Exception('Dont know this command ->', command)
+    print(queue.status())
+    queue.close()
+
+
+if __name__ == '__main__':
+    lensing_queue()
@@ -0,0 +1,185 @@
+# File Description:
+#   Strong lensing cross-sections of all halos of a lightcone as functions
+#   of source redshift, and the optical depth tau(zs) of the lightcone,
+#   without seeding sources (see lib/crosssection.py).
+#   Tables written: 'lenses' with the cross-sections of every lens on the
+#   source redshift grid, 'optical_depth' with one row per source redshift.
+#
+from __future__ import division
+import os, sys, glob
+import numpy as np
+from astropy.cosmology import LambdaCDM
+import pandas as pd
+sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/lib/')
+import read_hdf5
+sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/StrongLensing/LensingMap/lib/')
+import lm_cfuncs as cf
+import lensplane as lp
+import lensstore as ls
+import lenspool
+import prescreen
+import crosssection as xs
+import mapreader
+import mapprep
+import warnings
+warnings.filterwarnings("ignore", category=RuntimeWarning, append=1)
+os.system("taskset -p 0xff %d" % os.getpid())
+
+# thresholds of the total magnification of the cross-sections
+mu_min = (2., 10.)
+
+
+def lens_cross_sections(dmap, task, consts):
+    """
+    Cross-sections of one lens on the source redshift grid,
+    run by the workers of lenspool.LensPool
+    Input:
+        dmap[np.ndarray] : surface density map, read-only
+        task[dict] : row of the map, FOV [arcsec], zl
+        consts[dict] : ncells, cosmo, zs, nbins
+    Output:
+        see crosssection.cross_section_curves
+    """
+    ncells = consts['ncells']
+    FOV_arc = task['FOV']
+    dsx_arc = FOV_arc/ncells  #[arcsec] pixel size
+    lpv = np.linspace(-(FOV_arc-dsx_arc)/2, (FOV_arc-dsx_arc)/2, ncells)
+    plane = lp.LensPlane(dmap, FOV_arc, ncells, lpv)
+    return xs.cross_section_curves(plane, task['zl'], consts['zs'],
+                                   consts['cosmo'], consts['nbins'], mu_min)
+
+
+def lensing_cross_sections():
+    # Get command line arguments
+    args = {}
+    args["simdir"]       = sys.argv[1]
+    args["dmdir"]        = sys.argv[2]
+    args["lcdir"]        = sys.argv[3]
+    args["outbase"]      = sys.argv[4]
+    args["ncells"]      = int(sys.argv[5])
+    # number of processes, default all cores of the node
+    if len(sys.argv) > 6:
+        args["nproc"]   = int(sys.argv[6])
+    else:
+        args["nproc"]   = None
+    # source redshift grid, highest redshift and number of redshifts
+    if len(sys.argv) > 8:
+        args["zs"]   = np.linspace(0, float(sys.argv[7]),
+                                   int(sys.argv[8]) + 1)[1:]
+    else:
+        args["zs"]   = np.linspace(0, 2., 21)[1:]
+    # half opening angle of the lightcone [deg]
+    if len(sys.argv) > 9:
+        args["apex"]   = float(sys.argv[9])
+    else:
+        args["apex"]   = 0.522
+    # source plane pixels per side
+    args["nbins"] = 512
+
+    # Names of all available Density maps
+    dmfile = glob.glob(args["dmdir"]+'*.h5')
+    dmfile.sort(key = lambda x: x[-4])
+    # Names of all available Lightcones
+    lcfile = glob.glob(args["lcdir"]+'*.h5')
+    lcfile.sort(key = lambda x: x[-4])
+
+    label = args["simdir"].split('/')[-2].split('_')[2]
+    filename = args["outbase"]+'LM_xsection_%s.h5' % (label)
+    store = ls.LensStore(filename, 'w')
+
+    s = read_hdf5.snapshot(45, args["simdir"])
+    # Cosmological Parameters
+    cosmo = LambdaCDM(H0=s.header.hubble*100,
+                      Om0=s.header.omega_m,
+                      Ode0=s.header.omega_l)
+    screen = prescreen.PreScreen(cosmo)
+    consts = {'ncells' : args["ncells"], 'cosmo' : cosmo,
+              'zs' : args["zs"], 'nbins' : args["nbins"]}
+    pool = lenspool.LensPool(args["nproc"])
+    # cross-sections of all lenses
+    sigma = {'sigma2' : [], 'sigma4' : [], 'sigma_mu' : []}
+    # files of the next lightcone are read while the current one is run
+    dmreader = mapreader.MapReader(dmfile, ['HF_ID', 'LC_ID', 'fov_Mpc'],
+                                   maps='density_map')
+    lcreader = mapreader.MapReader(lcfile, ['LC_ID', 'Halo_z', 'VelDisp',
+                                            'snapnum', 'M200'])
+    for ff, (dmf, lcf) in enumerate(zip(dmreader, lcreader)):
+        print('\n')
+        print('------------- \n Reading Files: \n%s\n%s' % \
+                (dmfile[ff].split('/')[-2:], lcfile[ff].split('/')[-2:]))
+        dmdf = pd.DataFrame({'HF_ID' : dmf['HF_ID'],
+                             'LC_ID' : dmf['LC_ID'],
+                             'fov_Mpc' : dmf['fov_Mpc']})
+        dmdf['dmrow'] = np.arange(len(dmdf.index))
+        dmaps = dmf.maps
+
+        lcdf = pd.DataFrame({'LC_ID' : lcf['LC_ID'],
+                             'zl' : lcf['Halo_z'],
+                             'vrms' : lcf['VelDisp'],
+                             'snapnum' : lcf['snapnum']})
+        if 'M200' in lcf:
+            lcdf['M200'] = lcf['M200']  #[Msun/h]
+        else:
+            lcdf['M200'] = np.nan
+        lcdf = pd.merge(dmdf, lcdf, on='LC_ID')
+
+        # Lens tasks, halos which can not be strong lenses for the most
+        # distant sources are skipped
+        units = mapprep.MapUnits(lcdf['fov_Mpc'].values, lcdf['zl'].values,
+                                 cosmo, args["ncells"], hubble=True)
+        FOV_arc = units.fov_arc
+        zsmax = np.full(len(lcdf.index), np.max(args["zs"]))
+        keep = screen.catalogue(lcdf['vrms'].values,
+                                lcdf['M200'].values/cosmo.h,
+                                lcdf['zl'].values, zsmax,
+                                FOV_arc/args["ncells"])[0]
+        keep &= lcdf['zl'].values < zsmax
+        # critical surface density of the most distant sources
+        sigma_cr = np.ones(len(lcdf.index))
+        sigma_cr[keep] = units.sigma_crit(zsmax[keep], keep)
+        tasks = []
+        for ll in np.where(keep)[0]:
+            if not screen.density_map(dmaps.array[lcdf['dmrow'].values[ll]],
+                                      sigma_cr[ll])[0]:
+                continue
+            tasks.append({'row' : int(lcdf['dmrow'].values[ll]), 'll' : ll,
+                          'FOV' : FOV_arc[ll], 'zl' : lcdf['zl'].values[ll]})
+        print('Cross-sections of %d of %d halos' % \
+                (len(tasks), len(lcdf.index)))
+
+        for task, curves in pool.imap(lens_cross_sections, dmaps, tasks,
+                                      consts):
+            lens = lcdf.iloc[task['ll']]
+            store.append('lenses', {
+                'LC_ID' : [int(lens['LC_ID'])],
+                'HF_ID' : [int(lens['HF_ID'])],
+                'snapnum' : [int(lens['snapnum'])],
+                'zl' : [lens['zl']],
+                # [arcsec^2] on the source redshift grid
+                'sigma2' : [curves['sigma2']],
+                'sigma4' : [curves['sigma4']],
+                'sigma_muw' : [curves['sigma_muw']],
+                'sigma_mu' : [curves['sigma_mu']]})
+            for name in sigma:
+                sigma[name].append(curves[name])
+            store.flush()
+
+    # Optical depth of the lightcone
+    tau = {'zs' : args["zs"]}
+    for name in sigma:
+        if len(sigma[name]) == 0:
+            tau[name.replace('sigma', 'tau')] = np.zeros(
+                    (len(args["zs"]),) + ((len(mu_min),)
+                                          if name == 'sigma_mu' else ()))
+        else:
+            tau[name.replace('sigma', 'tau')] = xs.optical_depth(
+                    np.array(sigma[name]), args["apex"])
+    store.append('optical_depth', tau)
+    store.close()
+    for zz in range(len(args["zs"])):
+        print('zs = %.2f : tau(>=2 images) = %e, tau(>=4 images) = %e' % \
+              (args["zs"][zz], tau['tau2'][zz], tau['tau4'][zz]))
+
+
+if __name__ == '__main__':
+    lensing_cross_sections()
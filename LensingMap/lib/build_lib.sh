@@ -13,3 +13,27 @@ cd ..
 cd ./lib_so_lzos/
 ./make_so
 cd ..
+
+cd ./lib_so_contour/
+./make_so
+cd ..
+
+cd ./lib_so_lenseq/
+./make_so
+cd ..
+
+cd ./lib_so_tri_index/
+./make_so
+cd ..
+
+cd ./lib_so_bhtree/
+./make_so
+cd ..
+
+cd ./lib_so_sph_w_omp/
+./make_so
+cd ..
+
+cd ./lib_so_tri_roots/
+./make_so
+cd ..
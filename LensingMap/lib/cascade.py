@@ -0,0 +1,313 @@
+# File Description:
+#   Coarse-to-fine resolution cascade of the lens analysis.
+#   Level 0: the density map is block-averaged by a factor and its
+#            convergence and shear (one small FFT) decide whether det A
+#            comes close to zero anywhere. Most halos stop here.
+#   Level 1: full resolution only within a square window around the
+#            cells that came close, padded by a few coarse cells. The
+#            window map is transformed at full resolution and the
+#            fields of the mass outside of the window are added from
+#            the coarse map with the window cut out (point mass kernels),
+#            which are smooth within the window and can be interpolated.
+#   Level 2: the deflection of the window is refined around the critical
+#            curves (refinement.AdaptiveRefinement) if the tangential
+#            critical curve is resolved by too few pixels.
+#   The level reached, the window and the time spent on every level are
+#   kept in the state of the fields of every source redshift. Sources
+#   outside of the caustics of the last level are singly imaged, at
+#   level 0 all of them.
+#
+from __future__ import division
+import time
+import numpy as np
+import lenstools as lt
+import imagefinder as imf
+import refinement as rfn
+import caustics as cs
+import lm_cfuncs as cf
+
+
+def block_average(field, factor):
+    """ Average of factor x factor blocks of a square map """
+    nc = np.shape(field)[0]//factor
+    return np.reshape(field[:nc*factor, :nc*factor],
+                      (nc, factor, nc, factor)).mean(axis=(1, 3))
+
+
+class Cascade():
+    def __init__(self, sigma, fov_arc, ncells, coord, factor=4, pad=2,
+                 detA_max=0.3, rein_pixels=4, adaptive_args=None):
+        """
+        Input:
+            sigma[np.ndarray] : surface density map [Msun/unit^2]
+            fov_arc[float] : field-of-view [arcsec]
+            ncells[int] : number of cells per side, multiple of factor
+            coord[np.array] : lensing plane axis coordinates [arcsec]
+            factor[int] : downsampling of level 0
+            pad[int] : coarse cells around the window of level 1
+            detA_max[float] : level 0 cells with smaller det A are
+                              analysed at full resolution
+            rein_pixels[float] : Einstein radius in pixels below which
+                                 level 2 refines the critical curves
+            adaptive_args[dict] : keywords of refinement.AdaptiveRefinement
+        """
+        if ncells % factor != 0:
+            raise Exception('Number of cells is no multiple of ->', factor)
+        self.sigma = sigma
+        self.fov_arc = fov_arc
+        self.ncells = ncells
+        self.coord = np.asarray(coord, dtype=np.float64)
+        self.dsx_arc = fov_arc/ncells
+        self.factor = factor
+        self.pad = pad
+        self.detA_max = detA_max
+        self.rein_pixels = rein_pixels
+        self.adaptive_args = adaptive_args or {}
+        # level 0, unit Sigma_cr fields of the coarse map
+        t0 = time.time()
+        self.nc = ncells//factor
+        self.coarse = block_average(sigma, factor)
+        self.coarse_coord = self.coord.reshape(self.nc, factor).mean(axis=1)
+        kappa, shear1, shear2 = cf.call_cal_signals(self.coarse, fov_arc,
+                                                    self.nc)[3:]
+        self.coarse_signals = (kappa, np.hypot(shear1, shear2))
+        self.time_coarse = time.time() - t0
+        self._windows = {}
+        self._fields = {}
+
+    def fields(self, sigma_cr):
+        """
+        Cascade of a source with critical surface density sigma_cr,
+        sources at the same Sigma_cr share one cascade
+        Output:
+            CascadeFields
+        """
+        if sigma_cr not in self._fields:
+            self._fields[sigma_cr] = CascadeFields(self, sigma_cr)
+        return self._fields[sigma_cr]
+
+    def clear(self):
+        """ Drop fields of all source redshifts, windows are kept """
+        self._fields = {}
+
+    def window(self, flagged):
+        """
+        Square window of level 1 around the flagged coarse cells
+        Input:
+            flagged[np.ndarray(bool)] : coarse cells close to det A = 0
+        Output:
+            (i0, j0, m) : first coarse cell and side in coarse cells
+        """
+        ii, jj = np.where(flagged)
+        lo1, hi1 = ii.min() - self.pad, ii.max() + self.pad + 1
+        lo2, hi2 = jj.min() - self.pad, jj.max() + self.pad + 1
+        m = min(max(hi1 - lo1, hi2 - lo2), self.nc)
+        # centre on the flagged cells, shifted into the map
+        i0 = min(max((lo1 + hi1 - m)//2, 0), self.nc - m)
+        j0 = min(max((lo2 + hi2 - m)//2, 0), self.nc - m)
+        return i0, j0, m
+
+    def window_fields(self, win):
+        """
+        Unit Sigma_cr fields at full resolution within a window, built once
+        Output:
+            dict of axis coordinates and deflection, potential and
+            deflection derivative maps of the window
+        """
+        if win not in self._windows:
+            i0, j0, m = win
+            f = self.factor
+            sl1 = slice(i0*f, (i0 + m)*f)
+            sl2 = slice(j0*f, (j0 + m)*f)
+            ax1, ax2 = self.coord[sl1], self.coord[sl2]
+            # mass within the window at full resolution, embedded in zeros
+            # so that the kernels reach across the window diagonal
+            nw = m*f
+            ne = int(np.ceil(0.75*nw))*2
+            off = (ne - nw)//2
+            embed = np.zeros((ne, ne))
+            embed[off:off+nw, off:off+nw] = self.sigma[sl1, sl2]
+            inner = cf.call_cal_signals(embed, ne*self.dsx_arc, ne)
+            names = ['alpha1', 'alpha2', 'phi', 'kappa', 'shear1', 'shear2']
+            wf = dict((name, field[off:off+nw, off:off+nw])
+                      for name, field in zip(names, inner))
+            if m < self.nc:
+                # smooth fields of the mass outside of the window
+                outer = self.coarse.copy()
+                outer[i0:i0+m, j0:j0+m] = 0
+                far = cf.call_cal_far_fields(outer, self.fov_arc, self.nc) + \
+                      cf.call_cal_signals(outer, self.fov_arc, self.nc)[3:]
+                lp2, lp1 = np.meshgrid(ax2, ax1)
+                for name, field in zip(names, far):
+                    if name == 'kappa':
+                        continue
+                    wf[name] = wf[name] + np.reshape(cf.call_interp_points(
+                            field, self.coarse_coord, self.coarse_coord,
+                            lp1, lp2, 3), np.shape(lp1))
+            wf['d11'], wf['d12'], wf['d21'], wf['d22'] = \
+                    lt.spectral_derivatives(wf['kappa'], wf['shear1'],
+                                            wf['shear2'])
+            wf['ax1'], wf['ax2'] = ax1, ax2
+            self._windows[win] = wf
+        return self._windows[win]
+
+
+class CascadeFields():
+    def __init__(self, cascade, sigma_cr):
+        """
+        Runs the cascade of one source redshift up to the level needed
+        """
+        self.cascade = cascade
+        self.sigma_cr = sigma_cr
+        self.scale = 1/sigma_cr
+        self.state = {'level' : 0, 'window' : None,
+                      'time' : [cascade.time_coarse]}
+        self._cache = {}
+        self._run()
+
+    def _run(self):
+        cc = self.cascade
+        # level 0
+        t0 = time.time()
+        kappa, shear = cc.coarse_signals
+        detA = (1 - kappa*self.scale)**2 - (shear*self.scale)**2
+        flagged = detA < cc.detA_max
+        self.state['time'][0] += time.time() - t0
+        if not np.any(flagged):
+            self._einstein = (0, np.array([]), np.array([]), 0)
+            return
+
+        # level 1
+        t0 = time.time()
+        win = cc.window(flagged)
+        wf = cc.window_fields(win)
+        self.state['level'] = 1
+        self.state['window'] = win
+        self.ax1, self.ax2 = wf['ax1'], wf['ax2']
+        self.lp2, self.lp1 = np.meshgrid(wf['ax2'], wf['ax1'])
+        self.alpha1 = wf['alpha1']*self.scale
+        self.alpha2 = wf['alpha2']*self.scale
+        self.phi = wf['phi']*self.scale
+        self.kappa = wf['kappa']*self.scale
+        self.sp1 = self.lp1 - self.alpha1
+        self.sp2 = self.lp2 - self.alpha2
+        self.mu, self.detA, self.lambda_t = lt.jacobian_signals(
+                wf['d11']*self.scale, wf['d12']*self.scale,
+                wf['d21']*self.scale, wf['d22']*self.scale)
+        self._einstein = lt.einstein_radii(self.lp1, self.lp2,
+                                           self.sp1, self.sp2, self.detA,
+                                           self.lambda_t, None, 'med')
+        self.state['time'].append(time.time() - t0)
+        rein = self._einstein[3]
+        if rein == 0 or rein >= cc.rein_pixels*cc.dsx_arc:
+            return
+
+        # level 2
+        t0 = time.time()
+        self.state['level'] = 2
+        derivatives = [wf[dd]*self.scale
+                       for dd in ['d11', 'd12', 'd21', 'd22']]
+        self.adaptive = rfn.AdaptiveRefinement(self.alpha1, self.alpha2,
+                                               wf['ax1'], coord2=wf['ax2'],
+                                               derivatives=derivatives,
+                                               **cc.adaptive_args)
+        self._einstein = self.adaptive.einstein_radii('med')
+        self.state['time'].append(time.time() - t0)
+
+    @property
+    def level(self):
+        return self.state['level']
+
+    def einstein_radii(self, method='med'):
+        """
+        Critical curves, caustics and Einstein radius of the last level
+        Output:
+            Ncrit, curve_crit_tan, caustic, Rein (see lenstools.einstein_radii)
+        """
+        if method == 'med':
+            return self._einstein
+        key = 'einstein_radii_%s' % method
+        if key not in self._cache:
+            if self.level == 2:
+                self._cache[key] = self.adaptive.einstein_radii(method)
+            elif self.level == 1:
+                self._cache[key] = lt.einstein_radii(
+                        self.lp1, self.lp2, self.sp1, self.sp2, self.detA,
+                        self.lambda_t, None, method)
+            else:
+                self._cache[key] = self._einstein
+        return self._cache[key]
+
+    def critical_curves(self):
+        """
+        All critical curves of the last level, none at level 0
+        Output:
+            curves, closed, tangential (see lenstools.critical_curves)
+        """
+        if 'critical_curves' not in self._cache:
+            if self.level == 2:
+                self._cache['critical_curves'] = \
+                        self.adaptive.critical_curves()
+            elif self.level == 1:
+                self._cache['critical_curves'] = lt.critical_curves(
+                        self.lp1, self.lp2, self.detA, self.lambda_t,
+                        self.kappa)
+            else:
+                self._cache['critical_curves'] = \
+                        ([], np.array([], dtype=bool), np.array([], dtype=bool))
+        return self._cache['critical_curves']
+
+    @property
+    def caustic_classifier(self):
+        """
+        Caustic polygons of all critical curves, built once,
+        every source is singly imaged at level 0
+        """
+        if 'caustic_classifier' not in self._cache:
+            curves, closed = self.critical_curves()[:2]
+            if self.level == 0:
+                self._cache['caustic_classifier'] = cs.CausticClassifier(
+                        curves, closed, None, None, None, None)
+            else:
+                self._cache['caustic_classifier'] = cs.CausticClassifier(
+                        curves, closed, self.ax1, self.ax2, self.alpha1,
+                        self.alpha2, 0.25*self.cascade.dsx_arc)
+        return self._cache['caustic_classifier']
+
+    def images(self, beta1, beta2):
+        """
+        Images of many sources within the window,
+        no images without critical curves (level 0)
+        Output:
+            nimgs, theta1, theta2, mu, phi (see lensplane.LensingFields.images)
+        """
+        if self.level == 0:
+            empty = np.array([])
+            return np.zeros(len(beta1), dtype=int), empty, empty, empty, empty
+        if self.level == 2:
+            img_offsets, theta1, theta2, mu = self.adaptive.find_images(
+                    beta1, beta2)
+        else:
+            if 'image_finder' not in self._cache:
+                self._cache['image_finder'] = imf.TriangleImageFinder(
+                        self.lp1, self.lp2, self.sp1, self.sp2)
+            finder = self._cache['image_finder']
+            img_offsets, theta1, theta2, vertices, weights = \
+                    finder.find_images(beta1, beta2)
+            mu = finder.interpolate(self.mu, vertices, weights)
+        phi = cf.call_interp_points(self.phi, self.lp1[:, 0], self.lp2[0, :],
+                                    theta1, theta2, 3)
+        return np.diff(img_offsets), theta1, theta2, mu, phi
+
+    def timedelay_magnification(self, beta, zs, zl, cosmo):
+        """
+        Images of a source at position beta within the window
+        Output:
+            n_imgs, delta_t, mu, theta
+            (see lensplane.LensingFields.timedelay_magnification)
+        """
+        nimgs, theta1, theta2, mu, phi = self.images([beta[0]], [beta[1]])
+        table = lt.image_table(nimgs, theta1, theta2, mu, phi, [beta[0]],
+                               [beta[1]], [zs], zl, cosmo)
+        return len(mu), table['delta_t'], table['mu'], \
+               np.array([theta1, theta2]).T
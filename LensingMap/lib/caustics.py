@@ -0,0 +1,149 @@
+# File Description:
+#   Multiplicity classification of many sources behind one lens without
+#   solving the lens equation. The critical curves are mapped once to
+#   closed caustic polygons on the source plane, whose edges are binned
+#   in horizontal bands. A source is tested against the edges of its band
+#   only: a ray from the source towards +x crosses a caustic an odd number
+#   of times (or winds around it) if the source lies inside, and every
+#   caustic enclosing a source adds two images to the single image of a
+#   non-singular lens. Sources outside of all caustics are singly imaged
+#   and need no image solver.
+#   Caustics of critical curves ending on the map boundary can not be
+#   closed reliably, sources within their bounding box are kept.
+#
+from __future__ import division
+import numpy as np
+import lm_cfuncs as cf
+
+
+class CausticClassifier():
+    def __init__(self, curves, closed, axis1, axis2, alpha1, alpha2,
+                 margin=0., nbands=None):
+        """
+        Input:
+            curves[list] : (N,2) critical curves on the lensing plane
+                           [arcsec] (see lenstools.critical_curves)
+            closed[np.array(bool)] : False for curves ending on the boundary
+            axis1,axis2[np.array] : axis coordinates of the deflection maps
+            alpha1,alpha2[np.ndarray] : deflection maps [arcsec]
+            margin[float] : sources closer to a caustic are kept as
+                            possibly multiply imaged [arcsec]
+            nbands[int] : bands of the edge index, default sqrt(edges)
+        """
+        self.margin = margin
+        self.caustics = []
+        self.open_boxes = []
+        starts, ends, polys = [], [], []
+        for cc in range(len(curves)):
+            if len(curves[cc]) < 2:
+                continue
+            y1, y2 = cf.call_lens_equation(curves[cc][:, 0], curves[cc][:, 1],
+                                           axis1, axis2, alpha1, alpha2)
+            caustic = np.array([y1, y2]).T
+            self.caustics.append(caustic)
+            if not closed[cc]:
+                self.open_boxes.append([np.min(y1) - margin,
+                                        np.max(y1) + margin,
+                                        np.min(y2) - margin,
+                                        np.max(y2) + margin])
+                continue
+            # polygon edges, the last point joined with the first
+            starts.append(caustic)
+            ends.append(np.roll(caustic, -1, axis=0))
+            polys.append(np.full(len(caustic), len(polys)))
+        self.npolys = len(polys)
+        if self.npolys == 0:
+            self.nbands = 0
+            return
+        self.a = np.concatenate(starts)
+        self.b = np.concatenate(ends)
+        self.poly = np.concatenate(polys)
+        # band index of the edges, each in all bands its y-extent overlaps
+        nedges = len(self.a)
+        if nbands is None:
+            nbands = int(np.sqrt(nedges)) + 1
+        self.nbands = nbands
+        lo = np.minimum(self.a[:, 1], self.b[:, 1]) - margin
+        hi = np.maximum(self.a[:, 1], self.b[:, 1]) + margin
+        self.bmin = np.min(lo)
+        self.bsz = (np.max(hi) - self.bmin)*(1 + 1e-9)/nbands
+        blo = self._band(lo)
+        bhi = self._band(hi)
+        counts = bhi - blo + 1
+        first = np.cumsum(counts) - counts
+        self.edges = np.repeat(np.arange(nedges), counts)
+        bands = np.repeat(blo, counts) + np.arange(len(self.edges)) - \
+                np.repeat(first, counts)
+        order = np.argsort(bands, kind='stable')
+        self.edges = self.edges[order]
+        self.offsets = np.zeros(nbands + 1, dtype=int)
+        self.offsets[1:] = np.cumsum(np.bincount(bands, minlength=nbands))
+
+    def _band(self, y2):
+        return np.clip(np.floor((y2 - self.bmin)/self.bsz).astype(int),
+                       0, self.nbands - 1)
+
+    def classify(self, beta1, beta2):
+        """
+        Caustics enclosing every source
+        Input:
+            beta1,beta2[np.array] : source positions [arcsec]
+        Output:
+            ncaustics[np.array(int)] : number of closed caustics enclosing
+                                       the source, 1+2*ncaustics images
+            multiple[np.array(bool)] : source may be multiply imaged,
+                                       inside or within margin of a caustic
+                                       or within the box of an open one
+        """
+        beta1 = np.atleast_1d(np.asarray(beta1, dtype=np.float64))
+        beta2 = np.atleast_1d(np.asarray(beta2, dtype=np.float64))
+        nsrc = len(beta1)
+        ncaustics = np.zeros(nsrc, dtype=int)
+        multiple = np.zeros(nsrc, dtype=bool)
+        for box in self.open_boxes:
+            multiple |= ((beta1 >= box[0]) & (beta1 <= box[1]) &
+                         (beta2 >= box[2]) & (beta2 <= box[3]))
+        if self.npolys == 0:
+            return ncaustics, multiple
+
+        # sources within the y-range of the index, sorted by band
+        inband = np.where((beta2 >= self.bmin) &
+                          (beta2 < self.bmin + self.nbands*self.bsz))[0]
+        band = self._band(beta2[inband])
+        order = np.argsort(band, kind='stable')
+        inband, band = inband[order], band[order]
+        bounds = np.searchsorted(band, np.arange(self.nbands + 1))
+        crossings = np.zeros((nsrc, self.npolys), dtype=int)
+        winding = np.zeros((nsrc, self.npolys), dtype=int)
+        for bb in np.where(np.diff(bounds) > 0)[0]:
+            ee = self.edges[self.offsets[bb]:self.offsets[bb+1]]
+            if len(ee) == 0:
+                continue
+            ss = inband[bounds[bb]:bounds[bb+1]]
+            y1, y2 = beta1[ss, None], beta2[ss, None]
+            a1, a2 = self.a[ee, 0], self.a[ee, 1]
+            b1, b2 = self.b[ee, 0], self.b[ee, 1]
+            # edges crossed by the ray towards +x
+            up = (a2 <= y2) & (b2 > y2)
+            down = (b2 <= y2) & (a2 > y2)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                xc = a1 + (y2 - a2)*(b1 - a1)/(b2 - a2)
+            cross = (up | down) & (xc > y1)
+            pp = np.broadcast_to(self.poly[ee], cross.shape)
+            rows = np.broadcast_to(ss[:, None], cross.shape)
+            np.add.at(crossings, (rows[cross], pp[cross]), 1)
+            np.add.at(winding, (rows[cross], pp[cross]),
+                      np.where(up, 1, -1)[cross])
+            if self.margin > 0:
+                # distance to the edges
+                d1, d2 = b1 - a1, b2 - a2
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    tt = np.clip(((y1 - a1)*d1 + (y2 - a2)*d2)/
+                                 (d1**2 + d2**2), 0, 1)
+                tt = np.where(np.isfinite(tt), tt, 0)
+                dist = np.hypot(a1 + tt*d1 - y1, a2 + tt*d2 - y2)
+                multiple[ss] |= np.any(dist <= self.margin, axis=1)
+        inside = (crossings % 2 == 1) | (winding != 0)
+        ncaustics = np.sum(inside, axis=1)
+        multiple |= ncaustics > 0
+        return ncaustics, multiple
@@ -0,0 +1,96 @@
+# File Description:
+#   Helpers of the ctypes bindings (lm_cfuncs, cfuncs and
+#   LensingPostProc/lib/lpp_cfuncs). The shared libraries are found next
+#   to the binding module instead of under a fixed path and are loaded
+#   once per process. The prototypes only accept C ordered arrays of
+#   their dtype, inputs which already are are handed over without a
+#   copy, and the results can be written into buffers of the caller
+#   (out=), e.g. reused for every source of a lens. The numpy dtype of
+#   a ctypes type is resolved once, numpy takes longer for that than for
+#   copying a small array.
+#   The kernels do not write to their inputs, a view of a read-only map
+#   (lenspool.SharedMaps) is passed as it is.
+#
+from __future__ import division
+import os
+import ctypes as ct
+import numpy as np
+
+_libraries = {}
+_dtypes = {}
+
+
+def lib_dir(module_file):
+    """ Directory of a binding module, with the lib_so_* directories """
+    return os.path.dirname(os.path.abspath(module_file)) + '/'
+
+
+def load_library(path):
+    """ Shared library, loaded once per process """
+    path = os.path.abspath(path)
+    if path not in _libraries:
+        if not os.path.isfile(path):
+            raise Exception('Shared library not built ->', path)
+        _libraries[path] = ct.CDLL(path)
+    return _libraries[path]
+
+
+def as_dtype(dtype):
+    """ numpy dtype of a ctypes or numpy type """
+    try:
+        return _dtypes[dtype]
+    except KeyError:
+        _dtypes[dtype] = np.dtype(dtype)
+        return _dtypes[dtype]
+
+
+def ndpointer(dtype, ndim=None):
+    """
+    Argument type of a C array, numpy caches the type of every dtype and
+    ndim so all prototypes share them
+    """
+    return np.ctypeslib.ndpointer(dtype=as_dtype(dtype), ndim=ndim,
+                                  flags='C_CONTIGUOUS')
+
+
+def as_input(x, dtype, flat=False):
+    """
+    Array handed to a kernel, copied only if x is not C ordered or not
+    of dtype
+    Input:
+        x: array or sequence
+        dtype: ctypes or numpy type
+        flat[bool] : 1D view of the array
+    """
+    x = np.ascontiguousarray(x, dtype=as_dtype(dtype))
+    if flat:
+        x = x.reshape(-1)
+    return x
+
+
+def as_output(out, shape, dtype):
+    """
+    Buffer a kernel writes to, a new zeroed array if out is None, else
+    out after checking and zeroing it
+    """
+    if not isinstance(shape, tuple):
+        shape = (shape,)
+    dtype = as_dtype(dtype)
+    if out is None:
+        return np.zeros(shape, dtype=dtype)
+    if not isinstance(out, np.ndarray) or out.shape != shape or \
+       out.dtype != dtype or not out.flags.c_contiguous or \
+       not out.flags.writeable:
+        raise Exception('Output buffer does not match ->',
+                        (shape, dtype.name))
+    out.fill(0)
+    return out
+
+
+def as_outputs(out, nout, shape, dtype):
+    """ nout buffers of as_output, out is None or a sequence of nout """
+    if out is None:
+        out = [None]*nout
+    elif len(out) != nout:
+        raise Exception('Number of output buffers is not ->', nout)
+    return [as_output(oo, shape, dtype) for oo in out]
@@ -1,22 +1,28 @@
+import sys
+sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/lib/')
+import cosmotable
+
 apr = 206269.43  #radians to arcsec
 
 def Dc(z, cosmo):
-    res = cosmo.comoving_distance(z).value*cosmo.h
+    res = cosmotable.get_table(cosmo).Dc(z)*cosmo.h
     return res
 
 def Da(z, cosmo):
-    res = cosmo.angular_diameter_distance(z).value*cosmo.h #/(1+z)
+    res = cosmotable.get_table(cosmo).Da(z)*cosmo.h #/(1+z)
     return res
 
 def Dc2(z1,z2, cosmo):
-    Dcz1 = (cosmo.comoving_distance(z1).value*cosmo.h)
-    Dcz2 = (cosmo.comoving_distance(z2).value*cosmo.h)
+    table = cosmotable.get_table(cosmo)
+    Dcz1 = (table.Dc(z1)*cosmo.h)
+    Dcz2 = (table.Dc(z2)*cosmo.h)
     res = (Dcz2-Dcz1+1e-8)
     return res
 
 def Da2(z1,z2, cosmo):
-    Dcz1 = (cosmo.angular_diameter_distance(z1).value*cosmo.h)
-    Dcz2 = (cosmo.angular_diameter_distance(z2).value*cosmo.h)
+    table = cosmotable.get_table(cosmo)
+    Dcz1 = (table.Da(z1)*cosmo.h)
+    Dcz2 = (table.Da(z2)*cosmo.h)
     res = (Dcz2-Dcz1+1e-8) #/(1+z2)
     return res
 
@@ -25,28 +31,31 @@ import numpy as np
 import ctypes as ct
 import os
 
-lib_path = "/cosma5/data/dp004/dc-beck3/StrongLensing/LensingMap/lib/"
+import cbind as cb
+
+# lib_so_* next to this file
+lib_path = cb.lib_dir(__file__)
 #---------------------------------------------------------------------------------
-sps = ct.CDLL(lib_path+"lib_so_sph_w_omp/libsphsdens.so")
+sps = cb.load_library(lib_path+"lib_so_sph_w_omp/libsphsdens.so")
 
-sps.cal_sph_sdens_weight.argtypes =[np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_float), \
+sps.cal_sph_sdens_weight.argtypes =[cb.ndpointer(dtype = ct.c_float), \
+                                    cb.ndpointer(dtype = ct.c_float), \
+                                    cb.ndpointer(dtype = ct.c_float), \
+                                    cb.ndpointer(dtype = ct.c_float), \
                                     ct.c_float,ct.c_long,ct.c_float,ct.c_long,ct.c_long, \
                                     ct.c_float,ct.c_float,ct.c_float, \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_float)]
+                                    cb.ndpointer(dtype = ct.c_float), \
+                                    cb.ndpointer(dtype = ct.c_float), \
+                                    cb.ndpointer(dtype = ct.c_float)]
 
 sps.cal_sph_sdens_weight.restype  = ct.c_int
 
 def call_sph_sdens_weight(x1,x2,x3,mpp,Bsz,Ncc):
    
-    x1 = np.array(x1, dtype=ct.c_float)
-    x2 = np.array(x2, dtype=ct.c_float)
-    x3 = np.array(x3, dtype=ct.c_float)
-    mpp = np.array(mpp, dtype=ct.c_float)
+    x1 = cb.as_input(x1, ct.c_float)
+    x2 = cb.as_input(x2, ct.c_float)
+    x3 = cb.as_input(x3, ct.c_float)
+    mpp = cb.as_input(mpp, ct.c_float)
     dcl = ct.c_float(Bsz/Ncc)
     Ngb = ct.c_long(32)
     xc1 = ct.c_float(0.0)
@@ -60,23 +69,23 @@ def call_sph_sdens_weight(x1,x2,x3,mpp,Bsz,Ncc):
     sps.cal_sph_sdens_weight(x1,x2,x3,mpp,ct.c_float(Bsz),ct.c_long(Ncc),dcl,Ngb,ct.c_long(Np),xc1,xc2,xc3,posx1,posx2,sdens);
     return sdens
 #---------------------------------------------------------------------------------
-sps.cal_sph_sdens_weight_omp.argtypes =[np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                        np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                        np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                        np.ctypeslib.ndpointer(dtype = ct.c_float), \
+sps.cal_sph_sdens_weight_omp.argtypes =[cb.ndpointer(dtype = ct.c_float), \
+                                        cb.ndpointer(dtype = ct.c_float), \
+                                        cb.ndpointer(dtype = ct.c_float), \
+                                        cb.ndpointer(dtype = ct.c_float), \
                                         ct.c_float,ct.c_long,ct.c_float,ct.c_long,ct.c_long, \
                                         ct.c_float,ct.c_float,ct.c_float, \
-                                        np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                        np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                        np.ctypeslib.ndpointer(dtype = ct.c_float)]
+                                        cb.ndpointer(dtype = ct.c_float), \
+                                        cb.ndpointer(dtype = ct.c_float), \
+                                        cb.ndpointer(dtype = ct.c_float)]
 
 sps.cal_sph_sdens_weight_omp.restype  = ct.c_int
 
 def call_sph_sdens_weight_omp(x1,x2,x3,mpp,Bsz,Nc):
-    x1 = np.array(x1,dtype=ct.c_float)
-    x2 = np.array(x1,dtype=ct.c_float)
-    x3 = np.array(x1,dtype=ct.c_float)
-    mpp = np.array(mpp,dtype=ct.c_float)
+    x1 = cb.as_input(x1, ct.c_float)
+    x2 = cb.as_input(x2, ct.c_float)
+    x3 = cb.as_input(x3, ct.c_float)
+    mpp = cb.as_input(mpp, ct.c_float)
     dsx = ct.c_float(Bsz/Nc)
     Ngb = ct.c_long(32)
     xc1 = ct.c_float(0.0)
@@ -91,48 +100,48 @@ def call_sph_sdens_weight_omp(x1,x2,x3,mpp,Bsz,Nc):
     return sdens
 
 #---------------------------------------------------------------------------------
-gls = ct.CDLL(lib_path+"lib_so_cgls/libglsg.so")
-gls.kappa0_to_alphas.argtypes = [np.ctypeslib.ndpointer(dtype = ct.c_double), \
+gls = cb.load_library(lib_path+"lib_so_cgls/libglsg.so")
+gls.kappa0_to_alphas.argtypes = [cb.ndpointer(dtype = ct.c_double), \
                                  ct.c_int,ct.c_double,\
-                                 np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                 np.ctypeslib.ndpointer(dtype = ct.c_double)]
+                                 cb.ndpointer(dtype = ct.c_double), \
+                                 cb.ndpointer(dtype = ct.c_double)]
 gls.kappa0_to_alphas.restype  = ct.c_void_p
 
 def call_cal_alphas(Kappa, Bsz, Ncc):
-    kappa0 = np.array(Kappa, dtype=ct.c_double)
+    kappa0 = cb.as_input(Kappa, ct.c_double)
     alpha1 = np.array(np.zeros((Ncc,Ncc)), dtype=ct.c_double)
     alpha2 = np.array(np.zeros((Ncc,Ncc)), dtype=ct.c_double)
     gls.kappa0_to_alphas(kappa0, Ncc, Bsz, alpha1, alpha2)
     return alpha1,alpha2
 
-gls.kappa0_to_phi.argtypes = [np.ctypeslib.ndpointer(dtype = ct.c_double), \
+gls.kappa0_to_phi.argtypes = [cb.ndpointer(dtype = ct.c_double), \
                               ct.c_int,ct.c_double,\
-                              np.ctypeslib.ndpointer(dtype = ct.c_double)]
+                              cb.ndpointer(dtype = ct.c_double)]
 gls.kappa0_to_phi.restype  = ct.c_void_p
 
 def call_cal_phi(Kappa, Bsz, Ncc):
-	kappa0 = np.array(Kappa, dtype=ct.c_double)
+	kappa0 = cb.as_input(Kappa, ct.c_double)
 	phi = np.array(np.zeros((Ncc, Ncc)), dtype=ct.c_double)
 	gls.kappa0_to_phi(kappa0, Ncc, Bsz, phi)
 
 	return phi
 
 #--------------------------------------------------------------------
-lzos = ct.CDLL(lib_path+"lib_so_lzos/liblzos.so")
-lzos.lanczos_diff_2_tag.argtypes = [np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_double), \
+lzos = cb.load_library(lib_path+"lib_so_lzos/liblzos.so")
+lzos.lanczos_diff_2_tag.argtypes = [cb.ndpointer(dtype = ct.c_double), \
+                                    cb.ndpointer(dtype = ct.c_double), \
+                                    cb.ndpointer(dtype = ct.c_double), \
+                                    cb.ndpointer(dtype = ct.c_double), \
+                                    cb.ndpointer(dtype = ct.c_double), \
+                                    cb.ndpointer(dtype = ct.c_double), \
                                     ct.c_double,ct.c_int,ct.c_int]
 lzos.lanczos_diff_2_tag.restype  = ct.c_void_p
 
 def call_lanczos_derivative(alpha1,alpha2,Bsz,Ncc):
     dif_tag = ct.c_int(2)
     dcl = ct.c_double(Bsz/Ncc)
-    m1 = np.array(alpha1,dtype=ct.c_double)
-    m2 = np.array(alpha2,dtype=ct.c_double)
+    m1 = cb.as_input(alpha1, ct.c_double)
+    m2 = cb.as_input(alpha2, ct.c_double)
     m11 = np.zeros((Ncc, Ncc))
     m12 = np.zeros((Ncc, Ncc))
     m21 = np.zeros((Ncc, Ncc))
@@ -144,24 +153,24 @@ def call_lanczos_derivative(alpha1,alpha2,Bsz,Ncc):
 
 #---------------------------------------------------------------------------------
 # Cloud-in-Cell scheme
-rtf = ct.CDLL(lib_path + "lib_so_icic/librtf.so")
+rtf = cb.load_library(lib_path+"lib_so_icic/librtf.so")
 
-rtf.inverse_cic.argtypes = [np.ctypeslib.ndpointer(dtype =  ct.c_double),\
-                            np.ctypeslib.ndpointer(dtype =  ct.c_double), \
-                            np.ctypeslib.ndpointer(dtype =  ct.c_double), \
+rtf.inverse_cic.argtypes = [cb.ndpointer(dtype =  ct.c_double),\
+                            cb.ndpointer(dtype =  ct.c_double), \
+                            cb.ndpointer(dtype =  ct.c_double), \
                             ct.c_double,ct.c_double,ct.c_double, \
                             ct.c_int,ct.c_int,ct.c_int,ct.c_int,\
-                            np.ctypeslib.ndpointer(dtype = ct.c_double)]
+                            cb.ndpointer(dtype = ct.c_double)]
 rtf.inverse_cic.restype  = ct.c_void_p
 
 def call_inverse_cic(img_in, yc1, yc2, yi1, yi2, dsi):
     ny1,ny2 = np.shape(img_in)
     nx1,nx2 = np.shape(yi1)
 
-    img_in = np.array(img_in,dtype=ct.c_double)
+    img_in = cb.as_input(img_in, ct.c_double)
 
-    yi1 = np.array(yi1,dtype=ct.c_double)
-    yi2 = np.array(yi2,dtype=ct.c_double)
+    yi1 = cb.as_input(yi1, ct.c_double)
+    yi2 = cb.as_input(yi2, ct.c_double)
 
     img_out = np.zeros((nx1,nx2))
 
@@ -169,38 +178,38 @@ def call_inverse_cic(img_in, yc1, yc2, yi1, yi2, dsi):
     return img_out.reshape((nx1,nx2))
 
 #--------------------------------------------------------------------
-rtf.inverse_cic_omp.argtypes = [np.ctypeslib.ndpointer(dtype =  ct.c_double),\
-                                np.ctypeslib.ndpointer(dtype =  ct.c_double), \
-                                np.ctypeslib.ndpointer(dtype =  ct.c_double), \
+rtf.inverse_cic_omp.argtypes = [cb.ndpointer(dtype =  ct.c_double),\
+                                cb.ndpointer(dtype =  ct.c_double), \
+                                cb.ndpointer(dtype =  ct.c_double), \
                                 ct.c_double,ct.c_double,ct.c_double, \
                                 ct.c_int,ct.c_int,ct.c_int,ct.c_int,\
-                                np.ctypeslib.ndpointer(dtype = ct.c_double)]
+                                cb.ndpointer(dtype = ct.c_double)]
 rtf.inverse_cic_omp.restype  = ct.c_void_p
 
 def call_inverse_cic_omp(img_in,yc1,yc2,yi1,yi2,dsi):
     ny1,ny2 = np.shape(img_in)
     nx1,nx2 = np.shape(yi1)
-    img_in = np.array(img_in,dtype=ct.c_double)
-    yi1 = np.array(yi1,dtype=ct.c_double)
-    yi2 = np.array(yi2,dtype=ct.c_double)
+    img_in = cb.as_input(img_in, ct.c_double)
+    yi1 = cb.as_input(yi1, ct.c_double)
+    yi2 = cb.as_input(yi2, ct.c_double)
     img_out = np.zeros((nx1,nx2))
 
     rtf.inverse_cic_omp(img_in,yi1,yi2,ct.c_double(yc1),ct.c_double(yc2),ct.c_double(dsi),ct.c_int(ny1),ct.c_int(ny2),ct.c_int(nx1),ct.c_int(nx2),img_out)
     return img_out.reshape((nx1,nx2))
 
 #--------------------------------------------------------------------
-rtf.inverse_cic_single.argtypes = [np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                   np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                   np.ctypeslib.ndpointer(dtype = ct.c_float), \
+rtf.inverse_cic_single.argtypes = [cb.ndpointer(dtype = ct.c_float), \
+                                   cb.ndpointer(dtype = ct.c_float), \
+                                   cb.ndpointer(dtype = ct.c_float), \
                                    ct.c_float,ct.c_float,ct.c_float,ct.c_int,ct.c_int,ct.c_int, \
-                                   np.ctypeslib.ndpointer(dtype = ct.c_float)]
+                                   cb.ndpointer(dtype = ct.c_float)]
 rtf.inverse_cic_single.restype  = ct.c_void_p
 
 def call_inverse_cic_single(img_in,yc1,yc2,yi1,yi2,dsi):
     ny1,ny2 = np.shape(img_in)
-    img_in = np.array(img_in,dtype=ct.c_float)
-    yi1 = np.array(yi1,dtype=ct.c_float)
-    yi2 = np.array(yi2,dtype=ct.c_float)
+    img_in = cb.as_input(img_in, ct.c_float)
+    yi1 = cb.as_input(yi1, ct.c_float)
+    yi2 = cb.as_input(yi2, ct.c_float)
     nlimgs = len(yi1)
     img_out = np.zeros((nlimgs),dtype=ct.c_float)
 
@@ -208,11 +217,11 @@ def call_inverse_cic_single(img_in,yc1,yc2,yi1,yi2,dsi):
     return img_out
 
 #--------------------------------------------------------------------
-rtf.inverse_cic_omp_single.argtypes = [np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                       np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                       np.ctypeslib.ndpointer(dtype = ct.c_float), \
+rtf.inverse_cic_omp_single.argtypes = [cb.ndpointer(dtype = ct.c_float), \
+                                       cb.ndpointer(dtype = ct.c_float), \
+                                       cb.ndpointer(dtype = ct.c_float), \
                                        ct.c_float,ct.c_float,ct.c_float,ct.c_int,ct.c_int,ct.c_int, \
-                                       np.ctypeslib.ndpointer(dtype = ct.c_float)]
+                                       cb.ndpointer(dtype = ct.c_float)]
 rtf.inverse_cic_omp_single.restype  = ct.c_void_p
 
 def call_inverse_cic_single_omp(img_in,yc1,yc2,yi1,yi2,dsi):
@@ -224,9 +233,9 @@ def call_inverse_cic_single_omp(img_in,yc1,yc2,yi1,yi2,dsi):
         dsi: pixel size on grid
     """
     ny1,ny2 = np.shape(img_in)
-    img_in = np.array(img_in,dtype=ct.c_float)
-    yi1 = np.array(yi1,dtype=ct.c_float)
-    yi2 = np.array(yi2,dtype=ct.c_float)
+    img_in = cb.as_input(img_in, ct.c_float)
+    yi1 = cb.as_input(yi1, ct.c_float)
+    yi2 = cb.as_input(yi2, ct.c_float)
     nlimgs = len(yi1)
     img_out = np.zeros((nlimgs),dtype=ct.c_float)
 
@@ -234,22 +243,22 @@ def call_inverse_cic_single_omp(img_in,yc1,yc2,yi1,yi2,dsi):
     return img_out
 
 #--------------------------------------------------------------------
-tri = ct.CDLL(lib_path+"lib_so_tri_roots/libtri.so")
-tri.mapping_triangles.argtypes = [np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                  np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                  np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                  np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                  np.ctypeslib.ndpointer(dtype = ct.c_double), \
+tri = cb.load_library(lib_path+"lib_so_tri_roots/libtri.so")
+tri.mapping_triangles.argtypes = [cb.ndpointer(dtype = ct.c_double), \
+                                  cb.ndpointer(dtype = ct.c_double), \
+                                  cb.ndpointer(dtype = ct.c_double), \
+                                  cb.ndpointer(dtype = ct.c_double), \
+                                  cb.ndpointer(dtype = ct.c_double), \
                                   ct.c_int, \
-                                  np.ctypeslib.ndpointer(dtype = ct.c_double)]
+                                  cb.ndpointer(dtype = ct.c_double)]
 tri.mapping_triangles.restype  = ct.c_void_p
 
 def call_mapping_triangles(pys, xi1, xi2, yi1, yi2):
-    pys_in = np.array(pys, dtype=ct.c_double)
-    xi1_in = np.array(xi1, dtype=ct.c_double)
-    xi2_in = np.array(xi2, dtype=ct.c_double)
-    yi1_in = np.array(yi1, dtype=ct.c_double)
-    yi2_in = np.array(yi2, dtype=ct.c_double)
+    pys_in = cb.as_input(pys, ct.c_double)
+    xi1_in = cb.as_input(xi1, ct.c_double)
+    xi2_in = cb.as_input(xi2, ct.c_double)
+    yi1_in = cb.as_input(yi1, ct.c_double)
+    yi2_in = cb.as_input(yi2, ct.c_double)
     nc_in = ct.c_int(np.shape(xi1)[0])
 
     # assuming there will not be more than 40 lensed images
@@ -0,0 +1,141 @@
+# File Description:
+#   Strong lensing cross-sections and optical depth without sampling
+#   sources. The triangles of the lensing plane grid are mapped to the
+#   source plane and rasterised onto a source plane grid in one compiled
+#   pass (lm_cfuncs.call_tri_raster), which gives the number of images
+#   and their total magnification for a source at every pixel. The areas
+#   of multiplicity >= 2 and >= 4, and of total magnification above a
+#   threshold, follow for every source redshift from the unit Sigma_cr
+#   fields of a lensplane.LensPlane (or cascade.Cascade).
+#   Summed over the lenses of a lightcone and divided by its solid angle
+#   they give the optical depth tau(zs), from which lensing rates follow
+#   without Monte Carlo realisations of sources.
+#
+from __future__ import division
+import sys
+import numpy as np
+from astropy import units as u
+sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/lib/')
+import cosmotable
+import lm_cfuncs as cf
+
+
+def source_grid(sp1, sp2, detA, nbins, pad=0.05):
+    """
+    Source plane grid around the multiply imaged region. Every source with
+    more than one image of a non-singular lens has an image of negative
+    parity, so the region is covered by the rays with det A < 0.
+    Input:
+        sp1,sp2[np.ndarray] : source plane coordinates of light rays [arcsec]
+        detA[np.ndarray] : det A of the rays
+        nbins[int] : pixels per side
+        pad[float] : margin, fraction of the side
+    Output:
+        bmin1, bmin2, bsz : lower corner and pixel size [arcsec],
+                            None if no ray has det A < 0
+    """
+    neg = detA < 0
+    if not np.any(neg):
+        return None
+    lo1, hi1 = np.min(sp1[neg]), np.max(sp1[neg])
+    lo2, hi2 = np.min(sp2[neg]), np.max(sp2[neg])
+    side = max(hi1 - lo1, hi2 - lo2)*(1 + 2*pad)
+    bsz = side/nbins
+    return 0.5*(lo1 + hi1 - side), 0.5*(lo2 + hi2 - side), bsz
+
+
+def cross_sections(lp1, lp2, sp1, sp2, detA, nbins=512, mu_min=(2., 10.)):
+    """
+    Cross-sections of one lens and source redshift
+    Input:
+        lp1,lp2[np.ndarray] : lensing plane coordinates of light rays [arcsec]
+        sp1,sp2[np.ndarray] : source plane coordinates of light rays [arcsec]
+        detA[np.ndarray] : det A of the rays
+        nbins[int] : source plane pixels per side
+        mu_min[list] : thresholds of the total magnification
+    Output:
+        xs[dict] : source plane areas [arcsec^2] with
+            'sigma2', 'sigma4' : at least 2 and 4 images
+            'sigma_mu' : at least 2 images of total magnification
+                         >= mu_min, for every threshold
+            'sigma_muw' : at least 2 images, weighted with the total
+                          magnification (lensing plane area of the images)
+    """
+    xs = {'sigma2' : 0., 'sigma4' : 0., 'sigma_muw' : 0.,
+          'sigma_mu' : np.zeros(len(mu_min))}
+    grid = source_grid(sp1, sp2, detA, nbins)
+    if grid is None:
+        return xs
+    bmin1, bmin2, bsz = grid
+    mult, mu_tot = cf.call_tri_raster(lp1, lp2, sp1, sp2, nbins, nbins,
+                                      bmin1, bmin2, bsz, bsz)
+    multi = mult >= 2
+    xs['sigma2'] = np.sum(multi)*bsz**2
+    xs['sigma4'] = np.sum(mult >= 4)*bsz**2
+    xs['sigma_muw'] = np.sum(mu_tot[multi])*bsz**2
+    xs['sigma_mu'] = np.array([np.sum(mu_tot[multi] >= mm)
+                               for mm in mu_min])*bsz**2
+    return xs
+
+
+def cross_section_curves(plane, zl, zs, cosmo, nbins=512, mu_min=(2., 10.)):
+    """
+    Cross-sections of one lens as functions of source redshift, all
+    redshifts rescale the same unit Sigma_cr fields
+    Input:
+        plane[lensplane.LensPlane] : or cascade.Cascade
+        zl[float] : lens redshift
+        zs[np.array] : source redshifts
+    Output:
+        curves[dict] : cross_sections of every source redshift,
+                       'sigma2', 'sigma4', 'sigma_muw' of shape (nzs,) and
+                       'sigma_mu' of shape (nzs, len(mu_min)) [arcsec^2],
+                       zero for sources in front of the lens,
+                       the fields of the plane are dropped
+    """
+    zs = np.atleast_1d(zs)
+    curves = {'sigma2' : np.zeros(len(zs)), 'sigma4' : np.zeros(len(zs)),
+              'sigma_muw' : np.zeros(len(zs)),
+              'sigma_mu' : np.zeros((len(zs), len(mu_min)))}
+    table = cosmotable.get_table(cosmo)
+    for zz in np.where(zs > zl)[0]:
+        fields = plane.fields(table.sigma_crit(zl, zs[zz]))
+        if getattr(fields, 'level', 1) == 0:
+            # cascade without critical curves
+            continue
+        if hasattr(fields, 'lp1'):
+            lp1, lp2 = fields.lp1, fields.lp2
+        else:
+            lp1, lp2 = plane.lp1, plane.lp2
+        xs = cross_sections(lp1, lp2, fields.sp1, fields.sp2, fields.detA,
+                            nbins, mu_min)
+        for name in curves:
+            curves[name][zz] = xs[name]
+        # only the areas are kept
+        plane.clear()
+    return curves
+
+
+def cone_solid_angle(apex):
+    """
+    Solid angle of a lightcone
+    Input:
+        apex[float] : half opening angle [deg] (see LightCone/LC_create.py)
+    Output:
+        [arcsec^2]
+    """
+    omega = 2*np.pi*(1 - np.cos(np.deg2rad(apex)))
+    return omega*(1*u.rad).to_value('arcsec')**2
+
+
+def optical_depth(sigma, apex=0.522):
+    """
+    Optical depth of the lenses of a lightcone, lenses do not overlap
+    Input:
+        sigma[np.ndarray] : (nlenses, nzs, ...) cross-sections [arcsec^2]
+        apex[float] : half opening angle of the lightcone [deg]
+    Output:
+        tau[np.ndarray] : (nzs, ...) fraction of the sky of sources at zs
+                          which is strongly lensed
+    """
+    return np.sum(sigma, axis=0)/cone_solid_angle(apex)
@@ -0,0 +1,59 @@
+# File Description:
+#   Image finder for many sources behind one lens. The triangles of the
+#   lensing plane grid are mapped to the source plane and binned once on
+#   a uniform grid, so that every source is only tested against the few
+#   triangles of its own bin instead of all triangles of the map.
+#
+from __future__ import division
+import numpy as np
+import lm_cfuncs as cf
+
+
+class TriangleImageFinder():
+    def __init__(self, lp1, lp2, sp1, sp2, nbins=None):
+        """
+        Input:
+            lp1,lp2[np.ndarray] : lensing plane x,y-coordinates [arcsec]
+            sp1,sp2[np.ndarray] : source plane x,y-coordinates [arcsec]
+            nbins[int] : bins per side of the source plane index,
+                         default is one bin per grid cell
+        """
+        self.lp1 = np.array(lp1, dtype=np.float64)
+        self.lp2 = np.array(lp2, dtype=np.float64)
+        self.sp1 = np.array(sp1, dtype=np.float64)
+        self.sp2 = np.array(sp2, dtype=np.float64)
+        if nbins is None:
+            nbins = max(np.shape(sp1)) - 1
+        self.nb1 = self.nb2 = int(nbins)
+        self.bmin1 = np.min(self.sp1)
+        self.bmin2 = np.min(self.sp2)
+        # widen bins slightly so the upper edge falls into the last bin
+        self.bsz1 = (np.max(self.sp1) - self.bmin1)*(1 + 1e-9)/self.nb1
+        self.bsz2 = (np.max(self.sp2) - self.bmin2)*(1 + 1e-9)/self.nb2
+        self.offsets, self.tris = cf.call_tri_index_build(
+                self.sp1, self.sp2, self.nb1, self.nb2,
+                self.bmin1, self.bmin2, self.bsz1, self.bsz2)
+
+    def find_images(self, beta1, beta2):
+        """
+        Images of all sources
+        Input:
+            beta1,beta2[np.array] : source positions [arcsec]
+        Output:
+            img_offsets[np.array] : images of source s are
+                                    [img_offsets[s]:img_offsets[s+1]]
+            theta1,theta2[np.array] : image positions [arcsec]
+            vertices[np.ndarray] : (nimgs,3) flat grid indices of the
+                                   triangle containing each image
+            weights[np.ndarray] : (nimgs,3) barycentric weights
+        """
+        return cf.call_tri_index_query(
+                beta1, beta2, self.lp1, self.lp2, self.sp1, self.sp2,
+                self.nb1, self.nb2, self.bmin1, self.bmin2,
+                self.bsz1, self.bsz2, self.offsets, self.tris)
+
+    def interpolate(self, field, vertices, weights):
+        """
+        Values of a lensing plane map (e.g. mu, phi) at the images
+        """
+        return np.sum(np.ravel(field)[vertices]*weights, axis=1)
@@ -0,0 +1,159 @@
+# File Description:
+#   Content-addressed cache of the lensing artifacts of a halo.
+#   An entry is a set of arrays (deflection, potential, det A, critical
+#   curves, ...) stored as one .npz file named by the hash of everything
+#   it depends on: the bytes of the density map, the settings (FOV,
+#   redshifts or Sigma_cr, resolution, ...) and the version of the code,
+#   a hash of the python and C sources of this library. A change to any
+#   of them gives a new key, so entries are never stale.
+#   Entries are written atomically (several workers may share a cache)
+#   and the least recently used ones are evicted when the cache exceeds
+#   its size budget.
+#
+from __future__ import division
+import os, glob
+import hashlib
+import numpy as np
+
+_code_version = None
+
+
+def code_version():
+    """ Hash of the python and C sources of the lensing library """
+    global _code_version
+    if _code_version is None:
+        libdir = os.path.dirname(os.path.abspath(__file__))
+        files = sorted(glob.glob(os.path.join(libdir, '*.py')) +
+                       glob.glob(os.path.join(libdir, 'lib_so_*', '*.[ch]')))
+        sha = hashlib.sha1()
+        for ff in files:
+            sha.update(os.path.relpath(ff, libdir).encode())
+            with open(ff, 'rb') as fp:
+                sha.update(fp.read())
+        _code_version = sha.hexdigest()
+    return _code_version
+
+
+class LensCache():
+    def __init__(self, cachedir, budget=20.):
+        """
+        Input:
+            cachedir[str] : directory of the cache entries
+            budget[float] : size of the cache [GB]
+        """
+        self.cachedir = cachedir
+        self.budget = int(budget*1024**3)
+        if not os.path.isdir(cachedir):
+            try:
+                os.makedirs(cachedir)
+            except OSError:
+                # created by another worker
+                pass
+
+    def key(self, array=None, **settings):
+        """
+        Key of an entry
+        Input:
+            array[np.ndarray] : density map, None if only settings matter
+            settings : values the entry depends on, including keys of
+                       other entries
+        Output:
+            key[str]
+        """
+        sha = hashlib.sha1(code_version().encode())
+        if array is not None:
+            array = np.ascontiguousarray(array)
+            sha.update(('%s%s' % (array.dtype.str, array.shape)).encode())
+            sha.update(array.view(np.uint8))
+        for name in sorted(settings):
+            value = settings[name]
+            if isinstance(value, np.ndarray):
+                sha.update(name.encode())
+                sha.update(np.ascontiguousarray(value).view(np.uint8))
+            else:
+                sha.update(('%s=%r;' % (name, value)).encode())
+        return sha.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cachedir, key + '.npz')
+
+    def get(self, key):
+        """
+        Output:
+            dict of arrays of the entry, None if not cached
+        """
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                arrays = dict((name, npz[name]) for name in npz.files)
+            # least recently used ones are evicted first
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return arrays
+
+    def put(self, key, arrays):
+        """
+        Store the dict of arrays of an entry and evict old ones
+        """
+        path = self._path(key)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as fp:
+            np.savez(fp, **arrays)
+        os.rename(tmp, path)
+        self.evict()
+
+    def contains(self, key):
+        """ True if the entry of key is cached """
+        return os.path.isfile(self._path(key))
+
+    def cached(self, key, func):
+        """
+        Entry of key, computed with func() (returning a dict of arrays)
+        and stored if not cached
+        """
+        arrays = self.get(key)
+        if arrays is None:
+            arrays = func()
+            self.put(key, arrays)
+        return arrays
+
+    def entries(self):
+        """
+        Output:
+            list of (last use, size [bytes], path) of all entries
+        """
+        entries = []
+        for path in glob.glob(os.path.join(self.cachedir, '*.npz')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def size(self):
+        """ Size of all entries [bytes] """
+        return sum(ee[1] for ee in self.entries())
+
+    def evict(self):
+        """ Remove the least recently used entries beyond the budget """
+        entries = sorted(self.entries())
+        total = sum(ee[1] for ee in entries)
+        for mtime, size, path in entries:
+            if total <= self.budget:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # removed by another worker
+                pass
+            total -= size
+
+    def clear(self):
+        """ Remove all entries """
+        for mtime, size, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
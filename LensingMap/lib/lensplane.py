@@ -0,0 +1,529 @@
+# File Description:
+#   Lens plane of a single surface density map. The deflection, potential
+#   and their derivatives are computed once for Sigma_cr = 1 (by FFT or a
+#   Barnes-Hut tree) and rescaled for every source redshift; detA, mu,
+#   critical curves and images are evaluated per source on request, on
+#   the native grid or on adaptively refined patches. lens_planes builds
+#   the planes of a stack of maps from one batched transform.
+#
+from __future__ import division
+import time
+import numpy as np
+import lenstools as lt
+import imagefinder as imf
+import refinement as rfn
+import caustics as cs
+import treelens as tl
+import lm_cfuncs as cf
+
+
+class LensPlane():
+    def __init__(self, sigma, fov_arc, ncells, coord, refine='centre',
+                 adaptive_args=None, derivatives='fd', ksigma=0.,
+                 cache=None, unit_fields=None, deflections='fft',
+                 tree_args=None, sigma_unit=1., particles=None):
+        """
+        Input:
+            sigma[np.ndarray] : surface density map [sigma_unit]
+            fov_arc[float] : field-of-view [arcsec]
+            ncells[int] : number of cells per side
+            coord[np.array] : lensing plane axis coordinates [arcsec]
+            refine[str] : 'centre' fixed refinement of the central third,
+                          'adaptive' refinement around critical curves
+            adaptive_args[dict] : keywords of refinement.AdaptiveRefinement
+            derivatives[str] : 'fd' finite differences of the deflection,
+                               'spectral' from the spectrum of sigma
+            ksigma[float] : width of Gaussian smoothing kernel applied to
+                            all 'spectral' maps [arcsec]
+            cache[lenscache.LensCache] : cache of the fields, None for none
+            unit_fields[tuple] : deflection and potential maps of unit
+                                 Sigma_cr computed before (see
+                                 lens_planes), only for derivatives='fd'
+                                 and deflections='fft'
+            deflections[str] : 'fft' zero-padded FFT, 'tree' Barnes-Hut
+                               tree of the pixels, 'particles' Barnes-Hut
+                               tree of SPH particles with their Jacobian
+                               and images polished at their resolution,
+                               only for derivatives='fd'
+            tree_args[dict] : keywords of treelens.TreeLens or
+                              treelens.ParticleLens
+            sigma_unit[float] : unit of sigma [Msun/unit^2]
+            particles[tuple] : x1, x2 [arcsec], mass [sigma_unit arcsec^2]
+                               and hsml [arcsec] of the projected
+                               particles, for deflections='particles'
+        """
+        if refine not in ('centre', 'adaptive'):
+            raise Exception('Dont know this refinement ->', refine)
+        if derivatives not in ('fd', 'spectral'):
+            raise Exception('Dont know these derivatives ->', derivatives)
+        if deflections not in ('fft', 'tree', 'particles') or \
+                (deflections != 'fft' and derivatives != 'fd') or \
+                ((deflections == 'particles') != (particles is not None)):
+            raise Exception('Dont know these deflections ->', deflections)
+        if unit_fields is not None and \
+                (derivatives != 'fd' or deflections != 'fft'):
+            raise Exception('Unit fields are FFT deflections ->', deflections)
+        self.fov_arc = fov_arc
+        self.ncells = ncells
+        self.dsx_arc = fov_arc/ncells  #[arcsec] pixel size
+        self.refine = refine
+        self.adaptive_args = adaptive_args or {}
+        self.derivatives = derivatives
+        self.cache = cache
+        self.unit_fields = unit_fields
+        self.deflections = deflections
+        self.tree_args = tree_args or {}
+        self.sigma_unit = sigma_unit
+        self.particles = particles
+        # unit Sigma_cr fields
+        if cache is None:
+            maps = self._unit_fields(sigma, coord, ksigma)
+        else:
+            self.key = plane_key(cache, sigma, fov_arc, ncells, coord,
+                                 refine, derivatives, ksigma, deflections,
+                                 self.tree_args, sigma_unit, particles)
+            maps = cache.cached(self.key, lambda: self._unit_fields(
+                    sigma, coord, ksigma))
+        for name in ['alpha1', 'alpha2', 'phi', 'd11', 'd12', 'd21', 'd22',
+                     'coord']:
+            setattr(self, name, maps[name])
+        self.unit_fields = None
+        # the potential is not refined, it stays on the input grid
+        self.phi_coord = np.asarray(coord, dtype=np.float64)
+        # lensing plane grid, finer resolution in centre
+        self.lp2, self.lp1 = np.meshgrid(self.coord, self.coord)  #[arcsec]
+        self._fields = {}
+
+    def _unit_fields(self, sigma, coord, ksigma):
+        """
+        Deflection, potential and deflection derivatives of unit Sigma_cr
+        Output:
+            dict of maps and the lensing plane axis coordinates
+        """
+        fov_arc, ncells, unit = self.fov_arc, self.ncells, self.sigma_unit
+        if self.derivatives == 'spectral':
+            alpha1, alpha2, phi, kappa, shear1, shear2 = \
+                    cf.call_cal_signals(sigma, fov_arc, ncells, ksigma, unit)
+            if self.refine == 'centre':
+                (alpha1, alpha2, kappa, shear1, shear2), coord = \
+                        lt.refine_maps([alpha1, alpha2, kappa, shear1, shear2],
+                                       coord)
+            d11, d12, d21, d22 = lt.spectral_derivatives(kappa, shear1, shear2)
+        elif self.deflections == 'particles':
+            # Jacobian of the particles themselves, the potential on the
+            # input grid
+            lens = self.particle_lens(unit)
+            phi = lens.maps(coord)[2]
+            if self.refine == 'centre':
+                coord = lt.refine_coord(coord)
+            alpha1, alpha2, d11, d12, d21, d22 = [
+                    ff for nn, ff in enumerate(lens.maps(coord)) if nn != 2]
+        else:
+            if self.unit_fields is not None:
+                alpha1, alpha2, phi = self.unit_fields
+            elif self.deflections == 'tree':
+                alpha1, alpha2, phi = tl.TreeLens.from_map(
+                        sigma, coord, unit, **self.tree_args).maps(coord)
+            else:
+                alpha1, alpha2 = cf.call_cal_alphas(sigma, fov_arc, ncells,
+                                                    unit)
+                phi = cf.call_cal_phi(sigma, fov_arc, ncells, unit)
+            if self.refine == 'centre':
+                alpha1, alpha2, coord = lt.refine_alphas(alpha1, alpha2, coord)
+            d11, d12, d21, d22 = lt.alpha_derivatives(alpha1, alpha2, coord)
+        return {'alpha1' : alpha1, 'alpha2' : alpha2, 'phi' : phi,
+                'd11' : d11, 'd12' : d12, 'd21' : d21, 'd22' : d22,
+                'coord' : coord}
+
+    def particle_lens(self, scale):
+        """
+        Tree of the particles
+        Input:
+            scale[float] : factor applied to the masses, e.g. 1/Sigma_cr
+        Output:
+            treelens.ParticleLens
+        """
+        x1, x2, mass, hsml = self.particles
+        return tl.ParticleLens(x1, x2, np.asarray(mass)*scale, hsml,
+                               **self.tree_args)
+
+    def fields(self, sigma_cr):
+        """
+        Lensing fields for a source with critical surface density sigma_cr,
+        sources at the same Sigma_cr share one set of fields
+        Input:
+            sigma_cr[float] : critical surface density [Msun/unit^2]
+        Output:
+            LensingFields
+        """
+        if sigma_cr not in self._fields:
+            self._fields[sigma_cr] = LensingFields(self, sigma_cr)
+        return self._fields[sigma_cr]
+
+    def clear(self):
+        """ Drop fields of all source redshifts """
+        self._fields = {}
+
+
+class LensingFields():
+    def __init__(self, plane, sigma_cr):
+        self.plane = plane
+        self.sigma_cr = sigma_cr
+        self.scale = 1/sigma_cr
+        self._cache = {}
+
+    def _get(self, key, func):
+        if key not in self._cache:
+            self._cache[key] = func()
+        return self._cache[key]
+
+    @property
+    def alpha1(self):
+        return self._get('alpha1', lambda: self.plane.alpha1*self.scale)
+
+    @property
+    def alpha2(self):
+        return self._get('alpha2', lambda: self.plane.alpha2*self.scale)
+
+    @property
+    def phi(self):
+        return self._get('phi', lambda: self.plane.phi*self.scale)
+
+    @property
+    def sp1(self):
+        """ Source plane x-coordinates of light rays [arcsec] """
+        return self._get('sp1', lambda: self.plane.lp1 - self.alpha1)
+
+    @property
+    def sp2(self):
+        """ Source plane y-coordinates of light rays [arcsec] """
+        return self._get('sp2', lambda: self.plane.lp2 - self.alpha2)
+
+    @property
+    def kappa(self):
+        """ Convergence on the refined grid """
+        return self._get('kappa', lambda: 0.5*(self.plane.d11 +
+                                               self.plane.d22)*self.scale)
+
+    def _jacobian(self):
+        pl = self.plane
+        mu, detA, lambda_t = lt.jacobian_signals(pl.d11*self.scale,
+                                                 pl.d12*self.scale,
+                                                 pl.d21*self.scale,
+                                                 pl.d22*self.scale)
+        self._cache['mu'] = mu
+        self._cache['detA'] = detA
+        self._cache['lambda_t'] = lambda_t
+
+    @property
+    def mu(self):
+        if 'mu' not in self._cache:
+            self._jacobian()
+        return self._cache['mu']
+
+    @property
+    def detA(self):
+        if 'detA' not in self._cache:
+            self._jacobian()
+        return self._cache['detA']
+
+    @property
+    def lambda_t(self):
+        if 'lambda_t' not in self._cache:
+            self._jacobian()
+        return self._cache['lambda_t']
+
+    @property
+    def adaptive(self):
+        """
+        Patches refined around the critical curves, built once, with
+        derivatives='spectral' the spectral derivatives are resampled
+        """
+        def build():
+            pl = self.plane
+            if pl.derivatives == 'spectral':
+                derivatives = [pl.d11*self.scale, pl.d12*self.scale,
+                               pl.d21*self.scale, pl.d22*self.scale]
+            else:
+                derivatives = None
+            return rfn.AdaptiveRefinement(self.alpha1, self.alpha2, pl.coord,
+                                          derivatives=derivatives,
+                                          **pl.adaptive_args)
+        return self._get('adaptive', build)
+
+    def einstein_radii(self, method='med'):
+        """
+        Critical curves, caustics and Einstein radius, evaluated once
+        Output:
+            Ncrit, curve_crit_tan, caustic, Rein (see lenstools.einstein_radii)
+        """
+        key = 'einstein_radii_%s' % method
+        if key not in self._cache:
+            if self.plane.cache is None:
+                self._cache[key] = self._einstein_radii(method)
+            else:
+                self._cache[key] = self._cached_einstein_radii(method)
+        return self._cache[key]
+
+    def _einstein_radii(self, method):
+        if self.plane.refine == 'adaptive':
+            return self.adaptive.einstein_radii(method)
+        return lt.einstein_radii(self.plane.lp1, self.plane.lp2,
+                                 self.sp1, self.sp2, self.detA,
+                                 self.lambda_t, None, method)
+
+    def _cached_einstein_radii(self, method):
+        """ Critical curves and det A map from the cache of the plane """
+        pl = self.plane
+        key = pl.cache.key(plane=pl.key, sigma_cr=self.sigma_cr, method=method,
+                           adaptive_args=sorted(pl.adaptive_args.items()))
+
+        def compute():
+            Ncrit, curve_crit_tan, caustic, Rein = self._einstein_radii(method)
+            arrays = {'Ncrit' : Ncrit, 'curve_crit_tan' : curve_crit_tan,
+                      'caustic' : caustic, 'Rein' : Rein}
+            if pl.refine != 'adaptive':
+                arrays['detA'] = self.detA
+            return arrays
+
+        arrays = pl.cache.cached(key, compute)
+        if 'detA' in arrays and 'detA' not in self._cache:
+            self._cache['detA'] = arrays['detA']
+        return (int(arrays['Ncrit']), arrays['curve_crit_tan'],
+                arrays['caustic'], float(arrays['Rein']))
+
+    def critical_curves(self):
+        """
+        All critical curves, labelled tangential or radial
+        Output:
+            curves, closed, tangential (see lenstools.critical_curves)
+        """
+        if self.plane.refine == 'adaptive':
+            return self._get('critical_curves',
+                             lambda: self.adaptive.critical_curves())
+        return self._get('critical_curves', lambda: lt.critical_curves(
+                self.plane.lp1, self.plane.lp2, self.detA, self.lambda_t,
+                self.kappa))
+
+    @property
+    def image_finder(self):
+        """ Source plane index of mapped triangles, built once """
+        return self._get('image_finder', lambda: imf.TriangleImageFinder(
+                self.plane.lp1, self.plane.lp2, self.sp1, self.sp2))
+
+    @property
+    def caustic_classifier(self):
+        """ Caustic polygons of all critical curves, built once """
+        def build():
+            curves, closed = self.critical_curves()[:2]
+            return cs.CausticClassifier(curves, closed, self.plane.coord,
+                                        self.plane.coord, self.alpha1,
+                                        self.alpha2, 0.25*self.plane.dsx_arc)
+        return self._get('caustic_classifier', build)
+
+    def find_images(self, beta1, beta2):
+        """
+        Images of many sources
+        Output:
+            img_offsets, theta1, theta2, vertices, weights
+            (see imagefinder.TriangleImageFinder.find_images),
+            with refine='adaptive' img_offsets, theta1, theta2, mu
+            (see refinement.AdaptiveRefinement.find_images)
+        """
+        if self.plane.refine == 'adaptive':
+            return self.adaptive.find_images(beta1, beta2)
+        return self.image_finder.find_images(beta1, beta2)
+
+    def images(self, beta1, beta2):
+        """
+        Images of many sources with the magnification, from the deflection
+        derivatives interpolated at the images, and the lensing potential
+        Output:
+            nimgs[np.array] : number of images of every source
+            theta1, theta2, mu, phi[np.array] : of all images, images of
+                                                one source following each
+                                                other (see lenstools.image_table)
+        """
+        pl = self.plane
+        if pl.deflections == 'particles':
+            # bracketed on the input grid, polished with Newton steps
+            lens = pl.particle_lens(pl.sigma_unit*self.scale)
+            return lens.images(beta1, beta2, pl.phi_coord)
+        if pl.refine == 'adaptive':
+            img_offsets, theta1, theta2, mu = self.adaptive.find_images(
+                    beta1, beta2)
+        else:
+            finder = self.image_finder
+            img_offsets, theta1, theta2, vertices, weights = \
+                    finder.find_images(beta1, beta2)
+            d11, d12, d21, d22 = [finder.interpolate(dd, vertices, weights)*
+                                  self.scale
+                                  for dd in (pl.d11, pl.d12, pl.d21, pl.d22)]
+            mu = lt.jacobian_signals(d11, d12, d21, d22)[0]
+        phi = cf.call_interp_points(pl.phi, pl.phi_coord, pl.phi_coord,
+                                    theta1, theta2, 3)*self.scale
+        return np.diff(img_offsets), theta1, theta2, mu, phi
+
+    def timedelay_magnification(self, beta, zs, zl, cosmo):
+        """
+        Time-delay and magnification of a source at position beta
+        Output:
+            n_imgs[int] : number of images
+            delta_t[np.array] : arrival times of the images [sday]
+            mu[np.array] : magnifications of the images
+            theta[np.ndarray] : (n_imgs, 2) image positions [arcsec]
+        """
+        nimgs, theta1, theta2, mu, phi = self.images([beta[0]], [beta[1]])
+        table = lt.image_table(nimgs, theta1, theta2, mu, phi, [beta[0]],
+                               [beta[1]], [zs], zl, cosmo)
+        return len(mu), table['delta_t'], table['mu'], \
+               np.array([theta1, theta2]).T
+
+
+def precision_report(sigma, fov_arc, ncells, coord, sigma_cr, beta, zs, zl,
+                     cosmo, **plane_args):
+    """
+    Einstein radius, images, magnifications and time delays of one source
+    in single against double precision
+    Input:
+        sigma[np.ndarray] : surface density map [Msun/unit^2]
+        sigma_cr[float] : critical surface density [Msun/unit^2]
+        beta[list] : source position [arcsec]
+        plane_args : keywords of LensPlane
+    Output:
+        report[dict] : Rein and n_imgs of both precisions, largest
+                       differences of the matched images in position
+                       [arcsec], magnification (relative) and time delay
+                       [days], run time of both precisions [s]
+    """
+    results = {}
+    prec = cf.precision
+    try:
+        for pp in ['double', 'single']:
+            cf.set_precision(pp)
+            t0 = time.time()
+            fields = LensPlane(sigma, fov_arc, ncells, coord,
+                               **plane_args).fields(sigma_cr)
+            Rein = fields.einstein_radii('med')[3]
+            n_imgs, delta_t, mu, theta = fields.timedelay_magnification(
+                    beta, zs, zl, cosmo)
+            results[pp] = (time.time() - t0, Rein, n_imgs,
+                           np.asarray(delta_t), np.asarray(mu),
+                           np.reshape(theta, (-1, 2)))
+    finally:
+        cf.set_precision(prec)
+
+    (t_d, Rein_d, n_d, dt_d, mu_d, th_d) = results['double']
+    (t_s, Rein_s, n_s, dt_s, mu_s, th_s) = results['single']
+    report = {'Rein_double' : Rein_d, 'Rein_single' : Rein_s,
+              'Rein_rel' : abs(Rein_s - Rein_d)/Rein_d if Rein_d > 0 else 0.,
+              'n_imgs_double' : n_d, 'n_imgs_single' : n_s,
+              'theta_max' : 0., 'mu_rel_max' : 0., 'delta_t_max' : 0.,
+              'time_double' : t_d, 'time_single' : t_s}
+    if n_d > 0 and n_s > 0:
+        # match every image of double precision with the closest one
+        dist = np.hypot(th_d[:, 0, None] - th_s[None, :, 0],
+                        th_d[:, 1, None] - th_s[None, :, 1])
+        nn = np.argmin(dist, axis=1)
+        report['theta_max'] = np.max(dist[np.arange(n_d), nn])
+        report['mu_rel_max'] = float(np.max(np.abs(mu_s[nn] - mu_d)/
+                                            np.abs(mu_d)))
+        if len(dt_d) > 0 and len(dt_s) == n_s:
+            # delays with respect to the first image of double precision
+            dt_s = dt_s[nn] - dt_s[nn][np.argmin(dt_d)]
+            dt_d = dt_d - np.min(dt_d)
+            report['delta_t_max'] = np.max(np.abs(dt_s - dt_d))
+    return report
+
+
+def plane_key(cache, sigma, fov_arc, ncells, coord, refine='centre',
+              derivatives='fd', ksigma=0., deflections='fft', tree_args=None,
+              sigma_unit=1., particles=None, **unused):
+    """
+    Cache key of the unit Sigma_cr fields of a LensPlane
+    Input:
+        cache[lenscache.LensCache]
+        others : see LensPlane, keywords which do not change the fields
+                 are ignored
+    Output:
+        key[str]
+    """
+    return cache.key(sigma, fov_arc=fov_arc, ncells=ncells,
+                     coord=np.asarray(coord, dtype=np.float64),
+                     refine=refine, derivatives=derivatives, ksigma=ksigma,
+                     precision=cf.precision, deflections=deflections,
+                     tree_args=sorted((tree_args or {}).items()),
+                     sigma_unit=sigma_unit,
+                     particles=None if particles is None else
+                     np.concatenate([np.ravel(pp) for pp in particles]))
+
+
+def lens_planes(sigmas, fov_arcs, ncells, coords, nthreads=None,
+                sigma_units=1., **plane_args):
+    """
+    Lens planes of many maps of the same number of cells, the deflection
+    and potential of all maps without cached fields from one batched
+    transform (only for derivatives='fd' and deflections='fft')
+    Input:
+        sigmas[np.ndarray] : (nmaps, ncells, ncells) surface density maps
+        fov_arcs[np.array] : field-of-view of every map [arcsec]
+        coords[list] : lensing plane axis coordinates of every map [arcsec]
+        nthreads[int] : threads of the transforms, default all cores
+        sigma_units[np.array] : sigma_unit of every map, or of all maps
+        plane_args : keywords of LensPlane
+    Output:
+        list of LensPlane
+    """
+    units = np.broadcast_to(np.asarray(sigma_units, dtype=np.float64),
+                            (len(sigmas),))
+    unit_fields = [None]*len(sigmas)
+    if plane_args.get('derivatives', 'fd') == 'fd' and \
+            plane_args.get('deflections', 'fft') == 'fft':
+        todo = uncached(sigmas, fov_arcs, ncells, coords, units,
+                        **plane_args)
+        if len(todo) > 0:
+            alpha1, alpha2, phi = cf.call_cal_fields_many(
+                    np.asarray([sigmas[mm] for mm in todo]),
+                    np.asarray(fov_arcs)[todo], ncells, nthreads, units[todo])
+            for kk, mm in enumerate(todo):
+                unit_fields[mm] = (alpha1[kk], alpha2[kk], phi[kk])
+    return [LensPlane(sigmas[mm], fov_arcs[mm], ncells, coords[mm],
+                      unit_fields=unit_fields[mm], sigma_unit=units[mm],
+                      **plane_args)
+            for mm in range(len(sigmas))]
+
+
+def uncached(sigmas, fov_arcs, ncells, coords, sigma_units=1., cache=None,
+             **plane_args):
+    """
+    Indices of the maps whose unit Sigma_cr fields are not cached,
+    all maps without a cache (arguments see lens_planes)
+    """
+    units = np.broadcast_to(np.asarray(sigma_units, dtype=np.float64),
+                            (len(sigmas),))
+    if cache is None:
+        return list(range(len(sigmas)))
+    return [mm for mm in range(len(sigmas))
+            if not cache.contains(plane_key(cache, sigmas[mm], fov_arcs[mm],
+                                            ncells, coords[mm],
+                                            sigma_unit=units[mm],
+                                            **plane_args))]
+
+
+def fill_cache(sigmas, fov_arcs, ncells, coords, cache, nbatch=32,
+               nthreads=None, sigma_units=1., **plane_args):
+    """
+    Store the unit Sigma_cr fields of all uncached maps, nbatch maps per
+    batched transform, e.g. before workers build the planes one by one
+    (arguments see lens_planes)
+    """
+    units = np.broadcast_to(np.asarray(sigma_units, dtype=np.float64),
+                            (len(sigmas),))
+    todo = uncached(sigmas, fov_arcs, ncells, coords, units, cache,
+                    **plane_args)
+    for bb in range(0, len(todo), nbatch):
+        batch = todo[bb:bb+nbatch]
+        lens_planes([sigmas[mm] for mm in batch],
+                    [fov_arcs[mm] for mm in batch], ncells,
+                    [coords[mm] for mm in batch], nthreads, units[batch],
+                    cache=cache, **plane_args)
@@ -0,0 +1,111 @@
+# File Description:
+#   Node-level process pool for the lens loops.
+#   The density maps of a file are read once into a shared memory block,
+#   which the forked workers map read-only as np.ndarray. Workers take
+#   lens tasks (small dicts with the map row and lens properties) from the
+#   pool queue, so faster workers take more lenses, and only return the
+#   compact per-lens results, never the maps.
+#
+from __future__ import division
+import multiprocessing
+import ctypes
+import numpy as np
+
+# state of the worker processes, set by _init_worker
+_worker = {}
+
+
+class SharedMaps():
+    def __init__(self, shape, dtype=np.float64):
+        """
+        Stack of maps in shared memory, inherited by forked workers
+        Input:
+            shape[tuple] : (nmaps, nx, ny)
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        ctype = {np.dtype(np.float64) : ctypes.c_double,
+                 np.dtype(np.float32) : ctypes.c_float}[self.dtype]
+        self.raw = multiprocessing.RawArray(ctype, int(np.prod(self.shape)))
+
+    @classmethod
+    def from_dataset(cls, dset):
+        """ Read a HDF5 dataset directly into shared memory """
+        maps = cls(dset.shape, dset.dtype)
+        dset.read_direct(maps.array)
+        return maps
+
+    @classmethod
+    def from_array(cls, data):
+        data = np.asarray(data)
+        maps = cls(data.shape, data.dtype)
+        maps.array[:] = data
+        return maps
+
+    @property
+    def array(self):
+        """ np.ndarray view of the shared memory, no copy """
+        return np.frombuffer(self.raw, dtype=self.dtype).reshape(self.shape)
+
+
+def _init_worker(maps, func, consts):
+    _worker['maps'] = maps.array
+    _worker['func'] = func
+    _worker['consts'] = consts
+
+
+def worker_maps():
+    """
+    All maps of the pool, read-only, for tasks which need more than
+    their own row (e.g. halos along the line-of-sight)
+    """
+    return _worker['maps']
+
+
+def _run_task(task):
+    maps = _worker['maps']
+    return _worker['func'](maps[task['row']], task, _worker['consts'])
+
+
+class LensPool():
+    def __init__(self, nproc=None):
+        """
+        Input:
+            nproc[int] : number of worker processes,
+                         default all cores, 1 runs in this process
+        """
+        if nproc is None:
+            nproc = multiprocessing.cpu_count()
+        self.nproc = int(nproc)
+
+    def imap(self, func, maps, tasks, consts=None, chunksize=1):
+        """
+        Run func on every task
+        Input:
+            func : module-level function func(map, task, consts),
+                   map being the read-only row task['row'] of maps
+            maps[SharedMaps] : maps of the tasks
+            tasks[list] : dicts with at least the key 'row'
+            consts : constants of all tasks (e.g. cosmology, ncells)
+        Output:
+            iterator over (task, func(...)) in the order of tasks
+        """
+        if self.nproc == 1 or len(tasks) <= 1:
+            _init_worker(maps, func, consts)
+            for task in tasks:
+                yield task, _run_task(task)
+            return
+
+        # fork, so workers inherit the shared memory instead of a copy
+        ctx = multiprocessing.get_context('fork')
+        pool = ctx.Pool(processes=min(self.nproc, len(tasks)),
+                        initializer=_init_worker,
+                        initargs=(maps, func, consts))
+        try:
+            for task, res in zip(tasks, pool.imap(_run_task, tasks,
+                                                  chunksize=chunksize)):
+                yield task, res
+        finally:
+            # all results are in, or the loop was interrupted
+            pool.terminate()
+            pool.join()
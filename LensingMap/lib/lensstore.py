@@ -0,0 +1,194 @@
+# File Description:
+#   Columnar HDF5 store of strong lensing results.
+#   A file holds tables (e.g. 'lenses', 'sources'), each a group of equally
+#   long columns. Scalar and fixed-shape columns are datasets whose first
+#   axis runs over rows. Ragged columns (critical curves, caustics, images)
+#   hold one variable-length array per row, stored flat as 'values' with
+#   'offsets' of length nrows+1, rows of a ragged column r being
+#   values[offsets[r]:offsets[r+1]].
+#   Rows are appended incrementally (e.g. after every lens) and columns,
+#   or single rows of ragged columns, are read without loading the file.
+#
+from __future__ import division
+import numpy as np
+import h5py
+
+
+def _ragged_values(arrays, trail=None):
+    """
+    Flatten a list of arrays into values and row lengths
+    Input:
+        arrays[list] : one np.ndarray per row, shapes (n_r,)+trail
+        trail[tuple] : trailing shape, taken from arrays if None
+    Output:
+        values[np.ndarray] : concatenated rows
+        lengths[np.array] : number of entries per row
+    """
+    arrays = [np.asarray(aa) for aa in arrays]
+    if trail is None:
+        trail = ()
+        for aa in arrays:
+            if aa.size > 0:
+                trail = aa.shape[1:]
+                break
+    # empty rows (e.g. no critical curve) take the trailing shape of others
+    arrays = [aa.reshape((-1,) + tuple(trail)) if aa.size == 0 else aa
+              for aa in arrays]
+    lengths = np.array([len(aa) for aa in arrays], dtype=np.int64)
+    if len(arrays) == 0 or np.sum(lengths) == 0:
+        dtype = np.float64
+        for aa in arrays:
+            if aa.size > 0:
+                dtype = aa.dtype
+        return np.zeros((0,) + tuple(trail), dtype=dtype), lengths
+    return np.concatenate(arrays), lengths
+
+
+class LensStore():
+    def __init__(self, filename, mode='r'):
+        """
+        Input:
+            filename[str] : path of HDF5 file
+            mode[str] : 'r' read, 'w' create, 'a' append
+        """
+        self.filename = filename
+        self.hf = h5py.File(filename, mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.hf.id.valid:
+            self.hf.close()
+
+    def flush(self):
+        self.hf.flush()
+
+    @property
+    def attrs(self):
+        """ File-wide constants (e.g. snapnum, zl, zs) """
+        return self.hf.attrs
+
+    def tables(self):
+        return list(self.hf.keys())
+
+    def columns(self, table):
+        return list(self.hf[table].keys())
+
+    def nrows(self, table):
+        if table not in self.hf:
+            return 0
+        return int(self.hf[table].attrs['nrows'])
+
+    def is_ragged(self, table, name):
+        return isinstance(self.hf[table][name], h5py.Group)
+
+    def _extend(self, grp, name, data):
+        """ Append data along the first axis of a dataset """
+        if name not in grp:
+            grp.create_dataset(name, data=data, chunks=True,
+                               maxshape=(None,) + data.shape[1:])
+            return
+        ds = grp[name]
+        if ds.shape[1:] != data.shape[1:]:
+            raise Exception('Shape of column %s changed: %s -> %s' % \
+                    (name, ds.shape[1:], data.shape[1:]))
+        n0 = ds.shape[0]
+        ds.resize(n0 + len(data), axis=0)
+        ds[n0:] = data
+
+    def append(self, table, columns, ragged=None):
+        """
+        Append rows to a table, creating it on first use
+        Input:
+            table[str] : table name
+            columns[dict] : scalar or fixed-shape columns, one entry per row
+            ragged[dict] : ragged columns, list of one np.ndarray per row
+        """
+        if ragged is None:
+            ragged = {}
+        columns = dict((kk, np.asarray(vv)) for kk, vv in columns.items())
+        nrows = [len(vv) for vv in columns.values()] + \
+                [len(vv) for vv in ragged.values()]
+        if len(nrows) == 0:
+            return
+        if min(nrows) != max(nrows):
+            raise Exception('Columns of %s differ in length' % table)
+        nrows = nrows[0]
+
+        if table in self.hf:
+            grp = self.hf[table]
+            if set(grp.keys()) != set(columns.keys()) | set(ragged.keys()):
+                raise Exception('Columns of %s do not match: %s' % \
+                        (table, sorted(grp.keys())))
+        else:
+            grp = self.hf.create_group(table)
+            grp.attrs['nrows'] = 0
+
+        for name, data in columns.items():
+            self._extend(grp, name, data)
+        for name, arrays in ragged.items():
+            if name in grp:
+                if len(grp[name]['values']) == 0:
+                    # only empty rows so far, shape still unknown
+                    del grp[name]['values']
+                    values, lengths = _ragged_values(arrays)
+                else:
+                    trail = grp[name]['values'].shape[1:]
+                    values, lengths = _ragged_values(arrays, trail)
+                end = grp[name]['offsets'][-1]
+            else:
+                values, lengths = _ragged_values(arrays)
+                rgrp = grp.create_group(name)
+                self._extend(rgrp, 'offsets', np.zeros(1, dtype=np.int64))
+                end = 0
+            self._extend(grp[name], 'values', values)
+            self._extend(grp[name], 'offsets', end + np.cumsum(lengths))
+        grp.attrs['nrows'] = grp.attrs['nrows'] + nrows
+
+    def column(self, table, name, rows=slice(None)):
+        """ Scalar or fixed-shape column, optionally a slice of rows """
+        return self.hf[table][name][rows]
+
+    def ragged(self, table, name):
+        """
+        Ragged column as flat arrays
+        Output:
+            values[np.ndarray] : all rows concatenated
+            offsets[np.array] : row r is values[offsets[r]:offsets[r+1]]
+        """
+        grp = self.hf[table][name]
+        return grp['values'][:], grp['offsets'][:]
+
+    def row(self, table, name, r):
+        """ Single row of a ragged column, read without the others """
+        grp = self.hf[table][name]
+        start, end = grp['offsets'][r:r+2]
+        return grp['values'][start:end]
+
+    def split(self, table, name):
+        """ Ragged column as list of one np.ndarray per row """
+        values, offsets = self.ragged(table, name)
+        return np.split(values, offsets[1:-1])
+
+    def read(self, table, names=None):
+        """
+        Columns of a table
+        Input:
+            names[list] : column names, default are all columns
+        Output:
+            dict of np.ndarray for scalar columns,
+            lists of np.ndarray for ragged columns
+        """
+        if names is None:
+            names = self.columns(table)
+        data = {}
+        for name in names:
+            if self.is_ragged(table, name):
+                data[name] = self.split(table, name)
+            else:
+                data[name] = self.column(table, name)
+        return data
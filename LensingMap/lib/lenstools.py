@@ -11,18 +11,18 @@ from astropy import constants as const
 from astropy.cosmology import LambdaCDM
 import pandas as pd
 import h5py, pickle, pandas
-import matplotlib as mpl
-mpl.use('Agg')
-import matplotlib.pyplot as plt
 sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/lib/')
 import read_hdf5
+import cosmotable
 sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/StrongLensing/LensingMap/lib/')
-import cfuncs as cf
+import lm_cfuncs as cf
 import warnings
 warnings.filterwarnings("ignore", category=RuntimeWarning, append=1)
 os.system("taskset -p 0xff %d" % os.getpid())
 sys.settrace
 
+sday = (1*u.sday).to_value('s')  # sidereal day [s]
+
 
 def define_unit(simunit, hfname):
     exp = np.floor(np.log10(np.abs(simunit))).astype(int)
@@ -66,11 +66,8 @@ def source_selection(src_id, src_z, src_pos, halo_id):
 
 
 def sigma_crit(zLens, zSource, cosmo):
-    Ds = cosmo.angular_diameter_distance(zSource)
-    Dl = cosmo.angular_diameter_distance(zLens)
-    Dls = cosmo.angular_diameter_distance_z1z2(zLens, zSource)
-    sig_crit = (const.c**2/(4*np.pi*const.G))*Ds/(Dl*Dls)
-    return sig_crit
+    sig_crit = cosmotable.get_table(cosmo).sigma_crit(zLens, zSource)
+    return sig_crit*u.Unit('Msun Mpc-2')
 
 
 def area(vs):
@@ -87,29 +84,95 @@ def area(vs):
     return a
 
 
-def cal_lensing_signals(kap, bzz, ncc, coord):
-    dsx_arc = bzz/ncc
-    # deflection maps
-    alpha1, alpha2 = cf.call_cal_alphas(kap, bzz, ncc)
-   
-    #TODO: map to finer grid
-    alpha1_spline = RectBivariateSpline(coord, coord, alpha1)
-    alpha2_spline = RectBivariateSpline(coord, coord, alpha2)
+def refine_coord(coord, nrefine=256):
+    """
+    Replace the central third of a grid axis by a finer sampling
+    Input:
+        coord[np.array] : lensing plane axis coordinates
+        nrefine[int] : number of points in the refined centre
+    Output:
+        coord[np.array] : axis with finer resolution in centre
+    """
     lencoord = len(coord)
     centre_coord = np.linspace(coord[int(lencoord/3)],
                                coord[int(2*lencoord/3)],
-                               256)
+                               nrefine)
     coord = np.concatenate((coord[:int(lencoord/3)],
                             centre_coord,
                             coord[int(2*lencoord/3+1):]))
-    alpha1 = alpha1_spline(coord, coord)
-    alpha2 = alpha2_spline(coord, coord)
-    
+    return coord
+
+
+def refine_alphas(alpha1, alpha2, coord):
+    """
+    Map deflection maps onto a grid with finer resolution in the centre
+    Input:
+        alpha1, alpha2[np.ndarray] : deflection maps on native grid
+        coord[np.array] : native axis coordinates
+    Output:
+        alpha1, alpha2[np.ndarray] : deflection maps on refined grid
+        coord[np.array] : refined axis coordinates
+    """
+    (alpha1, alpha2), coord = refine_maps([alpha1, alpha2], coord)
+    return alpha1, alpha2, coord
+
+
+def refine_maps(maps, coord):
+    """
+    Map any maps onto a grid with finer resolution in the centre
+    Input:
+        maps[list] : np.ndarray on native grid
+        coord[np.array] : native axis coordinates
+    Output:
+        maps[list] : np.ndarray on refined grid
+        coord[np.array] : refined axis coordinates
+    """
+    fine = refine_coord(coord)
+    maps = [RectBivariateSpline(coord, coord, mm)(fine, fine) for mm in maps]
+    return maps, fine
+
+
+def alpha_derivatives(alpha1, alpha2, coord, coord2=None):
+    """
+    Finite difference derivatives of the deflection maps
+    Input:
+        coord, coord2[np.array] : axis coordinates along axis 0 and 1,
+                                  coord2 defaults to coord
+    Output:
+        d11, d12, d21, d22[np.ndarray] : d(alpha_i)/d(x_j)
+    """
+    if coord2 is None:
+        coord2 = coord
+    d11 = np.gradient(alpha1, coord, axis=0)
+    d12 = np.gradient(alpha1, coord2, axis=1)
+    d21 = np.gradient(alpha2, coord, axis=0)
+    d22 = np.gradient(alpha2, coord2, axis=1)
+    return d11, d12, d21, d22
+
+
+def spectral_derivatives(kappa, shear1, shear2):
+    """
+    Deflection derivatives from convergence and shear maps
+    (e.g. of lm_cfuncs.call_cal_signals), for jacobian_signals
+    Output:
+        d11, d12, d21, d22[np.ndarray] : d(alpha_i)/d(x_j)
+    """
+    return kappa + shear1, shear2, shear2, kappa - shear1
+
+
+def jacobian_signals(d11, d12, d21, d22):
+    """
+    Magnification related maps from the deflection derivatives
+    Output:
+        mu[np.ndarray] : magnification map
+        detA[np.ndarray] : determinant of the Jacobian
+        lambda_t[np.ndarray] : tangential eigenvalue
+    """
     # shear maps
-    al11 = 1 - np.gradient(alpha1, coord, axis=0)
-    al12 = - np.gradient(alpha1, coord, axis=1)
-    al21 = - np.gradient(alpha2, coord, axis=0)
-    al22 = 1 - np.gradient(alpha2, coord, axis=1)
+    al11 = 1 - d11
+    al12 = - d12
+    al21 = - d21
+    al22 = 1 - d22
     
     detA = al11*al22 - al12*al21 # = (1-kappa0-shear0)*(1-kappa0+shear0)
     
@@ -121,36 +184,146 @@ def cal_lensing_signals(kap, bzz, ncc, coord):
     # magnification maps
     mu = 1/detA  # = 1.0/((1.0-kappa0)**2.0-shear1*shear1-shear2*shear2)
     lambda_t = 1 - kappa0 - shear0  # tangential eigenvalue, page 115
+    return mu, detA, lambda_t
+
+
+def cal_lensing_signals(kap, bzz, ncc, coord, method='fd', ksigma=0.,
+                        scale=1.):
+    """
+    Lensing maps of a convergence map
+    Input:
+        kap[np.ndarray] : convergence map, or surface density map with
+                          scale = 1/Sigma_cr
+        bzz[float] : field-of-view [arcsec]
+        ncc[int] : number of cells per side
+        coord[np.array] : lensing plane axis coordinates [arcsec]
+        method[str] : 'fd' finite differences of the refined deflection,
+                      'spectral' shears from the spectrum of kap
+        ksigma[float] : width of Gaussian smoothing kernel applied to
+                        all maps in 'spectral' mode [arcsec]
+        scale[float] : factor applied to kap in the copy of the transforms
+    Output:
+        alpha1, alpha2, mu, phi, detA, lambda_t[np.ndarray] : refined maps
+        coord[np.array] : refined axis coordinates
+    """
+    if method == 'spectral':
+        # one FFT of kap for all maps, no finite differences
+        alpha1, alpha2, phi, kappa, shear1, shear2 = cf.call_cal_signals(
+                kap, bzz, ncc, ksigma, scale)
+        (alpha1, alpha2, kappa, shear1, shear2), coord = refine_maps(
+                [alpha1, alpha2, kappa, shear1, shear2], coord)
+        d11, d12, d21, d22 = spectral_derivatives(kappa, shear1, shear2)
+        mu, detA, lambda_t = jacobian_signals(d11, d12, d21, d22)
+        return alpha1, alpha2, mu, phi, detA, lambda_t, coord
+    elif method != 'fd':
+        raise Exception('Dont know this method ->', method)
+
+    dsx_arc = bzz/ncc
+    # deflection maps
+    alpha1, alpha2 = cf.call_cal_alphas(kap, bzz, ncc, scale)
+   
+    #TODO: map to finer grid
+    alpha1, alpha2, coord = refine_alphas(alpha1, alpha2, coord)
+    
+    # shear and magnification maps
+    d11, d12, d21, d22 = alpha_derivatives(alpha1, alpha2, coord)
+    mu, detA, lambda_t = jacobian_signals(d11, d12, d21, d22)
     
     # lensing potential
-    phi = cf.call_cal_phi(kap, bzz, ncc)
+    phi = cf.call_cal_phi(kap, bzz, ncc, scale)
 
     return alpha1, alpha2, mu, phi, detA, lambda_t, coord
 
 
-def einstein_radii(lp1, lp2, sp1, sp2 ,detA, lambda_t, cosmo, ax, method):
+def sample_grid(field, pts1, pts2):
+    """
+    Bilinear interpolation of a map at fractional indices
+    Input:
+        field[np.ndarray] : map on lensing plane
+        pts1,pts2[np.array] : fractional indices along axis 0 and 1
+    Output:
+        values of field at pts1,pts2
+    """
+    nx, ny = np.shape(field)
+    i0 = np.clip(np.floor(pts1).astype(int), 0, nx-2)
+    j0 = np.clip(np.floor(pts2).astype(int), 0, ny-2)
+    ti = pts1 - i0
+    tj = pts2 - j0
+    return (field[i0, j0]*(1-ti)*(1-tj) + field[i0, j0+1]*(1-ti)*tj +
+            field[i0+1, j0]*ti*(1-tj) + field[i0+1, j0+1]*ti*tj)
+
+
+def grid_points(lp1, lp2, pts1, pts2):
+    """
+    Lensing plane coordinates at fractional indices
+    Output:
+        (N,2) array of x,y-coordinates
+    """
+    return np.array([sample_grid(lp1, pts1, pts2),
+                     sample_grid(lp2, pts1, pts2)]).T
+
+
+def contours(lp1, lp2, field, level=0.):
+    """
+    All contours of a map at a given level, interpolated within pixels
+    Input:
+        lp1,lp2[np.ndarray] : lensing plane x,y-coordinates
+        field[np.ndarray] : map to contour
+    Output:
+        curves[list] : (N,2) arrays of x,y-coordinates of each contour
+        closed[np.array(bool)] : False for curves ending on map boundary
+    """
+    pts1, pts2, offsets, closed = cf.call_marching_squares(field, level)
+    xy = grid_points(lp1, lp2, pts1, pts2)
+    curves = [xy[offsets[cc]:offsets[cc+1]] for cc in range(len(closed))]
+    return curves, closed
+
+
+def critical_curves(lp1, lp2, detA, lambda_t, kappa):
+    """
+    Zero contours of detA labelled as tangential or radial critical curves.
+    On a tangential curve lambda_t = 1-kappa-shear vanishes, on a radial one
+    lambda_r = 1-kappa+shear = 2(1-kappa)-lambda_t.
+    Input:
+        lp1,lp2[np.ndarray] : lensing plane x,y-coordinates
+        detA, lambda_t, kappa[np.ndarray] : maps on lensing plane
+    Output:
+        curves[list] : (N,2) arrays of x,y-coordinates of each contour
+        closed[np.array(bool)] : False for curves ending on map boundary
+        tangential[np.array(bool)] : True for tangential critical curves
+    """
+    pts1, pts2, offsets, closed = cf.call_marching_squares(detA, 0.)
+    xy = grid_points(lp1, lp2, pts1, pts2)
+    # eigenvalues along curves
+    lam_t = sample_grid(lambda_t, pts1, pts2)
+    lam_r = 2*(1 - sample_grid(kappa, pts1, pts2)) - lam_t
+    curves = []
+    tangential = np.zeros(len(closed), dtype=bool)
+    for cc in range(len(closed)):
+        cs = slice(offsets[cc], offsets[cc+1])
+        curves.append(xy[cs])
+        tangential[cc] = (np.median(np.abs(lam_t[cs])) <
+                          np.median(np.abs(lam_r[cs])))
+    return curves, closed, tangential
+
+
+def einstein_radii(lp1, lp2, sp1, sp2 ,detA, lambda_t, cosmo, method):
     """
     Calculate Critical Curves, Caustics, and Einstein Radii
     Input:
-        lp1,lp2[float] : lensing plane x,y-coordinates
+        lp1,lp2[float] : lensing plane x,y-coordinates, lp1 varying
+                         along axis 0 and lp2 along axis 1
         sp1,sp2[float] : source plane x,y-coordinates
 
     """
-    crit_curve = ax.contour(lp1, lp2, detA,
-                            levels=(0,), colors='r',
-                            linewidths=1.5, zorder=200)
-    Ncrit = len(crit_curve.allsegs[0])
-    crit_curve = crit_curve.allsegs[0]
-    tan_crit_curve = ax.contour(lp1, lp2,
-                                lambda_t, levels=(0,), colors='r',
-                                linewidths=1.5, zorder=200)
-    NumTCC = len(tan_crit_curve.allsegs[0])
+    tan_crit_curve, closed = contours(lp1, lp2, lambda_t, 0.)
+    NumTCC = len(tan_crit_curve)
     if NumTCC> 0:
         # Find tangential critical curve on which to base Rein
         len_tan_crit = np.zeros(NumTCC)
         for i in range(NumTCC):
-            len_tan_crit[i] = len(tan_crit_curve.allsegs[0][i])
-        tan_crit_curve = tan_crit_curve.allsegs[0][len_tan_crit.argmax()]
+            len_tan_crit[i] = len(tan_crit_curve[i])
+        tan_crit_curve = tan_crit_curve[len_tan_crit.argmax()]
         
         # Einstein Radius
         if method == 'eqv':
@@ -160,17 +333,9 @@ def einstein_radii(lp1, lp2, sp1, sp2 ,detA, lambda_t, cosmo, ax, method):
             Rein = np.median(dist)  #[arcsec]
         
         # Caustics
-        for pp in range(len(tan_crit_curve)):
-            c1, c2 = (cf.call_mapping_triangles([tan_crit_curve[pp, 0],
-                                                 tan_crit_curve[pp, 1]],
-                                                sp1, sp2, lp1, lp2))
-            if pp == 0:
-                caustic1 = c1
-                caustic2 = c2
-            else:
-                caustic1 = np.hstack((caustic1, c1))
-                caustic2 = np.hstack((caustic2, c2))
-        caustic = np.array([caustic1, caustic2]).T
+        caustic = np.array(cf.call_lens_equation(
+                tan_crit_curve[:, 0], tan_crit_curve[:, 1],
+                lp1[:, 0], lp2[0, :], lp1 - sp1, lp2 - sp2)).T
 
     else:
         tan_crit_curve = np.array([])
@@ -179,6 +344,113 @@ def einstein_radii(lp1, lp2, sp1, sp2 ,detA, lambda_t, cosmo, ax, method):
     return NumTCC, tan_crit_curve, caustic, Rein
 
 
+def mean_kappa_profiles(kappa, dsx_arc, centre='peak', nsub=4):
+    """
+    Mean convergence within circles around the centre of every map,
+    all maps of a batch binned with one bincount
+    Input:
+        kappa[np.ndarray] : (nmaps, N, N) or (N, N) convergence maps
+        dsx_arc[float] : pixel size [arcsec]
+        centre[str] : 'peak' largest pixel or 'centre' of the map
+        nsub[int] : radial bins per pixel
+    Output:
+        theta[np.array] : outer radius of the bins [arcsec], up to half
+                          the map size
+        kbar[np.ndarray] : (nmaps, nbins) mean convergence within theta
+    """
+    kappa = np.asarray(kappa)
+    if kappa.ndim == 2:
+        kappa = kappa[None]
+    nmaps, n1, n2 = np.shape(kappa)
+    nbins = int(min(n1, n2)/2*nsub)
+    if centre == 'peak':
+        ipk = np.argmax(np.reshape(kappa, (nmaps, -1)), axis=1)
+        c1, c2 = ipk//n2, ipk % n2
+    elif centre == 'centre':
+        c1 = np.full(nmaps, (n1 - 1)/2)
+        c2 = np.full(nmaps, (n2 - 1)/2)
+    else:
+        raise Exception('Dont know this centre ->', centre)
+    ii, jj = np.arange(n1), np.arange(n2)
+    rr = np.hypot((ii[None, :, None] - c1[:, None, None]),
+                  (jj[None, None, :] - c2[:, None, None]))
+    rbin = (rr*nsub).astype(np.int64)
+    rbin[rbin >= nbins] = nbins
+    rbin += (nbins + 1)*np.arange(nmaps)[:, None, None]
+    counts = np.bincount(rbin.ravel(), minlength=nmaps*(nbins + 1))
+    ksum = np.bincount(rbin.ravel(), weights=kappa.ravel(),
+                       minlength=nmaps*(nbins + 1))
+    counts = np.cumsum(np.reshape(counts, (nmaps, nbins + 1))[:, :nbins], axis=1)
+    ksum = np.cumsum(np.reshape(ksum, (nmaps, nbins + 1))[:, :nbins], axis=1)
+    theta = np.arange(1, nbins + 1)/nsub*dsx_arc
+    with np.errstate(invalid='ignore', divide='ignore'):
+        kbar = ksum/counts
+    return theta, kbar
+
+
+def profile_einstein_radii(theta, kbar, level=1.):
+    """
+    Einstein radius where the mean convergence falls to level, outermost
+    crossing interpolated linearly between bins
+    Input:
+        theta[np.array] : radii of mean_kappa_profiles [arcsec]
+        kbar[np.ndarray] : (nmaps, nbins) profiles of mean_kappa_profiles
+        level[np.array] : mean convergence at the Einstein radius, e.g.
+                          Sigma_cr of every source if kbar is a mean
+                          surface density, one value or one per map
+    Output:
+        Rein[np.array] : [arcsec], 0 if the mean convergence never
+                         reaches level
+    """
+    kbar = np.atleast_2d(kbar)
+    level = np.atleast_1d(level)
+    nbins = np.shape(kbar)[1]
+    # one profile for many levels (sources) or one level for many maps
+    nmaps = max(len(kbar), len(level))
+    kbar = np.broadcast_to(kbar, (nmaps, nbins))
+    level = np.broadcast_to(level, (nmaps,))
+    above = np.where(np.isnan(kbar), False, kbar >= level[:, None])
+    # last bin at or above level, read from the outside
+    last = nbins - 1 - np.argmax(above[:, ::-1], axis=1)
+    Rein = np.zeros(len(kbar))
+    for mm in np.where(np.any(above, axis=1))[0]:
+        ll = last[mm]
+        if ll == nbins - 1:
+            Rein[mm] = theta[ll]
+            continue
+        k0, k1 = kbar[mm, ll], kbar[mm, ll + 1]
+        frac = (k0 - level[mm])/(k0 - k1) if k0 > k1 else 0.
+        Rein[mm] = theta[ll] + frac*(theta[ll + 1] - theta[ll])
+    return Rein
+
+
+def einstein_radius_agreement(rein_profile, rein_curve, tol=0.1):
+    """
+    Agreement of the mean convergence profile and critical curve
+    Einstein radii of many lenses
+    Input:
+        rein_profile, rein_curve[np.array] : [arcsec]
+        tol[float] : relative difference counted as agreement
+    Output:
+        dict of the number of lenses with both radii, with only one of
+        them, median and scatter (16th, 84th percentile) of the relative
+        difference and the fraction within tol
+    """
+    rp, rc = np.asarray(rein_profile, float), np.asarray(rein_curve, float)
+    both = (rp > 0) & (rc > 0)
+    report = {'n_both' : int(np.sum(both)),
+              'n_profile_only' : int(np.sum((rp > 0) & ~(rc > 0))),
+              'n_curve_only' : int(np.sum(~(rp > 0) & (rc > 0))),
+              'median' : np.nan, 'p16' : np.nan, 'p84' : np.nan,
+              'within_tol' : np.nan}
+    if np.any(both):
+        rel = rp[both]/rc[both] - 1
+        report['median'] = np.median(rel)
+        report['p16'], report['p84'] = np.percentile(rel, [16, 84])
+        report['within_tol'] = np.mean(np.abs(rel) <= tol)
+    return report
+
+
 def mpc2arc(SrcPosSky):
     # Source position [arcsec]
     x = SrcPosSky[0]*u.Mpc
@@ -194,40 +466,56 @@ def mpc2arc(SrcPosSky):
     return beta
 
 
-def timedelay_magnification(mu_map, phi_map, dsx_arc, Ncells, lp1, lp2,
-                            alpha1, alpha2, beta, zs, zl, cosmo):
+def time_delays(theta1, theta2, phi, beta, zs, zl, cosmo):
     """
     Input:
-        mu_map: 2D magnification map
-        phi_map: 2D potential map
-        dsx_arc: cell size in arcsec
-        Ncells: number of cells
-        lp1, lp2: lens place grid coordinates
-        alpha1, alpha2: 2D deflection map
-        SrcPosSky: source position in Mpc
-        zs: source redshift
-        zl: lens redshift
-
-    Output:
-        len(mu): number of multiple images of supernova
-        delta_t: Time it takes for photon to cover distance source-observer
-        mu: luminosity magnification of source
-    """
-    # Mapping light rays from image plane to source plan
-    [sp1, sp2] = [lp1 - alpha1, lp2 - alpha2]  #[arcsec]
-
-    theta1, theta2 = cf.call_mapping_triangles([beta[0], beta[1]], 
-                                               lp1, lp2, sp1, sp2)
-    # calculate magnifications of lensed Supernovae
-    mu = cf.call_inverse_cic_single(mu_map, 0.0, 0.0, theta1, theta2, dsx_arc)
-    # calculate time delays of lensed Supernovae in Days
-    prts = cf.call_inverse_cic_single(phi_map, 0.0, 0.0, theta1, theta2, dsx_arc)
-    Kc = ((1.0+zl)/const.c.to('Mpc/s') * \
-          (cosmo.angular_diameter_distance(zl) * \
-           cosmo.angular_diameter_distance(zs) / \
-           (cosmo.angular_diameter_distance(zs) - \
-            cosmo.angular_diameter_distance(zl)))).to('sday').value
+        theta1, theta2: image positions [arcsec]
+        phi: lensing potential at images
+        beta: source position [arcsec]
+    Output:
+        delta_t: arrival times of images [sday]
+    """
+    table = cosmotable.get_table(cosmo)
+    # time-delay distance (1+zl) Dl Ds/Dls
+    Kc = table.Ddt(zl, zs)*table.tsec_fac/sday  #[sday]
     delta_t = Kc*(0.5*((theta1 - beta[0])**2.0 + \
-                       (theta2 - beta[1])**2.0) - prts)/cf.apr**2
-    theta = np.array([theta1, theta2]).T
-    return len(mu), delta_t, mu, theta
+                       (theta2 - beta[1])**2.0) - phi)/cf.apr**2
+    return delta_t
+
+
+def image_table(nimgs, theta1, theta2, mu, phi, beta1, beta2, zs, zl, cosmo):
+    """
+    Table of all images of all sources of a lens, Fermat potentials and
+    time delays of all images in one pass with tabulated distances
+    Input:
+        nimgs[np.array] : number of images of every source
+        theta1, theta2[np.array] : image positions of all sources, images
+                                   of one source following each other [arcsec]
+        mu, phi[np.array] : magnification and lensing potential at images
+        beta1, beta2[np.array] : source positions [arcsec]
+        zs[np.array] : source redshifts
+        zl[float] : lens redshift
+    Output:
+        table[dict] : 'offsets', images of source s are
+                      [offsets[s]:offsets[s+1]], 'source' index of every
+                      image, 'theta1', 'theta2', 'mu', 'phi', 'fermat'
+                      Fermat potential [arcsec^2] and 'delta_t' arrival
+                      time [sday] of every image
+    """
+    nimgs = np.asarray(nimgs, dtype=np.int64)
+    offsets = np.zeros(len(nimgs)+1, dtype=np.int64)
+    offsets[1:] = np.cumsum(nimgs)
+    src = np.repeat(np.arange(len(nimgs)), nimgs)
+    theta1 = np.asarray(theta1, dtype=np.float64)
+    theta2 = np.asarray(theta2, dtype=np.float64)
+    phi = np.asarray(phi, dtype=np.float64)
+    table = cosmotable.get_table(cosmo)
+    # time-delay distance (1+zl) Dl Ds/Dls of every source
+    Kc = np.atleast_1d(table.Ddt(zl, np.asarray(zs, dtype=np.float64)))* \
+         table.tsec_fac/sday  #[sday]
+    fermat = 0.5*((theta1 - np.asarray(beta1)[src])**2 + \
+                  (theta2 - np.asarray(beta2)[src])**2) - phi
+    return {'offsets' : offsets, 'source' : src,
+            'theta1' : theta1, 'theta2' : theta2,
+            'mu' : np.asarray(mu, dtype=np.float64), 'phi' : phi,
+            'fermat' : fermat, 'delta_t' : Kc[src]*fermat/cf.apr**2}
@@ -0,0 +1,378 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <math.h>
+#include <complex.h>
+#include <omp.h>
+#include "bhtree.h"
+
+/*
+ * Barnes-Hut tree of point masses on a plane for the deflection and
+ * potential of a lens of unit critical surface density,
+ *   alpha(x) = 1/pi sum_i m_i (x-x_i)/|x-x_i|^2,
+ *   phi(x)   = 1/pi sum_i m_i ln|x-x_i|,
+ * without periodic images or zero-padding.
+ * With z = x1+i*x2 the potential is the real part of
+ * Phi(z) = 1/pi sum_i m_i log(z-z_i) and alpha1 - i*alpha2 = Phi'(z).
+ * Every node keeps the moments a_k = sum_i m_i (z_i-z_c)^k, k <= order,
+ * about its centre of mass z_c. Nodes of side s seen from a distance d
+ * with d > s/theta + delta, delta the offset of z_c from the centre of
+ * the node, are evaluated from the multipole expansion
+ *   Phi(z)  = 1/pi (a_0 log(w) - sum_k a_k/(k w^k)),
+ *   Phi'(z) = 1/pi sum_k a_k/w^(k+1),          w = z-z_c,
+ * the particles of all other leaves directly, softened by eps.
+ * Particles with smoothing lengths h are projected SPH particles with
+ * the cubic spline kernel of cal_sph_sdens_weight (support 2h), their
+ * deflection is that of the mass F(R/h) enclosed within R. Far nodes
+ * are expanded as point masses, the particles of far nodes whose kernel
+ * reaches the point (within 2*hmax of the box) are corrected directly.
+ * The Jacobian d_ij = d alpha_i/d x_j follows from
+ *   Phi''(z) = -1/pi sum_k (k+1) a_k/w^(k+2),
+ * d11 = Re Phi'', d12 = -Im Phi'', d22 = -d11 of the expansions.
+ */
+#define KERNEL_A (20.0/7.0)
+//--------------------------------------------------------------------
+static double kernel_mass(double q) {
+	// mass fraction of the projected cubic spline within q = R/h
+	if (q < 1.0) return KERNEL_A*q*q*(0.5 - 0.375*q*q + 0.15*q*q*q);
+	if (q < 2.0) return KERNEL_A*(q*q - q*q*q + 0.375*q*q*q*q - 0.05*q*q*q*q*q - 0.05);
+	return 1.0;
+}
+//--------------------------------------------------------------------
+static double kernel_dmass(double q) {
+	// dF/dq = A q w(q)
+	if (q < 1.0) return KERNEL_A*q*(1.0 - 1.5*q*q + 0.75*q*q*q);
+	if (q < 2.0) return KERNEL_A*q*0.25*(2.0-q)*(2.0-q)*(2.0-q);
+	return 0.0;
+}
+//--------------------------------------------------------------------
+static double kernel_pot2(double q) {
+	return log(2.0)*(1.0 + 0.05*KERNEL_A) - KERNEL_A*(77.0/150.0)
+	       + KERNEL_A*(q*q/2.0 - q*q*q/3.0 + 3.0*q*q*q*q/32.0 - q*q*q*q*q/100.0 - 0.05*log(q));
+}
+//--------------------------------------------------------------------
+static double kernel_pot(double q) {
+	// potential of the kernel in units of ln(R) outside, psi(q) + ln(h),
+	// psi' = F/q and psi(2) = ln(2)
+	if (q < 1.0) return kernel_pot2(1.0)
+	                    - KERNEL_A*(0.18625 - (q*q/4.0 - 3.0*q*q*q*q/32.0 + 3.0*q*q*q*q*q/100.0));
+	if (q < 2.0) return kernel_pot2(q);
+	return log(q);
+}
+//--------------------------------------------------------------------
+static long new_node(bh_tree *tree) {
+	if (tree->nnodes == tree->capacity) {
+		tree->capacity *= 2;
+		tree->nodes = (bh_node *)realloc(tree->nodes, tree->capacity*sizeof(bh_node));
+	}
+	return tree->nnodes++;
+}
+//--------------------------------------------------------------------
+static void node_moments(bh_tree *tree, bh_node *node) {
+	long i, p;
+	int k;
+	double mtot = 0.0, c1 = 0.0, c2 = 0.0;
+	double complex w, wk;
+
+	node->hmax = 0.0;
+	for (i = node->first; i < node->first+node->count; i++) {
+		p = tree->idx[i];
+		if (tree->h != NULL && tree->h[p] > node->hmax) node->hmax = tree->h[p];
+		mtot += tree->m[p];
+		c1 += tree->m[p]*tree->x1[p];
+		c2 += tree->m[p]*tree->x2[p];
+	}
+	if (mtot != 0.0) {
+		node->c1 = c1/mtot;
+		node->c2 = c2/mtot;
+	}
+	else {
+		node->c1 = node->lo1 + 0.5*node->size;
+		node->c2 = node->lo2 + 0.5*node->size;
+	}
+	// offset of the centre of mass from the centre of the box
+	node->delta = hypot(node->c1 - node->lo1 - 0.5*node->size,
+	                    node->c2 - node->lo2 - 0.5*node->size);
+	for (k = 0; k <= tree->order; k++) node->a[k] = 0.0;
+	for (i = node->first; i < node->first+node->count; i++) {
+		p = tree->idx[i];
+		w = (tree->x1[p] - node->c1) + I*(tree->x2[p] - node->c2);
+		wk = tree->m[p];
+		for (k = 0; k <= tree->order; k++) {
+			node->a[k] += wk;
+			wk *= w;
+		}
+	}
+}
+//--------------------------------------------------------------------
+static long build_node(bh_tree *tree, long first, long count, double lo1, double lo2,
+                       double size, int depth, long *buffer) {
+	long nd = new_node(tree);
+	long i, p, q, start[4], fill[4];
+	int c;
+	double mid1 = lo1 + 0.5*size;
+	double mid2 = lo2 + 0.5*size;
+	bh_node *node = &tree->nodes[nd];
+
+	node->lo1 = lo1;
+	node->lo2 = lo2;
+	node->size = size;
+	node->first = first;
+	node->count = count;
+	for (c = 0; c < 4; c++) node->child[c] = -1;
+	node_moments(tree, node);
+	// coincident particles stay in one leaf
+	if (count <= tree->leafsize || depth >= 48) return nd;
+
+	// sort particles into the quadrants
+	for (c = 0; c < 4; c++) fill[c] = 0;
+	for (i = first; i < first+count; i++) {
+		p = tree->idx[i];
+		c = (tree->x1[p] >= mid1) + 2*(tree->x2[p] >= mid2);
+		fill[c]++;
+	}
+	start[0] = first;
+	for (c = 1; c < 4; c++) start[c] = start[c-1] + fill[c-1];
+	for (c = 0; c < 4; c++) fill[c] = start[c];
+	for (i = first; i < first+count; i++) {
+		p = tree->idx[i];
+		c = (tree->x1[p] >= mid1) + 2*(tree->x2[p] >= mid2);
+		buffer[fill[c]++] = p;
+	}
+	for (i = first; i < first+count; i++) tree->idx[i] = buffer[i];
+
+	for (c = 0; c < 4; c++) {
+		if (fill[c] == start[c]) continue;
+		q = build_node(tree, start[c], fill[c]-start[c],
+		               (c%2) ? mid1 : lo1, (c/2) ? mid2 : lo2, 0.5*size, depth+1, buffer);
+		// the node array may have moved
+		tree->nodes[nd].child[c] = q;
+	}
+	return nd;
+}
+//--------------------------------------------------------------------
+void bh_build(bh_tree *tree, double *x1, double *x2, double *m, double *h, long n,
+              int order, int leafsize) {
+	long i;
+	double lo1, hi1, lo2, hi2, size;
+	long *buffer = (long *)malloc((n > 0 ? n : 1)*sizeof(long));
+
+	tree->x1 = x1;
+	tree->x2 = x2;
+	tree->m = m;
+	tree->h = h;
+	tree->order = (order > BH_MAXORDER) ? BH_MAXORDER : order;
+	tree->leafsize = (leafsize > 0) ? leafsize : 1;
+	tree->idx = (long *)malloc((n > 0 ? n : 1)*sizeof(long));
+	tree->capacity = 1024;
+	tree->nnodes = 0;
+	tree->nodes = (bh_node *)malloc(tree->capacity*sizeof(bh_node));
+	if (n == 0) {
+		free(buffer);
+		return;
+	}
+
+	lo1 = hi1 = x1[0];
+	lo2 = hi2 = x2[0];
+	for (i = 0; i < n; i++) {
+		tree->idx[i] = i;
+		if (x1[i] < lo1) lo1 = x1[i];
+		if (x1[i] > hi1) hi1 = x1[i];
+		if (x2[i] < lo2) lo2 = x2[i];
+		if (x2[i] > hi2) hi2 = x2[i];
+	}
+	size = fmax(hi1-lo1, hi2-lo2);
+	size = (size > 0.0) ? size*(1.0+1e-9) : 1.0;
+	build_node(tree, 0, n, lo1, lo2, size, 0, buffer);
+	free(buffer);
+}
+//--------------------------------------------------------------------
+void bh_free(bh_tree *tree) {
+	free(tree->idx);
+	free(tree->nodes);
+}
+//--------------------------------------------------------------------
+static void point_terms(bh_tree *tree, long p, double y1, double y2, double eps2,
+                        int correction, double *s) {
+	/*
+	 * Adds the deflection, potential and Jacobian of particle p at
+	 * (y1, y2) to s = (alpha1, alpha2, phi, d11, d12, d22), times pi.
+	 * With correction only the difference of the smoothed particle to
+	 * the point mass of the multipole expansions is added.
+	 */
+	double d1 = y1 - tree->x1[p];
+	double d2 = y2 - tree->x2[p];
+	double rr = d1*d1 + d2*d2;
+	double m = tree->m[p];
+	double hh, q, ff, gg;
+
+	if (tree->h == NULL || tree->h[p] <= 0.0) {
+		rr += eps2;
+		if (rr == 0.0 || correction) return;
+		s[0] += m*d1/rr;
+		s[1] += m*d2/rr;
+		s[2] += 0.5*m*log(rr);
+		s[3] += m*(rr - 2.0*d1*d1)/(rr*rr);
+		s[4] -= m*2.0*d1*d2/(rr*rr);
+		s[5] += m*(rr - 2.0*d2*d2)/(rr*rr);
+		return;
+	}
+	hh = tree->h[p];
+	if (correction && rr >= 4.0*hh*hh) return;
+	if (rr < 1e-24*hh*hh) {
+		// centre of the kernel, F/R^2 -> A/(2h^2)
+		s[2] += m*(kernel_pot(0.0) + log(hh));
+		s[3] += m*0.5*KERNEL_A/(hh*hh);
+		s[5] += m*0.5*KERNEL_A/(hh*hh);
+		return;
+	}
+	q = sqrt(rr)/hh;
+	ff = m*kernel_mass(q)/rr;
+	gg = m*kernel_dmass(q)/(hh*sqrt(rr)*rr) - 2.0*ff/rr;
+	s[2] += m*(kernel_pot(q) + log(hh));
+	if (correction) {
+		ff -= m/rr;
+		gg += 2.0*m/(rr*rr);
+		s[2] -= 0.5*m*log(rr);
+	}
+	s[0] += ff*d1;
+	s[1] += ff*d2;
+	s[3] += ff + gg*d1*d1;
+	s[4] += gg*d1*d2;
+	s[5] += ff + gg*d2*d2;
+}
+//--------------------------------------------------------------------
+static int in_reach(bh_node *node, double y1, double y2, double reach) {
+	return (y1 >= node->lo1-reach && y1 <= node->lo1+node->size+reach &&
+	        y2 >= node->lo2-reach && y2 <= node->lo2+node->size+reach);
+}
+//--------------------------------------------------------------------
+static void kernel_corrections(bh_tree *tree, long root, double y1, double y2, double *s) {
+	// smoothed particles of a node evaluated as multipoles, within 2h of the point
+	long stack[4*64+4];
+	long nd, i;
+	int c, sp = 0, leaf;
+	bh_node *node;
+
+	stack[sp++] = root;
+	while (sp > 0) {
+		nd = stack[--sp];
+		node = &tree->nodes[nd];
+		if (!in_reach(node, y1, y2, 2.0*node->hmax)) continue;
+		leaf = 1;
+		for (c = 0; c < 4; c++) {
+			if (node->child[c] >= 0) {
+				stack[sp++] = node->child[c];
+				leaf = 0;
+			}
+		}
+		if (!leaf) continue;
+		for (i = node->first; i < node->first+node->count; i++) {
+			point_terms(tree, tree->idx[i], y1, y2, 0.0, 1, s);
+		}
+	}
+}
+//--------------------------------------------------------------------
+void bh_evaluate(bh_tree *tree, double y1, double y2, double theta, double eps2,
+                 double *alpha1, double *alpha2, double *phi, double *jac) {
+	/*
+	 * Deflection and potential at (y1, y2), and the Jacobian
+	 * jac = (d11, d12, d22) if jac is not NULL
+	 */
+	long stack[4*64+4];
+	long nd, i;
+	int c, k, sp = 0, leaf;
+	double d1, d2, dd;
+	double s[6] = {0.0, 0.0, 0.0, 0.0, 0.0, 0.0};
+	double complex w, inv, pw, dPhi = 0.0, Phi = 0.0, ddPhi = 0.0;
+	bh_node *node;
+
+	if (tree->nnodes > 0) stack[sp++] = 0;
+	while (sp > 0) {
+		nd = stack[--sp];
+		node = &tree->nodes[nd];
+		d1 = y1 - node->c1;
+		d2 = y2 - node->c2;
+		dd = d1*d1 + d2*d2;
+		// far node, d > s/theta + delta, not containing the point
+		if (node->size < theta*(sqrt(dd) - node->delta) && !in_reach(node, y1, y2, 0.0)) {
+			w = d1 + I*d2;
+			inv = 1.0/w;
+			pw = inv;
+			Phi += node->a[0]*clog(w);
+			dPhi += node->a[0]*pw;
+			ddPhi -= node->a[0]*pw*pw;
+			for (k = 1; k <= tree->order; k++) {
+				Phi -= node->a[k]*pw/(double)k;
+				pw *= inv;
+				dPhi += node->a[k]*pw;
+				ddPhi -= (double)(k+1)*node->a[k]*pw*inv;
+			}
+			if (node->hmax > 0.0) kernel_corrections(tree, nd, y1, y2, s);
+			continue;
+		}
+		leaf = 1;
+		for (c = 0; c < 4; c++) {
+			if (node->child[c] >= 0) {
+				stack[sp++] = node->child[c];
+				leaf = 0;
+			}
+		}
+		if (!leaf) continue;
+		for (i = node->first; i < node->first+node->count; i++) {
+			point_terms(tree, tree->idx[i], y1, y2, eps2, 0, s);
+		}
+	}
+	*alpha1 = (s[0] + creal(dPhi))/M_PI;
+	*alpha2 = (s[1] - cimag(dPhi))/M_PI;
+	*phi = (s[2] + creal(Phi))/M_PI;
+	if (jac != NULL) {
+		jac[0] = (s[3] + creal(ddPhi))/M_PI;
+		jac[1] = (s[4] - cimag(ddPhi))/M_PI;
+		jac[2] = (s[5] - creal(ddPhi))/M_PI;
+	}
+}
+//--------------------------------------------------------------------
+void bh_fields(double *x1, double *x2, double *m, long n, double *y1, double *y2, long npts,
+               double theta, int order, double eps, int leafsize,
+               double *alpha1, double *alpha2, double *phi) {
+	/*
+	 * Deflection and potential of the masses m at (x1, x2) at the npts
+	 * points (y1, y2), theta = 0 sums all particles directly
+	 */
+	long j;
+	bh_tree tree;
+
+	bh_build(&tree, x1, x2, m, NULL, n, order, leafsize);
+#pragma omp parallel for schedule(dynamic,64) \
+	shared(tree, y1, y2, npts, theta, eps, alpha1, alpha2, phi) \
+	private(j)
+	for (j = 0; j < npts; j++) {
+		bh_evaluate(&tree, y1[j], y2[j], theta, eps*eps, &alpha1[j], &alpha2[j], &phi[j], NULL);
+	}
+	bh_free(&tree);
+}
+//--------------------------------------------------------------------
+void bh_particle_fields(double *x1, double *x2, double *m, double *h, long n,
+                        double *y1, double *y2, long npts, double theta, int order, int leafsize,
+                        double *alpha1, double *alpha2, double *phi,
+                        double *d11, double *d12, double *d22) {
+	/*
+	 * Deflection, potential and Jacobian of projected SPH particles of
+	 * smoothing lengths h at the npts points (y1, y2)
+	 */
+	long j;
+	double jac[3];
+	bh_tree tree;
+
+	bh_build(&tree, x1, x2, m, h, n, order, leafsize);
+#pragma omp parallel for schedule(dynamic,64) \
+	shared(tree, y1, y2, npts, theta, alpha1, alpha2, phi, d11, d12, d22) \
+	private(j, jac)
+	for (j = 0; j < npts; j++) {
+		bh_evaluate(&tree, y1[j], y2[j], theta, 0.0, &alpha1[j], &alpha2[j], &phi[j], jac);
+		d11[j] = jac[0];
+		d12[j] = jac[1];
+		d22[j] = jac[2];
+	}
+	bh_free(&tree);
+}
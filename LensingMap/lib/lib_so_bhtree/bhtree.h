@@ -0,0 +1,21 @@
+#define BH_MAXORDER 8
+typedef struct {
+	double lo1, lo2, size;
+	double c1, c2;
+	double hmax, delta;
+	long first, count;
+	long child[4];
+	double complex a[BH_MAXORDER+1];
+} bh_node;
+typedef struct {
+	double *x1, *x2, *m, *h;
+	long *idx;
+	bh_node *nodes;
+	long nnodes, capacity;
+	int order, leafsize;
+} bh_tree;
+void bh_build(bh_tree *tree, double *x1, double *x2, double *m, double *h, long n, int order, int leafsize);
+void bh_free(bh_tree *tree);
+void bh_evaluate(bh_tree *tree, double y1, double y2, double theta, double eps2, double *alpha1, double *alpha2, double *phi, double *jac);
+void bh_fields(double *x1, double *x2, double *m, long n, double *y1, double *y2, long npts, double theta, int order, double eps, int leafsize, double *alpha1, double *alpha2, double *phi);
+void bh_particle_fields(double *x1, double *x2, double *m, double *h, long n, double *y1, double *y2, long npts, double theta, int order, int leafsize, double *alpha1, double *alpha2, double *phi, double *d11, double *d12, double *d22);
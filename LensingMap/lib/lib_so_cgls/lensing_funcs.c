@@ -167,3 +167,261 @@ void kappa0_to_phi(double * kappa0, int Nc, double bsz, double * phi) {
 
 	free(phi_tmp);
 }
+//--------------------------------------------------------------------
+void spectrum_to_map(fftw_complex *in_fft, double *kernel_fft, int Nc2, double norm, double *out) {
+	// inverse transform of in_fft times a real kernel, corner of the padded map
+	int i;
+	int nh = Nc2*(Nc2/2+1);
+
+	fftw_complex *out_fft = (fftw_complex *)fftw_malloc(nh*sizeof(fftw_complex));
+	for(i=0;i<nh;i++) {
+		out_fft[i][0] = in_fft[i][0]*kernel_fft[i];
+		out_fft[i][1] = in_fft[i][1]*kernel_fft[i];
+	}
+
+	double *out_tmp = (double *)calloc(Nc2*Nc2,sizeof(double));
+	fftw_c2r_2d(out_fft, out_tmp, Nc2, Nc2);
+	for(i=0;i<Nc2*Nc2;i++) out_tmp[i] = out_tmp[i]*norm;
+	corner_matrix(out_tmp,Nc2,Nc2,out);
+
+	fftw_free(out_fft);
+	free(out_tmp);
+}
+//--------------------------------------------------------------------
+void kernel_convolve(fftw_complex *in_fft, double *kernel, double *smooth, int Nc2, double dsx, double *out) {
+	// convolution of the transformed map with a real space kernel
+	int i;
+	int nh = Nc2*(Nc2/2+1);
+	double tmpr,tmpi;
+
+	fftw_complex *kernel_fft = (fftw_complex *)fftw_malloc(nh*sizeof(fftw_complex));
+	fftw_r2c_2d(kernel, kernel_fft, Nc2, Nc2);
+
+	fftw_complex *out_fft = (fftw_complex *)fftw_malloc(nh*sizeof(fftw_complex));
+	for(i=0;i<nh;i++) {
+		tmpr = in_fft[i][0]*kernel_fft[i][0]-in_fft[i][1]*kernel_fft[i][1];
+		tmpi = in_fft[i][0]*kernel_fft[i][1]+in_fft[i][1]*kernel_fft[i][0];
+		out_fft[i][0] = tmpr*smooth[i];
+		out_fft[i][1] = tmpi*smooth[i];
+	}
+	fftw_free(kernel_fft);
+
+	double *out_tmp = (double *)calloc(Nc2*Nc2,sizeof(double));
+	fftw_c2r_2d(out_fft, out_tmp, Nc2, Nc2);
+	for(i=0;i<Nc2*Nc2;i++) out_tmp[i] = out_tmp[i]/((double)Nc2*Nc2)*dsx*dsx;
+	corner_matrix(out_tmp,Nc2,Nc2,out);
+
+	fftw_free(out_fft);
+	free(out_tmp);
+}
+//--------------------------------------------------------------------
+void kappa0_to_signals(double * kappa0, int Nc, double bsz, double ksigma,
+                       double * alpha1, double * alpha2, double * phi,
+                       double * kappa_s, double * shear1, double * shear2) {
+	// deflection, potential, convergence and shear from one transform of
+	// the padded convergence map. Shears follow from the spectrum as
+	// shear1 = (k1^2-k2^2)/k^2 kappa, shear2 = 2 k1 k2/k^2 kappa.
+	// ksigma > 0 multiplies all fields by a Gaussian kernel of that width.
+	int i,j,index;
+	int Nc2 = Nc*2;
+	int Nh = Nc2/2+1;
+	double dsx = bsz/(double)Nc;
+	double dk = 2.0*M_PI/(dsx*(double)Nc2);
+	double k1,k2,kk,norm;
+
+	double *kappa = (double *)calloc(Nc2*Nc2,sizeof(double));
+	zero_padding(kappa0,Nc,Nc,kappa);
+
+	fftw_complex *kappa_fft = (fftw_complex *)fftw_malloc(Nc2*Nh*sizeof(fftw_complex));
+	fftw_r2c_2d(kappa, kappa_fft, Nc2, Nc2);
+	free(kappa);
+
+	double *smooth = (double *)calloc(Nc2*Nh,sizeof(double));
+	double *ker_s1 = (double *)calloc(Nc2*Nh,sizeof(double));
+	double *ker_s2 = (double *)calloc(Nc2*Nh,sizeof(double));
+	for(i=0;i<Nc2;i++) for(j=0;j<Nh;j++) {
+		index = i*Nh+j;
+		k1 = (i <= Nc2/2) ? (double)i*dk : (double)(i-Nc2)*dk;
+		k2 = (double)j*dk;
+		kk = k1*k1+k2*k2;
+		smooth[index] = (ksigma > 0.0) ? exp(-0.5*kk*ksigma*ksigma) : 1.0;
+		if(index > 0) {
+			ker_s1[index] = (k1*k1-k2*k2)/kk*smooth[index];
+			ker_s2[index] = 2.0*k1*k2/kk*smooth[index];
+		}
+	}
+
+	norm = 1.0/((double)Nc2*Nc2);
+	spectrum_to_map(kappa_fft,smooth,Nc2,norm,kappa_s);
+	spectrum_to_map(kappa_fft,ker_s1,Nc2,norm,shear1);
+	spectrum_to_map(kappa_fft,ker_s2,Nc2,norm,shear2);
+	free(ker_s1);
+	free(ker_s2);
+
+	double *alpha1_iso = (double *)calloc(Nc2*Nc2,sizeof(double));
+	double *alpha2_iso = (double *)calloc(Nc2*Nc2,sizeof(double));
+	kernel_alphas_iso(Nc2,alpha1_iso,alpha2_iso,dsx);
+	kernel_convolve(kappa_fft,alpha1_iso,smooth,Nc2,dsx,alpha1);
+	kernel_convolve(kappa_fft,alpha2_iso,smooth,Nc2,dsx,alpha2);
+	free(alpha1_iso);
+	free(alpha2_iso);
+
+	double *phi_iso = (double *)calloc(Nc2*Nc2,sizeof(double));
+	kernel_phi_iso(Nc2,phi_iso,dsx);
+	kernel_convolve(kappa_fft,phi_iso,smooth,Nc2,dsx,phi);
+	free(phi_iso);
+
+	fftw_free(kappa_fft);
+	free(smooth);
+}
+//--------------------------------------------------------------------
+void kernel_far_iso(int Ncc,double *in1,double *in2,double *in3,double Dcell) {
+	// deflection and potential kernels of point masses at cell centres,
+	// not truncated, for mass far from where the fields are evaluated
+	int i,j;
+	double x,y,r2;
+
+	for(i=0;i<Ncc;i++) for(j=0;j<Ncc;j++) {
+		x = (i <= Ncc/2) ? (double)i*Dcell : (double)(i-Ncc)*Dcell;
+		y = (j <= Ncc/2) ? (double)j*Dcell : (double)(j-Ncc)*Dcell;
+		r2 = x*x+y*y;
+		if(i == 0 && j == 0) {
+			in1[0] = 0.0;
+			in2[0] = 0.0;
+			in3[0] = 1.0/M_PI*log(0.5*Dcell);
+		}
+		else {
+			in1[i*Ncc+j] = x/(M_PI*r2);
+			in2[i*Ncc+j] = y/(M_PI*r2);
+			in3[i*Ncc+j] = 0.5/M_PI*log(r2);
+		}
+	}
+}
+//--------------------------------------------------------------------
+void kappa0_to_far_fields(double * kappa0, int Nc, double bsz, double * alpha1, double * alpha2, double * phi) {
+	// deflection and potential of a convergence map with point mass kernels
+	int i;
+	int Nc2 = Nc*2;
+	int Nh = Nc2/2+1;
+	double dsx = bsz/(double)Nc;
+
+	double *kappa = (double *)calloc(Nc2*Nc2,sizeof(double));
+	zero_padding(kappa0,Nc,Nc,kappa);
+	fftw_complex *kappa_fft = (fftw_complex *)fftw_malloc(Nc2*Nh*sizeof(fftw_complex));
+	fftw_r2c_2d(kappa, kappa_fft, Nc2, Nc2);
+	free(kappa);
+
+	double *ones = (double *)malloc(Nc2*Nh*sizeof(double));
+	for(i=0;i<Nc2*Nh;i++) ones[i] = 1.0;
+
+	double *alpha1_far = (double *)calloc(Nc2*Nc2,sizeof(double));
+	double *alpha2_far = (double *)calloc(Nc2*Nc2,sizeof(double));
+	double *phi_far = (double *)calloc(Nc2*Nc2,sizeof(double));
+	kernel_far_iso(Nc2,alpha1_far,alpha2_far,phi_far,dsx);
+	kernel_convolve(kappa_fft,alpha1_far,ones,Nc2,dsx,alpha1);
+	kernel_convolve(kappa_fft,alpha2_far,ones,Nc2,dsx,alpha2);
+	kernel_convolve(kappa_fft,phi_far,ones,Nc2,dsx,phi);
+
+	free(alpha1_far);
+	free(alpha2_far);
+	free(phi_far);
+	free(ones);
+	fftw_free(kappa_fft);
+}
+//--------------------------------------------------------------------
+void kappa0_to_fields_many(double *kappa0, int nmap, int Nc, double *bsz, int nthreads,
+                           double *alpha1, double *alpha2, double *phi) {
+	// deflection and potential of a stack of nmap maps of Nc x Nc cells,
+	// one multi-transform plan for all maps. The kernels are transformed
+	// once for a cell size of unity: with cell size dsx the deflection
+	// kernels scale as 1/dsx and the potential kernel log(r) gains
+	// log(dsx) within the truncation radius (mask), so that
+	//   alpha = dsx*(kappa x K_alpha), phi = dsx^2*(kappa x (K_phi+log(dsx)/pi*mask))
+	static int threads_ready = 0;
+	int j,m,f;
+	long i,index;
+	int Nc2 = Nc*2;
+	int Nh = Nc2/2+1;
+	long nr = (long)Nc2*Nc2;
+	long nk = (long)Nc2*Nh;
+	int dims[2] = {Nc2, Nc2};
+	double dsx,scale,shift,norm = 1.0/((double)nr);
+	double tmpr,tmpi,kr,ki;
+	double *out;
+
+	// the threads of FFTW are set up once per process
+	if (!threads_ready) {
+		fftw_init_threads();
+		threads_ready = 1;
+	}
+	fftw_plan_with_nthreads(nthreads);
+
+	// kernels of unit cell size
+	double *ker = (double *)fftw_malloc(nr*sizeof(double));
+	fftw_complex *ker_fft = (fftw_complex *)fftw_malloc(4*nk*sizeof(fftw_complex));
+	double *ker_a2 = (double *)calloc(nr,sizeof(double));
+	kernel_alphas_iso(Nc2,ker,ker_a2,1.0);
+	fftw_r2c_2d(ker,ker_fft,Nc2,Nc2);
+	fftw_r2c_2d(ker_a2,ker_fft+nk,Nc2,Nc2);
+	free(ker_a2);
+	kernel_phi_iso(Nc2,ker,1.0);
+	fftw_r2c_2d(ker,ker_fft+2*nk,Nc2,Nc2);
+	for(i=0;i<nr;i++) ker[i] = 0.0;
+	for(i=0;i<=Nc2/2;i++) for(j=0;j<=Nc2/2;j++) {
+		if ((i+0.5)*(i+0.5)+(j+0.5)*(j+0.5) > 0.25*(double)Nc2*Nc2) continue;
+		ker[i*Nc2+j] = 1.0;
+		if (i > 0) ker[(Nc2-i)*Nc2+j] = 1.0;
+		if (j > 0) ker[i*Nc2+Nc2-j] = 1.0;
+		if (i > 0 && j > 0) ker[(Nc2-i)*Nc2+Nc2-j] = 1.0;
+	}
+	fftw_r2c_2d(ker,ker_fft+3*nk,Nc2,Nc2);
+	fftw_free(ker);
+
+	// spectra of all padded maps
+	double *real = (double *)fftw_malloc(nmap*nr*sizeof(double));
+	fftw_complex *kappa_fft = (fftw_complex *)fftw_malloc(nmap*nk*sizeof(fftw_complex));
+	fftw_complex *prod_fft = (fftw_complex *)fftw_malloc(nmap*nk*sizeof(fftw_complex));
+	fftw_plan plfd = fftw_plan_many_dft_r2c(2,dims,nmap,real,NULL,1,nr,
+	                                        kappa_fft,NULL,1,nk,FFTW_ESTIMATE);
+	fftw_plan plbd = fftw_plan_many_dft_c2r(2,dims,nmap,prod_fft,NULL,1,nk,
+	                                        real,NULL,1,nr,FFTW_ESTIMATE);
+
+#pragma omp parallel for num_threads(nthreads) private(i)
+	for(m=0;m<nmap;m++) {
+		for(i=0;i<nr;i++) real[m*nr+i] = 0.0;
+		zero_padding(kappa0+(long)m*Nc*Nc,Nc,Nc,real+m*nr);
+	}
+	fftw_execute(plfd);
+
+	for(f=0;f<3;f++) {
+#pragma omp parallel for num_threads(nthreads) private(i,index,dsx,scale,shift,kr,ki,tmpr,tmpi)
+		for(m=0;m<nmap;m++) {
+			dsx = bsz[m]/(double)Nc;
+			scale = (f < 2) ? dsx*norm : dsx*dsx*norm;
+			shift = (f < 2) ? 0.0 : log(dsx)/M_PI;
+			for(i=0;i<nk;i++) {
+				index = (long)m*nk+i;
+				kr = ker_fft[f*nk+i][0]+shift*ker_fft[3*nk+i][0];
+				ki = ker_fft[f*nk+i][1]+shift*ker_fft[3*nk+i][1];
+				tmpr = kappa_fft[index][0]*kr-kappa_fft[index][1]*ki;
+				tmpi = kappa_fft[index][0]*ki+kappa_fft[index][1]*kr;
+				prod_fft[index][0] = tmpr*scale;
+				prod_fft[index][1] = tmpi*scale;
+			}
+		}
+		fftw_execute(plbd);
+		out = (f == 0) ? alpha1 : ((f == 1) ? alpha2 : phi);
+#pragma omp parallel for num_threads(nthreads)
+		for(m=0;m<nmap;m++) {
+			corner_matrix(real+m*nr,Nc2,Nc2,out+(long)m*Nc*Nc);
+		}
+	}
+
+	fftw_destroy_plan(plfd);
+	fftw_destroy_plan(plbd);
+	fftw_free(real);
+	fftw_free(kappa_fft);
+	fftw_free(prod_fft);
+	fftw_free(ker_fft);
+	fftw_plan_with_nthreads(1);
+}
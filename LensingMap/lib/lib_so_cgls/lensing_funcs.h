@@ -5,3 +5,9 @@ void kernel_alphas_iso(int Ncc,double *in1,double *in2,double Dcell);
 void kappa0_to_alphas(double * kappa0, int Nc, double bsz, double * alpha1, double * alpha2);
 void kernel_phi_iso(int Ncc,double *in,double Dcell);
 void kappa0_to_phi(double * kappa0, int Nc, double bsz, double * phi);
+void spectrum_to_map(fftw_complex *in_fft, double *kernel_fft, int Nc2, double norm, double *out);
+void kernel_convolve(fftw_complex *in_fft, double *kernel, double *smooth, int Nc2, double dsx, double *out);
+void kappa0_to_signals(double * kappa0, int Nc, double bsz, double ksigma, double * alpha1, double * alpha2, double * phi, double * kappa_s, double * shear1, double * shear2);
+void kernel_far_iso(int Ncc,double *in1,double *in2,double *in3,double Dcell);
+void kappa0_to_far_fields(double * kappa0, int Nc, double bsz, double * alpha1, double * alpha2, double * phi);
+void kappa0_to_fields_many(double *kappa0, int nmap, int Nc, double *bsz, int nthreads, double *alpha1, double *alpha2, double *phi);
@@ -0,0 +1,204 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <math.h>
+#include <fftw3.h>
+#include "lensing_funcs_sp.h"
+/*
+ * Single precision variants of the FFT lensing kernels of lensing_funcs.c,
+ * transforms with fftwf. The kernels are evaluated in double precision
+ * and stored as float, only the maps and transforms are single precision.
+ */
+//--------------------------------------------------------------------
+void fftwf_r2c_2d_sp(float *in_real, fftwf_complex *in_fft, int nx, int ny) {
+	fftwf_plan plfd;
+	plfd = fftwf_plan_dft_r2c_2d(nx,ny,in_real,in_fft,FFTW_ESTIMATE);
+	fftwf_execute(plfd);
+	fftwf_destroy_plan(plfd);
+}
+//--------------------------------------------------------------------
+void fftwf_c2r_2d_sp(fftwf_complex *in_fft, float *in_real, int nx, int ny) {
+	// the c2r transform overwrites its input
+	fftwf_plan plbd;
+	plbd = fftwf_plan_dft_c2r_2d(nx,ny,in_fft,in_real,FFTW_ESTIMATE);
+	fftwf_execute(plbd);
+	fftwf_destroy_plan(plbd);
+}
+//--------------------------------------------------------------------
+void zero_padding_sp(float *in, int nx, int ny, float *out) {
+	int i,j;
+	for(i=0;i<nx;i++) for(j=0;j<ny;j++) {
+		out[i*2*ny+j] = in[i*ny+j];
+	}
+}
+//--------------------------------------------------------------------
+void corner_matrix_sp(float *in, int nx, int ny, float norm, float *out) {
+	int i,j;
+	for(i=0;i<nx/2;i++) for(j=0;j<ny/2;j++) {
+		out[i*ny/2+j] = in[i*ny+j]*norm;
+	}
+}
+//--------------------------------------------------------------------
+void kernel_fields_sp(int Ncc, float *in1, float *in2, float *in3, double Dcell) {
+	// deflection and potential kernels of kernel_alphas_iso and
+	// kernel_phi_iso, both truncated at half the padded map
+	int i,j,i0,j0;
+	double x,y,r,s1,s2;
+
+	for(i=0;i<Ncc;i++) for(j=0;j<Ncc;j++) {
+		i0 = (i <= Ncc/2) ? i : Ncc-i;
+		j0 = (j <= Ncc/2) ? j : Ncc-j;
+		s1 = (i <= Ncc/2) ? 1.0 : -1.0;
+		s2 = (j <= Ncc/2) ? 1.0 : -1.0;
+		x = (double)(i0)*Dcell+0.5*Dcell;
+		y = (double)(j0)*Dcell+0.5*Dcell;
+		r = sqrt(x*x+y*y);
+		if(r > Dcell*(double)Ncc/2.0) {
+			in1[i*Ncc+j] = 0.0f;
+			in2[i*Ncc+j] = 0.0f;
+			in3[i*Ncc+j] = 0.0f;
+		}
+		else {
+			in1[i*Ncc+j] = (float)(s1*x/(M_PI*r*r));
+			in2[i*Ncc+j] = (float)(s2*y/(M_PI*r*r));
+			in3[i*Ncc+j] = (float)(1.0/M_PI*log(r));
+		}
+	}
+}
+//--------------------------------------------------------------------
+void spectrum_product_sp(fftwf_complex *in_fft, fftwf_complex *kernel_fft, float *smooth,
+                         int Nc2, float norm, float *out) {
+	// inverse transform of in_fft times a kernel spectrum (NULL for unity)
+	// and a real factor (NULL for unity), corner of the padded map
+	int i;
+	int nh = Nc2*(Nc2/2+1);
+	float tmpr,tmpi;
+
+	fftwf_complex *out_fft = (fftwf_complex *)fftwf_malloc(nh*sizeof(fftwf_complex));
+	for(i=0;i<nh;i++) {
+		tmpr = in_fft[i][0];
+		tmpi = in_fft[i][1];
+		if(kernel_fft != NULL) {
+			tmpr = in_fft[i][0]*kernel_fft[i][0]-in_fft[i][1]*kernel_fft[i][1];
+			tmpi = in_fft[i][0]*kernel_fft[i][1]+in_fft[i][1]*kernel_fft[i][0];
+		}
+		if(smooth != NULL) {
+			tmpr *= smooth[i];
+			tmpi *= smooth[i];
+		}
+		out_fft[i][0] = tmpr;
+		out_fft[i][1] = tmpi;
+	}
+
+	float *out_tmp = (float *)fftwf_malloc(Nc2*Nc2*sizeof(float));
+	fftwf_c2r_2d_sp(out_fft,out_tmp,Nc2,Nc2);
+	corner_matrix_sp(out_tmp,Nc2,Nc2,norm,out);
+
+	fftwf_free(out_fft);
+	fftwf_free(out_tmp);
+}
+//--------------------------------------------------------------------
+fftwf_complex *padded_spectrum_sp(float *kappa0, int Nc) {
+	int Nc2 = Nc*2;
+	float *kappa = (float *)fftwf_malloc(Nc2*Nc2*sizeof(float));
+	fftwf_complex *kappa_fft = (fftwf_complex *)fftwf_malloc(Nc2*(Nc2/2+1)*sizeof(fftwf_complex));
+	int i;
+
+	for(i=0;i<Nc2*Nc2;i++) kappa[i] = 0.0f;
+	zero_padding_sp(kappa0,Nc,Nc,kappa);
+	fftwf_r2c_2d_sp(kappa,kappa_fft,Nc2,Nc2);
+	fftwf_free(kappa);
+	return kappa_fft;
+}
+//--------------------------------------------------------------------
+void kernel_convolve_sp(fftwf_complex *kappa_fft, float *kernel, float *smooth, int Nc2,
+                        double dsx, float *out) {
+	fftwf_complex *kernel_fft = (fftwf_complex *)fftwf_malloc(Nc2*(Nc2/2+1)*sizeof(fftwf_complex));
+	fftwf_r2c_2d_sp(kernel,kernel_fft,Nc2,Nc2);
+	spectrum_product_sp(kappa_fft,kernel_fft,smooth,Nc2,
+	                    (float)(dsx*dsx/((double)Nc2*Nc2)),out);
+	fftwf_free(kernel_fft);
+}
+//--------------------------------------------------------------------
+void kappa0_to_alphas_sp(float *kappa0, int Nc, double bsz, float *alpha1, float *alpha2) {
+	int Nc2 = Nc*2;
+	double dsx = bsz/(double)Nc;
+
+	fftwf_complex *kappa_fft = padded_spectrum_sp(kappa0,Nc);
+	float *alpha1_iso = (float *)fftwf_malloc(Nc2*Nc2*sizeof(float));
+	float *alpha2_iso = (float *)fftwf_malloc(Nc2*Nc2*sizeof(float));
+	float *phi_iso = (float *)fftwf_malloc(Nc2*Nc2*sizeof(float));
+	kernel_fields_sp(Nc2,alpha1_iso,alpha2_iso,phi_iso,dsx);
+	kernel_convolve_sp(kappa_fft,alpha1_iso,NULL,Nc2,dsx,alpha1);
+	kernel_convolve_sp(kappa_fft,alpha2_iso,NULL,Nc2,dsx,alpha2);
+
+	fftwf_free(alpha1_iso);
+	fftwf_free(alpha2_iso);
+	fftwf_free(phi_iso);
+	fftwf_free(kappa_fft);
+}
+//--------------------------------------------------------------------
+void kappa0_to_phi_sp(float *kappa0, int Nc, double bsz, float *phi) {
+	int Nc2 = Nc*2;
+	double dsx = bsz/(double)Nc;
+
+	fftwf_complex *kappa_fft = padded_spectrum_sp(kappa0,Nc);
+	float *alpha1_iso = (float *)fftwf_malloc(Nc2*Nc2*sizeof(float));
+	float *alpha2_iso = (float *)fftwf_malloc(Nc2*Nc2*sizeof(float));
+	float *phi_iso = (float *)fftwf_malloc(Nc2*Nc2*sizeof(float));
+	kernel_fields_sp(Nc2,alpha1_iso,alpha2_iso,phi_iso,dsx);
+	kernel_convolve_sp(kappa_fft,phi_iso,NULL,Nc2,dsx,phi);
+
+	fftwf_free(alpha1_iso);
+	fftwf_free(alpha2_iso);
+	fftwf_free(phi_iso);
+	fftwf_free(kappa_fft);
+}
+//--------------------------------------------------------------------
+void kappa0_to_signals_sp(float *kappa0, int Nc, double bsz, double ksigma,
+                          float *alpha1, float *alpha2, float *phi,
+                          float *kappa_s, float *shear1, float *shear2) {
+	// single precision kappa0_to_signals
+	int i,j,index;
+	int Nc2 = Nc*2;
+	int Nh = Nc2/2+1;
+	double dsx = bsz/(double)Nc;
+	double dk = 2.0*M_PI/(dsx*(double)Nc2);
+	double k1,k2,kk;
+	float norm = (float)(1.0/((double)Nc2*Nc2));
+
+	fftwf_complex *kappa_fft = padded_spectrum_sp(kappa0,Nc);
+
+	float *smooth = (float *)malloc(Nc2*Nh*sizeof(float));
+	float *ker_s1 = (float *)calloc(Nc2*Nh,sizeof(float));
+	float *ker_s2 = (float *)calloc(Nc2*Nh,sizeof(float));
+	for(i=0;i<Nc2;i++) for(j=0;j<Nh;j++) {
+		index = i*Nh+j;
+		k1 = (i <= Nc2/2) ? (double)i*dk : (double)(i-Nc2)*dk;
+		k2 = (double)j*dk;
+		kk = k1*k1+k2*k2;
+		smooth[index] = (ksigma > 0.0) ? (float)exp(-0.5*kk*ksigma*ksigma) : 1.0f;
+		if(index > 0) {
+			ker_s1[index] = (float)((k1*k1-k2*k2)/kk)*smooth[index];
+			ker_s2[index] = (float)(2.0*k1*k2/kk)*smooth[index];
+		}
+	}
+	spectrum_product_sp(kappa_fft,NULL,smooth,Nc2,norm,kappa_s);
+	spectrum_product_sp(kappa_fft,NULL,ker_s1,Nc2,norm,shear1);
+	spectrum_product_sp(kappa_fft,NULL,ker_s2,Nc2,norm,shear2);
+	free(ker_s1);
+	free(ker_s2);
+
+	float *alpha1_iso = (float *)fftwf_malloc(Nc2*Nc2*sizeof(float));
+	float *alpha2_iso = (float *)fftwf_malloc(Nc2*Nc2*sizeof(float));
+	float *phi_iso = (float *)fftwf_malloc(Nc2*Nc2*sizeof(float));
+	kernel_fields_sp(Nc2,alpha1_iso,alpha2_iso,phi_iso,dsx);
+	kernel_convolve_sp(kappa_fft,alpha1_iso,smooth,Nc2,dsx,alpha1);
+	kernel_convolve_sp(kappa_fft,alpha2_iso,smooth,Nc2,dsx,alpha2);
+	kernel_convolve_sp(kappa_fft,phi_iso,smooth,Nc2,dsx,phi);
+	fftwf_free(alpha1_iso);
+	fftwf_free(alpha2_iso);
+	fftwf_free(phi_iso);
+
+	fftwf_free(kappa_fft);
+	free(smooth);
+}
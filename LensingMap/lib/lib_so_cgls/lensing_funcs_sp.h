@@ -0,0 +1,11 @@
+void fftwf_r2c_2d_sp(float *in_real, fftwf_complex *in_fft, int nx, int ny);
+void fftwf_c2r_2d_sp(fftwf_complex *in_fft, float *in_real, int nx, int ny);
+void zero_padding_sp(float *in, int nx, int ny, float *out);
+void corner_matrix_sp(float *in, int nx, int ny, float norm, float *out);
+void kernel_fields_sp(int Ncc, float *in1, float *in2, float *in3, double Dcell);
+void spectrum_product_sp(fftwf_complex *in_fft, fftwf_complex *kernel_fft, float *smooth, int Nc2, float norm, float *out);
+fftwf_complex *padded_spectrum_sp(float *kappa0, int Nc);
+void kernel_convolve_sp(fftwf_complex *kappa_fft, float *kernel, float *smooth, int Nc2, double dsx, float *out);
+void kappa0_to_alphas_sp(float *kappa0, int Nc, double bsz, float *alpha1, float *alpha2);
+void kappa0_to_phi_sp(float *kappa0, int Nc, double bsz, float *phi);
+void kappa0_to_signals_sp(float *kappa0, int Nc, double bsz, double ksigma, float *alpha1, float *alpha2, float *phi, float *kappa_s, float *shear1, float *shear2);
@@ -0,0 +1,170 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <math.h>
+#include "marching_squares.h"
+
+/*
+ * Marching squares contouring of a 2D map at a given level.
+ *
+ * Grid edges carry the contour points:
+ *   horizontal edge h(i,j) between node (i,j) and (i,j+1), id = i*(ny-1)+j
+ *   vertical edge   v(i,j) between node (i,j) and (i+1,j), id = nh+i*ny+j
+ * Every crossed edge is shared by at most two cells, so the segments of
+ * all cells form chains through the edges, which are traced into open
+ * curves (ending on the map boundary) and closed curves.
+ * Points are returned in fractional index coordinates (axis 0, axis 1).
+ */
+//--------------------------------------------------------------------
+int cross_position(double *field, int id0, int id1, double level, double *t) {
+	double a0 = field[id0] - level;
+	double a1 = field[id1] - level;
+
+	if ((a0 > 0.0) == (a1 > 0.0)) return 0;
+	*t = a0/(a0 - a1);
+	return 1;
+}
+//--------------------------------------------------------------------
+void cell_edges(int i, int j, int nx, int ny, int *edges) {
+	int nh = nx*(ny-1);
+
+	edges[0] = i*(ny-1)+j;          // top,    node (i,j)   - (i,j+1)
+	edges[1] = nh+i*ny+j+1;         // right,  node (i,j+1) - (i+1,j+1)
+	edges[2] = (i+1)*(ny-1)+j;      // bottom, node (i+1,j) - (i+1,j+1)
+	edges[3] = nh+i*ny+j;           // left,   node (i,j)   - (i+1,j)
+}
+//--------------------------------------------------------------------
+static void link_edges(int *nbr, int e0, int e1) {
+	if (nbr[2*e0] < 0) nbr[2*e0] = e1; else nbr[2*e0+1] = e1;
+	if (nbr[2*e1] < 0) nbr[2*e1] = e0; else nbr[2*e1+1] = e0;
+}
+//--------------------------------------------------------------------
+static void edge_point(int e, int nx, int ny, double *tcross, double *p1, double *p2) {
+	int nh = nx*(ny-1);
+
+	if (e < nh) {
+		*p1 = (double)(e/(ny-1));
+		*p2 = (double)(e%(ny-1)) + tcross[e];
+	}
+	else {
+		*p1 = (double)((e-nh)/ny) + tcross[e];
+		*p2 = (double)((e-nh)%ny);
+	}
+}
+//--------------------------------------------------------------------
+static int trace_chain(int start, int nx, int ny, int *nbr, int *visited, double *tcross,
+                       int npts, int maxpts, double *pts1, double *pts2) {
+	int prev = -1;
+	int e = start;
+	int next;
+
+	while (e >= 0 && !visited[e]) {
+		if (npts >= maxpts) return -1;
+		visited[e] = 1;
+		edge_point(e, nx, ny, tcross, &pts1[npts], &pts2[npts]);
+		npts++;
+		next = (nbr[2*e] != prev) ? nbr[2*e] : nbr[2*e+1];
+		if (next == prev && nbr[2*e] == nbr[2*e+1]) next = -1;
+		prev = e;
+		e = next;
+	}
+	return npts;
+}
+//--------------------------------------------------------------------
+int marching_squares(double *field, int nx, int ny, double level, int maxpts, int maxcurves,
+                     double *pts1, double *pts2, int *offsets, int *closed) {
+	int i, j, k, e;
+	int nh = nx*(ny-1);
+	int nedges = nh + (nx-1)*ny;
+	int ncross, ncurves, npts;
+	int edges[4], crossed[4];
+	double t, centre;
+
+	double *tcross = (double *)calloc(nedges, sizeof(double));
+	int *nbr = (int *)malloc(2*nedges*sizeof(int));
+	int *visited = (int *)calloc(nedges, sizeof(int));
+	int *iscross = (int *)calloc(nedges, sizeof(int));
+
+	for (e = 0; e < 2*nedges; e++) nbr[e] = -1;
+
+	// crossing positions on all edges
+	for (i = 0; i < nx; i++) for (j = 0; j < ny-1; j++) {
+		e = i*(ny-1)+j;
+		if (cross_position(field, i*ny+j, i*ny+j+1, level, &t)) {
+			tcross[e] = t;
+			iscross[e] = 1;
+		}
+	}
+	for (i = 0; i < nx-1; i++) for (j = 0; j < ny; j++) {
+		e = nh+i*ny+j;
+		if (cross_position(field, i*ny+j, (i+1)*ny+j, level, &t)) {
+			tcross[e] = t;
+			iscross[e] = 1;
+		}
+	}
+
+	// connect crossed edges within every cell
+	for (i = 0; i < nx-1; i++) for (j = 0; j < ny-1; j++) {
+		cell_edges(i, j, nx, ny, edges);
+		ncross = 0;
+		for (k = 0; k < 4; k++) {
+			crossed[k] = iscross[edges[k]];
+			ncross += crossed[k];
+		}
+		if (ncross == 2) {
+			int ea = -1, eb = -1;
+			for (k = 0; k < 4; k++) {
+				if (!crossed[k]) continue;
+				if (ea < 0) ea = edges[k]; else eb = edges[k];
+			}
+			link_edges(nbr, ea, eb);
+		}
+		else if (ncross == 4) {
+			// saddle point, resolved by the cell centre value
+			centre = 0.25*(field[i*ny+j] + field[i*ny+j+1] +
+			               field[(i+1)*ny+j] + field[(i+1)*ny+j+1]) - level;
+			if ((centre > 0.0) == (field[i*ny+j] - level > 0.0)) {
+				link_edges(nbr, edges[0], edges[1]);
+				link_edges(nbr, edges[2], edges[3]);
+			}
+			else {
+				link_edges(nbr, edges[0], edges[3]);
+				link_edges(nbr, edges[1], edges[2]);
+			}
+		}
+	}
+
+	ncurves = 0;
+	npts = 0;
+	offsets[0] = 0;
+	// open curves start on edges with a single neighbour
+	for (e = 0; e < nedges; e++) {
+		if (!iscross[e] || visited[e] || nbr[2*e+1] >= 0) continue;
+		if (ncurves >= maxcurves) { npts = -1; break; }
+		npts = trace_chain(e, nx, ny, nbr, visited, tcross, npts, maxpts, pts1, pts2);
+		if (npts < 0) break;
+		closed[ncurves] = 0;
+		ncurves++;
+		offsets[ncurves] = npts;
+	}
+	// remaining chains are closed loops
+	for (e = 0; e < nedges && npts >= 0; e++) {
+		if (!iscross[e] || visited[e]) continue;
+		if (ncurves >= maxcurves) { npts = -1; break; }
+		npts = trace_chain(e, nx, ny, nbr, visited, tcross, npts, maxpts, pts1, pts2);
+		if (npts < 0 || npts >= maxpts) { npts = -1; break; }
+		pts1[npts] = pts1[offsets[ncurves]];
+		pts2[npts] = pts2[offsets[ncurves]];
+		npts++;
+		closed[ncurves] = 1;
+		ncurves++;
+		offsets[ncurves] = npts;
+	}
+
+	free(tcross);
+	free(nbr);
+	free(visited);
+	free(iscross);
+
+	if (npts < 0) return -1;
+	return ncurves;
+}
@@ -0,0 +1,3 @@
+int cross_position(double *field, int id0, int id1, double level, double *t);
+void cell_edges(int i, int j, int nx, int ny, int *edges);
+int marching_squares(double *field, int nx, int ny, double level, int maxpts, int maxcurves, double *pts1, double *pts2, int *offsets, int *closed);
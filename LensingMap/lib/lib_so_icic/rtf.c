@@ -231,3 +231,76 @@ void inverse_cic_weights(double *source_map, double *posy1, double *posy2, doubl
 					    *weights[i];
 	}
 }
+
+
+void inverse_cic_sp(float *source_map, float *posy1, float *posy2, float ysc1, float ysc2,float dsi, int nsx, int nsy, int nlx, int nly, float *lensed_map) {
+
+	int i1,j1,i,j;
+	int index;
+	float xb1,xb2;
+	float ww1,ww2,ww3,ww4,wx,wy;
+
+	for(i=0;i<nlx;i++) for(j=0;j<nly;j++) {
+
+		index = i*nly+j;
+
+		xb1 = (posy1[index]-ysc1)/dsi+(float)nsx/2.0f-0.5f;
+		xb2 = (posy2[index]-ysc2)/dsi+(float)nsy/2.0f-0.5f;
+
+		i1 = (int)xb1;
+		j1 = (int)xb2;
+
+		wx = 1.0f-(xb1-(float)(i1));
+		wy = 1.0f-(xb2-(float)(j1));
+
+		ww1 = wx*wy;
+		ww2 = wx*(1.0f-wy);
+		ww3 = (1.0f-wx)*wy;
+		ww4 = (1.0f-wx)*(1.0f-wy);
+
+		if (i1<0||i1>nsx-2||j1<0||j1>nsy-2) continue;
+
+		lensed_map[index] = ww1*source_map[i1*nsy+j1]
+						  + ww2*source_map[i1*nsy+j1+1]
+						  + ww3*source_map[(i1+1)*nsy+j1]
+						  + ww4*source_map[(i1+1)*nsy+j1+1];
+	}
+}
+
+
+void inverse_cic_omp_sp(float *source_map, float *posy1, float *posy2, float ysc1, float ysc2,float dsi, int nsx, int nsy, int nlx, int nly, float *lensed_map) {
+
+	int i1,j1,i,j;
+	int index;
+	float xb1,xb2;
+	float ww1,ww2,ww3,ww4,wx,wy;
+
+	// every pixel of the lensed map is written by one thread only
+#pragma omp parallel for num_threads(8) schedule(dynamic,16) \
+	private(index,j,i1,j1,xb1,xb2,wx,wy,ww1,ww2,ww3,ww4)
+	for(i=0;i<nlx;i++) for(j=0;j<nly;j++) {
+
+		index = i*nly+j;
+
+		xb1 = (posy1[index]-ysc1)/dsi+(float)nsx/2.0f-0.5f;
+		xb2 = (posy2[index]-ysc2)/dsi+(float)nsy/2.0f-0.5f;
+
+		i1 = (int)xb1;
+		j1 = (int)xb2;
+
+		wx = 1.0f-(xb1-(float)(i1));
+		wy = 1.0f-(xb2-(float)(j1));
+
+		ww1 = wx*wy;
+		ww2 = wx*(1.0f-wy);
+		ww3 = (1.0f-wx)*wy;
+		ww4 = (1.0f-wx)*(1.0f-wy);
+
+		if (i1<0||i1>nsx-2||j1<0||j1>nsy-2) continue;
+
+		lensed_map[index] = ww1*source_map[i1*nsy+j1]
+						  + ww2*source_map[i1*nsy+j1+1]
+						  + ww3*source_map[(i1+1)*nsy+j1]
+						  + ww4*source_map[(i1+1)*nsy+j1+1];
+	}
+}
@@ -0,0 +1,145 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <math.h>
+#include <omp.h>
+#include "lens_equation.h"
+
+/*
+ * Interpolation of lensing maps at arbitrary image plane points and the
+ * lens equation y = x - alpha(x) for arrays of points.
+ * Maps are stored row-major with shape (nx, ny) on a rectilinear grid with
+ * monotonically increasing axes axis1 (nx values) and axis2 (ny values),
+ * which may be non-uniform (e.g. refined in the centre).
+ * order = 1 : bilinear interpolation
+ * order = 3 : bicubic convolution (Keys, a = -0.5) in index space
+ * Points outside of the grid are evaluated at the nearest map edge.
+ */
+//--------------------------------------------------------------------
+int locate_cell(double *axis, int n, double x, double *t) {
+	int lo = 0;
+	int hi = n-1;
+	int mid;
+
+	if (x <= axis[0]) { *t = 0.0; return 0; }
+	if (x >= axis[n-1]) { *t = 1.0; return n-2; }
+	while (hi - lo > 1) {
+		mid = (lo + hi)/2;
+		if (axis[mid] > x) hi = mid; else lo = mid;
+	}
+	*t = (x - axis[lo])/(axis[lo+1] - axis[lo]);
+	return lo;
+}
+//--------------------------------------------------------------------
+double interp_bilinear(double *map, double *axis1, double *axis2, int nx, int ny, double x1, double x2) {
+	double t1, t2;
+	int i = locate_cell(axis1, nx, x1, &t1);
+	int j = locate_cell(axis2, ny, x2, &t2);
+
+	return map[i*ny+j]*(1.0-t1)*(1.0-t2)
+	     + map[i*ny+j+1]*(1.0-t1)*t2
+	     + map[(i+1)*ny+j]*t1*(1.0-t2)
+	     + map[(i+1)*ny+j+1]*t1*t2;
+}
+//--------------------------------------------------------------------
+static void keys_weights(double t, double *w) {
+	double a = -0.5;
+	double s;
+
+	s = 1.0 + t;
+	w[0] = a*s*s*s - 5.0*a*s*s + 8.0*a*s - 4.0*a;
+	s = t;
+	w[1] = (a+2.0)*s*s*s - (a+3.0)*s*s + 1.0;
+	s = 1.0 - t;
+	w[2] = (a+2.0)*s*s*s - (a+3.0)*s*s + 1.0;
+	w[3] = 1.0 - w[0] - w[1] - w[2];
+}
+//--------------------------------------------------------------------
+static int clamp(int i, int n) {
+	if (i < 0) return 0;
+	if (i > n-1) return n-1;
+	return i;
+}
+//--------------------------------------------------------------------
+double interp_bicubic(double *map, double *axis1, double *axis2, int nx, int ny, double x1, double x2) {
+	int k, l, ik, jl;
+	double t1, t2, row;
+	double w1[4], w2[4];
+	double res = 0.0;
+	int i = locate_cell(axis1, nx, x1, &t1);
+	int j = locate_cell(axis2, ny, x2, &t2);
+
+	keys_weights(t1, w1);
+	keys_weights(t2, w2);
+	for (k = 0; k < 4; k++) {
+		ik = clamp(i-1+k, nx);
+		row = 0.0;
+		for (l = 0; l < 4; l++) {
+			jl = clamp(j-1+l, ny);
+			row += w2[l]*map[ik*ny+jl];
+		}
+		res += w1[k]*row;
+	}
+	return res;
+}
+//--------------------------------------------------------------------
+void interp_points(double *map, double *axis1, double *axis2, int nx, int ny,
+                   double *x1, double *x2, int npts, int order, double *out) {
+	int i;
+
+	if (order == 3) {
+		for (i = 0; i < npts; i++) {
+			out[i] = interp_bicubic(map, axis1, axis2, nx, ny, x1[i], x2[i]);
+		}
+	}
+	else {
+		for (i = 0; i < npts; i++) {
+			out[i] = interp_bilinear(map, axis1, axis2, nx, ny, x1[i], x2[i]);
+		}
+	}
+}
+//--------------------------------------------------------------------
+void interp_points_omp(double *map, double *axis1, double *axis2, int nx, int ny,
+                       double *x1, double *x2, int npts, int order, double *out) {
+	int i;
+
+#pragma omp parallel for schedule(dynamic,256) \
+	shared(map, axis1, axis2, nx, ny, x1, x2, npts, order, out) private(i)
+	for (i = 0; i < npts; i++) {
+		if (order == 3) {
+			out[i] = interp_bicubic(map, axis1, axis2, nx, ny, x1[i], x2[i]);
+		}
+		else {
+			out[i] = interp_bilinear(map, axis1, axis2, nx, ny, x1[i], x2[i]);
+		}
+	}
+}
+//--------------------------------------------------------------------
+void lens_equation(double *alpha1, double *alpha2, double *axis1, double *axis2, int nx, int ny,
+                   double *x1, double *x2, int npts, int order, double *y1, double *y2) {
+	int i;
+
+	interp_points(alpha1, axis1, axis2, nx, ny, x1, x2, npts, order, y1);
+	interp_points(alpha2, axis1, axis2, nx, ny, x1, x2, npts, order, y2);
+	for (i = 0; i < npts; i++) {
+		y1[i] = x1[i] - y1[i];
+		y2[i] = x2[i] - y2[i];
+	}
+}
+//--------------------------------------------------------------------
+void lens_equation_omp(double *alpha1, double *alpha2, double *axis1, double *axis2, int nx, int ny,
+                       double *x1, double *x2, int npts, int order, double *y1, double *y2) {
+	int i;
+
+#pragma omp parallel for schedule(dynamic,256) \
+	shared(alpha1, alpha2, axis1, axis2, nx, ny, x1, x2, npts, order, y1, y2) private(i)
+	for (i = 0; i < npts; i++) {
+		if (order == 3) {
+			y1[i] = x1[i] - interp_bicubic(alpha1, axis1, axis2, nx, ny, x1[i], x2[i]);
+			y2[i] = x2[i] - interp_bicubic(alpha2, axis1, axis2, nx, ny, x1[i], x2[i]);
+		}
+		else {
+			y1[i] = x1[i] - interp_bilinear(alpha1, axis1, axis2, nx, ny, x1[i], x2[i]);
+			y2[i] = x2[i] - interp_bilinear(alpha2, axis1, axis2, nx, ny, x1[i], x2[i]);
+		}
+	}
+}
@@ -0,0 +1,7 @@
+int locate_cell(double *axis, int n, double x, double *t);
+double interp_bilinear(double *map, double *axis1, double *axis2, int nx, int ny, double x1, double x2);
+double interp_bicubic(double *map, double *axis1, double *axis2, int nx, int ny, double x1, double x2);
+void interp_points(double *map, double *axis1, double *axis2, int nx, int ny, double *x1, double *x2, int npts, int order, double *out);
+void interp_points_omp(double *map, double *axis1, double *axis2, int nx, int ny, double *x1, double *x2, int npts, int order, double *out);
+void lens_equation(double *alpha1, double *alpha2, double *axis1, double *axis2, int nx, int ny, double *x1, double *x2, int npts, int order, double *y1, double *y2);
+void lens_equation_omp(double *alpha1, double *alpha2, double *axis1, double *axis2, int nx, int ny, double *x1, double *x2, int npts, int order, double *y1, double *y2);
@@ -311,3 +311,22 @@ int cal_sph_sdens_weight_omp(float *x1, float *x2, float *x3,float *mpp,float bs
 	}
 	return (0);
 }
+
+int cal_sph_hsml(float *x1, float *x2, float *x3, long Ngb, long Np, float *hsml) {
+	/* smoothing lengths of cal_sph_sdens_weight, in the order of the particles */
+	long i,sph;
+	PARTICLE *particle = (PARTICLE *)malloc(Np*sizeof(PARTICLE));
+	for(i=0;i<Np;i++) {
+  	  	particle[i].x = (float)(x1[i]);
+  	  	particle[i].y = (float)(x2[i]);
+  	  	particle[i].z = (float)(x3[i]);
+  	}
+
+	double SPHBoxSize = 0.0;
+	sph = findHsml(particle,&Np,&Ngb,&SPHBoxSize,hsml);
+	if (sph == 1) {
+		printf("FindHsml is failed!\n");
+	}
+	free(particle);
+	return (int)(sph);
+}
@@ -17,3 +17,4 @@ int cal_sph_sdens_weight(float *x1, float *x2, float *x3,float *mpp,float bsz,lo
 void Make_cell_SPH_weight_omp(long Nc,float bsz,long Np, PARTICLE *particle, float * SmoothLength, float *mpp, float *sdens);
 int cal_sdens_sp_weight(float x_p,float y_p,float m_p,float hdsl,float dsx,long Nc,float *sdens_sp);
 int cal_sph_sdens_weight_omp(float *x1, float *x2, float *x3,float *mpp,float bsz,long  Nc,float dsx,long Ngb,long Np,float xc1,float xc2,float xc3,float *posx1, float * posx2, float *sdens);
+int cal_sph_hsml(float *x1, float *x2, float *x3, long Ngb, long Np, float *hsml);
@@ -0,0 +1,228 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <math.h>
+#include <omp.h>
+#include "tri_index.h"
+
+/*
+ * Source plane spatial index of the mapped image plane triangles.
+ *
+ * Every grid cell (i,j) of the (nx, ny) lensing plane is split into two
+ * triangles, as in bary2cart.c,
+ *   t = 2*(i*(ny-1)+j)   : (i,j), (i+1,j),   (i+1,j+1)
+ *   t = 2*(i*(ny-1)+j)+1 : (i,j), (i+1,j+1), (i,j+1)
+ * The triangles are mapped to the source plane (sp1, sp2) and stored in a
+ * uniform grid of nb1 x nb2 bins, each triangle in all bins its bounding
+ * box overlaps (compressed rows: offsets[nb1*nb2+1], tris).
+ * A source is only tested against the triangles of its own bin.
+ */
+//--------------------------------------------------------------------
+void triangle_vertices(long t, int ny, long *v) {
+	long cell = t/2;
+	long i = cell/(ny-1);
+	long j = cell%(ny-1);
+
+	v[0] = i*ny+j;
+	if (t%2 == 0) {
+		v[1] = (i+1)*ny+j;
+		v[2] = (i+1)*ny+j+1;
+	}
+	else {
+		v[1] = (i+1)*ny+j+1;
+		v[2] = i*ny+j+1;
+	}
+}
+//--------------------------------------------------------------------
+int point_in_triangle(double p1, double p2, double *sp1, double *sp2, long *v, double *w) {
+	double ax = sp1[v[0]], ay = sp2[v[0]];
+	double bx = sp1[v[1]], by = sp2[v[1]];
+	double cx = sp1[v[2]], cy = sp2[v[2]];
+	double area = (bx-ax)*(cy-ay) - (cx-ax)*(by-ay);
+
+	if (area == 0.0) return 0;
+	w[0] = ((bx-p1)*(cy-p2) - (cx-p1)*(by-p2))/area;
+	w[1] = ((cx-p1)*(ay-p2) - (ax-p1)*(cy-p2))/area;
+	w[2] = 1.0 - w[0] - w[1];
+	return (w[0] >= 0.0 && w[1] >= 0.0 && w[2] >= 0.0);
+}
+//--------------------------------------------------------------------
+int bin_of(double y, double bmin, double bsz, int nb) {
+	int b = (int)floor((y - bmin)/bsz);
+
+	if (b < 0) return 0;
+	if (b > nb-1) return nb-1;
+	return b;
+}
+//--------------------------------------------------------------------
+static void triangle_bins(long t, double *sp1, double *sp2, int ny, int nb1, int nb2,
+                          double bmin1, double bmin2, double bsz1, double bsz2, int *bb) {
+	int k;
+	long v[3];
+	double lo1, hi1, lo2, hi2;
+
+	triangle_vertices(t, ny, v);
+	lo1 = hi1 = sp1[v[0]];
+	lo2 = hi2 = sp2[v[0]];
+	for (k = 1; k < 3; k++) {
+		if (sp1[v[k]] < lo1) lo1 = sp1[v[k]];
+		if (sp1[v[k]] > hi1) hi1 = sp1[v[k]];
+		if (sp2[v[k]] < lo2) lo2 = sp2[v[k]];
+		if (sp2[v[k]] > hi2) hi2 = sp2[v[k]];
+	}
+	bb[0] = bin_of(lo1, bmin1, bsz1, nb1);
+	bb[1] = bin_of(hi1, bmin1, bsz1, nb1);
+	bb[2] = bin_of(lo2, bmin2, bsz2, nb2);
+	bb[3] = bin_of(hi2, bmin2, bsz2, nb2);
+}
+//--------------------------------------------------------------------
+void tri_index_count(double *sp1, double *sp2, int nx, int ny, int nb1, int nb2,
+                     double bmin1, double bmin2, double bsz1, double bsz2, long *counts) {
+	long t;
+	long ntris = 2*(long)(nx-1)*(long)(ny-1);
+	int b1, b2, bb[4];
+
+	for (t = 0; t < ntris; t++) {
+		triangle_bins(t, sp1, sp2, ny, nb1, nb2, bmin1, bmin2, bsz1, bsz2, bb);
+		for (b1 = bb[0]; b1 <= bb[1]; b1++) for (b2 = bb[2]; b2 <= bb[3]; b2++) {
+			counts[b1*nb2+b2]++;
+		}
+	}
+}
+//--------------------------------------------------------------------
+void tri_index_fill(double *sp1, double *sp2, int nx, int ny, int nb1, int nb2,
+                    double bmin1, double bmin2, double bsz1, double bsz2, long *offsets, long *tris) {
+	long t;
+	long ntris = 2*(long)(nx-1)*(long)(ny-1);
+	int b1, b2, bb[4];
+	long *cursor = (long *)malloc((long)nb1*nb2*sizeof(long));
+
+	for (b1 = 0; b1 < nb1*nb2; b1++) cursor[b1] = offsets[b1];
+	for (t = 0; t < ntris; t++) {
+		triangle_bins(t, sp1, sp2, ny, nb1, nb2, bmin1, bmin2, bsz1, bsz2, bb);
+		for (b1 = bb[0]; b1 <= bb[1]; b1++) for (b2 = bb[2]; b2 <= bb[3]; b2++) {
+			tris[cursor[b1*nb2+b2]++] = t;
+		}
+	}
+	free(cursor);
+}
+//--------------------------------------------------------------------
+int source_bin(double y1, double y2, int nb1, int nb2,
+                      double bmin1, double bmin2, double bsz1, double bsz2) {
+	double f1 = (y1 - bmin1)/bsz1;
+	double f2 = (y2 - bmin2)/bsz2;
+
+	if (f1 < 0.0 || f2 < 0.0 || f1 >= (double)nb1 || f2 >= (double)nb2) return -1;
+	return (int)f1*nb2 + (int)f2;
+}
+//--------------------------------------------------------------------
+void tri_index_query_count(double *ys1, double *ys2, int nsrc, double *sp1, double *sp2, int ny,
+                           int nb1, int nb2, double bmin1, double bmin2, double bsz1, double bsz2,
+                           long *offsets, long *tris, long *nimgs) {
+	int s;
+
+#pragma omp parallel for schedule(dynamic,16) \
+	shared(ys1, ys2, nsrc, sp1, sp2, ny, nb1, nb2, bmin1, bmin2, bsz1, bsz2, offsets, tris, nimgs) \
+	private(s)
+	for (s = 0; s < nsrc; s++) {
+		long k, v[3];
+		double w[3];
+		int b = source_bin(ys1[s], ys2[s], nb1, nb2, bmin1, bmin2, bsz1, bsz2);
+
+		nimgs[s] = 0;
+		if (b < 0) continue;
+		for (k = offsets[b]; k < offsets[b+1]; k++) {
+			triangle_vertices(tris[k], ny, v);
+			if (point_in_triangle(ys1[s], ys2[s], sp1, sp2, v, w)) nimgs[s]++;
+		}
+	}
+}
+//--------------------------------------------------------------------
+void tri_index_query_fill(double *ys1, double *ys2, int nsrc, double *lp1, double *lp2,
+                          double *sp1, double *sp2, int ny,
+                          int nb1, int nb2, double bmin1, double bmin2, double bsz1, double bsz2,
+                          long *offsets, long *tris, long *img_offsets,
+                          double *theta1, double *theta2, long *vertices, double *weights) {
+	int s;
+
+#pragma omp parallel for schedule(dynamic,16) \
+	shared(ys1, ys2, nsrc, lp1, lp2, sp1, sp2, ny, nb1, nb2, bmin1, bmin2, bsz1, bsz2, \
+	       offsets, tris, img_offsets, theta1, theta2, vertices, weights) \
+	private(s)
+	for (s = 0; s < nsrc; s++) {
+		long k, n, v[3];
+		double w[3];
+		int b = source_bin(ys1[s], ys2[s], nb1, nb2, bmin1, bmin2, bsz1, bsz2);
+
+		if (b < 0) continue;
+		n = img_offsets[s];
+		for (k = offsets[b]; k < offsets[b+1]; k++) {
+			triangle_vertices(tris[k], ny, v);
+			if (!point_in_triangle(ys1[s], ys2[s], sp1, sp2, v, w)) continue;
+			theta1[n] = w[0]*lp1[v[0]] + w[1]*lp1[v[1]] + w[2]*lp1[v[2]];
+			theta2[n] = w[0]*lp2[v[0]] + w[1]*lp2[v[1]] + w[2]*lp2[v[2]];
+			vertices[3*n+0] = v[0];
+			vertices[3*n+1] = v[1];
+			vertices[3*n+2] = v[2];
+			weights[3*n+0] = w[0];
+			weights[3*n+1] = w[1];
+			weights[3*n+2] = w[2];
+			n++;
+		}
+	}
+}
+//--------------------------------------------------------------------
+static double triangle_area(double *x1, double *x2, long *v) {
+	return (x1[v[1]]-x1[v[0]])*(x2[v[2]]-x2[v[0]]) - (x1[v[2]]-x1[v[0]])*(x2[v[1]]-x2[v[0]]);
+}
+//--------------------------------------------------------------------
+void tri_raster(double *lp1, double *lp2, double *sp1, double *sp2, int nx, int ny,
+                int nb1, int nb2, double bmin1, double bmin2, double bsz1, double bsz2,
+                int *mult, double *mu_tot) {
+	/*
+	 * Rasterise the mapped triangles onto a source plane grid of nb1 x nb2
+	 * pixels with centres bmin+(b+0.5)*bsz. Every triangle covering a pixel
+	 * centre is one image of a source there: mult counts the images and
+	 * mu_tot sums their magnifications, the ratio of the lensing plane to
+	 * the source plane area of the triangle.
+	 */
+	long t;
+	long ntris = 2*(long)(nx-1)*(long)(ny-1);
+	double bmax1 = bmin1 + nb1*bsz1;
+	double bmax2 = bmin2 + nb2*bsz2;
+
+#pragma omp parallel for schedule(dynamic,4096) \
+	shared(lp1, lp2, sp1, sp2, ny, ntris, nb1, nb2, bmin1, bmin2, bmax1, bmax2, bsz1, bsz2, mult, mu_tot) \
+	private(t)
+	for (t = 0; t < ntris; t++) {
+		int k, b1, b2, lo1, hi1, lo2, hi2;
+		long v[3];
+		double w[3], lo[2], hi[2], area_s, mu;
+
+		triangle_vertices(t, ny, v);
+		area_s = triangle_area(sp1, sp2, v);
+		if (area_s == 0.0) continue;
+		lo[0] = hi[0] = sp1[v[0]];
+		lo[1] = hi[1] = sp2[v[0]];
+		for (k = 1; k < 3; k++) {
+			if (sp1[v[k]] < lo[0]) lo[0] = sp1[v[k]];
+			if (sp1[v[k]] > hi[0]) hi[0] = sp1[v[k]];
+			if (sp2[v[k]] < lo[1]) lo[1] = sp2[v[k]];
+			if (sp2[v[k]] > hi[1]) hi[1] = sp2[v[k]];
+		}
+		if (hi[0] < bmin1 || lo[0] > bmax1 || hi[1] < bmin2 || lo[1] > bmax2) continue;
+		// pixel centres within the bounding box
+		lo1 = (int)ceil(fmax((lo[0]-bmin1)/bsz1-0.5, 0.0));
+		hi1 = (int)floor(fmin((hi[0]-bmin1)/bsz1-0.5, nb1-1.0));
+		lo2 = (int)ceil(fmax((lo[1]-bmin2)/bsz2-0.5, 0.0));
+		hi2 = (int)floor(fmin((hi[1]-bmin2)/bsz2-0.5, nb2-1.0));
+		if (lo1 > hi1 || lo2 > hi2) continue;
+		mu = fabs(triangle_area(lp1, lp2, v)/area_s);
+		for (b1 = lo1; b1 <= hi1; b1++) for (b2 = lo2; b2 <= hi2; b2++) {
+			if (!point_in_triangle(bmin1+(b1+0.5)*bsz1, bmin2+(b2+0.5)*bsz2, sp1, sp2, v, w)) continue;
+#pragma omp atomic
+			mult[b1*nb2+b2]++;
+#pragma omp atomic
+			mu_tot[b1*nb2+b2] += mu;
+		}
+	}
+}
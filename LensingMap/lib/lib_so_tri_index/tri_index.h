@@ -0,0 +1,14 @@
+void triangle_vertices(long t, int ny, long *v);
+int bin_of(double y, double bmin, double bsz, int nb);
+int source_bin(double y1, double y2, int nb1, int nb2, double bmin1, double bmin2, double bsz1, double bsz2);
+int point_in_triangle(double p1, double p2, double *sp1, double *sp2, long *v, double *w);
+void tri_index_count(double *sp1, double *sp2, int nx, int ny, int nb1, int nb2, double bmin1, double bmin2, double bsz1, double bsz2, long *counts);
+void tri_index_fill(double *sp1, double *sp2, int nx, int ny, int nb1, int nb2, double bmin1, double bmin2, double bsz1, double bsz2, long *offsets, long *tris);
+void tri_index_query_count(double *ys1, double *ys2, int nsrc, double *sp1, double *sp2, int ny, int nb1, int nb2, double bmin1, double bmin2, double bsz1, double bsz2, long *offsets, long *tris, long *nimgs);
+void tri_index_query_fill(double *ys1, double *ys2, int nsrc, double *lp1, double *lp2, double *sp1, double *sp2, int ny, int nb1, int nb2, double bmin1, double bmin2, double bsz1, double bsz2, long *offsets, long *tris, long *img_offsets, double *theta1, double *theta2, long *vertices, double *weights);
+int point_in_triangle_sp(double p1, double p2, float *sp1, float *sp2, long *v, double *w);
+void tri_index_count_sp(float *sp1, float *sp2, int nx, int ny, int nb1, int nb2, double bmin1, double bmin2, double bsz1, double bsz2, long *counts);
+void tri_index_fill_sp(float *sp1, float *sp2, int nx, int ny, int nb1, int nb2, double bmin1, double bmin2, double bsz1, double bsz2, long *offsets, long *tris);
+void tri_index_query_count_sp(double *ys1, double *ys2, int nsrc, float *sp1, float *sp2, int ny, int nb1, int nb2, double bmin1, double bmin2, double bsz1, double bsz2, long *offsets, long *tris, long *nimgs);
+void tri_index_query_fill_sp(double *ys1, double *ys2, int nsrc, float *lp1, float *lp2, float *sp1, float *sp2, int ny, int nb1, int nb2, double bmin1, double bmin2, double bsz1, double bsz2, long *offsets, long *tris, long *img_offsets, double *theta1, double *theta2, long *vertices, double *weights);
+void tri_raster(double *lp1, double *lp2, double *sp1, double *sp2, int nx, int ny, int nb1, int nb2, double bmin1, double bmin2, double bsz1, double bsz2, int *mult, double *mu_tot);
@@ -0,0 +1,132 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <math.h>
+#include <omp.h>
+#include "tri_index.h"
+
+/*
+ * Single precision variants of the triangle index of tri_index.c.
+ * Only the lensing and source plane maps are float, source positions,
+ * barycentric weights and image positions are computed in double.
+ */
+//--------------------------------------------------------------------
+int point_in_triangle_sp(double p1, double p2, float *sp1, float *sp2, long *v, double *w) {
+	double ax = sp1[v[0]], ay = sp2[v[0]];
+	double bx = sp1[v[1]], by = sp2[v[1]];
+	double cx = sp1[v[2]], cy = sp2[v[2]];
+	double area = (bx-ax)*(cy-ay) - (cx-ax)*(by-ay);
+
+	if (area == 0.0) return 0;
+	w[0] = ((bx-p1)*(cy-p2) - (cx-p1)*(by-p2))/area;
+	w[1] = ((cx-p1)*(ay-p2) - (ax-p1)*(cy-p2))/area;
+	w[2] = 1.0 - w[0] - w[1];
+	return (w[0] >= 0.0 && w[1] >= 0.0 && w[2] >= 0.0);
+}
+//--------------------------------------------------------------------
+static void triangle_bins_sp(long t, float *sp1, float *sp2, int ny, int nb1, int nb2,
+                             double bmin1, double bmin2, double bsz1, double bsz2, int *bb) {
+	int k;
+	long v[3];
+	double lo1, hi1, lo2, hi2;
+
+	triangle_vertices(t, ny, v);
+	lo1 = hi1 = sp1[v[0]];
+	lo2 = hi2 = sp2[v[0]];
+	for (k = 1; k < 3; k++) {
+		if (sp1[v[k]] < lo1) lo1 = sp1[v[k]];
+		if (sp1[v[k]] > hi1) hi1 = sp1[v[k]];
+		if (sp2[v[k]] < lo2) lo2 = sp2[v[k]];
+		if (sp2[v[k]] > hi2) hi2 = sp2[v[k]];
+	}
+	bb[0] = bin_of(lo1, bmin1, bsz1, nb1);
+	bb[1] = bin_of(hi1, bmin1, bsz1, nb1);
+	bb[2] = bin_of(lo2, bmin2, bsz2, nb2);
+	bb[3] = bin_of(hi2, bmin2, bsz2, nb2);
+}
+//--------------------------------------------------------------------
+void tri_index_count_sp(float *sp1, float *sp2, int nx, int ny, int nb1, int nb2,
+                        double bmin1, double bmin2, double bsz1, double bsz2, long *counts) {
+	long t;
+	long ntris = 2*(long)(nx-1)*(long)(ny-1);
+	int b1, b2, bb[4];
+
+	for (t = 0; t < ntris; t++) {
+		triangle_bins_sp(t, sp1, sp2, ny, nb1, nb2, bmin1, bmin2, bsz1, bsz2, bb);
+		for (b1 = bb[0]; b1 <= bb[1]; b1++) for (b2 = bb[2]; b2 <= bb[3]; b2++) {
+			counts[b1*nb2+b2]++;
+		}
+	}
+}
+//--------------------------------------------------------------------
+void tri_index_fill_sp(float *sp1, float *sp2, int nx, int ny, int nb1, int nb2,
+                       double bmin1, double bmin2, double bsz1, double bsz2, long *offsets, long *tris) {
+	long t;
+	long ntris = 2*(long)(nx-1)*(long)(ny-1);
+	int b1, b2, bb[4];
+	long *cursor = (long *)malloc((long)nb1*nb2*sizeof(long));
+
+	for (b1 = 0; b1 < nb1*nb2; b1++) cursor[b1] = offsets[b1];
+	for (t = 0; t < ntris; t++) {
+		triangle_bins_sp(t, sp1, sp2, ny, nb1, nb2, bmin1, bmin2, bsz1, bsz2, bb);
+		for (b1 = bb[0]; b1 <= bb[1]; b1++) for (b2 = bb[2]; b2 <= bb[3]; b2++) {
+			tris[cursor[b1*nb2+b2]++] = t;
+		}
+	}
+	free(cursor);
+}
+//--------------------------------------------------------------------
+void tri_index_query_count_sp(double *ys1, double *ys2, int nsrc, float *sp1, float *sp2, int ny,
+                              int nb1, int nb2, double bmin1, double bmin2, double bsz1, double bsz2,
+                              long *offsets, long *tris, long *nimgs) {
+	int s;
+
+#pragma omp parallel for schedule(dynamic,16) \
+	shared(ys1, ys2, nsrc, sp1, sp2, ny, nb1, nb2, bmin1, bmin2, bsz1, bsz2, offsets, tris, nimgs) \
+	private(s)
+	for (s = 0; s < nsrc; s++) {
+		long k, v[3];
+		double w[3];
+		int b = source_bin(ys1[s], ys2[s], nb1, nb2, bmin1, bmin2, bsz1, bsz2);
+
+		nimgs[s] = 0;
+		if (b < 0) continue;
+		for (k = offsets[b]; k < offsets[b+1]; k++) {
+			triangle_vertices(tris[k], ny, v);
+			if (point_in_triangle_sp(ys1[s], ys2[s], sp1, sp2, v, w)) nimgs[s]++;
+		}
+	}
+}
+//--------------------------------------------------------------------
+void tri_index_query_fill_sp(double *ys1, double *ys2, int nsrc, float *lp1, float *lp2,
+                             float *sp1, float *sp2, int ny,
+                             int nb1, int nb2, double bmin1, double bmin2, double bsz1, double bsz2,
+                             long *offsets, long *tris, long *img_offsets,
+                             double *theta1, double *theta2, long *vertices, double *weights) {
+	int s;
+
+#pragma omp parallel for schedule(dynamic,16) \
+	shared(ys1, ys2, nsrc, lp1, lp2, sp1, sp2, ny, nb1, nb2, bmin1, bmin2, bsz1, bsz2, \
+	       offsets, tris, img_offsets, theta1, theta2, vertices, weights) \
+	private(s)
+	for (s = 0; s < nsrc; s++) {
+		long k, n, v[3];
+		double w[3];
+		int b = source_bin(ys1[s], ys2[s], nb1, nb2, bmin1, bmin2, bsz1, bsz2);
+
+		if (b < 0) continue;
+		n = img_offsets[s];
+		for (k = offsets[b]; k < offsets[b+1]; k++) {
+			triangle_vertices(tris[k], ny, v);
+			if (!point_in_triangle_sp(ys1[s], ys2[s], sp1, sp2, v, w)) continue;
+			theta1[n] = w[0]*lp1[v[0]] + w[1]*lp1[v[1]] + w[2]*lp1[v[2]];
+			theta2[n] = w[0]*lp2[v[0]] + w[1]*lp2[v[1]] + w[2]*lp2[v[2]];
+			vertices[3*n+0] = v[0];
+			vertices[3*n+1] = v[1];
+			vertices[3*n+2] = v[2];
+			weights[3*n+0] = w[0];
+			weights[3*n+1] = w[1];
+			weights[3*n+2] = w[2];
+			n++;
+		}
+	}
+}
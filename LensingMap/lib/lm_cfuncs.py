@@ -1,7 +1,10 @@
 # File Description:
-# Contains cosmological distance calculations implemented with astropy
-# and cython bridge from python to c data-types for strong lensing
-# analysis
+# Contains cosmological distance calculations from tabulated astropy
+# distances and cython bridge from python to c data-types for strong
+# lensing analysis
+import sys
+sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/lib/')
+import cosmotable
 
 apr = 206269.43  #radians to arcsec
 
@@ -14,22 +17,24 @@ def Dc(z, unit, cosmo):
     Output:
         res: comoving distance in unit as defined by variable 'unit'
     """
-    res = cosmo.comoving_distance(z).to_value(unit)  #*cosmo.h
+    res = cosmotable.get_table(cosmo, unit).Dc(z)  #*cosmo.h
     return res
 
 def Da(z, unit, cosmo):
-    res = cosmo.angular_diameter_distance(z).to_value(unit)  #*cosmo.h
+    res = cosmotable.get_table(cosmo, unit).Da(z)  #*cosmo.h
     return res
 
 def Dc2(z1, z2, unit, cosmo):
-    Dcz1 = cosmo.comoving_distance(z1).to_value(unit)  #*cosmo.h
-    Dcz2 = cosmo.comoving_distance(z2).to_value(unit)  #*cosmo.h
+    table = cosmotable.get_table(cosmo, unit)
+    Dcz1 = table.Dc(z1)  #*cosmo.h
+    Dcz2 = table.Dc(z2)  #*cosmo.h
     res = (Dcz2-Dcz1+1e-8)
     return res
 
 def Da2(z1, z2, unit, cosmo):
-    Dcz1 = cosmo.angular_diameter_distance(z1).to_value(unit)  #*cosmo.h
-    Dcz2 = cosmo.angular_diameter_distance(z2).to_value(unit)  #*cosmo.h
+    table = cosmotable.get_table(cosmo, unit)
+    Dcz1 = table.Da(z1)  #*cosmo.h
+    Dcz2 = table.Da(z2)  #*cosmo.h
     res = (Dcz2-Dcz1+1e-8)
     return res
 
@@ -37,29 +42,53 @@ def Da2(z1, z2, unit, cosmo):
 import numpy as np
 import ctypes as ct
 import os
+import multiprocessing
 
-lib_path = "/cosma5/data/dp004/dc-beck3/StrongLensing/LensingMap/lib/"
+import cbind as cb
+
+# lib_so_* next to this file
+lib_path = cb.lib_dir(__file__)
+
+# floating point precision of the lensing kernels (FFT fields, Lanczos
+# derivatives, inverse CIC and triangle index), 'double' or 'single'
+precision = 'double'
+
+def set_precision(prec):
+    """
+    Select the precision of the lensing kernels at runtime, maps of
+    'single' precision take half the memory and bandwidth
+    """
+    global precision
+    if prec not in ('double', 'single'):
+        raise Exception('Dont know this precision ->', prec)
+    precision = prec
+
+def real_type():
+    """ ctypes type of the maps of the current precision """
+    if precision == 'single':
+        return ct.c_float
+    return ct.c_double
 #---------------------------------------------------------------------------------
-sps = ct.CDLL(lib_path+"lib_so_sph_w_omp/libsphsdens.so")
+sps = cb.load_library(lib_path+"lib_so_sph_w_omp/libsphsdens.so")
 
-sps.cal_sph_sdens_weight.argtypes =[np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_float), \
+sps.cal_sph_sdens_weight.argtypes =[cb.ndpointer(dtype = ct.c_float), \
+                                    cb.ndpointer(dtype = ct.c_float), \
+                                    cb.ndpointer(dtype = ct.c_float), \
+                                    cb.ndpointer(dtype = ct.c_float), \
                                     ct.c_float,ct.c_long,ct.c_float,ct.c_long,ct.c_long, \
                                     ct.c_float,ct.c_float,ct.c_float, \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_float)]
+                                    cb.ndpointer(dtype = ct.c_float), \
+                                    cb.ndpointer(dtype = ct.c_float), \
+                                    cb.ndpointer(dtype = ct.c_float)]
 
 sps.cal_sph_sdens_weight.restype  = ct.c_int
 
 def call_sph_sdens_weight(x1,x2,x3,mpp,Bsz,Ncc):
    
-    x1 = np.array(x1, dtype=ct.c_float)
-    x2 = np.array(x2, dtype=ct.c_float)
-    x3 = np.array(x3, dtype=ct.c_float)
-    mpp = np.array(mpp, dtype=ct.c_float)
+    x1 = cb.as_input(x1, ct.c_float)
+    x2 = cb.as_input(x2, ct.c_float)
+    x3 = cb.as_input(x3, ct.c_float)
+    mpp = cb.as_input(mpp, ct.c_float)
     dcl = ct.c_float(Bsz/Ncc)
     Ngb = ct.c_long(32)
     xc1 = ct.c_float(0.0)
@@ -73,23 +102,23 @@ def call_sph_sdens_weight(x1,x2,x3,mpp,Bsz,Ncc):
     sps.cal_sph_sdens_weight(x1,x2,x3,mpp,ct.c_float(Bsz),ct.c_long(Ncc),dcl,Ngb,ct.c_long(Np),xc1,xc2,xc3,posx1,posx2,sdens);
     return sdens
 #---------------------------------------------------------------------------------
-sps.cal_sph_sdens_weight_omp.argtypes =[np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                        np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                        np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                        np.ctypeslib.ndpointer(dtype = ct.c_float), \
+sps.cal_sph_sdens_weight_omp.argtypes =[cb.ndpointer(dtype = ct.c_float), \
+                                        cb.ndpointer(dtype = ct.c_float), \
+                                        cb.ndpointer(dtype = ct.c_float), \
+                                        cb.ndpointer(dtype = ct.c_float), \
                                         ct.c_float,ct.c_long,ct.c_float,ct.c_long,ct.c_long, \
                                         ct.c_float,ct.c_float,ct.c_float, \
-                                        np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                        np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                        np.ctypeslib.ndpointer(dtype = ct.c_float)]
+                                        cb.ndpointer(dtype = ct.c_float), \
+                                        cb.ndpointer(dtype = ct.c_float), \
+                                        cb.ndpointer(dtype = ct.c_float)]
 
 sps.cal_sph_sdens_weight_omp.restype  = ct.c_int
 
 def call_sph_sdens_weight_omp(x1,x2,x3,mpp,Bsz,Nc):
-    x1 = np.array(x1,dtype=ct.c_float)
-    x2 = np.array(x1,dtype=ct.c_float)
-    x3 = np.array(x1,dtype=ct.c_float)
-    mpp = np.array(mpp,dtype=ct.c_float)
+    x1 = cb.as_input(x1, ct.c_float)
+    x2 = cb.as_input(x2, ct.c_float)
+    x3 = cb.as_input(x3, ct.c_float)
+    mpp = cb.as_input(mpp, ct.c_float)
     dsx = ct.c_float(Bsz/Nc)
     Ngb = ct.c_long(32)
     xc1 = ct.c_float(0.0)
@@ -102,118 +131,298 @@ def call_sph_sdens_weight_omp(x1,x2,x3,mpp,Bsz,Nc):
 
     sps.cal_sph_sdens_weight_omp(x1,x2,x3,mpp,ct.c_float(Bsz),ct.c_long(Nc),dsx,Ngb,ct.c_long(Np),xc1,xc2,xc3,posx1,posx2,sdens);
     return sdens
+#---------------------------------------------------------------------------------
+sps.cal_sph_hsml.argtypes = [cb.ndpointer(dtype = ct.c_float), \
+                             cb.ndpointer(dtype = ct.c_float), \
+                             cb.ndpointer(dtype = ct.c_float), \
+                             ct.c_long,ct.c_long, \
+                             cb.ndpointer(dtype = ct.c_float)]
+sps.cal_sph_hsml.restype  = ct.c_int
+
+def call_sph_hsml(x1,x2,x3,Ngb=32):
+    """
+    Smoothing lengths of the particles as used by call_sph_sdens_weight
+    Input:
+        x1, x2, x3: particle positions
+        Ngb: number of neighbours
+    Output:
+        hsml: smoothing lengths, in the units of the positions
+    """
+    x1 = cb.as_input(x1, ct.c_float)
+    x2 = cb.as_input(x2, ct.c_float)
+    x3 = cb.as_input(x3, ct.c_float)
+    Np = len(x1)
+    hsml = np.zeros(Np,dtype=ct.c_float)
+    sps.cal_sph_hsml(x1,x2,x3,ct.c_long(Ngb),ct.c_long(Np),hsml)
+    return hsml
 
 #---------------------------------------------------------------------------------
-gls = ct.CDLL(lib_path+"lib_so_cgls/libglsg.so")
-gls.kappa0_to_alphas.argtypes = [np.ctypeslib.ndpointer(dtype = ct.c_double), \
+gls = cb.load_library(lib_path+"lib_so_cgls/libglsg.so")
+gls.kappa0_to_alphas.argtypes = [cb.ndpointer(dtype = ct.c_double), \
                                  ct.c_int,ct.c_double,\
-                                 np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                 np.ctypeslib.ndpointer(dtype = ct.c_double)]
+                                 cb.ndpointer(dtype = ct.c_double), \
+                                 cb.ndpointer(dtype = ct.c_double)]
 gls.kappa0_to_alphas.restype  = ct.c_void_p
 
-def call_cal_alphas(Kappa, Bsz, Ncc):
-    kappa0 = np.array(Kappa, dtype=ct.c_double)
-    alpha1 = np.array(np.zeros((Ncc,Ncc)), dtype=ct.c_double)
-    alpha2 = np.array(np.zeros((Ncc,Ncc)), dtype=ct.c_double)
-    gls.kappa0_to_alphas(kappa0, Ncc, Bsz, alpha1, alpha2)
+gls.kappa0_to_alphas_sp.argtypes = [cb.ndpointer(dtype = ct.c_float), \
+                                    ct.c_int,ct.c_double,\
+                                    cb.ndpointer(dtype = ct.c_float), \
+                                    cb.ndpointer(dtype = ct.c_float)]
+gls.kappa0_to_alphas_sp.restype  = ct.c_void_p
+
+def input_copy(Kappa, scale=1., dtype=ct.c_double):
+    """
+    Map handed to the kernels, the unit conversion (e.g. 1/Sigma_cr, see
+    mapprep.MapUnits) applied in the one copy, without a conversion Kappa
+    itself if it already has dtype and C order
+    Input:
+        Kappa: map or stack of maps
+        scale: factor, or one factor per map of a stack
+    """
+    scale = np.asarray(scale, dtype=np.float64)
+    if scale.ndim == 0 and scale == 1:
+        return cb.as_input(Kappa, dtype)
+    if scale.ndim > 0:
+        scale = scale.reshape((-1,) + (1,)*(np.ndim(Kappa) - 1))
+    return np.multiply(Kappa, scale, dtype=dtype)
+
+def call_cal_alphas(Kappa, Bsz, Ncc, scale=1., out=None):
+    """
+    Input:
+        out: (alpha1, alpha2) buffers to write to, None for new maps
+    """
+    real = real_type()
+    kappa0 = input_copy(Kappa, scale, real)
+    alpha1, alpha2 = cb.as_outputs(out, 2, (Ncc, Ncc), real)
+    if precision == 'single':
+        gls.kappa0_to_alphas_sp(kappa0, Ncc, Bsz, alpha1, alpha2)
+    else:
+        gls.kappa0_to_alphas(kappa0, Ncc, Bsz, alpha1, alpha2)
     return alpha1,alpha2
 
-gls.kappa0_to_phi.argtypes = [np.ctypeslib.ndpointer(dtype = ct.c_double), \
+gls.kappa0_to_phi.argtypes = [cb.ndpointer(dtype = ct.c_double), \
                               ct.c_int,ct.c_double,\
-                              np.ctypeslib.ndpointer(dtype = ct.c_double)]
+                              cb.ndpointer(dtype = ct.c_double)]
 gls.kappa0_to_phi.restype  = ct.c_void_p
 
-def call_cal_phi(Kappa, Bsz, Ncc):
-	kappa0 = np.array(Kappa, dtype=ct.c_double)
-	phi = np.array(np.zeros((Ncc, Ncc)), dtype=ct.c_double)
-	gls.kappa0_to_phi(kappa0, Ncc, Bsz, phi)
+gls.kappa0_to_phi_sp.argtypes = [cb.ndpointer(dtype = ct.c_float), \
+                                 ct.c_int,ct.c_double,\
+                                 cb.ndpointer(dtype = ct.c_float)]
+gls.kappa0_to_phi_sp.restype  = ct.c_void_p
+
+def call_cal_phi(Kappa, Bsz, Ncc, scale=1., out=None):
+	real = real_type()
+	kappa0 = input_copy(Kappa, scale, real)
+	phi = cb.as_output(out, (Ncc, Ncc), real)
+	if precision == 'single':
+		gls.kappa0_to_phi_sp(kappa0, Ncc, Bsz, phi)
+	else:
+		gls.kappa0_to_phi(kappa0, Ncc, Bsz, phi)
 
 	return phi
 
+gls.kappa0_to_signals.argtypes = [cb.ndpointer(dtype = ct.c_double), \
+                                  ct.c_int,ct.c_double,ct.c_double,\
+                                  cb.ndpointer(dtype = ct.c_double), \
+                                  cb.ndpointer(dtype = ct.c_double), \
+                                  cb.ndpointer(dtype = ct.c_double), \
+                                  cb.ndpointer(dtype = ct.c_double), \
+                                  cb.ndpointer(dtype = ct.c_double), \
+                                  cb.ndpointer(dtype = ct.c_double)]
+gls.kappa0_to_signals.restype  = ct.c_void_p
+gls.kappa0_to_signals_sp.argtypes = [cb.ndpointer(dtype = ct.c_float), \
+                                     ct.c_int,ct.c_double,ct.c_double,\
+                                     cb.ndpointer(dtype = ct.c_float), \
+                                     cb.ndpointer(dtype = ct.c_float), \
+                                     cb.ndpointer(dtype = ct.c_float), \
+                                     cb.ndpointer(dtype = ct.c_float), \
+                                     cb.ndpointer(dtype = ct.c_float), \
+                                     cb.ndpointer(dtype = ct.c_float)]
+gls.kappa0_to_signals_sp.restype  = ct.c_void_p
+
+def call_cal_signals(Kappa, Bsz, Ncc, ksigma=0., scale=1., out=None):
+    """
+    Deflection, potential, convergence and shear from one FFT of Kappa,
+    the shears computed in Fourier space
+    Input:
+        ksigma[float] : width of Gaussian smoothing kernel, 0 for none
+        scale[float] : factor applied to Kappa, see input_copy
+        out[list] : the six maps to write to, None for new maps
+    Output:
+        alpha1, alpha2, phi, kappa, shear1, shear2
+    """
+    real = real_type()
+    kappa0 = input_copy(Kappa, scale, real)
+    maps = cb.as_outputs(out, 6, (Ncc, Ncc), real)
+    if precision == 'single':
+        gls.kappa0_to_signals_sp(kappa0, Ncc, Bsz, ksigma, *maps)
+    else:
+        gls.kappa0_to_signals(kappa0, Ncc, Bsz, ksigma, *maps)
+    return maps
+
+gls.kappa0_to_far_fields.argtypes = [cb.ndpointer(dtype = ct.c_double), \
+                                     ct.c_int,ct.c_double,\
+                                     cb.ndpointer(dtype = ct.c_double), \
+                                     cb.ndpointer(dtype = ct.c_double), \
+                                     cb.ndpointer(dtype = ct.c_double)]
+gls.kappa0_to_far_fields.restype  = ct.c_void_p
+
+def call_cal_far_fields(Kappa, Bsz, Ncc):
+    """
+    Deflection and potential of Kappa with point mass kernels, accurate
+    far from the mass (e.g. the mass around a window)
+    Output:
+        alpha1, alpha2, phi
+    """
+    kappa0 = cb.as_input(Kappa, ct.c_double)
+    maps = [np.zeros((Ncc, Ncc), dtype=ct.c_double) for i in range(3)]
+    gls.kappa0_to_far_fields(kappa0, Ncc, Bsz, *maps)
+    return maps
+
+gls.kappa0_to_fields_many.argtypes = [cb.ndpointer(dtype = ct.c_double), \
+                                      ct.c_int,ct.c_int,\
+                                      cb.ndpointer(dtype = ct.c_double), \
+                                      ct.c_int,\
+                                      cb.ndpointer(dtype = ct.c_double), \
+                                      cb.ndpointer(dtype = ct.c_double), \
+                                      cb.ndpointer(dtype = ct.c_double)]
+gls.kappa0_to_fields_many.restype  = ct.c_void_p
+
+def call_cal_fields_many(Kappas, Bszs, Ncc, nthreads=None, scale=1.):
+    """
+    Deflection and potential of a stack of maps of the same number of
+    cells, one multi-transform FFT plan for all maps
+    Input:
+        Kappas: (nmaps, Ncc, Ncc) stack of maps
+        Bszs: size of every map, or one size of all maps
+        nthreads: threads of the transforms, default all cores
+        scale: factor of every map, or one factor of all maps
+    Output:
+        alpha1, alpha2, phi: (nmaps, Ncc, Ncc) stacks
+    """
+    kappa0 = input_copy(np.reshape(Kappas, (-1, Ncc, Ncc)), scale)
+    nmaps = len(kappa0)
+    bsz = np.array(np.broadcast_to(Bszs, (nmaps,)), dtype=ct.c_double)
+    if precision == 'single':
+        # no batched single precision kernel, map by map
+        maps = [call_cal_alphas(kappa0[mm], bsz[mm], Ncc) +
+                (call_cal_phi(kappa0[mm], bsz[mm], Ncc),) for mm in range(nmaps)]
+        return [np.array([mp[ff] for mp in maps]) for ff in range(3)]
+    if nthreads is None:
+        nthreads = multiprocessing.cpu_count()
+    maps = [np.zeros((nmaps, Ncc, Ncc), dtype=ct.c_double) for i in range(3)]
+    gls.kappa0_to_fields_many(kappa0, nmaps, Ncc, bsz, nthreads, *maps)
+    return maps
+
 #--------------------------------------------------------------------
-lzos = ct.CDLL(lib_path+"lib_so_lzos/liblzos.so")
-lzos.lanczos_diff_2_tag.argtypes = [np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                    np.ctypeslib.ndpointer(dtype = ct.c_double), \
+lzos = cb.load_library(lib_path+"lib_so_lzos/liblzos.so")
+lzos.lanczos_diff_2_tag.argtypes = [cb.ndpointer(dtype = ct.c_double), \
+                                    cb.ndpointer(dtype = ct.c_double), \
+                                    cb.ndpointer(dtype = ct.c_double), \
+                                    cb.ndpointer(dtype = ct.c_double), \
+                                    cb.ndpointer(dtype = ct.c_double), \
+                                    cb.ndpointer(dtype = ct.c_double), \
                                     ct.c_double,ct.c_int,ct.c_int]
 lzos.lanczos_diff_2_tag.restype  = ct.c_void_p
-
-def call_lanczos_derivative(alpha1,alpha2,Bsz,Ncc):
+lzos.lanczos_diff_2_tag_sp.argtypes = [cb.ndpointer(dtype = ct.c_float), \
+                                       cb.ndpointer(dtype = ct.c_float), \
+                                       cb.ndpointer(dtype = ct.c_float), \
+                                       cb.ndpointer(dtype = ct.c_float), \
+                                       cb.ndpointer(dtype = ct.c_float), \
+                                       cb.ndpointer(dtype = ct.c_float), \
+                                       ct.c_float,ct.c_int,ct.c_int]
+lzos.lanczos_diff_2_tag_sp.restype  = ct.c_void_p
+
+def call_lanczos_derivative(alpha1,alpha2,Bsz,Ncc,out=None):
+    """
+    Input:
+        out: (m11, m12, m21, m22) buffers to write to, None for new maps
+    """
     dif_tag = ct.c_int(2)
-    dcl = ct.c_double(Bsz/Ncc)
-    m1 = np.array(alpha1,dtype=ct.c_double)
-    m2 = np.array(alpha2,dtype=ct.c_double)
-    m11 = np.zeros((Ncc, Ncc))
-    m12 = np.zeros((Ncc, Ncc))
-    m21 = np.zeros((Ncc, Ncc))
-    m22 = np.zeros((Ncc, Ncc))
+    real = real_type()
+    dcl = real(Bsz/Ncc)
+    m1 = cb.as_input(alpha1, real)
+    m2 = cb.as_input(alpha2, real)
+    m11, m12, m21, m22 = cb.as_outputs(out, 4, (Ncc, Ncc), real)
 
-    lzos.lanczos_diff_2_tag(m1,m2,m11,m12,m21,m22,dcl,ct.c_int(Ncc),dif_tag)
+    if precision == 'single':
+        lzos.lanczos_diff_2_tag_sp(m1,m2,m11,m12,m21,m22,dcl,ct.c_int(Ncc),dif_tag)
+    else:
+        lzos.lanczos_diff_2_tag(m1,m2,m11,m12,m21,m22,dcl,ct.c_int(Ncc),dif_tag)
 
     return m11,m12,m21,m22
 
 #---------------------------------------------------------------------------------
 # Cloud-in-Cell scheme
-rtf = ct.CDLL(lib_path + "lib_so_icic/librtf.so")
+rtf = cb.load_library(lib_path+"lib_so_icic/librtf.so")
 
-rtf.inverse_cic.argtypes = [np.ctypeslib.ndpointer(dtype =  ct.c_double),\
-                            np.ctypeslib.ndpointer(dtype =  ct.c_double), \
-                            np.ctypeslib.ndpointer(dtype =  ct.c_double), \
+rtf.inverse_cic.argtypes = [cb.ndpointer(dtype =  ct.c_double),\
+                            cb.ndpointer(dtype =  ct.c_double), \
+                            cb.ndpointer(dtype =  ct.c_double), \
                             ct.c_double,ct.c_double,ct.c_double, \
                             ct.c_int,ct.c_int,ct.c_int,ct.c_int,\
-                            np.ctypeslib.ndpointer(dtype = ct.c_double)]
+                            cb.ndpointer(dtype = ct.c_double)]
 rtf.inverse_cic.restype  = ct.c_void_p
-
-def call_inverse_cic(img_in, yc1, yc2, yi1, yi2, dsi):
+for func in [rtf.inverse_cic_sp, rtf.inverse_cic_omp_sp]:
+    func.argtypes = [cb.ndpointer(dtype =  ct.c_float),\
+                     cb.ndpointer(dtype =  ct.c_float), \
+                     cb.ndpointer(dtype =  ct.c_float), \
+                     ct.c_float,ct.c_float,ct.c_float, \
+                     ct.c_int,ct.c_int,ct.c_int,ct.c_int,\
+                     cb.ndpointer(dtype = ct.c_float)]
+    func.restype  = ct.c_void_p
+
+def call_inverse_cic(img_in, yc1, yc2, yi1, yi2, dsi, out=None):
     ny1,ny2 = np.shape(img_in)
     nx1,nx2 = np.shape(yi1)
 
-    img_in = np.array(img_in,dtype=ct.c_double)
+    real = real_type()
+    img_in = cb.as_input(img_in, real)
 
-    yi1 = np.array(yi1,dtype=ct.c_double)
-    yi2 = np.array(yi2,dtype=ct.c_double)
+    yi1 = cb.as_input(yi1, real)
+    yi2 = cb.as_input(yi2, real)
 
-    img_out = np.zeros((nx1,nx2))
+    img_out = cb.as_output(out, (nx1,nx2), real)
 
-    rtf.inverse_cic(img_in,yi1,yi2,ct.c_double(yc1),ct.c_double(yc2),ct.c_double(dsi),ct.c_int(ny1),ct.c_int(ny2),ct.c_int(nx1),ct.c_int(nx2),img_out)
+    func = rtf.inverse_cic_sp if precision == 'single' else rtf.inverse_cic
+    func(img_in,yi1,yi2,real(yc1),real(yc2),real(dsi),ct.c_int(ny1),ct.c_int(ny2),ct.c_int(nx1),ct.c_int(nx2),img_out)
     return img_out.reshape((nx1,nx2))
 
 #--------------------------------------------------------------------
-rtf.inverse_cic_omp.argtypes = [np.ctypeslib.ndpointer(dtype =  ct.c_double),\
-                                np.ctypeslib.ndpointer(dtype =  ct.c_double), \
-                                np.ctypeslib.ndpointer(dtype =  ct.c_double), \
+rtf.inverse_cic_omp.argtypes = [cb.ndpointer(dtype =  ct.c_double),\
+                                cb.ndpointer(dtype =  ct.c_double), \
+                                cb.ndpointer(dtype =  ct.c_double), \
                                 ct.c_double,ct.c_double,ct.c_double, \
                                 ct.c_int,ct.c_int,ct.c_int,ct.c_int,\
-                                np.ctypeslib.ndpointer(dtype = ct.c_double)]
+                                cb.ndpointer(dtype = ct.c_double)]
 rtf.inverse_cic_omp.restype  = ct.c_void_p
 
-def call_inverse_cic_omp(img_in,yc1,yc2,yi1,yi2,dsi):
+def call_inverse_cic_omp(img_in,yc1,yc2,yi1,yi2,dsi,out=None):
     ny1,ny2 = np.shape(img_in)
     nx1,nx2 = np.shape(yi1)
-    img_in = np.array(img_in,dtype=ct.c_double)
-    yi1 = np.array(yi1,dtype=ct.c_double)
-    yi2 = np.array(yi2,dtype=ct.c_double)
-    img_out = np.zeros((nx1,nx2))
-
-    rtf.inverse_cic_omp(img_in,yi1,yi2,ct.c_double(yc1),ct.c_double(yc2),ct.c_double(dsi),ct.c_int(ny1),ct.c_int(ny2),ct.c_int(nx1),ct.c_int(nx2),img_out)
+    real = real_type()
+    img_in = cb.as_input(img_in, real)
+    yi1 = cb.as_input(yi1, real)
+    yi2 = cb.as_input(yi2, real)
+    img_out = cb.as_output(out, (nx1,nx2), real)
+
+    func = rtf.inverse_cic_omp_sp if precision == 'single' else rtf.inverse_cic_omp
+    func(img_in,yi1,yi2,real(yc1),real(yc2),real(dsi),ct.c_int(ny1),ct.c_int(ny2),ct.c_int(nx1),ct.c_int(nx2),img_out)
     return img_out.reshape((nx1,nx2))
 
 #--------------------------------------------------------------------
-rtf.inverse_cic_single.argtypes = [np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                   np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                   np.ctypeslib.ndpointer(dtype = ct.c_float), \
+rtf.inverse_cic_single.argtypes = [cb.ndpointer(dtype = ct.c_float), \
+                                   cb.ndpointer(dtype = ct.c_float), \
+                                   cb.ndpointer(dtype = ct.c_float), \
                                    ct.c_float,ct.c_float,ct.c_float,ct.c_int,ct.c_int,ct.c_int, \
-                                   np.ctypeslib.ndpointer(dtype = ct.c_float)]
+                                   cb.ndpointer(dtype = ct.c_float)]
 rtf.inverse_cic_single.restype  = ct.c_void_p
 
 def call_inverse_cic_single(img_in,yc1,yc2,yi1,yi2,dsi):
     ny1,ny2 = np.shape(img_in)
-    img_in = np.array(img_in,dtype=ct.c_float)
-    yi1 = np.array(yi1,dtype=ct.c_float)
-    yi2 = np.array(yi2,dtype=ct.c_float)
+    img_in = cb.as_input(img_in, ct.c_float)
+    yi1 = cb.as_input(yi1, ct.c_float)
+    yi2 = cb.as_input(yi2, ct.c_float)
     nlimgs = len(yi1)
     img_out = np.zeros((nlimgs),dtype=ct.c_float)
 
@@ -221,11 +430,11 @@ def call_inverse_cic_single(img_in,yc1,yc2,yi1,yi2,dsi):
     return img_out
 
 #--------------------------------------------------------------------
-rtf.inverse_cic_omp_single.argtypes = [np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                       np.ctypeslib.ndpointer(dtype = ct.c_float), \
-                                       np.ctypeslib.ndpointer(dtype = ct.c_float), \
+rtf.inverse_cic_omp_single.argtypes = [cb.ndpointer(dtype = ct.c_float), \
+                                       cb.ndpointer(dtype = ct.c_float), \
+                                       cb.ndpointer(dtype = ct.c_float), \
                                        ct.c_float,ct.c_float,ct.c_float,ct.c_int,ct.c_int,ct.c_int, \
-                                       np.ctypeslib.ndpointer(dtype = ct.c_float)]
+                                       cb.ndpointer(dtype = ct.c_float)]
 rtf.inverse_cic_omp_single.restype  = ct.c_void_p
 
 def call_inverse_cic_single_omp(img_in,yc1,yc2,yi1,yi2,dsi):
@@ -237,9 +446,9 @@ def call_inverse_cic_single_omp(img_in,yc1,yc2,yi1,yi2,dsi):
         dsi: pixel size on grid
     """
     ny1,ny2 = np.shape(img_in)
-    img_in = np.array(img_in,dtype=ct.c_float)
-    yi1 = np.array(yi1,dtype=ct.c_float)
-    yi2 = np.array(yi2,dtype=ct.c_float)
+    img_in = cb.as_input(img_in, ct.c_float)
+    yi1 = cb.as_input(yi1, ct.c_float)
+    yi2 = cb.as_input(yi2, ct.c_float)
     nlimgs = len(yi1)
     img_out = np.zeros((nlimgs),dtype=ct.c_float)
 
@@ -247,22 +456,22 @@ def call_inverse_cic_single_omp(img_in,yc1,yc2,yi1,yi2,dsi):
     return img_out
 
 #--------------------------------------------------------------------
-tri = ct.CDLL(lib_path+"lib_so_tri_roots/libtri.so")
-tri.mapping_triangles.argtypes = [np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                  np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                  np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                  np.ctypeslib.ndpointer(dtype = ct.c_double), \
-                                  np.ctypeslib.ndpointer(dtype = ct.c_double), \
+tri = cb.load_library(lib_path+"lib_so_tri_roots/libtri.so")
+tri.mapping_triangles.argtypes = [cb.ndpointer(dtype = ct.c_double), \
+                                  cb.ndpointer(dtype = ct.c_double), \
+                                  cb.ndpointer(dtype = ct.c_double), \
+                                  cb.ndpointer(dtype = ct.c_double), \
+                                  cb.ndpointer(dtype = ct.c_double), \
                                   ct.c_int, \
-                                  np.ctypeslib.ndpointer(dtype = ct.c_double)]
+                                  cb.ndpointer(dtype = ct.c_double)]
 tri.mapping_triangles.restype  = ct.c_void_p
 
 def call_mapping_triangles(pys, xi1, xi2, yi1, yi2):
-    pys_in = np.array(pys, dtype=ct.c_double)
-    xi1_in = np.array(xi1, dtype=ct.c_double)
-    xi2_in = np.array(xi2, dtype=ct.c_double)
-    yi1_in = np.array(yi1, dtype=ct.c_double)
-    yi2_in = np.array(yi2, dtype=ct.c_double)
+    pys_in = cb.as_input(pys, ct.c_double)
+    xi1_in = cb.as_input(xi1, ct.c_double)
+    xi2_in = cb.as_input(xi2, ct.c_double)
+    yi1_in = cb.as_input(yi1, ct.c_double)
+    yi2_in = cb.as_input(yi2, ct.c_double)
     nc_in = ct.c_int(np.shape(xi1)[0])
 
     # assuming there will not be more than 40 lensed images
@@ -276,6 +485,401 @@ def call_mapping_triangles(pys, xi1, xi2, yi1, yi2):
     xroot2 = xroots_out[1:aroots:2]
     return xroot1, xroot2
 #--------------------------------------------------------------------
+ctr = cb.load_library(lib_path+"lib_so_contour/libcontour.so")
+ctr.marching_squares.argtypes = [cb.ndpointer(dtype = ct.c_double), \
+                                 ct.c_int,ct.c_int,ct.c_double,ct.c_int,ct.c_int, \
+                                 cb.ndpointer(dtype = ct.c_double), \
+                                 cb.ndpointer(dtype = ct.c_double), \
+                                 cb.ndpointer(dtype = ct.c_int), \
+                                 cb.ndpointer(dtype = ct.c_int)]
+ctr.marching_squares.restype  = ct.c_int
+
+def call_marching_squares(field, level=0.0):
+    """
+    Input:
+        field: 2D map to contour
+        level: contour level
+    Output:
+        pts1, pts2: contour points in fractional index coordinates
+                    along axis 0 and axis 1
+        offsets: curve c consists of pts[offsets[c]:offsets[c+1]]
+        closed: True for closed curves, open ones end on the map boundary
+    """
+    field = cb.as_input(field, ct.c_double)
+    nx, ny = np.shape(field)
+    above = field > level
+    ncross = np.count_nonzero(above[:, 1:] != above[:, :-1]) + \
+             np.count_nonzero(above[1:, :] != above[:-1, :])
+    # every point sits on a crossed edge, closed curves repeat their start
+    maxcurves = ncross//2 + 1
+    maxpts = ncross + maxcurves
+    pts1 = np.zeros(maxpts, dtype=ct.c_double)
+    pts2 = np.zeros(maxpts, dtype=ct.c_double)
+    offsets = np.zeros(maxcurves+1, dtype=ct.c_int)
+    closed = np.zeros(maxcurves, dtype=ct.c_int)
+
+    ncurves = ctr.marching_squares(field, ct.c_int(nx), ct.c_int(ny),
+                                   ct.c_double(level), ct.c_int(maxpts),
+                                   ct.c_int(maxcurves), pts1, pts2,
+                                   offsets, closed)
+    if ncurves < 0:
+        raise Exception('Contour buffer overflow')
+    npts = offsets[ncurves]
+    return pts1[:npts], pts2[:npts], offsets[:ncurves+1], closed[:ncurves] == 1
+#--------------------------------------------------------------------
+leq = cb.load_library(lib_path+"lib_so_lenseq/liblenseq.so")
+for func in [leq.interp_points, leq.interp_points_omp]:
+    func.argtypes = [cb.ndpointer(dtype = ct.c_double), \
+                     cb.ndpointer(dtype = ct.c_double), \
+                     cb.ndpointer(dtype = ct.c_double), \
+                     ct.c_int,ct.c_int, \
+                     cb.ndpointer(dtype = ct.c_double), \
+                     cb.ndpointer(dtype = ct.c_double), \
+                     ct.c_int,ct.c_int, \
+                     cb.ndpointer(dtype = ct.c_double)]
+    func.restype  = ct.c_void_p
+
+def call_interp_points(img_in, axis1, axis2, x1, x2, order=1, omp=False,
+                       out=None):
+    """
+    Input:
+        img_in: 2D map on rectilinear (possibly non-uniform) grid
+        axis1, axis2: grid coordinates along axis 0 and axis 1
+        x1, x2: coordinates of points
+        order: 1 for bilinear, 3 for bicubic interpolation
+        omp: use OpenMP threads
+        out: buffer of the values to write to, None for a new array
+    Output:
+        img_out: map values at points
+    """
+    nx, ny = np.shape(img_in)
+    img_in = cb.as_input(img_in, ct.c_double)
+    axis1 = cb.as_input(axis1, ct.c_double)
+    axis2 = cb.as_input(axis2, ct.c_double)
+    x1 = cb.as_input(x1, ct.c_double, flat=True)
+    x2 = cb.as_input(x2, ct.c_double, flat=True)
+    npts = len(x1)
+    img_out = cb.as_output(out, npts, ct.c_double)
+
+    func = leq.interp_points_omp if omp else leq.interp_points
+    func(img_in, axis1, axis2, ct.c_int(nx), ct.c_int(ny), x1, x2,
+         ct.c_int(npts), ct.c_int(order), img_out)
+    return img_out
+
+for func in [leq.lens_equation, leq.lens_equation_omp]:
+    func.argtypes = [cb.ndpointer(dtype = ct.c_double), \
+                     cb.ndpointer(dtype = ct.c_double), \
+                     cb.ndpointer(dtype = ct.c_double), \
+                     cb.ndpointer(dtype = ct.c_double), \
+                     ct.c_int,ct.c_int, \
+                     cb.ndpointer(dtype = ct.c_double), \
+                     cb.ndpointer(dtype = ct.c_double), \
+                     ct.c_int,ct.c_int, \
+                     cb.ndpointer(dtype = ct.c_double), \
+                     cb.ndpointer(dtype = ct.c_double)]
+    func.restype  = ct.c_void_p
+
+def call_lens_equation(x1, x2, axis1, axis2, alpha1, alpha2, order=1, omp=False,
+                       out=None):
+    """
+    Map image plane points to the source plane, y = x - alpha(x)
+    Input:
+        x1, x2: image plane coordinates of points
+        axis1, axis2: grid coordinates of deflection maps along axis 0 and 1
+        alpha1, alpha2: 2D deflection maps
+        order: 1 for bilinear, 3 for bicubic interpolation
+        omp: use OpenMP threads
+        out: (y1, y2) buffers to write to, None for new arrays
+    Output:
+        y1, y2: source plane coordinates of points
+    """
+    nx, ny = np.shape(alpha1)
+    alpha1 = cb.as_input(alpha1, ct.c_double)
+    alpha2 = cb.as_input(alpha2, ct.c_double)
+    axis1 = cb.as_input(axis1, ct.c_double)
+    axis2 = cb.as_input(axis2, ct.c_double)
+    x1 = cb.as_input(x1, ct.c_double, flat=True)
+    x2 = cb.as_input(x2, ct.c_double, flat=True)
+    npts = len(x1)
+    y1, y2 = cb.as_outputs(out, 2, npts, ct.c_double)
+
+    func = leq.lens_equation_omp if omp else leq.lens_equation
+    func(alpha1, alpha2, axis1, axis2, ct.c_int(nx), ct.c_int(ny), x1, x2,
+         ct.c_int(npts), ct.c_int(order), y1, y2)
+    return y1, y2
+#--------------------------------------------------------------------
+tix = cb.load_library(lib_path+"lib_so_tri_index/libtriindex.so")
+for func in [tix.tri_index_count, tix.tri_index_fill]:
+    func.argtypes = [cb.ndpointer(dtype = ct.c_double), \
+                     cb.ndpointer(dtype = ct.c_double), \
+                     ct.c_int,ct.c_int,ct.c_int,ct.c_int, \
+                     ct.c_double,ct.c_double,ct.c_double,ct.c_double, \
+                     cb.ndpointer(dtype = ct.c_long)]
+    func.restype  = ct.c_void_p
+tix.tri_index_fill.argtypes = tix.tri_index_fill.argtypes + \
+                              [cb.ndpointer(dtype = ct.c_long)]
+for func in [tix.tri_index_count_sp, tix.tri_index_fill_sp]:
+    func.argtypes = [cb.ndpointer(dtype = ct.c_float), \
+                     cb.ndpointer(dtype = ct.c_float), \
+                     ct.c_int,ct.c_int,ct.c_int,ct.c_int, \
+                     ct.c_double,ct.c_double,ct.c_double,ct.c_double, \
+                     cb.ndpointer(dtype = ct.c_long)]
+    func.restype  = ct.c_void_p
+tix.tri_index_fill_sp.argtypes = tix.tri_index_fill_sp.argtypes + \
+                                 [cb.ndpointer(dtype = ct.c_long)]
+
+def call_tri_index_build(sp1, sp2, nb1, nb2, bmin1, bmin2, bsz1, bsz2):
+    """
+    Bin the mapped triangles of the lensing plane grid on the source plane
+    Input:
+        sp1, sp2: 2D source plane coordinates of light rays
+        nb1, nb2: number of bins
+        bmin1, bmin2: lower corner of binned region
+        bsz1, bsz2: bin size
+    Output:
+        offsets: triangles of bin b are tris[offsets[b]:offsets[b+1]]
+        tris: triangle ids
+    """
+    nx, ny = np.shape(sp1)
+    real = real_type()
+    sp1 = cb.as_input(sp1, real)
+    sp2 = cb.as_input(sp2, real)
+    if precision == 'single':
+        count, fill = tix.tri_index_count_sp, tix.tri_index_fill_sp
+    else:
+        count, fill = tix.tri_index_count, tix.tri_index_fill
+    counts = np.zeros(nb1*nb2, dtype=ct.c_long)
+    count(sp1, sp2, ct.c_int(nx), ct.c_int(ny),
+          ct.c_int(nb1), ct.c_int(nb2),
+          ct.c_double(bmin1), ct.c_double(bmin2),
+          ct.c_double(bsz1), ct.c_double(bsz2), counts)
+    offsets = np.zeros(nb1*nb2+1, dtype=ct.c_long)
+    offsets[1:] = np.cumsum(counts)
+    tris = np.zeros(offsets[-1], dtype=ct.c_long)
+    fill(sp1, sp2, ct.c_int(nx), ct.c_int(ny),
+         ct.c_int(nb1), ct.c_int(nb2),
+         ct.c_double(bmin1), ct.c_double(bmin2),
+         ct.c_double(bsz1), ct.c_double(bsz2), offsets, tris)
+    return offsets, tris
+
+tix.tri_index_query_count.argtypes = [cb.ndpointer(dtype = ct.c_double), \
+                                      cb.ndpointer(dtype = ct.c_double), \
+                                      ct.c_int, \
+                                      cb.ndpointer(dtype = ct.c_double), \
+                                      cb.ndpointer(dtype = ct.c_double), \
+                                      ct.c_int,ct.c_int,ct.c_int, \
+                                      ct.c_double,ct.c_double,ct.c_double,ct.c_double, \
+                                      cb.ndpointer(dtype = ct.c_long), \
+                                      cb.ndpointer(dtype = ct.c_long), \
+                                      cb.ndpointer(dtype = ct.c_long)]
+tix.tri_index_query_count.restype  = ct.c_void_p
+tix.tri_index_query_fill.argtypes = [cb.ndpointer(dtype = ct.c_double), \
+                                     cb.ndpointer(dtype = ct.c_double), \
+                                     ct.c_int, \
+                                     cb.ndpointer(dtype = ct.c_double), \
+                                     cb.ndpointer(dtype = ct.c_double), \
+                                     cb.ndpointer(dtype = ct.c_double), \
+                                     cb.ndpointer(dtype = ct.c_double), \
+                                     ct.c_int,ct.c_int,ct.c_int, \
+                                     ct.c_double,ct.c_double,ct.c_double,ct.c_double, \
+                                     cb.ndpointer(dtype = ct.c_long), \
+                                     cb.ndpointer(dtype = ct.c_long), \
+                                     cb.ndpointer(dtype = ct.c_long), \
+                                     cb.ndpointer(dtype = ct.c_double), \
+                                     cb.ndpointer(dtype = ct.c_double), \
+                                     cb.ndpointer(dtype = ct.c_long), \
+                                     cb.ndpointer(dtype = ct.c_double)]
+tix.tri_index_query_fill.restype  = ct.c_void_p
+# single precision maps, sp1 and sp2 (and lp1 and lp2)
+argtypes = list(tix.tri_index_query_count.argtypes)
+argtypes[3:5] = [cb.ndpointer(dtype = ct.c_float)]*2
+tix.tri_index_query_count_sp.argtypes = argtypes
+tix.tri_index_query_count_sp.restype  = ct.c_void_p
+argtypes = list(tix.tri_index_query_fill.argtypes)
+argtypes[3:7] = [cb.ndpointer(dtype = ct.c_float)]*4
+tix.tri_index_query_fill_sp.argtypes = argtypes
+tix.tri_index_query_fill_sp.restype  = ct.c_void_p
+
+def call_tri_index_query(ys1, ys2, lp1, lp2, sp1, sp2, nb1, nb2,
+                         bmin1, bmin2, bsz1, bsz2, offsets, tris):
+    """
+    Images of many sources from the binned triangles
+    Input:
+        ys1, ys2: source positions
+        lp1, lp2: 2D lensing plane coordinates of light rays
+        sp1, sp2: 2D source plane coordinates of light rays
+        nb1, ..., tris: binned triangles from call_tri_index_build
+    Output:
+        img_offsets: images of source s are [img_offsets[s]:img_offsets[s+1]]
+        theta1, theta2: image positions
+        vertices: (nimgs,3) flat grid indices of the enclosing triangle
+        weights: (nimgs,3) barycentric weights of the vertices
+    """
+    nx, ny = np.shape(sp1)
+    ys1 = cb.as_input(ys1, ct.c_double, flat=True)
+    ys2 = cb.as_input(ys2, ct.c_double, flat=True)
+    real = real_type()
+    lp1 = cb.as_input(lp1, real)
+    lp2 = cb.as_input(lp2, real)
+    sp1 = cb.as_input(sp1, real)
+    sp2 = cb.as_input(sp2, real)
+    offsets = cb.as_input(offsets, ct.c_long)
+    tris = cb.as_input(tris, ct.c_long)
+    if precision == 'single':
+        count, fill = tix.tri_index_query_count_sp, tix.tri_index_query_fill_sp
+    else:
+        count, fill = tix.tri_index_query_count, tix.tri_index_query_fill
+    nsrc = len(ys1)
+    nimgs = np.zeros(nsrc, dtype=ct.c_long)
+    count(ys1, ys2, ct.c_int(nsrc), sp1, sp2, ct.c_int(ny),
+          ct.c_int(nb1), ct.c_int(nb2),
+          ct.c_double(bmin1), ct.c_double(bmin2),
+          ct.c_double(bsz1), ct.c_double(bsz2),
+          offsets, tris, nimgs)
+    img_offsets = np.zeros(nsrc+1, dtype=ct.c_long)
+    img_offsets[1:] = np.cumsum(nimgs)
+    nimg = img_offsets[-1]
+    theta1 = np.zeros(nimg, dtype=ct.c_double)
+    theta2 = np.zeros(nimg, dtype=ct.c_double)
+    vertices = np.zeros((nimg, 3), dtype=ct.c_long)
+    weights = np.zeros((nimg, 3), dtype=ct.c_double)
+    fill(ys1, ys2, ct.c_int(nsrc), lp1, lp2, sp1, sp2,
+         ct.c_int(ny), ct.c_int(nb1), ct.c_int(nb2),
+         ct.c_double(bmin1), ct.c_double(bmin2),
+         ct.c_double(bsz1), ct.c_double(bsz2),
+         offsets, tris, img_offsets,
+         theta1, theta2, vertices, weights)
+    return img_offsets, theta1, theta2, vertices, weights
+
+tix.tri_raster.argtypes = [cb.ndpointer(dtype = ct.c_double), \
+                           cb.ndpointer(dtype = ct.c_double), \
+                           cb.ndpointer(dtype = ct.c_double), \
+                           cb.ndpointer(dtype = ct.c_double), \
+                           ct.c_int,ct.c_int,ct.c_int,ct.c_int, \
+                           ct.c_double,ct.c_double,ct.c_double,ct.c_double, \
+                           cb.ndpointer(dtype = ct.c_int), \
+                           cb.ndpointer(dtype = ct.c_double)]
+tix.tri_raster.restype  = ct.c_void_p
+
+def call_tri_raster(lp1, lp2, sp1, sp2, nb1, nb2, bmin1, bmin2, bsz1, bsz2):
+    """
+    Rasterise the mapped triangles of the lensing plane grid onto a source
+    plane grid, the maps of either precision are rasterised in double
+    Input:
+        lp1, lp2: 2D lensing plane coordinates of light rays
+        sp1, sp2: 2D source plane coordinates of light rays
+        nb1, nb2: number of source plane pixels
+        bmin1, bmin2: lower corner of the source plane grid
+        bsz1, bsz2: pixel size
+    Output:
+        mult: (nb1,nb2) number of images of a source at the pixel centres
+        mu_tot: (nb1,nb2) total magnification of these images
+    """
+    nx, ny = np.shape(sp1)
+    lp1 = cb.as_input(lp1, ct.c_double)
+    lp2 = cb.as_input(lp2, ct.c_double)
+    sp1 = cb.as_input(sp1, ct.c_double)
+    sp2 = cb.as_input(sp2, ct.c_double)
+    mult = np.zeros((nb1, nb2), dtype=ct.c_int)
+    mu_tot = np.zeros((nb1, nb2), dtype=ct.c_double)
+    tix.tri_raster(lp1, lp2, sp1, sp2, ct.c_int(nx), ct.c_int(ny),
+                   ct.c_int(nb1), ct.c_int(nb2),
+                   ct.c_double(bmin1), ct.c_double(bmin2),
+                   ct.c_double(bsz1), ct.c_double(bsz2), mult, mu_tot)
+    return mult, mu_tot
+#--------------------------------------------------------------------
+bht = cb.load_library(lib_path+"lib_so_bhtree/libbhtree.so")
+bht.bh_fields.argtypes = [cb.ndpointer(dtype = ct.c_double), \
+                          cb.ndpointer(dtype = ct.c_double), \
+                          cb.ndpointer(dtype = ct.c_double), \
+                          ct.c_long, \
+                          cb.ndpointer(dtype = ct.c_double), \
+                          cb.ndpointer(dtype = ct.c_double), \
+                          ct.c_long,ct.c_double,ct.c_int,ct.c_double,ct.c_int, \
+                          cb.ndpointer(dtype = ct.c_double), \
+                          cb.ndpointer(dtype = ct.c_double), \
+                          cb.ndpointer(dtype = ct.c_double)]
+bht.bh_fields.restype  = ct.c_void_p
+
+def call_bh_fields(x1, x2, mass, y1, y2, theta=0.5, order=4, eps=0.,
+                   leafsize=8, out=None):
+    """
+    Deflection and potential of point masses from a Barnes-Hut tree
+    Input:
+        x1, x2: positions of the masses
+        mass: masses, in units of Sigma_cr times unit area
+        y1, y2: points of evaluation
+        theta: opening angle, 0 sums all masses directly
+        order: order of the multipole expansion of the nodes, up to 8
+        eps: softening length
+        leafsize: largest number of masses of a leaf
+        out: (alpha1, alpha2, phi) buffers to write to, None for new arrays
+    Output:
+        alpha1, alpha2, phi: at the points
+    """
+    x1 = cb.as_input(x1, ct.c_double, flat=True)
+    x2 = cb.as_input(x2, ct.c_double, flat=True)
+    mass = cb.as_input(mass, ct.c_double, flat=True)
+    y1 = cb.as_input(y1, ct.c_double, flat=True)
+    y2 = cb.as_input(y2, ct.c_double, flat=True)
+    npts = len(y1)
+    alpha1, alpha2, phi = cb.as_outputs(out, 3, npts, ct.c_double)
+    bht.bh_fields(x1, x2, mass, ct.c_long(len(x1)), y1, y2, ct.c_long(npts),
+                  ct.c_double(theta), ct.c_int(order), ct.c_double(eps),
+                  ct.c_int(leafsize), alpha1, alpha2, phi)
+    return alpha1, alpha2, phi
+#--------------------------------------------------------------------
+bht.bh_particle_fields.argtypes = [cb.ndpointer(dtype = ct.c_double), \
+                                   cb.ndpointer(dtype = ct.c_double), \
+                                   cb.ndpointer(dtype = ct.c_double), \
+                                   cb.ndpointer(dtype = ct.c_double), \
+                                   ct.c_long, \
+                                   cb.ndpointer(dtype = ct.c_double), \
+                                   cb.ndpointer(dtype = ct.c_double), \
+                                   ct.c_long,ct.c_double,ct.c_int,ct.c_int, \
+                                   cb.ndpointer(dtype = ct.c_double), \
+                                   cb.ndpointer(dtype = ct.c_double), \
+                                   cb.ndpointer(dtype = ct.c_double), \
+                                   cb.ndpointer(dtype = ct.c_double), \
+                                   cb.ndpointer(dtype = ct.c_double), \
+                                   cb.ndpointer(dtype = ct.c_double)]
+bht.bh_particle_fields.restype  = ct.c_void_p
+
+def call_bh_particle_fields(x1, x2, mass, hsml, y1, y2, theta=0.5, order=4,
+                            leafsize=8, out=None):
+    """
+    Deflection, potential and Jacobian of projected SPH particles from a
+    Barnes-Hut tree
+    Input:
+        x1, x2: projected positions of the particles
+        mass: masses, in units of Sigma_cr times unit area
+        hsml: smoothing lengths of the cubic spline kernel
+        y1, y2: points of evaluation
+        theta: opening angle, 0 sums all particles directly
+        order: order of the multipole expansion of the nodes, up to 8
+        leafsize: largest number of particles of a leaf
+        out: (alpha1, alpha2, phi, d11, d12, d22) buffers to write to, None
+             for new arrays, d21 is then d12 itself
+    Output:
+        alpha1, alpha2, phi, d11, d12, d21, d22: at the points
+    """
+    x1 = cb.as_input(x1, ct.c_double, flat=True)
+    x2 = cb.as_input(x2, ct.c_double, flat=True)
+    mass = cb.as_input(mass, ct.c_double, flat=True)
+    hsml = cb.as_input(hsml, ct.c_double, flat=True)
+    y1 = cb.as_input(y1, ct.c_double, flat=True)
+    y2 = cb.as_input(y2, ct.c_double, flat=True)
+    npts = len(y1)
+    alpha1, alpha2, phi, d11, d12, d22 = cb.as_outputs(out, 6, npts,
+                                                       ct.c_double)
+    bht.bh_particle_fields(x1, x2, mass, hsml, ct.c_long(len(x1)), y1, y2,
+                           ct.c_long(npts), ct.c_double(theta),
+                           ct.c_int(order), ct.c_int(leafsize),
+                           alpha1, alpha2, phi, d11, d12, d22)
+    if out is not None:
+        return alpha1, alpha2, phi, d11, d12, d12, d22
+    return alpha1, alpha2, phi, d11, d12, d12.copy(), d22
+#--------------------------------------------------------------------
 
 def make_r_coor(bs, nc):
     ds = bs/nc
@@ -0,0 +1,65 @@
+# File Description:
+#   Units of a batch of surface density maps, computed once per file from
+#   the tabulated distances (cosmotable) instead of with astropy units for
+#   every lens: the field-of-view and pixel size in arcsec, the factor
+#   from the map unit to physical Msun/unit^2 (comoving maps) and Sigma_cr
+#   of any source redshift. The lightcone maps have a field-of-view in
+#   Mpc/h and physical surface densities (hubble=True).
+#   The maps themselves are not touched, the factor is applied in the
+#   copy handed to the transforms (lm_cfuncs.input_copy, sigma_unit of
+#   lensplane.LensPlane, scale of lenstools.cal_lensing_signals).
+#
+from __future__ import division
+import sys
+import numpy as np
+sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/lib/')
+import cosmotable
+import lm_cfuncs as cf
+
+
+class MapUnits():
+    def __init__(self, fov, zl, cosmo, ncells, unit='Mpc', comoving=False,
+                 hubble=False):
+        """
+        Input:
+            fov[np.array] : side length of every map [unit]
+            zl[np.array] : redshift of every map, or one of all maps
+            cosmo : astropy cosmology
+            ncells[int] : number of cells per side
+            unit[str] : length unit of fov and of the map area
+            comoving[bool] : fov and map area are comoving
+            hubble[bool] : fov in units of unit/h
+        """
+        self.fov = np.atleast_1d(np.asarray(fov, dtype=np.float64))
+        self.zl = np.broadcast_to(np.asarray(zl, dtype=np.float64),
+                                  self.fov.shape).copy()
+        self.cosmo = cosmo
+        self.ncells = ncells
+        self.unit = unit
+        self.comoving = comoving
+        self.table = cosmotable.get_table(cosmo, unit)
+        # physical lengths and surface densities
+        a = 1/(1 + self.zl) if comoving else np.ones_like(self.zl)
+        h = cosmo.h if hubble else 1.
+        self.fov_phys = self.fov*a/h  #[unit]
+        # M/L^2 -> M/(L a)^2
+        self.sigma_unit = 1/a**2  #[Msun/unit^2] per map unit
+        self.fov_arc = self.fov_phys/self.table.Da(self.zl)*cf.apr  #[arcsec]
+        self.dsx_arc = self.fov_arc/ncells  #[arcsec]
+
+    def __len__(self):
+        return len(self.fov)
+
+    def coord(self, mm):
+        """ Axis coordinates of the pixel centres of map mm [arcsec] """
+        dsx = self.dsx_arc[mm]
+        return np.linspace(-(self.fov_arc[mm] - dsx)/2,
+                           (self.fov_arc[mm] - dsx)/2, self.ncells)
+
+    def sigma_crit(self, zs, mm=slice(None)):
+        """
+        Critical surface density of maps mm for sources at zs
+        Output:
+            sigma_cr[np.array] : [Msun/unit^2]
+        """
+        return self.table.sigma_crit(self.zl[mm], zs)
@@ -0,0 +1,194 @@
+# File Description:
+#   Background reader of the DensityMap (and LightCone) .h5 files of a
+#   run. A thread reads the next files, maps directly into shared memory
+#   (lenspool.SharedMaps), while the lenses of the current file are run,
+#   and hands them over in order through a bounded queue. A file is only
+#   read once there is space for it, so at most depth files, queued or
+#   being read, are held in memory besides the current one.
+#   Files compressed as a whole (.h5.gz) are decompressed in the thread,
+#   datasets with HDF5 filters are decompressed by h5py on reading.
+#   stats() reports the time spent reading, the time the main loop waited
+#   for a file and the queue depth seen at every file.
+#   The workers of lenspool.LensPool are forked while the thread may be
+#   reading, they must not use h5py themselves.
+#
+from __future__ import division
+import gzip, io, time, threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import numpy as np
+import h5py
+import lenspool
+
+
+class MapFile():
+    def __init__(self, name, data, maps, read_time, nbytes):
+        """
+        Content of one file
+        Input:
+            name[str] : file name
+            data[dict] : datasets read into np.ndarray
+            maps[lenspool.SharedMaps] : map stack, None if not read
+            read_time[float] : [s]
+            nbytes[int] : bytes of all datasets and maps
+        """
+        self.name = name
+        self.data = data
+        self.maps = maps
+        self.read_time = read_time
+        self.nbytes = nbytes
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __contains__(self, key):
+        return key in self.data
+
+
+def read_file(name, datasets, maps=None, decompress=None):
+    """
+    Read datasets and the map stack of one file
+    Input:
+        name[str] : file name
+        datasets[list] : names of datasets, missing ones are skipped
+        maps[str] : name of the map stack dataset, None for none
+        decompress[str] : None, or 'gzip' for files compressed as a whole
+    Output:
+        MapFile
+    """
+    t0 = time.time()
+    if decompress is None:
+        source = name
+    elif decompress == 'gzip':
+        with gzip.open(name, 'rb') as f:
+            source = io.BytesIO(f.read())
+    else:
+        raise Exception('Dont know this decompression ->', decompress)
+    data = {}
+    nbytes = 0
+    with h5py.File(source, 'r') as hf:
+        for dset in datasets:
+            if dset in hf:
+                data[dset] = hf[dset][()]
+                nbytes += data[dset].nbytes
+        if maps is None:
+            stack = None
+        else:
+            stack = lenspool.SharedMaps.from_dataset(hf[maps])
+            nbytes += stack.array.nbytes
+    return MapFile(name, data, stack, time.time() - t0, nbytes)
+
+
+class MapReader():
+    def __init__(self, files, datasets, maps=None, depth=1, decompress=None):
+        """
+        Input:
+            files[list] : file names, read and returned in this order
+            datasets[list] : names of datasets of every file
+            maps[str] : name of the map stack dataset, None for none
+            depth[int] : files read ahead, 0 reads in the main loop
+            decompress[str] : see read_file
+        """
+        self.files = list(files)
+        self.datasets = list(datasets)
+        self.maps = maps
+        self.depth = depth
+        self.decompress = decompress
+        self.queue = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.depths = []
+        self.wait_time = 0.
+        self.read_time = 0.
+        self.nbytes = 0
+
+    def _read(self, name):
+        return read_file(name, self.datasets, self.maps, self.decompress)
+
+    def _produce(self):
+        for name in self.files:
+            # wait for space before reading, so that the file being read
+            # counts towards depth, but give up once the reader is closed
+            while self.queue.qsize() >= self.depth:
+                if self._stop.wait(0.1):
+                    return
+            if self._stop.is_set():
+                return
+            try:
+                item = self._read(name)
+            except Exception as err:
+                # raised again in the main loop
+                item = err
+            # only this thread puts, there is space
+            self.queue.put(item)
+            if isinstance(item, Exception):
+                return
+
+    def __iter__(self):
+        if self.depth < 1:
+            for name in self.files:
+                t0 = time.time()
+                item = self._read(name)
+                self._count(item, time.time() - t0, 0)
+                yield item
+            return
+
+        self._stop.clear()
+        self.queue = queue.Queue(maxsize=self.depth)
+        self._thread = threading.Thread(target=self._produce)
+        self._thread.daemon = True
+        self._thread.start()
+        try:
+            for ii in range(len(self.files)):
+                ready = self.queue.qsize()
+                t0 = time.time()
+                item = self.queue.get()
+                if isinstance(item, Exception):
+                    raise item
+                self._count(item, time.time() - t0, ready)
+                yield item
+        finally:
+            self.close()
+
+    def _count(self, item, wait, ready):
+        self.depths.append(ready)
+        self.wait_time += wait
+        self.read_time += item.read_time
+        self.nbytes += item.nbytes
+
+    @property
+    def qsize(self):
+        """ Files read ahead and waiting """
+        if self.queue is None:
+            return 0
+        return self.queue.qsize()
+
+    def close(self):
+        """ Stop the reader thread, files read ahead are dropped """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        """
+        Output:
+            stats[dict] : 'files', 'read_time' [s], 'wait_time' [s],
+                          'hidden' fraction of the read time not waited for,
+                          'MB' read, 'depth_mean', 'depth_max' of the queue
+                          when a file was taken
+        """
+        nfiles = len(self.depths)
+        if self.read_time > 0:
+            hidden = max(0., 1 - self.wait_time/self.read_time)
+        else:
+            hidden = 0.
+        return {'files' : nfiles,
+                'read_time' : self.read_time,
+                'wait_time' : self.wait_time,
+                'hidden' : hidden,
+                'MB' : self.nbytes/1024**2,
+                'depth_mean' : np.mean(self.depths) if nfiles else 0.,
+                'depth_max' : np.max(self.depths) if nfiles else 0}
@@ -0,0 +1,292 @@
+# File Description:
+#   Multi-plane ray tracing through the lightcone.
+#   The density maps of all halos along the line-of-sight of a lens are
+#   grouped into planes, one per snapshot shell of the lightcone. Every map
+#   is transformed once for a critical surface density of unity
+#   (lm_cfuncs.call_cal_signals), giving deflection, potential and their
+#   derivatives, which are rescaled for every source redshift. Rays are
+#   propagated with running sums over the planes (flat cosmology),
+#       theta_j = theta_1 - S0 + S1/Dc_j,
+#       S0 = sum_i w_i alpha_i, S1 = sum_i w_i Dc_i alpha_i,
+#       w_i = Dc_s/(Dc_s - Dc_i),
+#   so tracing does not keep the rays of all planes in memory. The
+#   Jacobian is propagated the same way and the arrival time is summed
+#   plane by plane (Fermat potential of Schneider, Ehlers & Falco 1992).
+#   Outside of its map a halo acts as point mass of the mass in the map.
+#
+from __future__ import division
+import sys
+import copy
+import collections
+import numpy as np
+sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/lib/')
+import cosmotable
+import lenstools as lt
+import imagefinder as imf
+import lm_cfuncs as cf
+
+
+class HaloField():
+    def __init__(self, sigma, fov_arc, ncells, centre):
+        """
+        Unit Sigma_cr lensing fields of one density map
+        Input:
+            sigma[np.ndarray] : surface density map [Msun/unit^2]
+            fov_arc[float] : field-of-view [arcsec]
+            ncells[int] : number of cells per side
+            centre[np.array] : sky position of map centre [arcsec]
+        """
+        self.fov_arc = fov_arc
+        self.centre = np.asarray(centre, dtype=np.float64)
+        dsx_arc = fov_arc/ncells
+        self.coord = np.linspace(-(fov_arc-dsx_arc)/2, (fov_arc-dsx_arc)/2,
+                                 ncells)
+        alpha1, alpha2, phi, kappa, shear1, shear2 = cf.call_cal_signals(
+                sigma, fov_arc, ncells)
+        d11, d12, d21, d22 = lt.spectral_derivatives(kappa, shear1, shear2)
+        self.maps = [alpha1, alpha2, phi, d11, d12, d22]
+        # point mass outside of map, in units of the fields
+        self.mass = np.sum(sigma)*dsx_arc**2/np.pi
+
+    def shifted(self, centre):
+        """ Same fields centred on another sky position, maps not copied """
+        halo = copy.copy(self)
+        halo.centre = np.asarray(centre, dtype=np.float64)
+        return halo
+
+    def evaluate(self, x1, x2, order=1):
+        """
+        Input:
+            x1, x2[np.array] : sky positions of rays [arcsec]
+            order[int] : 1 bilinear, 3 bicubic interpolation
+        Output:
+            alpha1, alpha2, phi, d11, d12, d22[np.array] at rays,
+            d21 being d12
+        """
+        x1 = x1 - self.centre[0]
+        x2 = x2 - self.centre[1]
+        inside = ((np.abs(x1) <= self.coord[-1]) &
+                  (np.abs(x2) <= self.coord[-1]))
+        rr = np.maximum(x1**2 + x2**2, (0.5*self.fov_arc)**2)
+        out = [self.mass*x1/rr, self.mass*x2/rr,
+               0.5*self.mass*np.log(rr),
+               self.mass*(x2**2 - x1**2)/rr**2,
+               -2*self.mass*x1*x2/rr**2,
+               self.mass*(x1**2 - x2**2)/rr**2]
+        if np.any(inside):
+            for ff in range(len(out)):
+                out[ff][inside] = cf.call_interp_points(
+                        self.maps[ff], self.coord, self.coord,
+                        x1[inside], x2[inside], order)
+        return out
+
+
+class LensShell():
+    def __init__(self, z, halos):
+        """
+        Plane of all halos of one snapshot shell
+        Input:
+            z[float] : redshift of plane
+            halos[list] : HaloField of the shell
+        """
+        self.z = z
+        self.halos = halos
+
+    def evaluate(self, x1, x2, order=1):
+        """ Sum of the fields of all halos, see HaloField.evaluate """
+        out = self.halos[0].evaluate(x1, x2, order)
+        for halo in self.halos[1:]:
+            for ff, val in enumerate(halo.evaluate(x1, x2, order)):
+                out[ff] += val
+        return out
+
+
+def effective_signals(a11, a12, a21, a22):
+    """
+    Effective convergence, shear and rotation of a multi-plane Jacobian
+    Output:
+        kappa, shear1, shear2, omega, mu, detA, lambda_t[np.array]
+    """
+    kappa = 1 - 0.5*(a11 + a22)
+    shear1 = 0.5*(a22 - a11)
+    shear2 = -0.5*(a12 + a21)
+    omega = 0.5*(a21 - a12)
+    detA = a11*a22 - a12*a21
+    mu = 1/detA
+    lambda_t = 1 - kappa - np.sqrt(shear1**2 + shear2**2)
+    return kappa, shear1, shear2, omega, mu, detA, lambda_t
+
+
+class MultiPlane():
+    def __init__(self, shells, cosmo):
+        """
+        Input:
+            shells[list] : LensShell along the line-of-sight
+            cosmo: astropy cosmology, flat
+        """
+        if np.abs(cosmo.Ok0) > 1e-6:
+            raise Exception('Multi-plane tracing needs a flat cosmology ->',
+                            cosmo.Ok0)
+        self.shells = sorted(shells, key=lambda sh: sh.z)
+        self.cosmo = cosmo
+        self.table = cosmotable.get_table(cosmo)
+        self._weights = {}
+
+    def weights(self, zs):
+        """
+        Distance ratios of all planes in front of a source, built once
+        Output:
+            dict of plane indices, comoving distances, 1/Sigma_cr
+            and arrival time factors [sday/arcsec^2]
+        """
+        if zs not in self._weights:
+            table = self.table
+            planes = [ii for ii, sh in enumerate(self.shells) if sh.z < zs]
+            zz = np.array([self.shells[ii].z for ii in planes] + [zs])
+            dc = np.atleast_1d(table.Dc(zz))
+            da = dc/(1 + zz)
+            # time factors of consecutive planes, last plane to source
+            tau = (1 + zz[:-1])*table.tsec_fac*da[:-1]*da[1:]/ \
+                  np.atleast_1d(table.Da2(zz[:-1], zz[1:]))/lt.sday/cf.apr**2
+            self._weights[zs] = {
+                    'planes' : planes, 'dc' : dc[:-1], 'dcs' : dc[-1],
+                    'scale' : 1/np.atleast_1d(table.sigma_crit(zz[:-1], zs)),
+                    'w' : dc[-1]/(dc[-1] - dc[:-1]),
+                    # beta_{i,i+1}, unity for the last plane
+                    'beta' : (dc[1:] - dc[:-1])*dc[-1]/ \
+                             (dc[1:]*(dc[-1] - dc[:-1])),
+                    'tau' : tau}
+        return self._weights[zs]
+
+    def trace(self, theta1, theta2, zs, order=1):
+        """
+        Trace rays from the observer to a source plane
+        Input:
+            theta1, theta2[np.array] : sky positions of rays [arcsec]
+            zs[float] : source redshift
+            order[int] : 1 bilinear, 3 bicubic interpolation of fields
+        Output:
+            dict of
+            beta1, beta2[np.array] : source plane positions [arcsec]
+            a11, a12, a21, a22[np.array] : Jacobian d(beta)/d(theta)
+            tarr[np.array] : arrival time up to a constant [sday]
+        """
+        shape = np.shape(theta1)
+        theta1 = np.array(theta1, dtype=np.float64).ravel()
+        theta2 = np.array(theta2, dtype=np.float64).ravel()
+        wts = self.weights(zs)
+        x1, x2 = theta1.copy(), theta2.copy()
+        # running sums of deflection and Jacobian terms
+        s0 = np.zeros((6, len(x1)))
+        s1 = np.zeros((6, len(x1)))
+        a = [np.ones_like(x1), np.zeros_like(x1),
+             np.zeros_like(x1), np.ones_like(x1)]
+        tarr = np.zeros_like(x1)
+        for pp, ii in enumerate(wts['planes']):
+            al1, al2, phi, d11, d12, d22 = self.shells[ii].evaluate(x1, x2,
+                                                                    order)
+            sc = wts['scale'][pp]
+            # deflection and U_i A_i of this plane, scaled to the source
+            terms = sc*np.array([al1, al2,
+                                 d11*a[0] + d12*a[2], d11*a[1] + d12*a[3],
+                                 d12*a[0] + d22*a[2], d12*a[1] + d22*a[3]])
+            s0 += wts['w'][pp]*terms
+            s1 += wts['w'][pp]*wts['dc'][pp]*terms
+            # rays and Jacobian on the next plane, or the source plane
+            if pp + 1 < len(wts['planes']):
+                dcn = wts['dc'][pp+1]
+            else:
+                dcn = wts['dcs']
+            y = s1/dcn - s0
+            y1, y2 = theta1 + y[0], theta2 + y[1]
+            tarr += wts['tau'][pp]*(0.5*((x1 - y1)**2 + (x2 - y2)**2) -
+                                    wts['beta'][pp]*sc*phi)
+            x1, x2 = y1, y2
+            a = [1 + y[2], y[3], y[4], 1 + y[5]]
+        out = {'beta1' : x1, 'beta2' : x2,
+               'a11' : a[0], 'a12' : a[1], 'a21' : a[2], 'a22' : a[3],
+               'tarr' : tarr}
+        return dict((kk, vv.reshape(shape)) for kk, vv in out.items())
+
+    def find_images(self, beta, zs, fov_arc, ncells, centre=(0., 0.),
+                    niter=5, tol=1e-3):
+        """
+        Images of a source, found by ray-shooting on a grid and polished
+        by Newton iterations of the multi-plane lens equation
+        Input:
+            beta[np.array] : source position [arcsec]
+            zs[float] : source redshift
+            fov_arc[float] : field-of-view of ray grid [arcsec]
+            ncells[int] : number of rays per side
+            centre[np.array] : sky position of grid centre [arcsec]
+            niter[int] : number of Newton iterations
+            tol[float] : largest source plane residual of images and
+                         smallest image separation, in units of the ray
+                         spacing
+        Output:
+            dict of images, see trace, plus theta1, theta2, kappa, shear1,
+            shear2, mu, delta_t [sday] and the ray grid of the source
+            (lp1, lp2, sp1, sp2, detA, lambda_t)
+        """
+        dsx_arc = fov_arc/ncells
+        lpv = np.linspace(-(fov_arc-dsx_arc)/2, (fov_arc-dsx_arc)/2, ncells)
+        lp2, lp1 = np.meshgrid(lpv + centre[1], lpv + centre[0])
+        rays = self.trace(lp1, lp2, zs)
+        finder = imf.TriangleImageFinder(lp1, lp2, rays['beta1'],
+                                         rays['beta2'])
+        theta1, theta2 = finder.find_images([beta[0]], [beta[1]])[1:3]
+        for it in range(niter):
+            img = self.trace(theta1, theta2, zs, order=3)
+            det = img['a11']*img['a22'] - img['a12']*img['a21']
+            r1 = beta[0] - img['beta1']
+            r2 = beta[1] - img['beta2']
+            theta1 = theta1 + (img['a22']*r1 - img['a12']*r2)/det
+            theta2 = theta2 + (img['a11']*r2 - img['a21']*r1)/det
+        img = self.trace(theta1, theta2, zs, order=3)
+        # drop images that did not converge and duplicates
+        res = np.hypot(img['beta1'] - beta[0], img['beta2'] - beta[1])
+        keep = []
+        for ii in np.argsort(res):
+            if res[ii] > tol*dsx_arc:
+                break
+            if all(np.hypot(theta1[ii] - theta1[kk], theta2[ii] - theta2[kk])
+                   > tol*dsx_arc for kk in keep):
+                keep.append(ii)
+        keep = np.sort(keep).astype(int)
+        theta1, theta2 = theta1[keep], theta2[keep]
+        img = dict((kk, vv[keep]) for kk, vv in img.items())
+        img['theta1'], img['theta2'] = theta1, theta2
+        (img['kappa'], img['shear1'], img['shear2'], img['omega'],
+         img['mu'], detA, lambda_t) = effective_signals(
+                img['a11'], img['a12'], img['a21'], img['a22'])
+        img['delta_t'] = img['tarr']
+        grid = effective_signals(rays['a11'], rays['a12'],
+                                 rays['a21'], rays['a22'])
+        img.update({'lp1' : lp1, 'lp2' : lp2,
+                    'sp1' : rays['beta1'], 'sp2' : rays['beta2'],
+                    'detA' : grid[5], 'lambda_t' : grid[6]})
+        return img
+
+
+class FieldCache():
+    def __init__(self, maxsize=64):
+        """
+        Least recently used HaloField of the line-of-sight halos,
+        halos in front of many lenses are transformed only once
+        """
+        self.maxsize = maxsize
+        self._fields = collections.OrderedDict()
+
+    def get(self, key, build):
+        """
+        Input:
+            key : unique halo identifier (e.g. LC_ID)
+            build : function returning the HaloField of key
+        """
+        if key in self._fields:
+            self._fields[key] = self._fields.pop(key)
+        else:
+            self._fields[key] = build()
+            if len(self._fields) > self.maxsize:
+                self._fields.popitem(last=False)
+        return self._fields[key]
@@ -0,0 +1,153 @@
+# File Description:
+#   Pre-screening of halos that can not form critical curves.
+#   Before the FFT, refinement and contouring of a lens, two cheap
+#   necessary conditions for det A <= 0 are tested, each with a
+#   conservative margin:
+#   - catalogue: Einstein radius of a SIS with the velocity dispersion of
+#     the halo, and mean convergence of a NFW halo of M200 within the
+#     resolution limit (nmin pixels of the map),
+#   - density map: largest mean convergence within apertures around the
+#     convergence peak, as an axisymmetric lens forms a tangential
+#     critical curve where the mean convergence within it reaches unity.
+#   A halo is only skipped if it fails a test, the estimates of all
+#   halos are kept for the log.
+#
+from __future__ import division
+import sys
+import numpy as np
+from astropy import units as u
+from astropy import constants as const
+sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/lib/')
+import cosmotable
+
+c_kms = const.c.to_value('km/s')
+
+
+def sis_einstein_radius(vrms, zl, zs, cosmo):
+    """
+    Einstein radius of a singular isothermal sphere
+    Input:
+        vrms[np.array] : velocity dispersion [km/s]
+        zl, zs[np.array] : lens and source redshift
+    Output:
+        theta_E[np.array] : [arcsec]
+    """
+    table = cosmotable.get_table(cosmo)
+    dratio = table.Da2(zl, zs)/table.Da(zs)
+    return (4*np.pi*(np.asarray(vrms)/c_kms)**2*dratio*u.rad).to_value('arcsec')
+
+
+def duffy_concentration(m200, z, h):
+    """
+    Mean concentration of relaxed halos, Duffy et al. (2008)
+    Input:
+        m200[np.array] : [Msun]
+    """
+    return 5.71*(np.asarray(m200)*h/2e12)**(-0.084)*(1 + np.asarray(z))**(-0.47)
+
+
+def _nfw_h(x):
+    """ Projected NFW mass within x = R/r_s, in units of 4 pi rho_s r_s^3 """
+    x = np.asarray(x, dtype=np.float64)
+    out = np.log(x/2)
+    lo = x < 1
+    hi = x > 1
+    out[lo] += 2/np.sqrt(1 - x[lo]**2)*np.arctanh(np.sqrt((1 - x[lo])/(1 + x[lo])))
+    out[hi] += 2/np.sqrt(x[hi]**2 - 1)*np.arctan(np.sqrt((x[hi] - 1)/(x[hi] + 1)))
+    out[~(lo | hi)] += 1
+    return out
+
+
+def nfw_mean_kappa(theta, m200, c200, zl, zs, cosmo):
+    """
+    Mean convergence of a NFW halo within an angular radius
+    Input:
+        theta[np.array] : radius [arcsec]
+        m200[np.array] : [Msun]
+        c200[np.array] : concentration
+    Output:
+        kappa_mean[np.array]
+    """
+    table = cosmotable.get_table(cosmo, 'Mpc')
+    m200, c200 = np.asarray(m200), np.asarray(c200)
+    rho_c = cosmo.critical_density(zl).to_value('Msun/Mpc3')
+    r200 = (3*m200/(4*np.pi*200*rho_c))**(1/3)  #[Mpc]
+    rr = (np.asarray(theta)*u.arcsec).to_value('rad')*table.Da(zl)  #[Mpc]
+    mc = np.log(1 + c200) - c200/(1 + c200)
+    mproj = m200*_nfw_h(np.atleast_1d(rr*c200/r200))/mc
+    return mproj/(np.pi*rr**2*table.sigma_crit(zl, zs))
+
+
+def map_kappa(kappa, nmin=2):
+    """
+    Peak and largest mean convergence within apertures around the peak
+    Input:
+        kappa[np.ndarray] : convergence map
+        nmin[int] : smallest aperture radius [pixel], resolution limit
+    Output:
+        kappa_peak[float] : largest pixel value
+        kappa_mean[float] : largest mean within apertures >= nmin pixels
+    """
+    ipk, jpk = np.unravel_index(np.argmax(kappa), np.shape(kappa))
+    ii, jj = np.indices(np.shape(kappa))
+    rbin = np.hypot(ii - ipk, jj - jpk).astype(int).ravel()
+    ncum = np.cumsum(np.bincount(rbin))
+    kcum = np.cumsum(np.bincount(rbin, weights=np.ravel(kappa)))
+    return kappa[ipk, jpk], np.max(kcum[nmin:]/ncum[nmin:])
+
+
+class PreScreen():
+    def __init__(self, cosmo, margin_cat=3., margin_map=2., nmin=2):
+        """
+        Input:
+            cosmo: astropy cosmology
+            margin_cat[float] : factor by which catalogue estimates may
+                                underestimate the lens strength
+            margin_map[float] : factor by which the mean convergence of
+                                the map may underestimate the lens
+                                strength (ellipticity, external shear)
+            nmin[int] : smallest resolved critical curve radius [pixel]
+        """
+        self.cosmo = cosmo
+        self.margin_cat = margin_cat
+        self.margin_map = margin_map
+        self.nmin = nmin
+
+    def catalogue(self, vrms, m200, zl, zs, dsx_arc, c200=None):
+        """
+        Catalogue test of many halos
+        Input:
+            vrms[np.array] : velocity dispersion [km/s]
+            m200[np.array] : [Msun]
+            zl[np.array] : halo redshift
+            zs[np.array] : highest source redshift of each halo
+            dsx_arc[np.array] : pixel size of maps [arcsec]
+            c200[np.array] : concentration, default Duffy et al. (2008)
+        Output:
+            keep[np.array(bool)] : halos which may be strong lenses
+            estimates[dict] : theta_E_sis [arcsec] and kappa_nfw
+        """
+        zl, zs = np.asarray(zl), np.asarray(zs)
+        if c200 is None:
+            c200 = duffy_concentration(m200, zl, self.cosmo.h)
+        theta_min = self.nmin*np.asarray(dsx_arc)
+        theta_sis = sis_einstein_radius(vrms, zl, zs, self.cosmo)
+        kappa_nfw = nfw_mean_kappa(theta_min, m200, c200, zl, zs, self.cosmo)
+        keep = ((theta_sis*self.margin_cat >= theta_min) |
+                (kappa_nfw*self.margin_cat >= 1))
+        return keep, {'theta_E_sis' : theta_sis, 'kappa_nfw' : kappa_nfw}
+
+    def density_map(self, sigma, sigma_cr):
+        """
+        Density map test of one halo
+        Input:
+            sigma[np.ndarray] : surface density map [Msun/unit^2]
+            sigma_cr[float] : smallest critical surface density of the
+                              sources of the halo [Msun/unit^2]
+        Output:
+            keep[bool] : halo may be a strong lens
+            estimates[dict] : kappa_peak and kappa_mean
+        """
+        kappa_peak, kappa_mean = map_kappa(sigma/sigma_cr, self.nmin)
+        keep = kappa_mean*self.margin_map >= 1
+        return keep, {'kappa_peak' : kappa_peak, 'kappa_mean' : kappa_mean}
@@ -0,0 +1,427 @@
+# File Description:
+#   Adaptive local mesh refinement around critical curves.
+#   The lensing plane is split into tiles of native cells. Tiles in which
+#   det A changes sign, or where |det A| is small, are refined as a
+#   quadtree: every node is resampled at twice the resolution of its
+#   parent from bicubic interpolation of the native deflection maps, until
+#   det A changes by less than a tolerance between levels. The leaves are
+#   small uniform patches, on which critical curves and images are found,
+#   while the rest of the map keeps the native grid.
+#
+from __future__ import division
+import numpy as np
+import lenstools as lt
+import imagefinder as imf
+import lm_cfuncs as cf
+
+
+class Patch():
+    def __init__(self, ax1, ax2, alpha1, alpha2, d11, d12, d21, d22, level):
+        """
+        Uniform grid of a quadtree node
+        Input:
+            ax1,ax2[np.array] : axis coordinates [arcsec]
+            alpha1,alpha2[np.ndarray] : deflection maps [arcsec]
+            d11,d12,d21,d22[np.ndarray] : deflection derivatives
+            level[int] : refinement level, 0 is the native resolution
+        """
+        self.ax1 = ax1
+        self.ax2 = ax2
+        self.level = level
+        self.lp2, self.lp1 = np.meshgrid(ax2, ax1)
+        self.alpha1 = alpha1
+        self.alpha2 = alpha2
+        self.sp1 = self.lp1 - alpha1
+        self.sp2 = self.lp2 - alpha2
+        self.kappa = 0.5*(d11 + d22)
+        self.mu, self.detA, self.lambda_t = lt.jacobian_signals(d11, d12,
+                                                                d21, d22)
+
+    @property
+    def box(self):
+        return self.ax1[0], self.ax1[-1], self.ax2[0], self.ax2[-1]
+
+    def flagged(self, detA_min):
+        """ det A changes sign or gets small within the patch """
+        return ((np.min(self.detA) < 0 < np.max(self.detA)) or
+                (np.min(np.abs(self.detA)) < detA_min))
+
+
+def _stitch(segments, tol):
+    """
+    Join open curve segments whose ends meet
+    Input:
+        segments[list] : (N,k) arrays, the first two columns x,y
+        tol[float] : largest distance of joined ends [arcsec]
+    Output:
+        curves[list] : joined (N,k) arrays
+        closed[np.array(bool)] : True for curves whose ends meet
+    """
+    segments = list(segments)
+    curves = []
+    closed = []
+    while len(segments) > 0:
+        curve = segments.pop(0)
+        grown = True
+        while grown and len(segments) > 0:
+            grown = False
+            ends = np.array([[ss[0, :2], ss[-1, :2]] for ss in segments])
+            # append to the tail of the curve
+            dist = np.sqrt(np.sum((ends - curve[-1, :2])**2, axis=2))
+            kk, ee = np.unravel_index(np.argmin(dist), dist.shape)
+            if dist[kk, ee] < tol:
+                seg = segments.pop(kk)
+                if ee == 1:
+                    seg = seg[::-1]
+                curve = np.concatenate((curve, seg[1:]))
+                grown = True
+                continue
+            # prepend to the head of the curve
+            dist = np.sqrt(np.sum((ends - curve[0, :2])**2, axis=2))
+            kk, ee = np.unravel_index(np.argmin(dist), dist.shape)
+            if dist[kk, ee] < tol:
+                seg = segments.pop(kk)
+                if ee == 0:
+                    seg = seg[::-1]
+                curve = np.concatenate((seg[:-1], curve))
+                grown = True
+        isclosed = (len(curve) > 2 and
+                    np.sqrt(np.sum((curve[0, :2] - curve[-1, :2])**2)) < tol)
+        if isclosed:
+            curve[-1] = curve[0]
+        elif np.sum(np.sqrt(np.sum(np.diff(curve[:, :2], axis=0)**2,
+                                   axis=1))) < tol:
+            # left over piece cutting a patch corner
+            continue
+        curves.append(curve)
+        closed.append(isclosed)
+    return curves, np.array(closed, dtype=bool)
+
+
+def _arc_median_radius(curve):
+    """ Median distance from centre of points evenly spaced along a curve """
+    seg = np.sqrt(np.sum(np.diff(curve, axis=0)**2, axis=1))
+    arc = np.concatenate(([0.], np.cumsum(seg)))
+    if arc[-1] == 0:
+        return np.median(np.sqrt(np.sum(curve**2, axis=1)))
+    s = np.linspace(0, arc[-1], len(curve))
+    x1 = np.interp(s, arc, curve[:, 0])
+    x2 = np.interp(s, arc, curve[:, 1])
+    return np.median(np.sqrt(x1**2 + x2**2))
+
+
+class AdaptiveRefinement():
+    def __init__(self, alpha1, alpha2, coord, tile=8, detA_min=0.1,
+                 tol=1e-3, max_level=4, order=3, derivatives=None,
+                 coord2=None):
+        """
+        Input:
+            alpha1,alpha2[np.ndarray] : deflection maps on the native,
+                                        uniform grid [arcsec]
+            coord[np.array] : native axis coordinates along axis 0 [arcsec]
+            tile[int] : native cells per tile side, even
+            detA_min[float] : tiles with smaller |det A| are refined
+            tol[float] : largest change of det A between the last two
+                         levels of a refined patch
+            max_level[int] : largest refinement level, the finest cells
+                             being 2^max_level times smaller than native
+            order[int] : 1 bilinear, 3 bicubic resampling of alpha
+            derivatives[tuple] : d11, d12, d21, d22 maps on the native grid
+                                 (e.g. lenstools.spectral_derivatives),
+                                 resampled like alpha, None for finite
+                                 differences of alpha
+            coord2[np.array] : native axis coordinates along axis 1, of
+                               the same spacing, default coord
+        """
+        if tile % 2 != 0:
+            raise Exception('tile has to be even ->', tile)
+        self.alpha1 = np.ascontiguousarray(alpha1, dtype=np.float64)
+        self.alpha2 = np.ascontiguousarray(alpha2, dtype=np.float64)
+        self.coord = np.asarray(coord, dtype=np.float64)
+        if coord2 is None:
+            self.coord2 = self.coord
+        else:
+            self.coord2 = np.asarray(coord2, dtype=np.float64)
+        self.tile = tile
+        self.detA_min = detA_min
+        self.tol = tol
+        self.max_level = max_level
+        self.order = order
+        self.dsx = self.coord[1] - self.coord[0]
+        self.npoints = 0  # number of resampled points
+
+        # native grid
+        if derivatives is None:
+            self.derivatives = None
+            d11, d12, d21, d22 = lt.alpha_derivatives(self.alpha1,
+                                                      self.alpha2, self.coord,
+                                                      self.coord2)
+        else:
+            self.derivatives = [np.ascontiguousarray(dd, dtype=np.float64)
+                                for dd in derivatives]
+            d11, d12, d21, d22 = self.derivatives
+        self.native = Patch(self.coord, self.coord2, self.alpha1, self.alpha2,
+                            d11, d12, d21, d22, 0)
+        self.patches = []
+        self.tiles = self._refine()
+        self._finders = None
+
+    def _flag_tiles(self):
+        """ Boxes of native tiles to refine as (i0, i1, j0, j1) cells """
+        detA = self.native.detA
+        ncell1, ncell2 = len(self.coord) - 1, len(self.coord2) - 1
+        # cell minimum and maximum of det A over its four corners
+        corners = np.array([detA[:-1, :-1], detA[1:, :-1],
+                            detA[:-1, 1:], detA[1:, 1:]])
+        flag = ((np.min(corners, axis=0) < 0) & (np.max(corners, axis=0) > 0)) | \
+               (np.min(np.abs(corners), axis=0) < self.detA_min)
+        tiles = []
+        for i0 in range(0, ncell1, self.tile):
+            for j0 in range(0, ncell2, self.tile):
+                i1 = min(i0 + self.tile, ncell1)
+                j1 = min(j0 + self.tile, ncell2)
+                if np.any(flag[i0:i1, j0:j1]):
+                    tiles.append((i0, i1, j0, j1))
+        return tiles
+
+    def _evaluate(self, boxes, n1, n2, level):
+        """
+        Patches of many boxes, resampled in one interpolation call
+        Input:
+            boxes[list] : (lo1, hi1, lo2, hi2) [arcsec]
+            n1,n2[list] : cells per side of every box
+        Output:
+            list of Patch
+        """
+        x1, x2, shapes = [], [], []
+        for bb in range(len(boxes)):
+            lo1, hi1, lo2, hi2 = boxes[bb]
+            h1 = (hi1 - lo1)/n1[bb]
+            h2 = (hi2 - lo2)/n2[bb]
+            # one node halo for central differences at the patch edge
+            ax1 = lo1 + h1*np.arange(-1, n1[bb]+2)
+            ax2 = lo2 + h2*np.arange(-1, n2[bb]+2)
+            g2, g1 = np.meshgrid(ax2, ax1)
+            x1.append(g1.ravel())
+            x2.append(g2.ravel())
+            shapes.append((ax1, ax2, h1, h2))
+        x1 = np.concatenate(x1)
+        x2 = np.concatenate(x2)
+        self.npoints += len(x1)
+        a1 = cf.call_interp_points(self.alpha1, self.coord, self.coord2,
+                                   x1, x2, self.order)
+        a2 = cf.call_interp_points(self.alpha2, self.coord, self.coord2,
+                                   x1, x2, self.order)
+        if self.derivatives is not None:
+            derivs = [cf.call_interp_points(dd, self.coord, self.coord2,
+                                            x1, x2, self.order)
+                      for dd in self.derivatives]
+        patches = []
+        start = 0
+        for ax1, ax2, h1, h2 in shapes:
+            end = start + len(ax1)*len(ax2)
+            p1 = a1[start:end].reshape(len(ax1), len(ax2))
+            p2 = a2[start:end].reshape(len(ax1), len(ax2))
+            inner = (slice(1, -1), slice(1, -1))
+            if self.derivatives is None:
+                dd = [np.gradient(p1, h1, axis=0), np.gradient(p1, h2, axis=1),
+                      np.gradient(p2, h1, axis=0), np.gradient(p2, h2, axis=1)]
+            else:
+                dd = [dn[start:end].reshape(len(ax1), len(ax2))
+                      for dn in derivs]
+            patches.append(Patch(ax1[1:-1], ax2[1:-1], p1[inner], p2[inner],
+                                 dd[0][inner], dd[1][inner], dd[2][inner],
+                                 dd[3][inner], level))
+            start = end
+        return patches
+
+    def _refine(self):
+        """ Level by level quadtree refinement of the flagged tiles """
+        tiles = self._flag_tiles()
+        c1, c2 = self.coord, self.coord2
+        boxes = [(c1[i0], c1[i1], c2[j0], c2[j1]) for i0, i1, j0, j1 in tiles]
+        # tiles start at twice the native resolution, every other node
+        # being a native node for the error estimate
+        n1 = [2*(i1-i0) for i0, i1, j0, j1 in tiles]
+        n2 = [2*(j1-j0) for i0, i1, j0, j1 in tiles]
+        parents = [self.native.detA[i0:i1+1, j0:j1+1]
+                   for i0, i1, j0, j1 in tiles]
+        level = 1
+        while len(boxes) > 0:
+            nodes = self._evaluate(boxes, n1, n2, level)
+            boxes_next, n1_next, n2_next, parents_next = [], [], [], []
+            for node, nn1, nn2, parent in zip(nodes, n1, n2, parents):
+                err = np.max(np.abs(node.detA[::2, ::2] - parent))
+                if ((level < self.max_level) and (err > self.tol) and
+                    node.flagged(self.detA_min)):
+                    lo1, hi1, lo2, hi2 = node.box
+                    m1 = 0.5*(lo1 + hi1)
+                    m2 = 0.5*(lo2 + hi2)
+                    h1 = nn1//2
+                    h2 = nn2//2
+                    for b1, s1 in [((lo1, m1), slice(0, h1+1)),
+                                   ((m1, hi1), slice(h1, nn1+1))]:
+                        for b2, s2 in [((lo2, m2), slice(0, h2+1)),
+                                       ((m2, hi2), slice(h2, nn2+1))]:
+                            boxes_next.append((b1[0], b1[1], b2[0], b2[1]))
+                            n1_next.append(nn1)
+                            n2_next.append(nn2)
+                            parents_next.append(node.detA[s1, s2])
+                else:
+                    self.patches.append(node)
+            boxes, n1, n2, parents = boxes_next, n1_next, n2_next, parents_next
+            level += 1
+        return tiles
+
+    def stats(self):
+        """
+        Cost of the refinement
+        Output:
+            dict of number of refined tiles and patches, patches per level,
+            resampled points and points of a uniform grid at the finest level
+        """
+        levels = np.array([pp.level for pp in self.patches], dtype=int)
+        finest = np.max(levels) if len(levels) > 0 else 0
+        nuniform = ((len(self.coord) - 1)*2**finest + 1)* \
+                   ((len(self.coord2) - 1)*2**finest + 1)
+        return {'tiles' : len(self.tiles),
+                'patches' : len(self.patches),
+                'per_level' : np.bincount(levels),
+                'points' : self.npoints,
+                'uniform_points' : nuniform}
+
+    def _segments(self, field, level, extra=()):
+        """
+        Contour segments of a patch field with extra fields sampled on them
+        Output:
+            list of (N,2+len(extra)) arrays
+        """
+        segments = []
+        for pp in self.patches:
+            pts1, pts2, offsets, closed = cf.call_marching_squares(
+                    getattr(pp, field), level)
+            if len(closed) == 0:
+                continue
+            cols = [lt.sample_grid(pp.lp1, pts1, pts2),
+                    lt.sample_grid(pp.lp2, pts1, pts2)]
+            for ee in extra:
+                cols.append(lt.sample_grid(getattr(pp, ee), pts1, pts2))
+            data = np.array(cols).T
+            for cc in range(len(closed)):
+                segments.append(data[offsets[cc]:offsets[cc+1]])
+        return segments
+
+    def contours(self, field, level=0.):
+        """
+        Contours of a map on the refined patches, joined across patches
+        Input:
+            field[str] : 'detA', 'lambda_t', 'kappa' or 'mu'
+        Output:
+            curves[list] : (N,2) arrays of x,y-coordinates of each contour
+            closed[np.array(bool)] : False for curves ending on a patch
+                                     that was not refined
+        """
+        curves, closed = _stitch(self._segments(field, level), 0.5*self.dsx)
+        return [cc[:, :2] for cc in curves], closed
+
+    def critical_curves(self):
+        """
+        Zero contours of detA on the refined patches, labelled as tangential
+        or radial critical curves (see lenstools.critical_curves)
+        Output:
+            curves, closed, tangential
+        """
+        curves, closed = _stitch(self._segments('detA', 0.,
+                                                ('lambda_t', 'kappa')),
+                                 0.5*self.dsx)
+        tangential = np.zeros(len(curves), dtype=bool)
+        for cc in range(len(curves)):
+            lam_t = curves[cc][:, 2]
+            lam_r = 2*(1 - curves[cc][:, 3]) - lam_t
+            tangential[cc] = (np.median(np.abs(lam_t)) <
+                              np.median(np.abs(lam_r)))
+        return [cc[:, :2] for cc in curves], closed, tangential
+
+    def einstein_radii(self, method='med'):
+        """
+        Tangential critical curve, caustic and Einstein radius from the
+        refined patches (see lenstools.einstein_radii). The longest curve
+        is taken and 'med' weighs points evenly along it, as the patches
+        sample curves with different resolutions.
+        Output:
+            Ncrit, curve_crit_tan, caustic, Rein
+        """
+        curves, closed = self.contours('lambda_t', 0.)
+        if len(curves) == 0:
+            return 0, np.array([]), np.array([]), 0
+        length = [np.sum(np.sqrt(np.sum(np.diff(cc, axis=0)**2, axis=1)))
+                  for cc in curves]
+        tan_crit_curve = curves[int(np.argmax(length))]
+        if method == 'eqv':
+            Rein = np.sqrt(np.abs(lt.area(tan_crit_curve))/np.pi)  #[arcsec]
+        if method == 'med':
+            Rein = _arc_median_radius(tan_crit_curve)  #[arcsec]
+        caustic = np.array(cf.call_lens_equation(
+                tan_crit_curve[:, 0], tan_crit_curve[:, 1],
+                self.coord, self.coord2, self.alpha1, self.alpha2,
+                self.order)).T
+        return len(curves), tan_crit_curve, caustic, Rein
+
+    def _in_tiles(self, x1, x2):
+        """ True for points inside refined tiles """
+        ncell1, ncell2 = len(self.coord) - 1, len(self.coord2) - 1
+        i = np.clip(np.floor((x1 - self.coord[0])/self.dsx).astype(int), 0, ncell1-1)
+        j = np.clip(np.floor((x2 - self.coord2[0])/self.dsx).astype(int), 0, ncell2-1)
+        mask = np.zeros((ncell1, ncell2), dtype=bool)
+        for i0, i1, j0, j1 in self.tiles:
+            mask[i0:i1, j0:j1] = True
+        return mask[i, j]
+
+    @staticmethod
+    def _in_box(x1, x2, box):
+        lo1, hi1, lo2, hi2 = box
+        return (x1 >= lo1) & (x1 < hi1) & (x2 >= lo2) & (x2 < hi2)
+
+    def find_images(self, beta1, beta2):
+        """
+        Images of many sources, found on the refined patches inside
+        refined tiles and on the native grid elsewhere
+        Input:
+            beta1,beta2[np.array] : source positions [arcsec]
+        Output:
+            img_offsets[np.array] : images of source s are
+                                    [img_offsets[s]:img_offsets[s+1]]
+            theta1,theta2[np.array] : image positions [arcsec]
+            mu[np.array] : magnification of images
+        """
+        beta1 = np.atleast_1d(np.asarray(beta1, dtype=np.float64))
+        beta2 = np.atleast_1d(np.asarray(beta2, dtype=np.float64))
+        src, theta1, theta2, mu = [], [], [], []
+
+        if self._finders is None:
+            # triangle indices of the native grid and all patches, built once
+            grids = [self.native] + self.patches
+            self._finders = [imf.TriangleImageFinder(gg.lp1, gg.lp2,
+                                                     gg.sp1, gg.sp2)
+                             for gg in grids]
+        grids = [(self.native, None)] + [(pp, pp.box) for pp in self.patches]
+        for (grid, box), finder in zip(grids, self._finders):
+            offsets, t1, t2, vertices, weights = finder.find_images(beta1,
+                                                                    beta2)
+            if box is None:
+                # native images outside of refined tiles
+                keep = ~self._in_tiles(t1, t2)
+            else:
+                keep = self._in_box(t1, t2, box)
+            s = np.repeat(np.arange(len(beta1)), np.diff(offsets))
+            src.append(s[keep])
+            theta1.append(t1[keep])
+            theta2.append(t2[keep])
+            mu.append(finder.interpolate(grid.mu, vertices[keep], weights[keep]))
+
+        src = np.concatenate(src)
+        order = np.argsort(src, kind='mergesort')
+        img_offsets = np.zeros(len(beta1)+1, dtype=int)
+        img_offsets[1:] = np.cumsum(np.bincount(src, minlength=len(beta1)))
+        return (img_offsets, np.concatenate(theta1)[order],
+                np.concatenate(theta2)[order], np.concatenate(mu)[order])
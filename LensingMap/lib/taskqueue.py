@@ -0,0 +1,196 @@
+# File Description:
+#   Manifest of lens tasks and a work queue in a SQLite file, shared by
+#   independent processes (e.g. the jobs of a SLURM array) without a
+#   central MPI job. Every task is one lens and a set of its sources with
+#   an estimated cost. Workers claim pending tasks file by file, the
+#   most expensive first, under a lease and mark them complete once their
+#   results are written. Only the owner of a claim completes or releases
+#   the task, so the results of a task are written by one worker.
+#   Tasks whose lease ran out, because the worker died or straggles, are
+#   handed out again, tasks failing max_attempts times are set 'failed'.
+#   A run is resumed by starting workers on the same queue file.
+#   Claims are serialised by the SQLite write lock of the file, which
+#   needs a filesystem with working POSIX locks.
+#
+from __future__ import division
+import json, sqlite3, time
+import numpy as np
+
+_columns = ['file', 'lcfile', 'row', 'LC_ID', 'src_start', 'src_stop',
+            'cost']
+
+
+def source_sets(nsrc, nmax):
+    """
+    Split the sources of one lens into sets of at most nmax
+    Output:
+        sets[list] : (start, stop) of every set
+    """
+    if nsrc == 0:
+        return []
+    nsets = int(np.ceil(nsrc/nmax))
+    bounds = np.linspace(0, nsrc, nsets + 1).astype(int)
+    return [(int(bounds[ii]), int(bounds[ii+1])) for ii in range(nsets)]
+
+
+def task_cost(ncells, nsrc):
+    """
+    Relative cost of lensing nsrc sources by a map of ncells^2 pixels,
+    the transforms of the plane and maps of every source redshift
+    """
+    return ncells**2*(np.log2(ncells) + nsrc)
+
+
+class TaskQueue():
+    def __init__(self, filename, lease=3600., max_attempts=3, timeout=600.):
+        """
+        Input:
+            filename[str] : SQLite file, created if missing
+            lease[float] : time a claimed task is reserved for [s]
+            max_attempts[int] : claims of a task before it is 'failed'
+            timeout[float] : wait for the lock of the file [s]
+        """
+        self.filename = filename
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.db = sqlite3.connect(filename, timeout=timeout,
+                                  isolation_level=None)
+        self.db.execute('CREATE TABLE IF NOT EXISTS tasks ('
+                        'id INTEGER PRIMARY KEY, file TEXT, lcfile TEXT, '
+                        'row INTEGER, LC_ID INTEGER, src_start INTEGER, '
+                        'src_stop INTEGER, cost REAL, '
+                        "state TEXT DEFAULT 'pending', owner TEXT, "
+                        'expires REAL, attempts INTEGER DEFAULT 0, '
+                        'finished REAL, message TEXT)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS tasks_file '
+                        'ON tasks (state, file, cost)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta '
+                        '(key TEXT PRIMARY KEY, value TEXT)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def set_meta(self, key, value):
+        """ Settings of the run shared by all workers, JSON encoded """
+        self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                        (key, json.dumps(value)))
+
+    def meta(self):
+        return {kk : json.loads(vv) for kk, vv in
+                self.db.execute('SELECT key, value FROM meta')}
+
+    def add(self, tasks):
+        """
+        Input:
+            tasks[list] : dicts with 'file', 'lcfile', 'row', 'LC_ID',
+                          'src_start', 'src_stop', 'cost'
+        """
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            self.db.executemany(
+                    'INSERT INTO tasks (%s) VALUES (%s)' % \
+                    (', '.join(_columns), ', '.join('?'*len(_columns))),
+                    [tuple(tt[cc] for cc in _columns) for tt in tasks])
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+
+    def claim(self, owner, ntasks=1):
+        """
+        Reserve pending or expired tasks of the first file, the most
+        expensive first, so that a worker reads few files
+        Input:
+            owner[str] : name of the worker
+            ntasks[int] : largest number of tasks claimed
+        Output:
+            tasks[list] : dicts of the columns and 'id'
+        """
+        now = time.time()
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            # expired too often
+            self.db.execute("UPDATE tasks SET state = 'failed', "
+                            "message = 'lease expired' WHERE "
+                            "state = 'running' AND expires < ? AND "
+                            'attempts >= ?', (now, self.max_attempts))
+            rows = self.db.execute(
+                    "SELECT id, %s FROM tasks WHERE state = 'pending' OR "
+                    "(state = 'running' AND expires < ?) "
+                    'ORDER BY file, cost DESC LIMIT ?' % ', '.join(_columns),
+                    (now, ntasks)).fetchall()
+            self.db.executemany(
+                    "UPDATE tasks SET state = 'running', owner = ?, "
+                    'expires = ?, attempts = attempts + 1 WHERE id = ?',
+                    [(owner, now + self.lease, rr[0]) for rr in rows])
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+        return [dict(zip(['id'] + _columns, rr)) for rr in rows]
+
+    def renew(self, ids, owner):
+        """
+        Extend the lease of tasks still held by owner
+        Output:
+            number of tasks renewed
+        """
+        return self.db.executemany(
+                'UPDATE tasks SET expires = ? WHERE id = ? AND '
+                "owner = ? AND state = 'running'",
+                [(time.time() + self.lease, ii, owner) for ii in ids]).rowcount
+
+    def complete(self, ids, owner):
+        """
+        Mark tasks still held by owner done, tasks claimed by another
+        worker after the lease ran out are left to it
+        Output:
+            number of tasks completed
+        """
+        return self.db.executemany(
+                "UPDATE tasks SET state = 'done', finished = ? WHERE id = ? "
+                "AND owner = ? AND state = 'running'",
+                [(time.time(), ii, owner) for ii in ids]).rowcount
+
+    def fail(self, ids, owner, message):
+        """
+        Release tasks still held by owner after an error, claimed again
+        up to max_attempts
+        """
+        self.db.executemany(
+                'UPDATE tasks SET state = CASE WHEN attempts >= ? '
+                "THEN 'failed' ELSE 'pending' END, message = ? WHERE id = ? "
+                "AND owner = ? AND state = 'running'",
+                [(self.max_attempts, str(message), ii, owner) for ii in ids])
+
+    def owners(self, state='done'):
+        """
+        Output:
+            owners[dict] : owner of every task of a state by id
+        """
+        return dict(self.db.execute('SELECT id, owner FROM tasks '
+                                    'WHERE state = ?', (state,)))
+
+    def reset(self, state='failed'):
+        """ Queue tasks of a state again, e.g. after fixing a failure """
+        self.db.execute("UPDATE tasks SET state = 'pending', attempts = 0 "
+                        'WHERE state = ?', (state,))
+
+    def status(self):
+        """
+        Output:
+            counts[dict] : number and cost of the tasks of every state
+        """
+        counts = {}
+        for state, num, cost in self.db.execute(
+                'SELECT state, COUNT(*), SUM(cost) FROM tasks '
+                'GROUP BY state'):
+            counts[state] = num
+            counts[state+'_cost'] = cost
+        return counts
@@ -0,0 +1,271 @@
+# File Description:
+#   Deflection and potential of a mass distribution from a Barnes-Hut
+#   tree (lib_so_bhtree) instead of the zero-padded FFT. The masses are
+#   the pixels of a surface density map or particles, the fields are
+#   evaluated at arbitrary points, e.g. only around critical curves or
+#   at images, and do not depend on the field-of-view around the mass.
+#   The opening angle theta and the order of the multipole expansion of
+#   the nodes trade accuracy for speed, compare_fft reports both against
+#   the FFT path and the direct sum.
+#   ParticleLens works on the projected particles themselves, smoothed
+#   with the SPH kernel and smoothing lengths of the density maps, and
+#   returns the Jacobian with the deflection, so that images are solved
+#   for without painting the particles to a uniform grid: a coarse grid
+#   only brackets the images, which are then polished by Newton steps.
+#
+from __future__ import division
+import time
+import numpy as np
+import lenstools as lt
+import imagefinder as imf
+import lm_cfuncs as cf
+
+
+class TreeLens():
+    def __init__(self, x1, x2, mass, theta=0.5, order=4, eps=0., leafsize=8):
+        """
+        Input:
+            x1,x2[np.array] : positions of the masses [arcsec]
+            mass[np.array] : masses [Sigma_cr arcsec^2]
+            theta[float] : opening angle, 0 sums all masses directly
+            order[int] : order of the multipole expansion, up to 8
+            eps[float] : softening length [arcsec]
+            leafsize[int] : largest number of masses of a leaf
+        """
+        self.x1 = np.array(x1, dtype=np.float64).ravel()
+        self.x2 = np.array(x2, dtype=np.float64).ravel()
+        self.mass = np.array(mass, dtype=np.float64).ravel()
+        self.theta = theta
+        self.order = order
+        self.eps = eps
+        self.leafsize = leafsize
+
+    @classmethod
+    def from_map(cls, sigma, coord, scale=1., **tree_args):
+        """
+        Pixels of a surface density map as point masses
+        Input:
+            sigma[np.ndarray] : surface density map [Sigma_cr]
+            coord[np.array] : uniform axis coordinates of the map [arcsec]
+            scale[float] : factor applied to sigma, e.g. 1/Sigma_cr
+            tree_args : keywords of TreeLens, the softening defaults to
+                        half a pixel
+        """
+        dsx = coord[1] - coord[0]
+        lp2, lp1 = np.meshgrid(coord, coord)
+        mass = np.asarray(sigma)*(scale*dsx**2)
+        indx = np.nonzero(mass)
+        tree_args.setdefault('eps', 0.5*dsx)
+        return cls(lp1[indx], lp2[indx], mass[indx], **tree_args)
+
+    def fields(self, y1, y2, theta=None):
+        """
+        Deflection and potential at points
+        Input:
+            y1,y2[np.array] : points [arcsec]
+            theta[float] : opening angle, default of the tree
+        Output:
+            alpha1, alpha2, phi[np.array] : [arcsec], [arcsec^2]
+        """
+        if theta is None:
+            theta = self.theta
+        return cf.call_bh_fields(self.x1, self.x2, self.mass, y1, y2, theta,
+                                 self.order, self.eps, self.leafsize)
+
+    def maps(self, coord1, coord2=None):
+        """
+        Deflection and potential maps on a grid
+        Output:
+            alpha1, alpha2, phi[np.ndarray] : (len(coord1), len(coord2))
+        """
+        if coord2 is None:
+            coord2 = coord1
+        lp2, lp1 = np.meshgrid(coord2, coord1)
+        return [np.reshape(ff, np.shape(lp1))
+                for ff in self.fields(lp1, lp2)]
+
+
+class ParticleLens():
+    def __init__(self, x1, x2, mass, hsml, theta=0.5, order=4, leafsize=8):
+        """
+        Input:
+            x1,x2[np.array] : projected positions of the particles [arcsec]
+            mass[np.array] : masses [Sigma_cr arcsec^2]
+            hsml[np.array] : smoothing lengths [arcsec]
+            theta[float] : opening angle, 0 sums all particles directly
+            order[int] : order of the multipole expansion, up to 8
+            leafsize[int] : largest number of particles of a leaf
+        """
+        self.x1 = np.array(x1, dtype=np.float64).ravel()
+        self.x2 = np.array(x2, dtype=np.float64).ravel()
+        self.mass = np.array(mass, dtype=np.float64).ravel()
+        self.hsml = np.array(hsml, dtype=np.float64).ravel()
+        self.theta = theta
+        self.order = order
+        self.leafsize = leafsize
+
+    @classmethod
+    def from_particles(cls, pos, mass, sigma_cr=1., axis=2, ngb=32,
+                       hsml=None, **tree_args):
+        """
+        Particles projected along one axis, with the smoothing lengths of
+        lm_cfuncs.call_sph_sdens_weight unless given
+        Input:
+            pos[np.ndarray] : (N,3) positions, transverse distances over the
+                              angular diameter distance of the lens [arcsec]
+            mass[np.array] : particle masses
+            sigma_cr[float] : critical surface density [mass/arcsec^2]
+            axis[int] : line-of-sight axis
+            ngb[int] : number of SPH neighbours
+            hsml[np.array] : smoothing lengths [arcsec]
+        """
+        pos = np.asarray(pos)
+        if hsml is None:
+            hsml = cf.call_sph_hsml(pos[:, 0], pos[:, 1], pos[:, 2], ngb)
+        axes = [aa for aa in range(3) if aa != axis]
+        return cls(pos[:, axes[0]], pos[:, axes[1]],
+                   np.asarray(mass)/sigma_cr, hsml, **tree_args)
+
+    def fields(self, y1, y2, theta=None):
+        """
+        Deflection, potential and deflection derivatives at points
+        Input:
+            y1,y2[np.array] : points [arcsec]
+            theta[float] : opening angle, default of the tree
+        Output:
+            alpha1, alpha2, phi, d11, d12, d21, d22[np.array]
+        """
+        if theta is None:
+            theta = self.theta
+        return cf.call_bh_particle_fields(self.x1, self.x2, self.mass,
+                                          self.hsml, y1, y2, theta,
+                                          self.order, self.leafsize)
+
+    def maps(self, coord1, coord2=None):
+        """
+        Deflection, potential and deflection derivative maps on a grid
+        Output:
+            alpha1, alpha2, phi, d11, d12, d21, d22[np.ndarray] :
+                (len(coord1), len(coord2))
+        """
+        if coord2 is None:
+            coord2 = coord1
+        lp2, lp1 = np.meshgrid(coord2, coord1)
+        return [np.reshape(ff, np.shape(lp1))
+                for ff in self.fields(lp1, lp2)]
+
+    def images(self, beta1, beta2, coord, niter=20):
+        """
+        Images of many sources, bracketed on a coarse grid and polished
+        with Newton steps of the lens equation at the particles' resolution
+        Input:
+            beta1,beta2[np.array] : source positions [arcsec]
+            coord[np.array] : axis coordinates of the coarse grid [arcsec]
+            niter[int] : Newton steps, halved where the residual grows
+        Output:
+            nimgs, theta1, theta2, mu, phi (see lensplane.LensingFields.images)
+        """
+        beta1 = np.atleast_1d(np.asarray(beta1, dtype=np.float64))
+        beta2 = np.atleast_1d(np.asarray(beta2, dtype=np.float64))
+        alpha1, alpha2 = self.maps(coord)[:2]
+        lp2, lp1 = np.meshgrid(coord, coord)
+        finder = imf.TriangleImageFinder(lp1, lp2, lp1 - alpha1, lp2 - alpha2)
+        img_offsets, theta1, theta2 = finder.find_images(beta1, beta2)[:3]
+        nimgs = np.diff(img_offsets)
+        b1 = np.repeat(beta1, nimgs)
+        b2 = np.repeat(beta2, nimgs)
+
+        fields = self.fields(theta1, theta2)
+        res = np.hypot(theta1 - fields[0] - b1, theta2 - fields[1] - b2)
+        lam = np.ones(len(theta1))
+        for ii in range(niter):
+            r1 = b1 - (theta1 - fields[0])
+            r2 = b2 - (theta2 - fields[1])
+            # A = 1 - d, A dtheta = r
+            a11, a12 = 1 - fields[3], -fields[4]
+            a21, a22 = -fields[5], 1 - fields[6]
+            det = a11*a22 - a12*a21
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t1 = theta1 + lam*(a22*r1 - a12*r2)/det
+                t2 = theta2 + lam*(a11*r2 - a21*r1)/det
+            step = np.isfinite(t1) & np.isfinite(t2)
+            t1 = np.where(step, t1, theta1)
+            t2 = np.where(step, t2, theta2)
+            new = self.fields(t1, t2)
+            new_res = np.hypot(t1 - new[0] - b1, t2 - new[1] - b2)
+            # steps across a critical curve may diverge, keep the better
+            better = new_res < res
+            lam = np.where(better, 1., 0.5*lam)
+            theta1 = np.where(better, t1, theta1)
+            theta2 = np.where(better, t2, theta2)
+            fields = [np.where(better, nn, ff) for nn, ff in zip(new, fields)]
+            res = np.where(better, new_res, res)
+
+        # images of neighbouring triangles converged to the same image
+        src = np.repeat(np.arange(len(beta1)), nimgs)
+        tol = 1e-3*(coord[1] - coord[0])
+        keep = np.ones(len(theta1), dtype=bool)
+        for ii in range(1, np.max(nimgs, initial=1)):
+            same = (src[ii:] == src[:-ii]) & \
+                   (np.hypot(theta1[ii:] - theta1[:-ii],
+                             theta2[ii:] - theta2[:-ii]) < tol)
+            keep[ii:] &= ~same
+        fields = [ff[keep] for ff in fields]
+        mu = lt.jacobian_signals(*fields[3:])[0]
+        nimgs = np.bincount(src[keep], minlength=len(beta1))
+        return nimgs, theta1[keep], theta2[keep], mu, fields[2]
+
+
+def _errors(alpha1, alpha2, phi, ref):
+    """ Deflection and potential errors relative to a reference """
+    dalpha = np.hypot(alpha1 - ref[0], alpha2 - ref[1])/np.hypot(ref[0], ref[1])
+    # the potential is defined up to a constant
+    dphi = phi - ref[2]
+    dphi = np.abs(dphi - np.mean(dphi))/(np.max(ref[2]) - np.min(ref[2]))
+    return {'alpha_err_median' : np.median(dalpha),
+            'alpha_err_max' : np.max(dalpha),
+            'phi_err_max' : np.max(dphi)}
+
+
+def compare_fft(sigma, fov_arc, ncells, coord, thetas=(0.3, 0.5, 0.8),
+                order=4, npts=2000, seed=0):
+    """
+    Accuracy and throughput of the tree against the FFT deflections
+    Input:
+        sigma[np.ndarray] : surface density map [Sigma_cr]
+        fov_arc[float] : field-of-view [arcsec]
+        ncells[int] : number of cells per side
+        coord[np.array] : lensing plane axis coordinates [arcsec]
+        thetas[list] : opening angles of the tree
+        npts[int] : pixel centres the methods are compared at
+    Output:
+        rows[list] : dict for the FFT and every opening angle with
+                     'method', 'theta', 'time' [s], 'points_per_s',
+                     errors of the deflection (relative) and potential
+                     (relative to its range) against the direct sum
+    """
+    rng = np.random.RandomState(seed)
+    pix = rng.randint(0, ncells, (2, npts))
+    y1, y2 = coord[pix[0]], coord[pix[1]]
+    tree = TreeLens.from_map(sigma, coord, order=order)
+    ref = tree.fields(y1, y2, theta=0.)
+
+    rows = []
+    t0 = time.time()
+    alpha1, alpha2 = cf.call_cal_alphas(sigma, fov_arc, ncells)
+    phi = cf.call_cal_phi(sigma, fov_arc, ncells)
+    dt = time.time() - t0
+    row = {'method' : 'fft', 'theta' : np.nan, 'time' : dt,
+           'points_per_s' : ncells**2/dt}
+    row.update(_errors(alpha1[pix[0], pix[1]], alpha2[pix[0], pix[1]],
+                       phi[pix[0], pix[1]], ref))
+    rows.append(row)
+    for theta in thetas:
+        t0 = time.time()
+        fields = tree.fields(y1, y2, theta)
+        dt = time.time() - t0
+        row = {'method' : 'tree', 'theta' : theta, 'time' : dt,
+               'points_per_s' : npts/dt}
+        row.update(_errors(fields[0], fields[1], fields[2], ref))
+        rows.append(row)
+    return rows
@@ -0,0 +1,62 @@
+# Run: python -m unittest test_cascade.py
+import sys
+import unittest
+import numpy as np
+sys.path.insert(0, '../lib/')
+import cascade
+
+
+def plummer_map(ncells, fov_arc, kappa0, rc, centre):
+    """ Convergence of a projected Plummer sphere, Sigma_cr = 1 """
+    dsx = fov_arc/ncells
+    coord = np.linspace(-(fov_arc-dsx)/2, (fov_arc-dsx)/2, ncells)
+    x2, x1 = np.meshgrid(coord, coord)
+    r2 = (x1 - centre[0])**2 + (x2 - centre[1])**2
+    return kappa0/(1 + r2/rc**2)**2, coord
+
+
+class TestCascade(unittest.TestCase):
+
+    def test_off_centre_refinement(self):
+        # window with i0 != j0, refined at level 2
+        kappa0, rc, centre = 5., 0.5, (6., -4.)
+        theta_e = rc*np.sqrt(kappa0 - 1)
+        sigma, coord = plummer_map(256, 40., kappa0, rc, centre)
+        casc = cascade.Cascade(sigma, 40., 256, coord, rein_pixels=64)
+        fields = casc.fields(1.)
+        self.assertEqual(fields.level, 2)
+        i0, j0, m = fields.state['window']
+        self.assertNotEqual(i0, j0)
+        # tangential critical curve on the Einstein ring around the lens
+        curve = fields.einstein_radii()[1]
+        radius = np.hypot(curve[:, 0] - centre[0], curve[:, 1] - centre[1])
+        self.assertTrue(np.allclose(radius, theta_e, atol=0.05))
+        # images match those of the same lens at the centre of the map
+        beta = 0.2
+        sigma0 = plummer_map(256, 40., kappa0, rc, (0., 0.))[0]
+        fields0 = cascade.Cascade(sigma0, 40., 256, coord,
+                                  rein_pixels=64).fields(1.)
+        nimgs, theta1, theta2, mu = fields.images([centre[0] + beta],
+                                                  [centre[1]])[:4]
+        nimgs0, theta10, theta20, mu0 = fields0.images([beta], [0.])[:4]
+        self.assertEqual(nimgs[0], nimgs0[0])
+        self.assertTrue(np.allclose(theta1 - centre[0], theta10, atol=0.01))
+        self.assertTrue(np.allclose(theta2 - centre[1], theta20, atol=0.01))
+        self.assertTrue(np.all(np.sign(mu) == np.sign(mu0)))
+        self.assertTrue(np.allclose(mu, mu0, rtol=0.25))
+
+    def test_caustic_classifier(self):
+        # sources behind the lens may be multiply imaged, others not
+        sigma, coord = plummer_map(256, 40., 5., 0.5, (6., -4.))
+        casc = cascade.Cascade(sigma, 40., 256, coord, rein_pixels=64)
+        multiple = casc.fields(1.).caustic_classifier.classify(
+                [6.1, -6.], [-4., 5.])[1]
+        self.assertTrue(np.all(multiple == [True, False]))
+        # no critical curves at level 0
+        fields = casc.fields(100.)
+        self.assertEqual(fields.level, 0)
+        self.assertFalse(fields.caustic_classifier.classify([6.], [-4.])[1][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
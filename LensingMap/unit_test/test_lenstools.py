@@ -0,0 +1,34 @@
+# Run: python -m unittest test_lenstools.py
+import sys
+import unittest
+import numpy as np
+from astropy import units as u
+from astropy import constants as const
+from astropy.cosmology import LambdaCDM
+sys.path.insert(0, '../../')
+sys.path.insert(0, '../lib/')
+import lenstools as lt
+import lm_cfuncs as cf
+
+
+class TestLensTools(unittest.TestCase):
+
+    def test_image_table_delays(self):
+        # arrival times scale with the time-delay distance (1+zl) Dl Ds/Dls
+        cosmo = LambdaCDM(H0=67.74, Om0=0.3089, Ode0=0.6911)
+        zl, zs = 0.5, np.array([1., 2.])
+        table = lt.image_table([1, 1], [1., 1.], [0., 0.], [1., 1.],
+                               [0., 0.], [0., 0.], [0., 0.], zs, zl, cosmo)
+        Dl = cosmo.angular_diameter_distance(zl)
+        Ds = cosmo.angular_diameter_distance(zs)
+        Dls = cosmo.angular_diameter_distance_z1z2(zl, zs)
+        expect = ((1 + zl)*Dl*Ds/Dls/const.c*0.5*(1*u.arcsec)**2).to_value(
+                'rad2 s', equivalencies=u.dimensionless_angles())
+        expect = expect/(1*u.sday).to_value('s')
+        self.assertTrue(np.allclose(table['delta_t'], expect, rtol=1e-4))
+        single = lt.time_delays(1., 0., 0., [0., 0.], zs[1], zl, cosmo)
+        self.assertTrue(np.isclose(single, table['delta_t'][1], rtol=1e-10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+# Run: python -m unittest test_mapprep.py
+import sys
+import unittest
+import numpy as np
+from astropy import units as u
+from astropy.cosmology import LambdaCDM
+sys.path.insert(0, '../../')
+sys.path.insert(0, '../lib/')
+import mapprep
+
+
+class TestMapUnits(unittest.TestCase):
+
+    def setUp(self):
+        self.cosmo = LambdaCDM(H0=67.74, Om0=0.3089, Ode0=0.6911)
+        self.fov = np.array([0.2, 0.5, 1.])
+        self.zl = np.array([0.1, 0.5, 1.2])
+
+    # lm_cfuncs.apr, 206269.43, is 2.2e-5 above the astropy radian
+
+    def test_lightcone_fov(self):
+        # field-of-view in Mpc/h as in the lightcone drivers before
+        fov_arc = mapprep.MapUnits(self.fov, self.zl, self.cosmo, 128,
+                                   hubble=True).fov_arc
+        Da = self.cosmo.angular_diameter_distance(self.zl).value
+        expect = (self.fov/(Da*self.cosmo.h)*u.rad).to_value('arcsec')
+        self.assertTrue(np.allclose(fov_arc, expect, rtol=1e-4))
+
+    def test_box_fov(self):
+        fov_arc = mapprep.MapUnits(self.fov, self.zl, self.cosmo, 128).fov_arc
+        Da = self.cosmo.angular_diameter_distance(self.zl).value
+        expect = (self.fov/Da*u.rad).to_value('arcsec')
+        self.assertTrue(np.allclose(fov_arc, expect, rtol=1e-4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+# Run: python -m unittest test_taskqueue.py
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0, '../lib/')
+import taskqueue
+
+
+def tasks(files, costs):
+    return [{'file' : ff, 'lcfile' : ff, 'row' : rr, 'LC_ID' : rr,
+             'src_start' : 0, 'src_stop' : 1, 'cost' : cc}
+            for ff in files for rr, cc in enumerate(costs)]
+
+
+class TestTaskQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.queue = taskqueue.TaskQueue(
+                os.path.join(self.tmpdir, 'queue.db'), lease=1000.)
+        self.queue.add(tasks(['b', 'a'], [1., 3., 2.]))
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_claim_file_by_file(self):
+        claimed = self.queue.claim('w1', 4)
+        self.assertEqual([cc['file'] for cc in claimed], ['a']*3 + ['b'])
+        self.assertEqual([cc['cost'] for cc in claimed], [3., 2., 1., 3.])
+
+    def test_complete_by_owner(self):
+        ids = [cc['id'] for cc in self.queue.claim('w1', 2)]
+        # lease ran out and the tasks went to another worker
+        self.queue.lease = -1.
+        self.queue.renew(ids, 'w1')
+        self.queue.lease = 1000.
+        self.assertEqual([cc['id'] for cc in self.queue.claim('w2', 2)], ids)
+        self.assertEqual(self.queue.renew(ids, 'w1'), 0)
+        self.assertEqual(self.queue.complete(ids, 'w1'), 0)
+        self.queue.fail(ids, 'w1', 'error')
+        self.assertEqual(self.queue.status()['running'], 2)
+        self.assertEqual(self.queue.complete(ids, 'w2'), 2)
+        self.assertEqual(self.queue.owners('done'), {ids[0] : 'w2',
+                                                     ids[1] : 'w2'})
+
+
+if __name__ == '__main__':
+    unittest.main()
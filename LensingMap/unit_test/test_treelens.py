@@ -0,0 +1,64 @@
+# Run: python -m unittest test_treelens.py
+import sys
+import unittest
+import numpy as np
+sys.path.insert(0, '../lib/')
+import treelens as tl
+import lensplane as lp
+
+
+def plummer_particles(npart, mass, rc, seed=0):
+    """ Projected particles of a Plummer sphere, Sigma_cr = 1 """
+    rng = np.random.RandomState(seed)
+    # projected radii from the cumulative mass r^2/(r^2 + rc^2)
+    uu = rng.uniform(0, 0.99, npart)
+    rr = rc*np.sqrt(uu/(1 - uu))
+    pp = rng.uniform(0, 2*np.pi, npart)
+    hsml = 0.5*rc*np.sqrt(1 + rr**2/rc**2)
+    return (rr*np.cos(pp), rr*np.sin(pp), np.full(npart, mass/npart), hsml)
+
+
+class TestParticleLens(unittest.TestCase):
+
+    def test_tree_against_direct_sum(self):
+        x1, x2, mass, hsml = plummer_particles(4000, 4*np.pi, 1.)
+        lens = tl.ParticleLens(x1, x2, mass, hsml, theta=0.5)
+        rng = np.random.RandomState(1)
+        y1, y2 = rng.uniform(-5, 5, (2, 500))
+        tree = lens.fields(y1, y2)
+        direct = lens.fields(y1, y2, theta=0.)
+        dalpha = np.hypot(tree[0] - direct[0], tree[1] - direct[1])
+        self.assertLess(np.max(dalpha/np.hypot(direct[0], direct[1])), 1e-4)
+        # deflection derivatives relative to the largest convergence
+        scale = np.max(np.abs(direct[3]))
+        for tt, dd in zip(tree[3:], direct[3:]):
+            self.assertLess(np.max(np.abs(tt - dd)), 1e-3*scale)
+        # symmetric Jacobian
+        self.assertTrue(np.array_equal(direct[4], direct[5]))
+
+    def test_polished_images(self):
+        particles = plummer_particles(4000, 4*np.pi, 1.)
+        ncells, fov_arc = 128, 12.
+        dsx = fov_arc/ncells
+        coord = np.linspace(-(fov_arc-dsx)/2, (fov_arc-dsx)/2, ncells)
+        edges = np.linspace(-fov_arc/2, fov_arc/2, ncells+1)
+        sigma = np.histogram2d(particles[0], particles[1], [edges, edges],
+                               weights=particles[2])[0]/dsx**2
+        plane = lp.LensPlane(sigma, fov_arc, ncells, coord,
+                             deflections='particles', particles=particles)
+        fields = plane.fields(1.)
+        beta1, beta2 = np.array([0.1, 0.3]), np.array([0.05, -0.2])
+        nimgs, theta1, theta2, mu, phi = fields.images(beta1, beta2)
+        self.assertTrue(np.all(nimgs >= 3))
+        # the lens equation at the particles' resolution, down to the
+        # error of the tree against the direct sum
+        lens = tl.ParticleLens(*particles)
+        b1, b2 = np.repeat(beta1, nimgs), np.repeat(beta2, nimgs)
+        for theta, tol in ((None, 1e-8), (0., 1e-4)):
+            alpha1, alpha2 = lens.fields(theta1, theta2, theta)[:2]
+            res = np.hypot(theta1 - alpha1 - b1, theta2 - alpha2 - b2)
+            self.assertLess(np.max(res), tol)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -57,7 +57,7 @@ def lensing_signal():
     
     indxdrop = []  # collect indices of subhalos falling through criterias
     if args["lenses"] == 1:
-        lafile = glob.glob(args["ladir"]+"*"+"_lens_"+"*"+"409.pickle")[0]
+        lafile = glob.glob(args["ladir"]+"*"+"_lens_"+"*"+"409.h5")[0]
         lenses = load.load_subhalos(args["snapnum"], args["simdir"],
                                     lafile, strong_lensing=1)
         # Run through lenses
@@ -14,6 +14,8 @@ sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/lib/')
 import read_hdf5
 import readlensing as rf
 import readsnap
+sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/StrongLensing/LensingMap/lib/')
+import lensstore as ls
 sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/StrongLensing/LensingMap/')
 #import lm_funcs_mp # Why do I need to load this???
 import matplotlib as mpl
@@ -63,25 +65,21 @@ def lensing_signal():
             "Rein" : []}
     label = args["simdir"].split('/')[-2].split('_')[-2]
     # Run through LensingMap output files 
-    for lm_file in glob.glob(args["ladir"]+'LM_'+label+".pickle"):
+    for lm_file in glob.glob(args["ladir"]+'LM_'+label+".h5"):
         # Load LensingMap Contents
-        LM = pickle.load(open(lm_file, 'rb'))
+        with ls.LensStore(lm_file, 'r') as LM:
+            lenses = LM.read('lenses')
+            sources = LM.read('sources', ['lens', 'Src_ID', 'zs', 'Rein', 'mu'])
         print('Processing the following file: \n %s' % (lm_file))
-        print('which contains %d lenses' % len(LM['HF_ID'][:]))
+        print('which contains %d lenses' % len(lenses['HF_ID']))
         print('with redshifts from %f to %f' % \
-                (np.min(LM['zl'][:]), np.max(LM['zl'][:])))
-        if False not in (np.diff(LM['snapnum'][:]) <= 0):
-            pass
-        else:
-            order = np.asarray(np.argsort(LM['snapnum'][:]))
-            LM['HF_ID'] = [LM['HF_ID'][oo] for oo in order]
-            LM['zl'] = [LM['zl'][oo] for oo in order]
-            LM['Sources']['Src_ID'] = [LM['Sources']['Src_ID'][oo] for oo in order]
-            LM['Sources']['zs'] = [LM['Sources']['zs'][oo] for oo in order]
-            LM['Sources']['mu'] = [LM['Sources']['mu'][oo] for oo in order]
-            LM['Sources']['Rein'] = [LM['Sources']['Rein'][oo] for oo in order]
-            LM['snapnum'] = [LM['snapnum'][oo] for oo in order]
-            assert False not in (np.diff(LM['snapnum'][:]) >= 0)
+                (np.min(lenses['zl']), np.max(lenses['zl'])))
+        # Sources of lens ll are rows src_offsets[ll]:src_offsets[ll+1]
+        src_offsets = np.zeros(len(lenses['HF_ID'])+1, dtype=int)
+        src_offsets[1:] = np.cumsum(np.bincount(sources['lens'],
+                                                minlength=len(lenses['HF_ID'])))
+        # Group lenses of the same snapshot
+        order = np.argsort(lenses['snapnum'], kind='mergesort')
         
 
         #TODO: sanity check remove after it works
@@ -102,11 +100,11 @@ def lensing_signal():
         #lcsndf = pd.concat([lcsndf1, lcsndf2])
         previous_snapnum = -1
         # Run through lenses
-        for ll in range(len(LM['HF_ID'])):
+        for ll in order:
             # Load Lens properties
-            HFID = int(LM['HF_ID'][ll]) #int(LM['Rockstar_ID'][ll])
-            snapnum = int(LM['snapnum'][ll])
-            zl = LM['zl'][ll]
+            HFID = int(lenses['HF_ID'][ll]) #int(LM['Rockstar_ID'][ll])
+            snapnum = int(lenses['snapnum'][ll])
+            zl = lenses['zl'][ll]
 
             # Only load new particle data if lens is at another snapshot
             if (previous_snapnum != snapnum):
@@ -173,13 +171,13 @@ def lensing_signal():
 
             ## Lensing Mass
             # Run through sources
-            for ss in range(len(LM['Sources']['Src_ID'][ll])):
-                n_imgs = len(LM['Sources']['mu'][ll][ss])
+            for ss in range(src_offsets[ll], src_offsets[ll+1]):
+                n_imgs = len(sources['mu'][ss])
                 if n_imgs == 1:
                 #    print('!!! numer of lensing images = 1, ', n_imgs)
                     continue
-                zs = LM['Sources']['zs'][ll][ss]
-                Rein_arc = LM['Sources']['Rein'][ll][ss]*u.arcsec
+                zs = sources['zs'][ss]
+                Rein_arc = sources['Rein'][ss]*u.arcsec
                 Rein = Rein_arc.to_value('rad') * \
                         cosmo.angular_diameter_distance(zl).to('kpc')
                 Lens['n_imgs'].append(n_imgs)
@@ -189,10 +187,10 @@ def lensing_signal():
                 Lens['Mdyn_stellar'].append(mdyn_s)
                 Lens["Vrms_stellar"].append(vrms_s.to_value('km/s'))
                 Lens["Vrms_rks"].append(Vrms)
-                Lens['Rein'].append(LM['Sources']['Rein'][ll][ss])
+                Lens['Rein'].append(sources['Rein'][ss])
                 Lens['HF_ID'].append(HFID)
-                Lens['LC_ID'].append(LM['LC_ID'][ll])
-                Lens['SrcID'].append(LM['Sources']['Src_ID'][ll][ss])
+                Lens['LC_ID'].append(lenses['LC_ID'][ll])
+                Lens['SrcID'].append(sources['Src_ID'][ss])
                 Lens['zl'].append(zl)
                 Lens['zs'].append(zs)
                 print('Saved data of lens %d' %  (ll))
@@ -1,14 +1,12 @@
 from __future__ import division
 import os, sys, glob
 import numpy as np
-import pickle
 import pandas as pd
 from astropy import units as u
 from astropy import constants as const
 from astropy.cosmology import LambdaCDM
-sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/StrongLensing/LensingAnalysis/')
-import LM_main_box
-from LM_main_box import plant_Tree
+sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/StrongLensing/LensingMap/lib/')
+import lensstore as ls
 sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/StrongLensing/LensingPostProc/lib/')
 import lpp_cfuncs as cf
 import lpp_pyfuncs as lppf
@@ -117,6 +115,30 @@ def load_dm(snapnum, snapfile):
     return dm
 
 
+def load_lensing_results(lafile):
+    """
+    Lenses of a LensingMap results store, ragged and map columns
+    as one np.ndarray per row
+
+    Returns
+    -------
+    ladf : pd.DataFrame
+    attrs : dict
+        file-wide constants (snapnum, zl, zs)
+    """
+    with ls.LensStore(lafile, 'r') as LA:
+        attrs = dict(LA.attrs)
+        data = LA.read('lenses')
+    for key in data.keys():
+        if isinstance(data[key], list) or np.ndim(data[key]) > 1:
+            column = np.empty(len(data[key]), dtype=object)
+            for ll in range(len(data[key])):
+                column[ll] = data[key][ll]
+            data[key] = column
+    ladf = pd.DataFrame(data)
+    return ladf, attrs
+
+
 def load_subhalos(snapnum, snapfile, lafile, strong_lensing=1):
     """
     Parameters
@@ -162,32 +184,17 @@ def load_subhalos(snapnum, snapfile, lafile, strong_lensing=1):
     df = df.set_index('HF_ID')
 
     if strong_lensing == True:
-        LA = pickle.load(open(lafile, "rb"))  #, encoding='latin1')
+        ladf, attrs = load_lensing_results(lafile)
         print('Processing the following file: \n %s' % (lafile))
-        print('which contains %d lenses' % len(LA['HF_ID'][:]))
-        print('with max. einst. radius: %f', np.max(LA['Sources']['Rein'][:]))
+        print('which contains %d lenses' % len(ladf.index.values))
+        print('with max. einst. radius: %f', np.max(ladf['Rein'].values))
         
         # Output only subhalos acting as gravitational strong lenses
         # Find intersection
-        ladf = pd.DataFrame({
-            'HF_ID' : LA["HF_ID"],
-            'ZS' : LA["zs"],
-            'FOV' : LA["FOV"],
-            'Rein' : LA["Sources"]["Rein"],
-            })
-        ladf['Nimg'] = pd.Series(0, index=ladf.index)
-        ladf['theta'] = pd.Series(0, index=ladf.index).astype(np.ndarray)
-        ladf['delta_t'] = pd.Series(0, index=ladf.index).astype(np.ndarray)
-        ladf['mu'] = pd.Series(0, index=ladf.index).astype(np.ndarray)
-        ladf['TCC'] = pd.Series(0, index=ladf.index).astype(np.ndarray)
-        ladf['DMAP'] = pd.Series(0, index=ladf.index).astype(np.ndarray)
-        for ll in range(len(ladf.index.values)):
-            ladf['Nimg'][ll] = len(LA['Sources']['mu'][ll])
-            ladf['theta'][ll] = LA['Sources']['theta'][ll]
-            ladf['delta_t'][ll] = LA['Sources']['delta_t'][ll]
-            ladf['mu'][ll] = LA['Sources']['mu'][ll]
-            ladf['TCC'][ll] = LA['Sources']['TCC'][ll]
-            ladf['DMAP'][ll] = LA['DMAP'][ll]
+        ladf['ZS'] = pd.Series(attrs['zs'], index=ladf.index)
+        ladf['Nimg'] = ladf['mu'].apply(len)
+        ladf = ladf[['HF_ID', 'ZS', 'FOV', 'Rein', 'Nimg',
+                     'theta', 'delta_t', 'mu', 'TCC', 'DMAP']]
         
         ladf = ladf.sort_values(by=['HF_ID'])
         ladf = ladf.set_index('HF_ID')  # may contain dublicates
@@ -215,7 +222,10 @@ def load_subhalos(snapnum, snapfile, lafile, strong_lensing=1):
         # Initialize
         ladf['Mlens'] = pd.Series(0, index=ladf.index)
     elif strong_lensing == False:
-        ladf = pd.read_hdf(lafile, key='nonlenses')
+        ladf, attrs = load_lensing_results(lafile)
+        ladf['snapnum'] = pd.Series(attrs['snapnum'], index=ladf.index)
+        ladf['zl'] = pd.Series(attrs['zl'], index=ladf.index)
+        ladf['zs'] = pd.Series(attrs['zs'], index=ladf.index)
         ladf = ladf.sort_values(by=['HF_ID'])
         ladf = ladf.set_index('HF_ID')
         print('Processing the following file: \n %s' % (lafile))
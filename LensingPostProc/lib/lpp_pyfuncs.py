@@ -8,6 +8,7 @@ from astropy import constants as const
 import lpp_cfuncs as lcf
 sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/lib/')
 import read_hdf5
+import cosmotable
 
 
 def check_in_sphere(c, pos, Rth):
@@ -143,14 +144,9 @@ def sigma_crit(zLens, zSource, cosmo):
     Returns:
     --------
     sig_crit : float
-        Critical surface density [kg/m^2]
+        Critical surface density [Msun/kpc^2]
     """
-    Ds = cosmo.angular_diameter_distance(zSource)
-    Dl = cosmo.angular_diameter_distance(zLens)
-    Dls = cosmo.angular_diameter_distance_z1z2(zLens, zSource)
-    D = (Ds/(Dl*Dls)).to(1/u.meter)
-    sig_crit = (const.c**2/(4*np.pi*const.G))*D
-    return sig_crit.to_value('M_sun/kpc^2')
+    return cosmotable.get_table(cosmo, 'kpc').sigma_crit(zLens, zSource)
 
 
 def mass_lensing(Rein, zl, zs, cosmo):
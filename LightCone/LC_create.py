@@ -15,6 +15,7 @@ from lc_tools import Dc
 import lc_randomize as LCR
 sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/lib/')  # parent directory
 import readsnap
+import cosmotable
 import readlensing as rf
 
 
@@ -90,8 +91,9 @@ for sim in range(len(sim_dir)):
     z_lcone = snapshot_redshifts(snapfile, snap_tot_num, zmax)
     # Comoving distance between z_lcone
     CoDi = Dc(z_lcone, box.unitlength, cosmo)
-    # Interpolation fct. between comoving dist. and redshift
-    reddistfunc = interp1d(CoDi, z_lcone, kind='cubic')
+    # Inverse of comoving dist., tabulated once per cosmology
+    distredtable = cosmotable.get_table(cosmo,
+                                        cosmotable.length_unit(box.unitlength))
     CoDi = CoDi[1:]
     print(CoDi)
 
@@ -192,7 +194,7 @@ for sim in range(len(sim_dir)):
     sub_dist = np.sqrt(lc['pos_lc'][:, 0]**2 + \
                        lc['pos_lc'][:, 1]**2 + \
                        lc['pos_lc'][:, 2]**2)
-    redshift_lc = [reddistfunc(dist) for dist in sub_dist]
+    redshift_lc = distredtable.z_of_Dc(np.asarray(sub_dist))
     #redshift_lc = [z_at_value(cosmo.comoving_distance, dist*u.Mpc, zmax=1) for dist in sub_dist]
     # Write data to h5 file which can be read by LightCone_read.py
     # to analyse and plot
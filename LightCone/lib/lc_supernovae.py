@@ -12,6 +12,7 @@ from astropy.cosmology import z_at_value
 sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/lib/')
 import readsubf
 import readsnap
+import cosmotable
 sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/StrongLensing/LightCone/lib/')
 import CosmoDist as cd
 
@@ -24,11 +25,11 @@ def redshift_division(zmax, cosmo, unit, cosmosim):
     # middle redshift & distnace
     zmid = np.linspace((zr[1]-zr[0])/2, zr[-2] + (zr[-1]-zr[-2])/2, 999)
     if exp == 21:  # simulation in [kpc]
-        dist_zr = (cosmo.comoving_distance(zr)).to_value('kpc')
+        dist_zr = cosmotable.get_table(cosmo, 'kpc').Dc(zr)
         # Comoving distance between redshifts
         dist_bet = [cd.comoving_distance(zr[j+1],zr[j],**cosmosim)*1e3 for j in range(len(zr)-1)]
     elif exp == 23:  # simulation in [Mpc]
-        dist_zr = (cosmo.comoving_distance(zr)).to_value('Mpc')
+        dist_zr = cosmotable.get_table(cosmo, 'Mpc').Dc(zr)
         # Comoving distance between redshifts
         dist_bet = [cd.comoving_distance(zr[j+1],zr[j],**cosmosim) for j in range(len(zr)-1)]
     else:
@@ -203,11 +204,7 @@ def snia_number_density(yr, z, agefunc, redfunc, **cosmosim):
 #@nb.njit  #(fastmath=True, parallel=False)
 def SNIa_position(i, indx, SNIa_num, dist_sr, u_lenspos, l_lenspos, fov,
                   S_ID, S_possky, unit):
-    exp = np.floor(np.log10(np.abs(unit))).astype(int)
-    if exp == 21:  # simulation in [kpc]
-        unit = u.kpc
-    elif exp == 23:  #simulation in [Mpc]
-        unit = u.Mpc
+    table = cosmotable.get_table(cosmo, cosmotable.length_unit(unit))
 
     sid = np.zeros(int(np.sum(SNIa_num)))
     sred = np.zeros(int(np.sum(SNIa_num)))
@@ -225,7 +222,7 @@ def SNIa_position(i, indx, SNIa_num, dist_sr, u_lenspos, l_lenspos, fov,
             radial_rnd = u_lenspos*(l_lenspos + \
                          rnd.random()*(dist_max - l_lenspos))
             sposx = np.sqrt(radial_rnd[0]**2 + radial_rnd[1]**2 + radial_rnd[2]**2)
-            zs = z_at_value(cosmo.comoving_distance, sposx*unit, zmax=2)
+            zs = table.z_of_Dc(sposx)
             # max. distance equa to re
             charge = 1 if rnd.random() < 0.5 else -1
             sposy = charge*rnd.random()*fov[y]*0.5
@@ -7,6 +7,7 @@ from astropy.cosmology import LambdaCDM
 sys.path.insert(0, '/cosma5/data/dp004/dc-beck3/lib/')
 import readsnap
 import read_hdf5
+import cosmotable
 
 
 # Disable
@@ -42,14 +43,8 @@ def snapshot_redshifts(snapfile, snap_tot_num, zmax):
 
 
 def Dc(z, unit, cosmo):
-    exp = np.floor(np.log10(np.abs(unit))).astype(int)
-    if exp == 21:  # simulation in [kpc]
-        CoDi = cosmo.comoving_distance(z).to_value('kpc')
-    elif exp == 23:  #simulation in [Mpc]
-        CoDi = cosmo.comoving_distance(z).to_value('Mpc')
-    else:
-        raise Exception('Dont know this unit ->', unit)
-    return CoDi
+    table = cosmotable.get_table(cosmo, cosmotable.length_unit(unit))
+    return table.Dc(z)
 
 
 class Lightcone():
@@ -0,0 +1,142 @@
+# File Description:
+#   Tabulated cosmological distances for the lensing loops.
+#   Comoving distances are evaluated with astropy once per cosmology on a
+#   redshift grid and interpolated with cubic splines. All other distances
+#   (angular diameter, lens-source, time-delay, Sigma_cr and z(D_c)) are
+#   derived from them, vectorised and without astropy Quantities.
+#
+from __future__ import division
+import numpy as np
+from scipy.interpolate import CubicSpline
+from astropy import units as u
+from astropy import constants as const
+
+_tables = {}
+
+
+def get_table(cosmo, unit='Mpc', zmax=10., nz=2000):
+    """
+    Distance table of a cosmology, built on first request
+    Input:
+        cosmo: astropy cosmology
+        unit: distance unit in kpc, Mpc, ...
+    Output:
+        CosmoTable
+    """
+    # tables keep a reference to their cosmology, so its id stays unique
+    key = (id(cosmo), unit, zmax, nz)
+    if key not in _tables:
+        _tables[key] = CosmoTable(cosmo, unit, zmax, nz)
+    return _tables[key]
+
+
+def length_unit(unitlength):
+    """ Distance unit of a simulation from its unit length in [cm] """
+    exp = np.floor(np.log10(np.abs(unitlength))).astype(int)
+    if exp == 21:  # simulation in [kpc]
+        return 'kpc'
+    elif exp == 23:  # simulation in [Mpc]
+        return 'Mpc'
+    else:
+        raise Exception('Dont know this unit ->', unitlength)
+
+
+def _out(x):
+    if np.ndim(x) == 0:
+        return float(x)
+    return x
+
+
+class CosmoTable():
+    def __init__(self, cosmo, unit='Mpc', zmax=10., nz=2000):
+        """
+        Input:
+            cosmo: astropy cosmology
+            unit: distance unit in kpc, Mpc, ...
+            zmax: largest tabulated redshift
+            nz: number of redshift nodes, denser at low redshift
+        """
+        self.cosmo = cosmo
+        self.unit = unit
+        self.zmax = zmax
+        self.z = np.expm1(np.linspace(0, np.log1p(zmax), nz))
+        self.dc = cosmo.comoving_distance(self.z).to_value(unit)
+        self.dh = (const.c/cosmo.H0).to_value(unit)  # Hubble distance
+        self.ok = cosmo.Ok0
+        self._dc = CubicSpline(self.z, self.dc)
+        self._z = CubicSpline(self.dc[1:], self.z[1:])
+        # c^2/(4 pi G) in [Msun/unit]
+        self.sigma_fac = (const.c**2/(4*np.pi*const.G)).to_value('Msun/%s' % unit)
+        # light travel time (unit/c) in [s]
+        self.tsec_fac = (1*u.Unit(unit)/const.c).to_value('s')
+
+    def _transverse(self, dc):
+        """ Transverse comoving distance from line-of-sight distance """
+        if self.ok > 0:
+            sok = np.sqrt(self.ok)
+            return self.dh/sok*np.sinh(sok*dc/self.dh)
+        elif self.ok < 0:
+            sok = np.sqrt(-self.ok)
+            return self.dh/sok*np.sin(sok*dc/self.dh)
+        return dc
+
+    def Dc(self, z):
+        """ Comoving distance [unit] """
+        return _out(self._dc(z))
+
+    def Dm(self, z):
+        """ Transverse comoving distance [unit] """
+        return _out(self._transverse(self._dc(z)))
+
+    def Da(self, z):
+        """ Angular diameter distance [unit] """
+        return _out(self._transverse(self._dc(z))/(1 + np.asarray(z)))
+
+    def _pair(self, z1, z2):
+        """ Transverse comoving distances of z1 and z2 in one spline call """
+        z1, z2 = np.broadcast_arrays(np.asarray(z1, dtype=float),
+                                     np.asarray(z2, dtype=float))
+        dm = self._transverse(self._dc(np.concatenate((z1.ravel(), z2.ravel()))))
+        return z1, z2, dm[:z1.size].reshape(z1.shape), dm[z1.size:].reshape(z2.shape)
+
+    def _da2(self, dm1, dm2, z2):
+        dm12 = dm2*np.sqrt(1 + self.ok*(dm1/self.dh)**2) - \
+               dm1*np.sqrt(1 + self.ok*(dm2/self.dh)**2)
+        return dm12/(1 + z2)
+
+    def Da2(self, z1, z2):
+        """ Angular diameter distance between z1 < z2 [unit] """
+        z1, z2, dm1, dm2 = self._pair(z1, z2)
+        return _out(self._da2(dm1, dm2, z2))
+
+    def Ddt(self, zl, zs):
+        """ Time-delay distance (1+zl) Dl Ds/Dls [unit] """
+        zl, zs, dml, dms = self._pair(zl, zs)
+        return _out(dml*dms/((1 + zs)*self._da2(dml, dms, zs)))
+
+    def sigma_crit(self, zl, zs):
+        """ Critical surface density [Msun/unit^2] """
+        zl, zs, dml, dms = self._pair(zl, zs)
+        return _out(self.sigma_fac*dms*(1 + zl)/((1 + zs)*dml*self._da2(dml, dms, zs)))
+
+    def z_of_Dc(self, dc):
+        """ Redshift at comoving distance [unit] """
+        return _out(self._z(dc))
+
+    def error_bound(self, nsample=500):
+        """
+        Largest relative deviation from astropy halfway between nodes,
+        where the spline error peaks
+        Output:
+            dict of maximum relative errors of Dc, Da, Da2 and z(Dc)
+        """
+        step = max(1, (len(self.z) - 1)//nsample)
+        zmid = 0.5*(self.z[1::step] + self.z[:-1:step])
+        dc = self.cosmo.comoving_distance(zmid).to_value(self.unit)
+        da = self.cosmo.angular_diameter_distance(zmid).to_value(self.unit)
+        zl = 0.5*zmid
+        dls = self.cosmo.angular_diameter_distance_z1z2(zl, zmid).to_value(self.unit)
+        return {'Dc' : np.max(np.abs(self.Dc(zmid)/dc - 1)),
+                'Da' : np.max(np.abs(self.Da(zmid)/da - 1)),
+                'Da2' : np.max(np.abs(self.Da2(zl, zmid)/dls - 1)),
+                'z' : np.max(np.abs(self.z_of_Dc(dc)/zmid - 1))}